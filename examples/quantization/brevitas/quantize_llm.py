@@ -1,13 +1,12 @@
 from argparse import ArgumentParser
+from pathlib import Path
 
-import torch
 from brevitas.export.onnx.standard.qcdq.manager import StdQCDQONNXManager
-from brevitas_examples.llm.llm_quant.export import brevitas_proxy_export_mode
 
 from optimum.amd import BrevitasQuantizationConfig, BrevitasQuantizer
 from optimum.amd.brevitas.accelerate_utils import calc_cpu_device_map, calc_gpu_device_map, offload_model, remove_hooks
 from optimum.amd.brevitas.data_utils import compute_perplexity, get_dataset_for_model
-from optimum.exporters.onnx import onnx_export_from_model
+from optimum.amd.brevitas.export import onnx_export_from_quantized_model, pack_onnx_int4_weights
 from transformers import AutoTokenizer
 
 
@@ -74,22 +73,32 @@ def main(args):
     return_val["quant_perplexity"] = perplexity
     print(f"Perplexity (quantized model): {perplexity}")
 
-    print("Exporting the model to ONNX...")
     if use_accelerate:
         remove_hooks(quantized_model)
     quantized_model = quantized_model.to("cpu")
 
+    if args.quantized_output_path is not None:
+        print(f"Saving the quantized model to {args.quantized_output_path}...")
+        quantizer.save_pretrained(args.quantized_output_path)
+
+    print("Exporting the model to ONNX...")
+
     # Export to ONNX through optimum.exporters.
     export_manager = StdQCDQONNXManager
-    export_manager.change_weight_export(export_weight_q_node=True)
-    with torch.no_grad(), brevitas_proxy_export_mode(quantized_model, export_manager=export_manager):
-        onnx_export_from_model(
-            quantized_model,
-            args.onnx_output_path,
-            task="text-generation-with-past",
-            do_validation=False,
-            no_post_process=True,
-        )
+    # The packing of the 4-bit weights reads their integer values, that are exported as int8 initializers.
+    export_manager.change_weight_export(export_weight_q_node=not args.onnx_int4_weights)
+    onnx_export_from_quantized_model(
+        quantized_model,
+        args.onnx_output_path,
+        task="text-generation-with-past",
+        max_shard_size=args.onnx_max_shard_size,
+        export_manager=export_manager,
+    )
+
+    if args.onnx_int4_weights:
+        print("Packing the 4-bit weights of the ONNX model...")
+        for onnx_path in Path(args.onnx_output_path).glob("*.onnx"):
+            pack_onnx_int4_weights(onnx_path)
     return return_val
 
 
@@ -160,6 +169,24 @@ if __name__ == "__main__":
         default="llm_quantized_onnx",
         help="Location to store the output ONNX model (default: %(default)s)",
     )
+    parser.add_argument(
+        "--onnx-max-shard-size",
+        type=str,
+        default="2GB",
+        help="Maximum size of the files storing the weights of the ONNX model, that are written one weight at a time to bound the memory of the export (default: %(default)s).",
+    )
+    parser.add_argument(
+        "--onnx-int4-weights",
+        action="store_true",
+        default=False,
+        help="Whether to store the 4-bit weights of the ONNX model packed two per byte with their group scales, in `MatMulNBits` nodes of ONNX Runtime, rather than as 8-bit or float initializers followed by QuantizeLinear / DequantizeLinear nodes (default: %(default)s).",
+    )
+    parser.add_argument(
+        "--quantized-output-path",
+        type=str,
+        default=None,
+        help="If set, location to save the quantized model, to be reloaded with `BrevitasQuantizer.from_quantized` (default: %(default)s)",
+    )
 
     args = parser.parse_args()
 
@@ -7,16 +7,29 @@ from transformers.utils import _LazyModule
 
 
 _import_structure = {
+    "brevitas.checkpoint": [
+        "BrevitasQuantizationCheckpoint",
+    ],
     "brevitas.configuration": [
         "BrevitasQuantizationConfig",
     ],
+    "brevitas.packed_linear": [
+        "PackedQuantLinear",
+    ],
+    "brevitas.profiling": [
+        "BrevitasQuantizationCallback",
+        "BrevitasQuantizationProfile",
+    ],
     "brevitas.quantizer": [
         "BrevitasQuantizer",
     ],
 }
 
 if TYPE_CHECKING:
+    from .brevitas.checkpoint import BrevitasQuantizationCheckpoint
     from .brevitas.configuration import BrevitasQuantizationConfig
+    from .brevitas.packed_linear import PackedQuantLinear
+    from .brevitas.profiling import BrevitasQuantizationCallback, BrevitasQuantizationProfile
     from .brevitas.quantizer import BrevitasQuantizer
 else:
     import sys
@@ -1,6 +1,15 @@
 # Copyright 2023 The HuggingFace Team. All rights reserved.
 # Licensed under the MIT License.
 
+from .checkpoint import BrevitasQuantizationCheckpoint
 from .configuration import BrevitasQuantizationConfig
 from .data_utils import get_dataset_for_model
+from .export import (
+    onnx_export_from_quantized_model,
+    pack_int4_matmul_weights,
+    pack_onnx_int4_weights,
+    save_onnx_external_data,
+)
+from .packed_linear import PackedQuantLinear, pack_quantized_linears
+from .profiling import BrevitasQuantizationCallback, BrevitasQuantizationProfile
 from .quantizer import BrevitasQuantizer
@@ -0,0 +1,308 @@
+# Copyright 2024 The HuggingFace Team. All rights reserved.
+# Licensed under the MIT License.
+"""Stage-level and per-layer GPTQ checkpoints of BrevitasQuantizer, to resume interrupted quantizations."""
+
+import hashlib
+import json
+import logging
+import os
+from dataclasses import asdict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+import torch
+from safetensors import safe_open
+from safetensors.torch import load_model, save_file, save_model
+
+from .configuration import BrevitasQuantizationConfig
+
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_MANIFEST_NAME = "quantization_checkpoint.json"
+CHECKPOINT_STATE_NAME = "model.safetensors"
+
+
+def get_calibration_fingerprint(calibration_dataset: Optional[List[Dict]]) -> Optional[str]:
+    """
+    Returns a SHA-256 fingerprint of the names, shapes, dtypes and values of the tensors of a calibration dataset.
+    """
+    if calibration_dataset is None:
+        return None
+
+    digest = hashlib.sha256()
+    for sample in calibration_dataset:
+        for name in sorted(sample):
+            value = sample[name]
+            digest.update(name.encode())
+            if isinstance(value, torch.Tensor):
+                value = value.detach().cpu().contiguous()
+                digest.update(f"{value.dtype}{tuple(value.shape)}".encode())
+                digest.update(value.view(-1).view(torch.uint8).numpy().tobytes() if value.numel() else b"")
+            else:
+                digest.update(repr(value).encode())
+
+    return digest.hexdigest()
+
+
+def get_config_fingerprint(quantization_config: BrevitasQuantizationConfig) -> str:
+    """
+    Returns a SHA-256 fingerprint of a quantization configuration.
+    """
+    config = json.dumps(asdict(quantization_config), sort_keys=True, default=str)
+    return hashlib.sha256(config.encode()).hexdigest()
+
+
+def _write_atomic(save_fn, path: Path):
+    # Writes to a temporary file first, so that a preemption during the write never leaves a truncated checkpoint.
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    save_fn(str(tmp_path))
+    os.replace(tmp_path, path)
+
+
+def _add_missing_biases(model: torch.nn.Module, state_path: Path):
+    # Bias correction adds a bias to the layers that had none, that must exist before loading their values.
+    state_keys = set(model.state_dict())
+    modules = dict(model.named_modules())
+    with safe_open(str(state_path), framework="pt") as state_file:
+        for key in state_file.keys():
+            module_name, _, parameter_name = key.rpartition(".")
+            module = modules.get(module_name)
+            if (
+                key in state_keys
+                or parameter_name != "bias"
+                or module is None
+                or getattr(module, "bias", 0) is not None
+            ):
+                continue
+            bias = state_file.get_tensor(key)
+            module.bias = torch.nn.Parameter(torch.zeros_like(bias, device=module.weight.device))
+
+
+def _check_not_offloaded(model: torch.nn.Module):
+    if any(tensor.is_meta for tensor in model.state_dict().values()):
+        raise ValueError(
+            "Checkpointing the quantization of a model with weights offloaded by accelerate is not supported, please "
+            "fit the model on the available devices or disable the checkpointing."
+        )
+
+
+class BrevitasQuantizationCheckpoint:
+    """
+    Checkpoints the stages of a [`~BrevitasQuantizer.quantize`] call in a directory, and resumes from them.
+
+    The stages that only update values (weight equalization, cross-layer activation equalization, GPTQ, calibration,
+    bias correction) save the state of the model as safetensors when they complete, and are skipped on resume. The
+    stages that change the structure of the model (tracing, offloading, layerwise activation equalization,
+    `quantize_model`) always run, the saved state being loaded after the last completed stage that saved it. GPTQ
+    additionally saves the layers updated by each of its steps, so that an interrupted GPTQ resumes from its last
+    completed layer.
+
+    The quantization configuration, the calibration dataset and the model are checked against the checkpoint on
+    resume, a mismatch raising a `ValueError`.
+
+    Args:
+        checkpoint_dir (`Optional[Union[str, Path]]`):
+            The directory of the checkpoint, created if it does not exist and resumed from otherwise. If `None`, nothing
+            is checkpointed and all the stages run.
+        quantization_config (`BrevitasQuantizationConfig`):
+            The quantization configuration.
+        calibration_dataset (`Optional[List[Dict]]`, defaults to `None`):
+            The calibration dataset.
+        model_name_or_path (`Optional[str]`, defaults to `None`):
+            The quantized model.
+    """
+
+    def __init__(
+        self,
+        checkpoint_dir: Optional[Union[str, Path]],
+        quantization_config: BrevitasQuantizationConfig,
+        calibration_dataset: Optional[List[Dict]] = None,
+        model_name_or_path: Optional[str] = None,
+    ):
+        self._stage_index = -1
+        self.checkpoint_dir = Path(checkpoint_dir) if checkpoint_dir is not None else None
+        self.manifest = {
+            "model_name_or_path": model_name_or_path,
+            "config_fingerprint": None,
+            "calibration_fingerprint": None,
+            "completed_stages": [],
+            "state_stage_index": None,
+            "gptq_steps": [],
+        }
+        if self.checkpoint_dir is None:
+            return
+
+        self.manifest["config_fingerprint"] = get_config_fingerprint(quantization_config)
+        self.manifest["calibration_fingerprint"] = get_calibration_fingerprint(calibration_dataset)
+
+        manifest_path = self.checkpoint_dir / CHECKPOINT_MANIFEST_NAME
+        if manifest_path.is_file():
+            with open(manifest_path, "r") as manifest_file:
+                saved_manifest = json.load(manifest_file)
+            for key, description in [
+                ("model_name_or_path", "model"),
+                ("config_fingerprint", "quantization configuration"),
+                ("calibration_fingerprint", "calibration dataset"),
+            ]:
+                if saved_manifest.get(key) != self.manifest[key]:
+                    raise ValueError(
+                        f"The {description} differs from the one of the checkpoint in {self.checkpoint_dir}, please "
+                        "use another checkpoint directory or resume with the same model, configuration and dataset."
+                    )
+            self.manifest = saved_manifest
+            logger.info(
+                f"Resuming the quantization from {self.checkpoint_dir}, completed stages: "
+                f"{self.manifest['completed_stages']}, completed GPTQ steps: {len(self.manifest['gptq_steps'])}."
+            )
+        else:
+            self.checkpoint_dir.mkdir(parents=True, exist_ok=True)
+            self._save_manifest()
+
+    @property
+    def enabled(self) -> bool:
+        return self.checkpoint_dir is not None
+
+    @property
+    def completed_stages(self) -> List[str]:
+        return list(self.manifest["completed_stages"])
+
+    def _save_manifest(self):
+        def save_fn(path):
+            with open(path, "w") as manifest_file:
+                json.dump(self.manifest, manifest_file, indent=4)
+
+        _write_atomic(save_fn, self.checkpoint_dir / CHECKPOINT_MANIFEST_NAME)
+
+    def should_run(self, name: str, structural: bool = False) -> bool:
+        """
+        Starts the stage `name`, returning whether it has to run: only the completed stages that do not change the
+        structure of the model are skipped. [`~BrevitasQuantizationCheckpoint.complete`] must be called after the stage.
+        """
+        self._stage_index += 1
+        if self.checkpoint_dir is None:
+            return True
+
+        completed_stages = self.manifest["completed_stages"]
+        if self._stage_index < len(completed_stages):
+            if completed_stages[self._stage_index] != name:
+                raise ValueError(
+                    f"The stage {name} does not match the stage {completed_stages[self._stage_index]} of the checkpoint "
+                    f"in {self.checkpoint_dir}."
+                )
+            if not structural:
+                logger.info(f"Skipping the stage {name}, completed in the checkpoint.")
+                return False
+
+        return True
+
+    def complete(self, name: str, model: torch.nn.Module, structural: bool = False):
+        """
+        Completes the stage `name`: saves the state of `model` after a stage that only updates values, or loads the
+        saved state into `model` at the point of the resumed quantization where it was saved.
+        """
+        if self.checkpoint_dir is None:
+            return
+
+        state_path = self.checkpoint_dir / CHECKPOINT_STATE_NAME
+        if self._stage_index < len(self.manifest["completed_stages"]):
+            if self._stage_index == self.manifest["state_stage_index"]:
+                logger.info(f"Loading the state of the model after the stage {name} from {state_path}.")
+                _add_missing_biases(model, state_path)
+                load_model(model, str(state_path), strict=True, device=str(next(model.parameters()).device))
+            return
+
+        if not structural:
+            _check_not_offloaded(model)
+            _write_atomic(lambda path: save_model(model, path), state_path)
+            self.manifest["state_stage_index"] = self._stage_index
+
+        self.manifest["completed_stages"].append(name)
+        if name == "gptq":
+            # The full state supersedes the per-layer checkpoints of GPTQ.
+            self.clear_gptq_steps()
+        self._save_manifest()
+
+    def get_gptq_completed_layers(self) -> List[List[str]]:
+        """
+        Returns the names of the layers updated by each completed GPTQ step.
+        """
+        return [step["layers"] for step in self.manifest["gptq_steps"]]
+
+    def clear_gptq_steps(self):
+        """
+        Deletes the checkpoints of the GPTQ steps.
+        """
+        if self.checkpoint_dir is None:
+            return
+
+        for step in self.manifest["gptq_steps"]:
+            (self.checkpoint_dir / step["file"]).unlink(missing_ok=True)
+        self.manifest["gptq_steps"] = []
+        self._save_manifest()
+
+    def restore_gptq_steps(self, model: torch.nn.Module):
+        """
+        Loads the layers updated by the completed GPTQ steps into `model`.
+        """
+        modules = dict(model.named_modules())
+        for step in self.manifest["gptq_steps"]:
+            with safe_open(str(self.checkpoint_dir / step["file"]), framework="pt") as step_file:
+                for key in step_file.keys():
+                    module_name, _, tensor_name = key.rpartition(".")
+                    tensor = getattr(modules[module_name], tensor_name)
+                    with torch.no_grad():
+                        tensor.copy_(step_file.get_tensor(key))
+
+    def save_gptq_step(self, model: torch.nn.Module, layer_names: List[str]):
+        """
+        Saves the layers updated by a GPTQ step.
+        """
+        if self.checkpoint_dir is None:
+            return
+
+        modules = dict(model.named_modules())
+        tensors = {}
+        for name in layer_names:
+            for tensor_name, tensor in modules[name].state_dict(prefix=f"{name}.", keep_vars=True).items():
+                if tensor.is_meta:
+                    _check_not_offloaded(model)
+                tensors[tensor_name] = tensor.detach().cpu().contiguous()
+
+        step_file = f"gptq_step_{len(self.manifest['gptq_steps']):05d}.safetensors"
+        _write_atomic(lambda path: save_file(tensors, path), self.checkpoint_dir / step_file)
+        self.manifest["gptq_steps"].append({"file": step_file, "layers": list(layer_names)})
+        self._save_manifest()
+
+
+def get_weight_fingerprints(model: torch.nn.Module) -> Dict[str, Tuple[int, float, float]]:
+    """
+    Returns a cheap fingerprint of the weight of each quantized layer, to find the layers updated by a GPTQ step.
+    """
+    fingerprints = {}
+    for name, module in model.named_modules():
+        weight = getattr(module, "weight", None)
+        if hasattr(module, "weight_quant") and isinstance(weight, torch.Tensor) and not weight.is_meta:
+            with torch.no_grad():
+                fingerprints[name] = (weight.data_ptr(), float(weight.double().sum()), float(weight.double().norm()))
+    return fingerprints
+
+
+def skip_gptq_layers(gptq, layer_names: List[str]) -> bool:
+    """
+    Marks the layers already updated by GPTQ as done, so that GPTQ moves on to the next layers. Returns `False` if the
+    installed Brevitas does not allow it.
+
+    Brevitas has no public API to resume GPTQ: this relies on the `gpxq_layers` (`gptq_layers` in older releases)
+    mapping of `gptq_mode` and on the `disable_pre_forward_hook` flag of its layers. When they are missing, the caller
+    applies GPTQ to all the layers again.
+    """
+    layers = getattr(gptq, "gpxq_layers", None) or getattr(gptq, "gptq_layers", None)
+    if not isinstance(layers, dict):
+        return False
+    if any(name not in layers or not hasattr(layers[name], "disable_pre_forward_hook") for name in layer_names):
+        return False
+
+    for name in layer_names:
+        layers[name].disable_pre_forward_hook = True
+    return True
@@ -211,6 +211,27 @@ class DatasetToDevice(torch.utils.data.Dataset):
         return len(self.data)
 
 
+def get_empty_past_key_values(config: Any, device: Optional[Union[str, torch.device]] = None):
+    """
+    Returns empty `past_key_values` for a model with the configuration `config`, that are required by the models traced
+    with torch.fx as they can not have optional inputs.
+    """
+    normalized_config_class = NormalizedConfigManager.get_normalized_config_class(config.model_type)
+    normalized_config = normalized_config_class(config)
+
+    num_heads = normalized_config.num_attention_heads
+    head_dim = normalized_config.hidden_size // num_heads
+    num_layers = normalized_config.num_layers
+
+    return tuple(
+        (
+            torch.zeros(1, num_heads, 0, head_dim, device=device),
+            torch.zeros(1, num_heads, 0, head_dim, device=device),
+        )
+        for _ in range(num_layers)
+    )
+
+
 def get_dataset_for_model(
     model_name_or_path: str,
     qconfig: "BrevitasQuantizationConfig",
@@ -265,21 +286,8 @@ def get_dataset_for_model(
     if qconfig.requires_fx_graph():
         config = AutoConfig.from_pretrained(model_name_or_path)
 
-        normalized_config_class = NormalizedConfigManager.get_normalized_config_class(config.model_type)
-        normalized_config = normalized_config_class(config)
-
-        num_heads = normalized_config.num_attention_heads
-        head_dim = normalized_config.hidden_size // num_heads
-        num_layers = normalized_config.num_layers
-
         for sample in data:
-            sample["past_key_values"] = tuple(
-                (
-                    torch.zeros(1, num_heads, 0, head_dim, device=sample["input_ids"].device),
-                    torch.zeros(1, num_heads, 0, head_dim, device=sample["input_ids"].device),
-                )
-                for _ in range(num_layers)
-            )
+            sample["past_key_values"] = get_empty_past_key_values(config, device=sample["input_ids"].device)
 
     data = DatasetToDevice(data, device=device)
 
@@ -0,0 +1,668 @@
+# Copyright 2024 The HuggingFace Team. All rights reserved.
+# Licensed under the MIT License.
+"""Export of Brevitas-quantized models to ONNX with sharded external data, and post-processing of the exported models."""
+
+import hashlib
+import inspect
+import logging
+from itertools import chain
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple, Union
+
+import numpy as np
+import onnx
+import torch
+from brevitas.export.onnx.standard.qcdq.manager import StdQCDQONNXManager
+from brevitas_examples.llm.llm_quant.export import brevitas_proxy_export_mode
+from onnx import helper, numpy_helper
+from onnx.external_data_helper import ExternalDataInfo
+
+from transformers.utils.hub import convert_file_size_to_int
+
+
+logger = logging.getLogger(__name__)
+
+# The block sizes tried for the `MatMulNBits` operator, from the preferred one.
+INT4_BLOCK_SIZES = [128, 64, 32, 16, 256]
+
+MS_DOMAIN = "com.microsoft"
+
+
+def _get_attribute(node: onnx.NodeProto, name: str, default=None):
+    for attribute in node.attribute:
+        if attribute.name == name:
+            return helper.get_attribute_value(attribute)
+    return default
+
+
+class _GraphIndex:
+    """
+    The producers, initializers and constants of an ONNX graph. The initializers stored as external data are read from
+    `base_dir` when needed.
+    """
+
+    def __init__(self, graph: onnx.GraphProto, base_dir: Optional[Path] = None):
+        self.graph = graph
+        self.base_dir = base_dir
+        self.initializers = {initializer.name: initializer for initializer in graph.initializer}
+        self.producers = {output: node for node in graph.node for output in node.output}
+
+    def get_constant(self, name: str) -> Optional[np.ndarray]:
+        if name in self.initializers:
+            tensor = self.initializers[name]
+            if tensor.data_location == onnx.TensorProto.EXTERNAL:
+                if self.base_dir is None:
+                    raise ValueError(f"The initializer {name} is stored as external data, but no base_dir is given.")
+                loaded_tensor = onnx.TensorProto()
+                loaded_tensor.CopyFrom(tensor)
+                del loaded_tensor.external_data[:]
+                loaded_tensor.data_location = onnx.TensorProto.DEFAULT
+                loaded_tensor.raw_data = _read_tensor_data(tensor, self.base_dir)
+                tensor = loaded_tensor
+            return numpy_helper.to_array(tensor)
+        node = self.producers.get(name)
+        if node is not None and node.op_type == "Constant":
+            value = _get_attribute(node, "value")
+            return numpy_helper.to_array(value) if value is not None else None
+        return None
+
+
+def _broadcast(param: np.ndarray, shape: Tuple[int, ...], axis: int) -> np.ndarray:
+    """
+    Broadcasts a per-tensor, per-axis or per-group quantization parameter to the shape of the quantized tensor.
+    """
+    if param.size == 1:
+        return np.broadcast_to(param.reshape(()), shape)
+    if param.ndim == 1:
+        view = [1] * len(shape)
+        view[axis % len(shape)] = -1
+        param = param.reshape(view)
+    return np.broadcast_to(param, shape)
+
+
+def _get_int_values(index: _GraphIndex, name: str) -> Optional[Tuple[np.ndarray, bool]]:
+    """
+    Returns the integer values of a quantized weight, with their signedness, either stored as an integer initializer or
+    computed from a float initializer quantized by a `QuantizeLinear` node, possibly followed by a `Clip` node.
+    """
+    bounds = None
+    node = index.producers.get(name)
+    if node is not None and node.op_type == "Clip":
+        bounds = [index.get_constant(input_name) if input_name else None for input_name in node.input[1:3]]
+        if any(input_name and bound is None for input_name, bound in zip(node.input[1:3], bounds)):
+            return None
+        name = node.input[0]
+        node = index.producers.get(name)
+
+    values = index.get_constant(name)
+    if values is not None:
+        if values.dtype not in (np.int8, np.uint8):
+            return None
+        signed = values.dtype == np.int8
+        values = values.astype(np.int32)
+    elif node is not None and node.op_type == "QuantizeLinear":
+        weight = index.get_constant(node.input[0])
+        scale = index.get_constant(node.input[1])
+        zero_point = index.get_constant(node.input[2]) if len(node.input) > 2 and node.input[2] else None
+        if weight is None or scale is None or (len(node.input) > 2 and node.input[2] and zero_point is None):
+            return None
+        if _get_attribute(node, "block_size", 0):
+            return None
+        if zero_point is None:
+            zero_point = np.zeros((), dtype=np.uint8)
+        signed = zero_point.dtype == np.int8
+        axis = _get_attribute(node, "axis", 1)
+        values = np.rint(weight / _broadcast(scale, weight.shape, axis)) + _broadcast(zero_point, weight.shape, axis)
+        values = np.clip(values, -128 if signed else 0, 127 if signed else 255).astype(np.int32)
+    else:
+        return None
+
+    if bounds is not None:
+        low, high = (bound if bound is not None else default for bound, default in zip(bounds, (-128, 255)))
+        values = np.clip(values, low, high).astype(np.int32)
+    return values, signed
+
+
+def _reshape(array: np.ndarray, shape: np.ndarray) -> np.ndarray:
+    # A zero keeps the dimension of the input, as with `allowzero=0`.
+    shape = [array.shape[i] if size == 0 else int(size) for i, size in enumerate(shape)]
+    return array.reshape(shape)
+
+
+def _get_quantized_weight(index: _GraphIndex, name: str) -> Optional[Tuple[np.ndarray, np.ndarray, np.ndarray, bool]]:
+    """
+    Returns the integer weight, scale and zero-point broadcast to the shape of the tensor `name`, with the signedness
+    of the integers, when `name` is a weight dequantized by a `DequantizeLinear` node, possibly followed by `Transpose`
+    and `Reshape` nodes.
+    """
+    transforms = []
+    node = index.producers.get(name)
+    while node is not None and node.op_type in ("Transpose", "Reshape"):
+        if node.op_type == "Reshape":
+            shape = index.get_constant(node.input[1])
+            if shape is None:
+                return None
+            transforms.insert(0, (_reshape, shape))
+        else:
+            transforms.insert(0, (np.transpose, _get_attribute(node, "perm")))
+        node = index.producers.get(node.input[0])
+
+    if node is None or node.op_type != "DequantizeLinear" or _get_attribute(node, "block_size", 0):
+        return None
+    int_values = _get_int_values(index, node.input[0])
+    scale = index.get_constant(node.input[1])
+    has_zero_point = len(node.input) > 2 and node.input[2]
+    zero_point = index.get_constant(node.input[2]) if has_zero_point else np.zeros((), dtype=np.int32)
+    if int_values is None or scale is None or zero_point is None:
+        return None
+
+    values, signed = int_values
+    axis = _get_attribute(node, "axis", 1)
+    scale = _broadcast(scale, values.shape, axis)
+    zero_point = _broadcast(zero_point.astype(np.int32), values.shape, axis)
+    for transform, arg in transforms:
+        values, scale, zero_point = (transform(array, arg) for array in (values, scale, zero_point))
+    return values, scale, zero_point, signed
+
+
+def _is_blockwise_constant(array: np.ndarray, block_size: int) -> bool:
+    padding = -array.shape[1] % block_size
+    blocks = np.pad(array, ((0, 0), (0, padding)), mode="edge").reshape(array.shape[0], -1, block_size)
+    return bool((blocks == blocks[:, :, :1]).all())
+
+
+def _pack_nibbles(values: np.ndarray) -> np.ndarray:
+    # The first value of each pair is stored in the low nibble.
+    if values.shape[-1] % 2:
+        values = np.concatenate([values, np.zeros((*values.shape[:-1], 1), dtype=values.dtype)], axis=-1)
+    return (values[..., 0::2] | (values[..., 1::2] << 4)).astype(np.uint8)
+
+
+def get_int4_block_size(scale: np.ndarray, zero_point: np.ndarray, block_size: Optional[int] = None) -> Optional[int]:
+    """
+    Returns the block size of the `MatMulNBits` operator with which the scale and zero-point of shape
+    `(out_features, in_features)` are constant over each block of input features, or `None` if there is none.
+    """
+    for size in [block_size] if block_size is not None else INT4_BLOCK_SIZES:
+        if _is_blockwise_constant(scale, size) and _is_blockwise_constant(zero_point, size):
+            return size
+    return None
+
+
+def _make_matmul_nbits(
+    weight_name: str,
+    weight: Tuple[np.ndarray, np.ndarray, np.ndarray, bool],
+    block_size: Optional[int],
+    new_initializers: List[onnx.TensorProto],
+) -> Optional[Tuple[List[str], Dict[str, int]]]:
+    """
+    Creates the packed initializers of a weight of shape `(out_features, in_features)` for the `MatMulNBits` operator,
+    and returns the names of its weight inputs along its attributes.
+    """
+    values, scale, zero_point, signed = weight
+    # `MatMulNBits` dequantizes unsigned 4-bit integers, with a default zero-point of 8.
+    offset = 8 if signed else 0
+    values = values + offset
+    zero_point = zero_point + offset
+    if values.min() < 0 or values.max() > 15 or zero_point.min() < 0 or zero_point.max() > 15:
+        return None
+
+    size = get_int4_block_size(scale, zero_point, block_size)
+    if size is None:
+        logger.warning(f"The scales of {weight_name} are not constant over blocks of a supported size, not packed.")
+        return None
+
+    out_features, in_features = values.shape
+    num_blocks = -(-in_features // size)
+    padding = num_blocks * size - in_features
+    values = np.pad(values, ((0, 0), (0, padding))).reshape(out_features, num_blocks, size)
+    block_scale = np.pad(scale, ((0, 0), (0, padding)), mode="edge")[:, ::size]
+    block_zero_point = np.pad(zero_point, ((0, 0), (0, padding)), mode="edge")[:, ::size]
+
+    names = [f"{weight_name}_int4", f"{weight_name}_int4_scales"]
+    new_initializers.append(numpy_helper.from_array(_pack_nibbles(values), names[0]))
+    new_initializers.append(numpy_helper.from_array(np.ascontiguousarray(block_scale).flatten(), names[1]))
+    if (block_zero_point != 8).any():
+        names.append(f"{weight_name}_int4_zero_points")
+        new_initializers.append(numpy_helper.from_array(_pack_nibbles(block_zero_point).flatten(), names[2]))
+
+    return names, {"K": in_features, "N": out_features, "bits": 4, "block_size": size}
+
+
+def _remove_unused(graph: onnx.GraphProto):
+    """
+    Removes the nodes and initializers of a graph that do not contribute to its outputs.
+    """
+    used = {output.name for output in graph.output}
+
+    def add_subgraph_inputs(subgraph: onnx.GraphProto):
+        for node in subgraph.node:
+            used.update(node.input)
+            for attribute in node.attribute:
+                for sub in [attribute.g] if attribute.HasField("g") else attribute.graphs:
+                    add_subgraph_inputs(sub)
+
+    kept_nodes = []
+    for node in reversed(graph.node):
+        if not any(output in used for output in node.output):
+            continue
+        kept_nodes.append(node)
+        used.update(node.input)
+        for attribute in node.attribute:
+            for subgraph in [attribute.g] if attribute.HasField("g") else attribute.graphs:
+                add_subgraph_inputs(subgraph)
+
+    del graph.node[:]
+    graph.node.extend(reversed(kept_nodes))
+    kept_initializers = [initializer for initializer in graph.initializer if initializer.name in used]
+    del graph.initializer[:]
+    graph.initializer.extend(kept_initializers)
+
+
+def pack_int4_matmul_weights(
+    model: onnx.ModelProto, block_size: Optional[int] = None, base_dir: Optional[Union[str, Path]] = None
+) -> int:
+    """
+    Replaces in place the `MatMul` and `Gemm` nodes of an ONNX model whose weight is quantized on 4 bits, as exported
+    with `StdQCDQONNXManager` (an integer or float initializer followed by `QuantizeLinear`, `Clip` and
+    `DequantizeLinear` nodes), with `MatMulNBits` nodes of ONNX Runtime. Their weights are stored as two 4-bit integers
+    per byte, with a scale per block of input features. The weights quantized on more than 4 bits are left unchanged.
+
+    Args:
+        model (`onnx.ModelProto`):
+            The ONNX model.
+        block_size (`Optional[int]`, defaults to `None`):
+            The number of input features sharing a scale in `MatMulNBits`, a power of two of at least 16. Defaults to
+            the largest of 128, 64, 32 and 16 compatible with the quantization granularity of each weight (the
+            per-group weights need their group size).
+        base_dir (`Optional[Union[str, Path]]`, defaults to `None`):
+            The directory of the external data files of the model, if its external data are not loaded. The quantized
+            weights and their parameters are then read one at a time.
+
+    Returns:
+        `int`: The number of replaced `MatMul` and `Gemm` nodes.
+    """
+    if block_size is not None and (block_size < 16 or block_size & (block_size - 1)):
+        raise ValueError(f"The block size must be a power of two of at least 16, got {block_size}.")
+
+    graph = model.graph
+    index = _GraphIndex(graph, Path(base_dir) if base_dir is not None else None)
+    new_initializers = []
+    packed = {}
+    new_nodes = []
+    num_packed = 0
+    for node in graph.node:
+        if node.op_type == "MatMul":
+            transposed = False
+        elif (
+            node.op_type == "Gemm"
+            and not _get_attribute(node, "transA", 0)
+            and _get_attribute(node, "alpha", 1.0) == 1.0
+            and _get_attribute(node, "beta", 1.0) == 1.0
+        ):
+            transposed = bool(_get_attribute(node, "transB", 0))
+        else:
+            new_nodes.append(node)
+            continue
+
+        # Tied weights are packed once.
+        key = (node.input[1], transposed)
+        if key not in packed:
+            packed[key] = None
+            weight = _get_quantized_weight(index, node.input[1])
+            if weight is not None and weight[0].ndim == 2:
+                values, scale, zero_point, signed = weight
+                if not transposed:
+                    values, scale, zero_point = values.T, scale.T, zero_point.T
+                weight_name = (node.name or node.output[0]).strip("/").replace("/", "_")
+                packed[key] = _make_matmul_nbits(
+                    weight_name, (values, scale, zero_point, signed), block_size, new_initializers
+                )
+
+        if packed[key] is None:
+            new_nodes.append(node)
+            continue
+
+        weight_inputs, attributes = packed[key]
+        has_bias = node.op_type == "Gemm" and len(node.input) > 2 and node.input[2]
+        output = f"{node.output[0]}_matmul" if has_bias else node.output[0]
+        new_nodes.append(
+            helper.make_node(
+                "MatMulNBits",
+                [node.input[0], *weight_inputs],
+                [output],
+                name=f"{node.name}_MatMulNBits" if node.name else "",
+                domain=MS_DOMAIN,
+                **attributes,
+            )
+        )
+        if has_bias:
+            new_nodes.append(
+                helper.make_node(
+                    "Add", [output, node.input[2]], [node.output[0]], name=f"{node.name}_Add" if node.name else ""
+                )
+            )
+        num_packed += 1
+
+    if num_packed:
+        del graph.node[:]
+        graph.node.extend(new_nodes)
+        graph.initializer.extend(new_initializers)
+        _remove_unused(graph)
+        if not any(opset.domain == MS_DOMAIN for opset in model.opset_import):
+            model.opset_import.append(helper.make_opsetid(MS_DOMAIN, 1))
+
+    logger.info(f"Replaced {num_packed} MatMul and Gemm nodes with 4-bit weights by MatMulNBits nodes.")
+    return num_packed
+
+
+def pack_onnx_int4_weights(
+    model_path: Union[str, Path], output_path: Optional[Union[str, Path]] = None, block_size: Optional[int] = None
+) -> int:
+    """
+    Packs the 4-bit weights of an ONNX model exported from a Brevitas-quantized model with
+    [`~optimum.amd.brevitas.export.pack_int4_matmul_weights`], and saves it. The packed model can be run with the
+    `CPUExecutionProvider` of ONNX Runtime.
+
+    Args:
+        model_path (`Union[str, Path]`):
+            The path of the ONNX model.
+        output_path (`Optional[Union[str, Path]]`, defaults to `None`):
+            The path of the packed ONNX model. Defaults to `model_path`, that is overwritten.
+        block_size (`Optional[int]`, defaults to `None`):
+            The number of input features sharing a scale, see
+            [`~optimum.amd.brevitas.export.pack_int4_matmul_weights`].
+
+    Returns:
+        `int`: The number of replaced `MatMul` and `Gemm` nodes.
+    """
+    model_path = Path(model_path)
+    output_path = Path(output_path) if output_path is not None else model_path
+
+    # The external data are not loaded: the weights are read when packed, and the other initializers when saved.
+    model = onnx.load(str(model_path), load_external_data=False)
+    previous_files = _get_external_data_files(model.graph)
+    num_packed = pack_int4_matmul_weights(model, block_size=block_size, base_dir=model_path.parent)
+    # The initializers are written to external data files if the packed model is too large.
+    external_data_size = sum(
+        _get_external_data_length(tensor, model_path.parent)
+        for tensor in model.graph.initializer
+        if tensor.data_location == onnx.TensorProto.EXTERNAL
+    )
+    use_external_data = model.ByteSize() + external_data_size >= onnx.checker.MAXIMUM_PROTOBUF
+    _save_with_external_data(
+        model,
+        model_path,
+        output_path,
+        max_shard_size=convert_file_size_to_int("2GB"),
+        size_threshold=1024 if use_external_data else None,
+        previous_files=previous_files,
+    )
+    return num_packed
+
+
+class _ExternalDataWriter:
+    """
+    Appends tensors to external data files of at most `max_shard_size` bytes, named `{prefix}`, `{prefix}_1`, etc.
+    The files are written with a `.tmp` suffix until `finalize` is called.
+    """
+
+    def __init__(self, directory: Path, prefix: str, max_shard_size: Optional[int]):
+        self.directory = directory
+        self.prefix = prefix
+        self.max_shard_size = max_shard_size
+        self.locations = []
+        self.file = None
+        self.size = 0
+
+    def write(self, data: bytes) -> Tuple[str, int]:
+        if self.file is None or (
+            self.max_shard_size is not None and self.size and self.size + len(data) > self.max_shard_size
+        ):
+            self.close()
+            location = self.prefix if not self.locations else f"{self.prefix}_{len(self.locations)}"
+            self.locations.append(location)
+            self.file = open(self.directory / f"{location}.tmp", "wb")
+            self.size = 0
+
+        offset = self.size
+        self.file.write(data)
+        self.size += len(data)
+        return self.locations[-1], offset
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def finalize(self):
+        self.close()
+        for location in self.locations:
+            (self.directory / f"{location}.tmp").replace(self.directory / location)
+
+
+def _read_tensor_data(tensor: onnx.TensorProto, base_dir: Path) -> bytes:
+    if tensor.data_location == onnx.TensorProto.EXTERNAL:
+        info = ExternalDataInfo(tensor)
+        with open(base_dir / info.location, "rb") as data_file:
+            data_file.seek(info.offset or 0)
+            return data_file.read(info.length) if info.length else data_file.read()
+    if tensor.HasField("raw_data"):
+        return tensor.raw_data
+    return numpy_helper.to_array(tensor).tobytes()
+
+
+def _get_external_data_length(tensor: onnx.TensorProto, base_dir: Path) -> int:
+    info = ExternalDataInfo(tensor)
+    if info.length:
+        return info.length
+    return (base_dir / info.location).stat().st_size - (info.offset or 0)
+
+
+def _rename_inputs(graph: onnx.GraphProto, renames: Dict[str, str]):
+    for node in graph.node:
+        for i, name in enumerate(node.input):
+            if name in renames:
+                node.input[i] = renames[name]
+        for attribute in node.attribute:
+            for subgraph in [attribute.g] if attribute.HasField("g") else attribute.graphs:
+                _rename_inputs(subgraph, renames)
+
+
+def _get_external_data_files(graph: onnx.GraphProto, include_initializers: bool = True) -> Set[str]:
+    locations = set()
+    if include_initializers:
+        for tensor in graph.initializer:
+            if tensor.data_location == onnx.TensorProto.EXTERNAL:
+                locations.add(ExternalDataInfo(tensor).location)
+    for node in graph.node:
+        for attribute in node.attribute:
+            if attribute.HasField("t") and attribute.t.data_location == onnx.TensorProto.EXTERNAL:
+                locations.add(ExternalDataInfo(attribute.t).location)
+            for subgraph in [attribute.g] if attribute.HasField("g") else attribute.graphs:
+                locations.update(_get_external_data_files(subgraph))
+    return locations
+
+
+def _save_with_external_data(
+    model: onnx.ModelProto,
+    model_path: Path,
+    output_path: Path,
+    max_shard_size: Optional[int],
+    size_threshold: Optional[int],
+    previous_files: Optional[Set[str]] = None,
+) -> int:
+    """
+    Saves an ONNX model, reading its initializers one at a time, from memory or from their external data files
+    relative to `model_path`, and writing those of at least `size_threshold` bytes to external data files of at most
+    `max_shard_size` bytes. The initializers with the same type, shape and content are saved once. When overwriting
+    `model_path`, its previous external data files, and `previous_files` for a model whose external data are already
+    loaded, are removed. Returns the number of deduplicated initializers.
+    """
+    graph = model.graph
+    previous_files = set(previous_files) if previous_files is not None else set()
+    previous_files.update(_get_external_data_files(graph))
+    # The graph inputs and outputs keep their names.
+    protected = {value.name for value in graph.input} | {value.name for value in graph.output}
+    writer = _ExternalDataWriter(output_path.parent, f"{output_path.name}_data", max_shard_size)
+    seen = {}
+    renames = {}
+    deduplicated_size = 0
+    try:
+        for tensor in graph.initializer:
+            if tensor.data_type == onnx.TensorProto.STRING:
+                continue
+            data = _read_tensor_data(tensor, model_path.parent)
+            key = (tensor.data_type, tuple(tensor.dims), hashlib.sha256(data).digest())
+            if key in seen and tensor.name not in protected:
+                renames[tensor.name] = seen[key]
+                deduplicated_size += len(data)
+                continue
+            seen.setdefault(key, tensor.name)
+
+            if size_threshold is not None and len(data) >= size_threshold:
+                location, offset = writer.write(data)
+                for field in ["raw_data", "float_data", "int32_data", "int64_data", "double_data", "uint64_data"]:
+                    tensor.ClearField(field)
+                del tensor.external_data[:]
+                for key, value in [("location", location), ("offset", offset), ("length", len(data))]:
+                    tensor.external_data.add(key=key, value=str(value))
+                tensor.data_location = onnx.TensorProto.EXTERNAL
+            elif tensor.data_location == onnx.TensorProto.EXTERNAL:
+                del tensor.external_data[:]
+                tensor.data_location = onnx.TensorProto.DEFAULT
+                tensor.raw_data = data
+    finally:
+        writer.close()
+
+    if renames:
+        initializers = [tensor for tensor in graph.initializer if tensor.name not in renames]
+        del graph.initializer[:]
+        graph.initializer.extend(initializers)
+        _rename_inputs(graph, renames)
+        logger.info(
+            f"Deduplicated {len(renames)} initializers with the same content ({deduplicated_size / 2**20:.1f} MiB)."
+        )
+
+    # The previous external data files are read until here, and may have the names of the new ones.
+    if output_path.resolve() == model_path.resolve():
+        for location in previous_files - _get_external_data_files(graph, include_initializers=False):
+            (model_path.parent / location).unlink(missing_ok=True)
+    writer.finalize()
+    output_path.write_bytes(model.SerializeToString())
+    return len(renames)
+
+
+def save_onnx_external_data(
+    model_path: Union[str, Path],
+    output_path: Optional[Union[str, Path]] = None,
+    max_shard_size: Union[int, str] = "2GB",
+    size_threshold: int = 1024,
+) -> int:
+    """
+    Saves the initializers of an ONNX model to sharded external data files, `{model_name}_data`,
+    `{model_name}_data_1`, etc., without loading its external data in memory: the initializers are read and written one
+    at a time. The initializers with the same type, shape and content, such as tied weights and the scales and
+    zero-points repeated by the QCDQ export of Brevitas, are saved once.
+
+    Args:
+        model_path (`Union[str, Path]`):
+            The path of the ONNX model, whose initializers are stored in the model file or in external data files.
+        output_path (`Optional[Union[str, Path]]`, defaults to `None`):
+            The path of the saved ONNX model. Defaults to `model_path`, that is overwritten along its external data
+            files.
+        max_shard_size (`Union[int, str]`, defaults to `"2GB"`):
+            The maximum size of an external data file, in bytes or as a string such as `"5GB"`. A larger initializer is
+            written to its own file.
+        size_threshold (`int`, defaults to `1024`):
+            The minimum size in bytes of the initializers saved as external data, smaller initializers are stored in
+            the model file.
+
+    Returns:
+        `int`: The number of deduplicated initializers.
+    """
+    model_path = Path(model_path)
+    output_path = Path(output_path) if output_path is not None else model_path
+    model = onnx.load(str(model_path), load_external_data=False)
+    return _save_with_external_data(
+        model, model_path, output_path, convert_file_size_to_int(max_shard_size), size_threshold
+    )
+
+
+def onnx_export_from_quantized_model(
+    model: torch.nn.Module,
+    output: Union[str, Path],
+    task: str = "text-generation-with-past",
+    max_shard_size: Union[int, str] = "2GB",
+    export_manager=StdQCDQONNXManager,
+    opset: Optional[int] = None,
+):
+    """
+    Exports a model quantized with Brevitas to `model.onnx` with the ONNX exporter of PyTorch and the ONNX configuration
+    of `optimum.exporters.onnx` for `task`, and saves the initializers of the exported model to sharded external data
+    files with [`~optimum.amd.brevitas.export.save_onnx_external_data`].
+
+    The ONNX exporter of PyTorch writes each initializer of a model larger than 2GB to its own file, that
+    `onnx_export_from_model` would then all load in memory to save them in a single file. They are instead moved one at
+    a time to the sharded files, so that the export needs no more memory than the exporter of PyTorch. As with
+    `onnx_export_from_model(..., do_validation=False, no_post_process=True)`, the exported model is neither validated
+    nor post-processed, and a decoder exported with past key values takes them as inputs.
+
+    Args:
+        model (`torch.nn.Module`):
+            The quantized model.
+        output (`Union[str, Path]`):
+            The directory of the exported ONNX model.
+        task (`str`, defaults to `"text-generation-with-past"`):
+            The task of the export.
+        max_shard_size (`Union[int, str]`, defaults to `"2GB"`):
+            The maximum size of an external data file, see [`~optimum.amd.brevitas.export.save_onnx_external_data`].
+        export_manager (defaults to `StdQCDQONNXManager`):
+            The Brevitas export manager.
+        opset (`Optional[int]`, defaults to `None`):
+            The ONNX opset of the export. Defaults to the default opset of the ONNX configuration.
+    """
+    from optimum.exporters.tasks import TasksManager
+
+    task = TasksManager.map_from_synonym(task)
+    onnx_config_constructor = TasksManager.get_exporter_config_constructor(
+        "onnx", model=model, task=task, library_name="transformers"
+    )
+    float_dtype = {torch.float16: "fp16", torch.bfloat16: "bf16"}.get(next(model.parameters()).dtype, "fp32")
+    config_kwargs = {"use_past_in_inputs": True} if task.endswith("-with-past") else {}
+    onnx_config = onnx_config_constructor(model.config, float_dtype=float_dtype, **config_kwargs)
+
+    output = Path(output)
+    output.mkdir(parents=True, exist_ok=True)
+    onnx_path = output / "model.onnx"
+
+    model = model.eval()
+    model.config.return_dict = True
+    for key, value in (onnx_config.values_override or {}).items():
+        setattr(model.config, key, value)
+
+    dummy_inputs = onnx_config.rename_ambiguous_inputs(onnx_config.generate_dummy_inputs(framework="pt"))
+    # The Brevitas export managers hook into the TorchScript-based exporter, that is no longer the default of PyTorch.
+    export_kwargs = {"dynamo": False} if "dynamo" in inspect.signature(torch.onnx.export).parameters else {}
+    with torch.no_grad(), brevitas_proxy_export_mode(
+        model, export_manager=export_manager
+    ), onnx_config.patch_model_for_export(model):
+        inputs = onnx_config.ordered_inputs(model)
+        torch.onnx.export(
+            model,
+            (dummy_inputs,),
+            f=onnx_path.as_posix(),
+            input_names=list(inputs.keys()),
+            output_names=list(onnx_config.outputs.keys()),
+            dynamic_axes=dict(chain(inputs.items(), onnx_config.outputs.items())),
+            do_constant_folding=True,
+            opset_version=opset if opset is not None else onnx_config.DEFAULT_ONNX_OPSET,
+            **export_kwargs,
+        )
+
+    model.config.save_pretrained(output)
+    generation_config = getattr(model, "generation_config", None)
+    if generation_config is not None:
+        generation_config.save_pretrained(output)
+
+    save_onnx_external_data(onnx_path, max_shard_size=max_shard_size)
@@ -0,0 +1,275 @@
+# Copyright 2024 The HuggingFace Team. All rights reserved.
+# Licensed under the MIT License.
+"""Inference-time linear layers storing the weights quantized by Brevitas as packed low-bit integers."""
+
+import logging
+from typing import List, Optional
+
+import torch
+
+from .serialization import get_int_weight, get_quant_weight_layers, pack_int_tensor
+
+
+logger = logging.getLogger(__name__)
+
+PACKED_LINEAR_KERNELS = ["int4", "int8", "dequantize"]
+
+# The group sizes supported by the int4 CPU kernel of PyTorch.
+INT4_KERNEL_GROUP_SIZES = [256, 128, 64, 32]
+
+
+def _has_aten_op(name: str) -> bool:
+    return hasattr(torch.ops.aten, name)
+
+
+class PackedQuantLinear(torch.nn.Module):
+    """
+    A linear layer whose weight is stored as packed integers with per-tensor, per-channel or per-group scales and
+    zero-points, `weight = (int_weight - zero_point) * scale`, so that its memory reflects the bit width of the
+    quantization. The matrix multiplication uses, on CPU:
+
+    - `"int4"`: the int4 kernel of PyTorch, that dequantizes the weights on the fly, for weights of up to 4 bits whose
+        number of output features is a multiple of 16 and whose group size is 32, 64, 128 or 256 (per-channel weights
+        are split in groups of one of these sizes).
+    - `"int8"`: the int8 kernel of PyTorch, for symmetric per-tensor or per-channel weights of up to 8 bits.
+    - `"dequantize"`: the weights are unpacked and dequantized by blocks of output features, keeping the temporary float
+        weights small, followed by a float matrix multiplication.
+
+    The int4 and int8 kernels of PyTorch are only vectorized for `bfloat16`, hence are selected by default only with
+    `compute_dtype=torch.bfloat16`.
+
+    Args:
+        int_weight (`torch.Tensor`):
+            The integer weight, of shape `(out_features, in_features)`.
+        scale (`torch.Tensor`):
+            The scale, of shape `(out_features, num_groups)`, where the groups split the input features evenly.
+        zero_point (`torch.Tensor`):
+            The zero-point, of the same shape as `scale`.
+        bit_width (`int`):
+            The bit width of the integer weight.
+        signed (`bool`):
+            Whether the integer weight is signed.
+        bias (`Optional[torch.Tensor]`, defaults to `None`):
+            The bias.
+        input_quant (`Optional[torch.nn.Module]`, defaults to `None`):
+            The Brevitas quantizer of the input of the layer, applied before the matrix multiplication.
+        kernel (`Optional[str]`, defaults to `None`):
+            The kernel to use, one of `"int4"`, `"int8"` and `"dequantize"`. Defaults to the fastest kernel supporting
+            the weight and `compute_dtype`.
+        compute_dtype (`Optional[torch.dtype]`, defaults to `None`):
+            The dtype of the matrix multiplication, the output being cast back to the dtype of the input. Defaults to
+            the dtype of `scale`.
+    """
+
+    def __init__(
+        self,
+        int_weight: torch.Tensor,
+        scale: torch.Tensor,
+        zero_point: torch.Tensor,
+        bit_width: int,
+        signed: bool,
+        bias: Optional[torch.Tensor] = None,
+        input_quant: Optional[torch.nn.Module] = None,
+        kernel: Optional[str] = None,
+        compute_dtype: Optional[torch.dtype] = None,
+    ):
+        super().__init__()
+        self.out_features, self.in_features = int_weight.shape
+        self.bit_width = bit_width
+        self.signed = signed
+        self.input_quant = input_quant
+        self.compute_dtype = compute_dtype if compute_dtype is not None else scale.dtype
+        self.bias = torch.nn.Parameter(bias.detach().clone(), requires_grad=False) if bias is not None else None
+
+        num_groups = scale.shape[1]
+        if scale.shape != (self.out_features, num_groups) or self.in_features % num_groups:
+            raise ValueError(
+                f"The scale of shape {tuple(scale.shape)} does not split the weight of shape {tuple(int_weight.shape)} "
+                "in groups of input features."
+            )
+        self.group_size = self.in_features // num_groups
+        scale = scale.to(self.compute_dtype)
+        zero_point = zero_point.to(self.compute_dtype).expand_as(scale)
+
+        supported_kernels = self.get_supported_kernels(int_weight, zero_point)
+        if kernel is None:
+            kernel = supported_kernels[0] if self.compute_dtype == torch.bfloat16 else "dequantize"
+        elif kernel not in supported_kernels:
+            raise ValueError(
+                f"The kernel {kernel} does not support this weight, supported kernels: {supported_kernels}."
+            )
+        self.kernel = kernel
+
+        # The weight is stored shifted to be unsigned, `weight = uint_weight * scale + zero`.
+        offset = 2 ** (bit_width - 1) if signed and bit_width <= 8 else 0
+        if kernel == "int4":
+            kernel_group_size = next(size for size in INT4_KERNEL_GROUP_SIZES if self.group_size % size == 0)
+            repeats = self.group_size // kernel_group_size
+            scale = scale.repeat_interleave(repeats, dim=1)
+            zero_point = zero_point.repeat_interleave(repeats, dim=1)
+            self.group_size = kernel_group_size
+
+            # The kernel computes `(uint_weight - 8) * scale + zero`.
+            self.register_buffer(
+                "weight_packed",
+                torch.ops.aten._convert_weight_to_int4pack_for_cpu((int_weight + offset).to(torch.int32).cpu(), 1),
+            )
+            self.register_buffer(
+                "scales_and_zeros",
+                torch.stack([scale, (8 - offset - zero_point) * scale], dim=-1).transpose(0, 1).contiguous(),
+            )
+        elif kernel == "int8":
+            self.register_buffer("weight_packed", int_weight.to(torch.int8))
+            self.register_buffer("weight_scale", scale[:, 0].contiguous())
+        else:
+            # Each row is packed separately, so that blocks of rows can be unpacked.
+            self.register_buffer(
+                "weight_packed", torch.stack([pack_int_tensor(row, bit_width, signed) for row in int_weight])
+            )
+            self.register_buffer("weight_scale", scale.contiguous())
+            self.register_buffer("weight_zero", (-(zero_point + offset) * scale).contiguous())
+
+    def get_supported_kernels(self, int_weight: torch.Tensor, zero_point: torch.Tensor) -> List[str]:
+        kernels = []
+        on_cpu = int_weight.device.type == "cpu"
+        if (
+            on_cpu
+            and self.bit_width <= 4
+            and self.out_features % 16 == 0
+            and any(self.group_size % size == 0 for size in INT4_KERNEL_GROUP_SIZES)
+            and _has_aten_op("_weight_int4pack_mm_for_cpu")
+        ):
+            kernels.append("int4")
+        if (
+            on_cpu
+            and self.bit_width <= 8
+            and self.signed
+            and self.group_size == self.in_features
+            and not zero_point.any()
+            and _has_aten_op("_weight_int8pack_mm")
+        ):
+            kernels.append("int8")
+        kernels.append("dequantize")
+        return kernels
+
+    @classmethod
+    def from_quant_linear(
+        cls, module: torch.nn.Module, kernel: Optional[str] = None, compute_dtype: Optional[torch.dtype] = None
+    ) -> "PackedQuantLinear":
+        """
+        Converts a Brevitas `QuantLinear` to a `PackedQuantLinear`.
+        """
+        int_weight, scale, zero_point, bit_width, signed = get_int_weight(module)
+
+        # Per-tensor and per-channel parameters are one group, per-group ones are of shape `(out_features, num_groups, 1)`.
+        out_features = int_weight.shape[0]
+        scale = scale.reshape(out_features, -1) if scale.numel() > 1 else scale.reshape(1, 1).expand(out_features, 1)
+        zero_point = (
+            zero_point.reshape(out_features, -1)
+            if zero_point.numel() > 1
+            else zero_point.reshape(1, 1).expand(out_features, 1)
+        )
+
+        input_quant = module.input_quant if getattr(module, "is_input_quant_enabled", False) else None
+        return cls(
+            int_weight,
+            scale.to(module.weight.dtype),
+            zero_point,
+            bit_width,
+            signed,
+            bias=module.bias,
+            input_quant=input_quant,
+            kernel=kernel,
+            compute_dtype=compute_dtype,
+        )
+
+    def dequantize_weight(self, start: int = 0, end: Optional[int] = None) -> torch.Tensor:
+        """
+        Returns the float weight of the output features `start` to `end`, for the `"dequantize"` kernel.
+        """
+        end = self.out_features if end is None else min(end, self.out_features)
+        packed = self.weight_packed[start:end]
+        if self.bit_width <= 4:
+            uint_weight = torch.empty((*packed.shape, 2), dtype=torch.uint8, device=packed.device)
+            torch.bitwise_and(packed, 0xF, out=uint_weight[..., 0])
+            torch.bitwise_right_shift(packed, 4, out=uint_weight[..., 1])
+            packed = uint_weight.flatten(1)
+
+        # The conversion copies the weight, that can be dequantized in place.
+        weight = packed[:, : self.in_features].to(self.compute_dtype).reshape(end - start, -1, self.group_size)
+        weight.mul_(self.weight_scale[start:end, :, None]).add_(self.weight_zero[start:end, :, None])
+        return weight.reshape(end - start, self.in_features)
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        if self.input_quant is not None:
+            x = self.input_quant(x)
+            x = getattr(x, "value", x)
+
+        dtype = x.dtype
+        batch_shape = x.shape[:-1]
+        x = x.reshape(-1, self.in_features).to(self.compute_dtype).contiguous()
+        if self.kernel == "int4":
+            output = torch.ops.aten._weight_int4pack_mm_for_cpu(
+                x, self.weight_packed, self.group_size, self.scales_and_zeros
+            )
+        elif self.kernel == "int8":
+            output = torch.ops.aten._weight_int8pack_mm(x, self.weight_packed, self.weight_scale)
+        else:
+            # About 16 MiB of float weights at a time.
+            block_size = max(1, 2**22 // max(1, self.in_features))
+            output = torch.cat(
+                [
+                    torch.nn.functional.linear(x, self.dequantize_weight(start, start + block_size))
+                    for start in range(0, self.out_features, block_size)
+                ],
+                dim=-1,
+            )
+
+        output = output.to(dtype)
+        if self.bias is not None:
+            output = output + self.bias.to(dtype)
+        return output.reshape(*batch_shape, self.out_features)
+
+    def extra_repr(self) -> str:
+        return (
+            f"in_features={self.in_features}, out_features={self.out_features}, bit_width={self.bit_width}, "
+            f"group_size={self.group_size}, kernel={self.kernel}, compute_dtype={self.compute_dtype}, "
+            f"bias={self.bias is not None}"
+        )
+
+
+@torch.no_grad()
+def pack_quantized_linears(
+    model: torch.nn.Module, kernel: Optional[str] = None, compute_dtype: Optional[torch.dtype] = None
+) -> torch.nn.Module:
+    """
+    Replaces in place the linear layers of a model quantized by [`~BrevitasQuantizer.quantize`], that fake-quantize
+    their float weights, with [`~optimum.amd.brevitas.packed_linear.PackedQuantLinear`] layers storing the packed
+    integer weights. The converted model is meant for inference on CPU.
+
+    Args:
+        model (`torch.nn.Module`):
+            The quantized model.
+        kernel (`Optional[str]`, defaults to `None`):
+            The kernel of all the layers, see [`~optimum.amd.brevitas.packed_linear.PackedQuantLinear`]. Defaults to
+            the fastest kernel supporting each layer.
+        compute_dtype (`Optional[torch.dtype]`, defaults to `None`):
+            The dtype of the matrix multiplications, e.g. `torch.bfloat16` to use the int4 and int8 kernels of PyTorch
+            on a float32 model. Defaults to the dtype of the model.
+    """
+    num_layers = 0
+    for name, module in get_quant_weight_layers(model).items():
+        if not isinstance(module, torch.nn.Linear):
+            continue
+
+        parent_name, _, child_name = name.rpartition(".")
+        parent = model.get_submodule(parent_name) if parent_name else model
+        setattr(
+            parent,
+            child_name,
+            PackedQuantLinear.from_quant_linear(module, kernel=kernel, compute_dtype=compute_dtype),
+        )
+        num_layers += 1
+
+    logger.info(f"Packed the weights of {num_layers} quantized linear layers.")
+    return model
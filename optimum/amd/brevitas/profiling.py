@@ -0,0 +1,271 @@
+# Copyright 2024 The HuggingFace Team. All rights reserved.
+# Licensed under the MIT License.
+"""Per-stage wall time, peak memory and throughput of the quantization recipes of BrevitasQuantizer."""
+
+import json
+import logging
+import os
+import platform
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Union
+
+import torch
+
+
+logger = logging.getLogger(__name__)
+
+
+def get_current_rss_mb() -> Optional[float]:
+    """
+    Returns the current resident memory of the process in MiB, or `None` when it can not be read.
+    """
+    if sys.platform.startswith("linux"):
+        try:
+            with open("/proc/self/statm", "r") as statm:
+                return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+        except (OSError, ValueError, IndexError):
+            return None
+
+    try:
+        import psutil
+    except ImportError:
+        return None
+
+    return psutil.Process().memory_info().rss / 2**20
+
+
+class _RSSSampler:
+    # Polls the resident memory in a background thread, as the peak resident memory reported by the OS can not be
+    # reset between stages.
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.peak_rss_mb = get_current_rss_mb()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _sample(self):
+        rss_mb = get_current_rss_mb()
+        if rss_mb is not None:
+            self.peak_rss_mb = rss_mb if self.peak_rss_mb is None else max(self.peak_rss_mb, rss_mb)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+
+
+@dataclass
+class BrevitasStageProfile:
+    """
+    The profile of one stage of the quantization.
+
+    Args:
+        name (`str`):
+            The stage, e.g. `"tracing"`, `"weight_equalization"`, `"activation_equalization"`, `"quantize_model"`,
+            `"offload"`, `"gptq"`, `"calibration"` or `"bias_correction"`.
+        wall_time_s (`float`):
+            The duration of the stage, in seconds.
+        peak_rss_mb (`Optional[float]`, defaults to `None`):
+            The peak resident host memory during the stage, in MiB, sampled periodically.
+        rss_delta_mb (`Optional[float]`, defaults to `None`):
+            The resident host memory at the end of the stage minus at its start, in MiB.
+        peak_device_memory_mb (`Dict[str, float]`, defaults to `{}`):
+            The peak memory allocated by PyTorch on each device during the stage, in MiB.
+        num_samples (`Optional[int]`, defaults to `None`):
+            The number of calibration samples processed by the stage, for the stages running the model on data.
+    """
+
+    name: str
+    wall_time_s: float
+    peak_rss_mb: Optional[float] = None
+    rss_delta_mb: Optional[float] = None
+    peak_device_memory_mb: Dict[str, float] = field(default_factory=dict)
+    num_samples: Optional[int] = None
+
+    @property
+    def samples_per_second(self) -> Optional[float]:
+        if not self.num_samples or self.wall_time_s <= 0:
+            return None
+        return self.num_samples / self.wall_time_s
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(asdict(self), samples_per_second=self.samples_per_second)
+
+
+@dataclass
+class BrevitasQuantizationProfile:
+    """
+    The per-stage profile of a [`~BrevitasQuantizer.quantize`] call.
+
+    Args:
+        stages (`List[BrevitasStageProfile]`):
+            The profile of each stage, in execution order.
+        model_name_or_path (`Optional[str]`, defaults to `None`):
+            The quantized model.
+        quantization_config (`Dict[str, Any]`, defaults to `{}`):
+            The quantization configuration, as a dictionary.
+        environment (`Dict[str, Any]`, defaults to `{}`):
+            The software and devices the quantization ran on.
+    """
+
+    stages: List[BrevitasStageProfile]
+    model_name_or_path: Optional[str] = None
+    quantization_config: Dict[str, Any] = field(default_factory=dict)
+    environment: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def total_time_s(self) -> float:
+        return sum(stage.wall_time_s for stage in self.stages)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "model_name_or_path": self.model_name_or_path,
+            "quantization_config": self.quantization_config,
+            "environment": self.environment,
+            "total_time_s": self.total_time_s,
+            "stages": [stage.to_dict() for stage in self.stages],
+        }
+
+    def save(self, save_path: Union[str, Path]):
+        """
+        Saves the profile as JSON.
+        """
+        Path(save_path).parent.mkdir(parents=True, exist_ok=True)
+        with open(save_path, "w") as profile_file:
+            json.dump(self.to_dict(), profile_file, indent=4, default=str)
+
+    def summary(self) -> str:
+        """
+        Returns a table of the stages, with their share of the total time.
+        """
+        total_time_s = self.total_time_s
+        lines = [
+            f"{'stage':<24} {'time (s)':>10} {'share':>7} {'peak RSS (MiB)':>15} {'peak device (MiB)':>18} "
+            f"{'samples/s':>10}"
+        ]
+        for stage in self.stages:
+            peak_rss = f"{stage.peak_rss_mb:.1f}" if stage.peak_rss_mb is not None else "-"
+            peak_device = f"{max(stage.peak_device_memory_mb.values()):.1f}" if stage.peak_device_memory_mb else "-"
+            throughput = f"{stage.samples_per_second:.2f}" if stage.samples_per_second is not None else "-"
+            share = stage.wall_time_s / total_time_s if total_time_s > 0 else 0.0
+            lines.append(
+                f"{stage.name:<24} {stage.wall_time_s:>10.3f} {share:>7.1%} {peak_rss:>15} {peak_device:>18} "
+                f"{throughput:>10}"
+            )
+        lines.append(f"{'total':<24} {total_time_s:>10.3f}")
+        return "\n".join(lines)
+
+
+class BrevitasQuantizationCallback:
+    """
+    Base class of the callbacks notified of the stages of [`~BrevitasQuantizer.quantize`], e.g. to report progress or
+    to stream the profile of each stage to a monitoring system.
+    """
+
+    def on_stage_begin(self, name: str):
+        """
+        Called before a stage runs.
+        """
+
+    def on_stage_end(self, stage: BrevitasStageProfile):
+        """
+        Called after a stage ran, with its profile.
+        """
+
+
+class BrevitasStageProfiler:
+    """
+    Profiles the stages of a quantization recipe.
+
+    Args:
+        callbacks (`Optional[List[BrevitasQuantizationCallback]]`, defaults to `None`):
+            Callbacks notified at the beginning and the end of each stage.
+        rss_sample_interval (`float`, defaults to `0.01`):
+            The interval between two samples of the resident host memory, in seconds.
+    """
+
+    def __init__(
+        self, callbacks: Optional[List[BrevitasQuantizationCallback]] = None, rss_sample_interval: float = 0.01
+    ):
+        self.callbacks = list(callbacks or [])
+        self.rss_sample_interval = rss_sample_interval
+        self.stages: List[BrevitasStageProfile] = []
+
+    @contextmanager
+    def stage(self, name: str, num_samples: Optional[int] = None):
+        """
+        Profiles the code run in the context as the stage `name`.
+        """
+        for callback in self.callbacks:
+            callback.on_stage_begin(name)
+
+        num_devices = torch.cuda.device_count() if torch.cuda.is_available() else 0
+        for device in range(num_devices):
+            torch.cuda.synchronize(device)
+            torch.cuda.reset_peak_memory_stats(device)
+
+        start_rss_mb = get_current_rss_mb()
+        with _RSSSampler(self.rss_sample_interval) as sampler:
+            start = time.perf_counter()
+            yield
+            for device in range(num_devices):
+                torch.cuda.synchronize(device)
+            wall_time_s = time.perf_counter() - start
+        end_rss_mb = get_current_rss_mb()
+
+        profile = BrevitasStageProfile(
+            name=name,
+            wall_time_s=wall_time_s,
+            peak_rss_mb=sampler.peak_rss_mb,
+            rss_delta_mb=end_rss_mb - start_rss_mb if start_rss_mb is not None and end_rss_mb is not None else None,
+            peak_device_memory_mb={
+                f"cuda:{device}": torch.cuda.max_memory_allocated(device) / 2**20 for device in range(num_devices)
+            },
+            num_samples=num_samples,
+        )
+        self.stages.append(profile)
+        logger.info(f"Stage {name} took {wall_time_s:.3f} s.")
+
+        for callback in self.callbacks:
+            callback.on_stage_end(profile)
+
+    def get_profile(
+        self, model_name_or_path: Optional[str] = None, quantization_config: Optional[Dict[str, Any]] = None
+    ) -> BrevitasQuantizationProfile:
+        """
+        Returns the profile of the stages run so far.
+        """
+        environment = {
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "torch": torch.__version__,
+            "devices": [torch.cuda.get_device_name(device) for device in range(torch.cuda.device_count())]
+            if torch.cuda.is_available()
+            else [],
+        }
+        try:
+            import brevitas
+
+            environment["brevitas"] = brevitas.__version__
+        except (ImportError, AttributeError):
+            pass
+
+        return BrevitasQuantizationProfile(
+            stages=list(self.stages),
+            model_name_or_path=model_name_or_path,
+            quantization_config=quantization_config or {},
+            environment=environment,
+        )
@@ -3,6 +3,8 @@
 
 import inspect
 import logging
+from dataclasses import asdict
+from pathlib import Path
 from typing import Dict, List, Optional, Union
 
 import torch
@@ -15,10 +17,16 @@ from tqdm import tqdm
 
 from optimum.exporters import TasksManager
 from optimum.quantization_base import OptimumQuantizer
+from transformers import AutoConfig
+from transformers.modeling_utils import no_init_weights
 from transformers.utils.fx import symbolic_trace
 
 from .accelerate_utils import offload_model, remove_hooks
+from .checkpoint import BrevitasQuantizationCheckpoint, get_weight_fingerprints, skip_gptq_layers
 from .configuration import BrevitasQuantizationConfig
+from .data_utils import get_empty_past_key_values
+from .profiling import BrevitasQuantizationCallback, BrevitasQuantizationProfile, BrevitasStageProfiler
+from .serialization import load_quantization_config, load_quantized_state, save_quantized_model
 
 
 logger = logging.getLogger(__name__)
@@ -35,6 +43,9 @@ class BrevitasQuantizer(OptimumQuantizer):
         self.model_name_or_path = model_name_or_path
         self.config = self.model.config
         self.group_of_parallel_layers = None
+        self.quantization_profile: Optional[BrevitasQuantizationProfile] = None
+        self.quantization_config: Optional[BrevitasQuantizationConfig] = None
+        self.quantized_model: Optional[torch.nn.Module] = None
 
     @classmethod
     def from_pretrained(
@@ -106,17 +117,34 @@ class BrevitasQuantizer(OptimumQuantizer):
         return cls(model, model_name_or_path)
 
     def quantize(
-        self, quantization_config: BrevitasQuantizationConfig, calibration_dataset: Optional[List[Dict]] = None
+        self,
+        quantization_config: BrevitasQuantizationConfig,
+        calibration_dataset: Optional[List[Dict]] = None,
+        callbacks: Optional[List[BrevitasQuantizationCallback]] = None,
+        profile_path: Optional[Union[str, Path]] = None,
+        checkpoint_dir: Optional[Union[str, Path]] = None,
     ) -> torch.nn.Module:
         """
         Quantizes the model using Brevitas according to the `quantization_config`.
 
+        The wall time, peak host and device memory and calibration throughput of each stage of the quantization are
+        recorded in `self.quantization_profile`, a [`~optimum.amd.brevitas.profiling.BrevitasQuantizationProfile`].
+
         Arguments:
             quantization_config (`BrevitasQuantizationConfig`):
                 Quantization configuration to use to quantize the model.
             calibration_dataset (`Optional[List[Dict]]`, defaults to `None`):
                 In case the quantization involves a calibration phase, this argument needs to be specified as a list of inputs to the model.
                 Example: `calibration_dataset = [{"input_ids": torch.tensor([[1, 2, 3, 4]])}, {"input_ids": torch.tensor([[6, 7, 3, 4]])}]` which is a dataset for a model taking `input_ids` as an argument, and which has two samples.
+            callbacks (`Optional[List[BrevitasQuantizationCallback]]`, defaults to `None`):
+                Callbacks notified at the beginning and the end of each stage of the quantization.
+            profile_path (`Optional[Union[str, Path]]`, defaults to `None`):
+                If set, path where the profile of the stages is saved as JSON.
+            checkpoint_dir (`Optional[Union[str, Path]]`, defaults to `None`):
+                If set, directory where the model is checkpointed after each stage and each GPTQ layer. Calling
+                `quantize` again with the same directory, model, configuration and calibration dataset resumes an
+                interrupted quantization, skipping the completed stages and GPTQ layers. See
+                [`~optimum.amd.brevitas.checkpoint.BrevitasQuantizationCheckpoint`].
         """
 
         requires_data = (
@@ -132,25 +160,30 @@ class BrevitasQuantizer(OptimumQuantizer):
         use_accelerate = hasattr(self.model, "hf_device_map")
         dtype = next(iter(self.model.parameters())).dtype
 
+        profiler = BrevitasStageProfiler(callbacks)
+        num_samples = len(calibration_dataset) if calibration_dataset is not None else None
+        checkpoint = BrevitasQuantizationCheckpoint(
+            checkpoint_dir, quantization_config, calibration_dataset, self.model_name_or_path
+        )
+
         if quantization_config.requires_fx_graph():
             if use_accelerate:  # Remove hooks if we're converting to a fx.GraphModule
                 remove_hooks(self.model)
 
-            forward_signature = inspect.signature(self.model.forward).parameters
-            if all(
-                input_name in forward_signature for input_name in ["input_ids", "attention_mask", "past_key_values"]
-            ):
-                input_names = ["input_ids", "attention_mask", "past_key_values"]
-            else:
-                raise ValueError(
-                    f"Quantization with an FX graph is currently only supported for models taking `input_ids`, `attention_mask` and `past_key_values` as inputs. The model only has the following inputs: {forward_signature}"
-                )
+            input_names = get_fx_input_names(self.model)
 
-            with torch.no_grad():
+            checkpoint.should_run("tracing", structural=True)
+            with profiler.stage("tracing"), torch.no_grad():
                 model = symbolic_trace(self.model, input_names)
+            checkpoint.complete("tracing", model, structural=True)
 
             if use_accelerate:
-                model = offload_model(model, quantization_config.gpu_device_map, quantization_config.cpu_device_map)
+                checkpoint.should_run("offload", structural=True)
+                with profiler.stage("offload"):
+                    model = offload_model(
+                        model, quantization_config.gpu_device_map, quantization_config.cpu_device_map
+                    )
+                checkpoint.complete("offload", model, structural=True)
         else:
             model = self.model
 
@@ -158,17 +191,27 @@ class BrevitasQuantizer(OptimumQuantizer):
         # one with FX-traced, the other one not.
         # Since weights are shared across the two, we can apply weight/activation equalization
         # by using one representation or the other based on needs.
-        if quantization_config.apply_weight_equalization:
+        if quantization_config.apply_weight_equalization and checkpoint.should_run("weight_equalization"):
             logger.info("Applying weight equalization...")
-            apply_weight_equalization(model)
+            with profiler.stage("weight_equalization"):
+                apply_weight_equalization(model)
             logger.info("Weight equalization applied.")
+        if quantization_config.apply_weight_equalization:
+            checkpoint.complete("weight_equalization", model)
 
-        if quantization_config.activations_equalization is not None:
+        # Layerwise equalization inserts new nodes in the model, hence always runs.
+        layerwise = quantization_config.activations_equalization == "layerwise"
+        if quantization_config.activations_equalization is not None and checkpoint.should_run(
+            "activation_equalization", structural=layerwise
+        ):
             logger.info(
                 f"Applying Activation Equalization {quantization_config.activations_equalization} (SmoothQuant)..."
             )
-            apply_act_equalization(model, quantization_config.activations_equalization, calibration_dataset)
+            with profiler.stage("activation_equalization", num_samples=num_samples):
+                apply_act_equalization(model, quantization_config.activations_equalization, calibration_dataset)
             logger.info("Activation equalization applied.")
+        if quantization_config.activations_equalization is not None:
+            checkpoint.complete("activation_equalization", model, structural=layerwise)
 
         if use_accelerate:
             remove_hooks(model)
@@ -177,55 +220,124 @@ class BrevitasQuantizer(OptimumQuantizer):
             device = next(model.parameters()).device
 
         # We do not quantize embedding and last fully connected layer
-        model = quantize_model(
-            model,
-            dtype=dtype,
-            device=device,
-            weight_quant_format="int",
-            weight_quant_type="sym" if quantization_config.weights_symmetric else "asym",
-            weight_bit_width=quantization_config.weights_bitwidth,
-            weight_param_method=quantization_config.weights_param_method,
-            weight_scale_precision=quantization_config.scale_precision,
-            weight_quant_granularity=quantization_config.weights_quant_granularity,
-            weight_group_size=quantization_config.weights_group_size,
-            quantize_weight_zero_point=quantization_config.quantize_zero_point,
-            input_bit_width=None if quantization_config.weights_only else quantization_config.activations_bitwidth,
-            input_quant_type="sym" if quantization_config.activations_symmetric else "asym",
-            input_quant_format="int",
-            input_param_method=quantization_config.activations_param_method,
-            input_scale_precision=quantization_config.scale_precision,
-            input_scale_type="static" if quantization_config.is_static else "dynamic",
-            input_quant_granularity=quantization_config.activations_quant_granularity,
-            input_group_size=quantization_config.activations_group_size,
-            quantize_input_zero_point=quantization_config.quantize_zero_point,
-        )
+        checkpoint.should_run("quantize_model", structural=True)
+        with profiler.stage("quantize_model"):
+            model = apply_quantization(model, quantization_config, dtype, device)
+        checkpoint.complete("quantize_model", model, structural=True)
 
         if use_accelerate:
-            model = offload_model(model, quantization_config.gpu_device_map, quantization_config.cpu_device_map)
+            checkpoint.should_run("offload", structural=True)
+            with profiler.stage("offload"):
+                model = offload_model(model, quantization_config.gpu_device_map, quantization_config.cpu_device_map)
+            checkpoint.complete("offload", model, structural=True)
 
-        if quantization_config.apply_gptq:
+        if quantization_config.apply_gptq and checkpoint.should_run("gptq"):
             logger.info("Applying gptq...")
-            apply_gptq(
-                model,
-                calibration_dataset,
-                act_order=quantization_config.gptq_act_order,
-                group_of_parallel_layers=self.group_of_parallel_layers,
-            )
+            with profiler.stage("gptq", num_samples=num_samples):
+                apply_gptq(
+                    model,
+                    calibration_dataset,
+                    act_order=quantization_config.gptq_act_order,
+                    group_of_parallel_layers=self.group_of_parallel_layers,
+                    checkpoint=checkpoint,
+                )
             logger.info("GPTQ applied.")
+        if quantization_config.apply_gptq:
+            checkpoint.complete("gptq", model)
 
-        if not quantization_config.weights_only and quantization_config.is_static:
+        apply_static_calibration = not quantization_config.weights_only and quantization_config.is_static
+        if apply_static_calibration and checkpoint.should_run("calibration"):
             logger.info("Applying activation calibration...")
-            apply_calibration(model, calibration_dataset)
+            with profiler.stage("calibration", num_samples=num_samples):
+                apply_calibration(model, calibration_dataset)
             logger.info("Activation calibration applied.")
+        if apply_static_calibration:
+            checkpoint.complete("calibration", model)
 
-        if quantization_config.apply_bias_correction:
+        if quantization_config.apply_bias_correction and checkpoint.should_run("bias_correction"):
             logger.info("Applying Bias Correction...")
-            apply_bias_correction(
-                model,
-                calibration_dataset,
-            )
+            with profiler.stage("bias_correction", num_samples=num_samples):
+                apply_bias_correction(
+                    model,
+                    calibration_dataset,
+                )
             logger.info("Bias Correction applied.")
+        if quantization_config.apply_bias_correction:
+            checkpoint.complete("bias_correction", model)
+
+        self.quantization_config = quantization_config
+        self.quantized_model = model
+        self.quantization_profile = profiler.get_profile(self.model_name_or_path, asdict(quantization_config))
+        logger.info(f"Quantization profile:\n{self.quantization_profile.summary()}")
+        if profile_path is not None:
+            self.quantization_profile.save(profile_path)
+
+        return model
+
+    def save_pretrained(self, save_directory: Union[str, Path]):
+        """
+        Saves the model quantized by [`~BrevitasQuantizer.quantize`], to be reloaded with
+        [`~BrevitasQuantizer.from_quantized`] without quantizing it again. The quantized weights are stored as packed
+        integers along their scales and zero-points, e.g. two 4-bit weights per byte.
+
+        Arguments:
+            save_directory (`Union[str, Path]`):
+                Directory where the model configuration, the quantization configuration and the quantized weights
+                are saved.
+        """
+        if self.quantized_model is None:
+            raise ValueError("The model has not been quantized, please call `quantize` before `save_pretrained`.")
+
+        self.config.save_pretrained(save_directory)
+        save_quantized_model(
+            self.quantized_model,
+            save_directory,
+            self.quantization_config,
+            self.model_name_or_path,
+            next(iter(self.model.parameters())).dtype,
+        )
+
+    @classmethod
+    def from_quantized(
+        cls, save_directory: Union[str, Path], device: Optional[Union[str, torch.device]] = None
+    ) -> torch.nn.Module:
+        """
+        Loads a model saved with [`~BrevitasQuantizer.save_pretrained`]. The quantized layers are created from the
+        saved quantization configuration, and their weights are restored from the memory-mapped packed integers,
+        without running the calibration, the equalization or GPTQ again.
 
+        Arguments:
+            save_directory (`Union[str, Path]`):
+                Directory where the quantized model was saved.
+            device (`Optional[Union[str, torch.device]]`, defaults to `None`):
+                The device to load the model on. Defaults to the CPU.
+        """
+        quantization_config, config = load_quantization_config(save_directory)
+        dtype = getattr(torch, config["torch_dtype"])
+        device = torch.device(device) if device is not None else torch.device("cpu")
+
+        # The weights are loaded from the quantized checkpoint, they do not need to be initialized.
+        model_config = AutoConfig.from_pretrained(save_directory)
+        model_class = TasksManager.get_model_class_for_task("text-generation", framework="pt")
+        with no_init_weights():
+            model = model_class.from_config(model_config, torch_dtype=dtype)
+        model = model.to(device).eval()
+
+        # Only the stages changing the structure of the model are applied, the values being overwritten by the saved ones.
+        if quantization_config.requires_fx_graph():
+            with torch.no_grad():
+                model = symbolic_trace(model, get_fx_input_names(model))
+        if quantization_config.activations_equalization == "layerwise":
+            sample = {
+                "input_ids": torch.zeros((1, 1), dtype=torch.long, device=device),
+                "attention_mask": torch.ones((1, 1), dtype=torch.long, device=device),
+            }
+            if quantization_config.requires_fx_graph():
+                sample["past_key_values"] = get_empty_past_key_values(model_config, device=device)
+            apply_act_equalization(model, "layerwise", [sample])
+        model = apply_quantization(model, quantization_config, dtype, device)
+
+        load_quantized_state(model, save_directory)
         return model
 
     """
@@ -251,6 +363,50 @@ class BrevitasQuantizer(OptimumQuantizer):
     """
 
 
+def get_fx_input_names(model: torch.nn.Module) -> List[str]:
+    forward_signature = inspect.signature(model.forward).parameters
+    if all(input_name in forward_signature for input_name in ["input_ids", "attention_mask", "past_key_values"]):
+        return ["input_ids", "attention_mask", "past_key_values"]
+
+    raise ValueError(
+        f"Quantization with an FX graph is currently only supported for models taking `input_ids`, `attention_mask` and `past_key_values` as inputs. The model only has the following inputs: {forward_signature}"
+    )
+
+
+def apply_quantization(
+    model: torch.nn.Module,
+    quantization_config: BrevitasQuantizationConfig,
+    dtype: torch.dtype,
+    device: Optional[torch.device] = None,
+) -> torch.nn.Module:
+    """
+    Replaces the layers of the model with Brevitas quantized layers, according to `quantization_config`. The embedding
+    and the last fully connected layer are not quantized.
+    """
+    return quantize_model(
+        model,
+        dtype=dtype,
+        device=device,
+        weight_quant_format="int",
+        weight_quant_type="sym" if quantization_config.weights_symmetric else "asym",
+        weight_bit_width=quantization_config.weights_bitwidth,
+        weight_param_method=quantization_config.weights_param_method,
+        weight_scale_precision=quantization_config.scale_precision,
+        weight_quant_granularity=quantization_config.weights_quant_granularity,
+        weight_group_size=quantization_config.weights_group_size,
+        quantize_weight_zero_point=quantization_config.quantize_zero_point,
+        input_bit_width=None if quantization_config.weights_only else quantization_config.activations_bitwidth,
+        input_quant_type="sym" if quantization_config.activations_symmetric else "asym",
+        input_quant_format="int",
+        input_param_method=quantization_config.activations_param_method,
+        input_scale_precision=quantization_config.scale_precision,
+        input_scale_type="static" if quantization_config.is_static else "dynamic",
+        input_quant_granularity=quantization_config.activations_quant_granularity,
+        input_group_size=quantization_config.activations_group_size,
+        quantize_input_zero_point=quantization_config.quantize_zero_point,
+    )
+
+
 @torch.no_grad()
 def apply_act_equalization(
     model: torch.nn.Module, act_equalization_type: str, dataset: List[Dict], alpha: float = 0.5
@@ -284,9 +440,12 @@ def apply_gptq(
     dataset: List[Dict],
     act_order: bool = True,
     group_of_parallel_layers: Optional[List[List]] = None,
+    checkpoint: Optional[BrevitasQuantizationCheckpoint] = None,
 ) -> None:
     """
     To speed up GPTQ computation, we can look through the model to find layers that can be optimized in parallel because they do not depend on each other. A typical case is the input matrices of the attention layer. We just need to specify the suffix of the layer, and they will be matched across the entire structure.
+
+    If a `checkpoint` is given, the layers updated by each GPTQ step are saved to it, and the layers saved by an interrupted run are restored and skipped.
     """
     with gptq_mode(
         model,
@@ -295,10 +454,47 @@ def apply_gptq(
         act_order=act_order,
         create_weight_orig=False,
     ) as gptq:
-        for _ in tqdm(range(gptq.num_layers)):
+        num_layers = gptq.num_layers
+        if checkpoint is None or not checkpoint.enabled:
+            checkpoint = None
+
+        completed_layers = checkpoint.get_gptq_completed_layers() if checkpoint is not None else []
+        if completed_layers:
+            completed_layer_names = {name for layer_names in completed_layers for name in layer_names}
+            if skip_gptq_layers(gptq, list(completed_layer_names)):
+                logger.info(
+                    f"Resuming GPTQ after {len(completed_layers)} completed steps ({len(completed_layer_names)} layers)."
+                )
+                checkpoint.restore_gptq_steps(model)
+                # `num_layers` counts the GPTQ steps (a group of parallel layers is a single step), like the checkpoint.
+                num_layers -= len(completed_layers)
+            else:
+                logger.warning(
+                    "The installed Brevitas does not allow to skip the GPTQ layers completed in the checkpoint, GPTQ "
+                    "is applied to all the layers again."
+                )
+                checkpoint.clear_gptq_steps()
+
+        # The layers of each step are known to GPxQ before the update, otherwise they are found by their updated weights.
+        find_updated_layers = checkpoint is not None and not hasattr(gptq, "current_layer")
+        for _ in tqdm(range(num_layers)):
+            fingerprints = get_weight_fingerprints(model) if find_updated_layers else None
             for inps in dataset:
                 gptq.model(**inps)
+            layer_names = list(gptq.current_layer.layer_names) if hasattr(gptq, "current_layer") else []
             gptq.update()
+            if checkpoint is not None:
+                if find_updated_layers:
+                    updated_fingerprints = get_weight_fingerprints(model)
+                    layer_names = [
+                        name
+                        for name, fingerprint in updated_fingerprints.items()
+                        if fingerprints.get(name) != fingerprint
+                    ]
+                if not layer_names:
+                    # All the layers are updated, the remaining iterations would only run the dataset again.
+                    break
+                checkpoint.save_gptq_step(model, layer_names)
 
 
 @torch.no_grad()
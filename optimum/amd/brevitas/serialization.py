@@ -0,0 +1,223 @@
+# Copyright 2024 The HuggingFace Team. All rights reserved.
+# Licensed under the MIT License.
+"""Serialization of Brevitas-quantized models, with the quantized weights stored as packed integers."""
+
+import json
+import logging
+from dataclasses import asdict
+from pathlib import Path
+from typing import Any, Dict, Tuple, Union
+
+import torch
+from safetensors import safe_open
+from safetensors.torch import save_file
+
+from .configuration import BrevitasQuantizationConfig
+
+
+logger = logging.getLogger(__name__)
+
+QUANTIZATION_CONFIG_NAME = "quantization_config.json"
+QUANTIZED_WEIGHTS_NAME = "quantized_model.safetensors"
+QUANTIZATION_FORMAT_VERSION = 1
+
+
+def pack_int_tensor(tensor: torch.Tensor, bit_width: int, signed: bool) -> torch.Tensor:
+    """
+    Packs a tensor of integers on `bit_width` bits: two values per byte up to 4 bits, one value per byte up to 8 bits,
+    and as `int32` otherwise. The values are shifted to be unsigned, and flattened.
+    """
+    if bit_width > 8:
+        return tensor.to(torch.int32).flatten()
+
+    offset = 2 ** (bit_width - 1) if signed else 0
+    values = (tensor.to(torch.int32) + offset).flatten()
+    if values.numel() and (values.min() < 0 or values.max() >= 2**bit_width):
+        raise ValueError(f"The tensor can not be packed on {bit_width} bits, its values are out of range.")
+
+    if bit_width <= 4:
+        if values.numel() % 2:
+            values = torch.cat([values, values.new_zeros(1)])
+        values = values[0::2] | (values[1::2] << 4)
+    return values.to(torch.uint8)
+
+
+def unpack_int_tensor(packed: torch.Tensor, bit_width: int, signed: bool, shape: Tuple[int, ...]) -> torch.Tensor:
+    """
+    Unpacks a tensor packed with [`~optimum.amd.brevitas.serialization.pack_int_tensor`] as `int32` values of the
+    given shape.
+    """
+    if bit_width > 8:
+        return packed.to(torch.int32).reshape(shape)
+
+    values = packed.to(torch.int32)
+    if bit_width <= 4:
+        values = torch.stack([values & 0xF, values >> 4], dim=-1).flatten()
+    numel = torch.Size(shape).numel()
+    offset = 2 ** (bit_width - 1) if signed else 0
+    return (values[:numel] - offset).reshape(shape)
+
+
+def get_quant_weight_layers(model: torch.nn.Module) -> Dict[str, torch.nn.Module]:
+    """
+    Returns the layers of `model` whose weight is quantized by Brevitas.
+    """
+    return {
+        name: module
+        for name, module in model.named_modules()
+        if hasattr(module, "quant_weight") and getattr(module, "is_weight_quant_enabled", True)
+    }
+
+
+def get_int_weight(module: torch.nn.Module) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor, int, bool]:
+    """
+    Returns the integer weight of a layer quantized by Brevitas, with the shape of its weight, along its scale,
+    zero-point, bit width and signedness.
+    """
+    quant_weight = module.quant_weight()
+    int_weight = quant_weight.int().round().to(torch.int32).reshape(module.weight.shape)
+    return (
+        int_weight,
+        quant_weight.scale.detach(),
+        quant_weight.zero_point.detach(),
+        int(quant_weight.bit_width),
+        bool(quant_weight.signed),
+    )
+
+
+def dequantize_int_tensor(
+    int_weight: torch.Tensor, scale: torch.Tensor, zero_point: torch.Tensor, dtype: torch.dtype
+) -> torch.Tensor:
+    """
+    Dequantizes integer weights with their scale and zero-point, broadcasting per-tensor, per-channel or per-group
+    quantization parameters. Per-group parameters have an additional dimension, e.g. `(out_features, num_groups, 1)`.
+    """
+    shape = int_weight.shape
+    if scale.dim() > int_weight.dim():
+        int_weight = int_weight.reshape(*scale.shape[:-1], -1)
+    weight = (int_weight.to(scale.dtype) - zero_point.to(scale.dtype)) * scale
+    return weight.reshape(shape).to(dtype)
+
+
+def save_quantized_model(
+    model: torch.nn.Module,
+    save_directory: Union[str, Path],
+    quantization_config: BrevitasQuantizationConfig,
+    model_name_or_path: str,
+    dtype: torch.dtype,
+):
+    """
+    Saves a model quantized with Brevitas: the quantized weights as packed integers with their scales and zero-points,
+    and the other tensors of the model (non-quantized layers, quantization parameters of the activations, equalization
+    scales) as they are.
+    """
+    save_directory = Path(save_directory)
+    save_directory.mkdir(parents=True, exist_ok=True)
+
+    tensors = {}
+    quantized_layers = {}
+    with torch.no_grad():
+        for name, module in get_quant_weight_layers(model).items():
+            int_weight, scale, zero_point, bit_width, signed = get_int_weight(module)
+
+            tensors[f"{name}.weight_packed"] = pack_int_tensor(int_weight, bit_width, signed).cpu()
+            tensors[f"{name}.weight_scale"] = scale.cpu().contiguous()
+            tensors[f"{name}.weight_zero_point"] = zero_point.cpu().contiguous()
+            quantized_layers[name] = {
+                "bit_width": bit_width,
+                "signed": signed,
+                "shape": list(module.weight.shape),
+            }
+
+    # Tied tensors are saved once, they are restored with the tensor they share their storage with.
+    data_ptrs = set()
+    for name, tensor in model.state_dict().items():
+        module_name, _, tensor_name = name.rpartition(".")
+        if tensor.is_meta:
+            raise ValueError(
+                f"The tensor {name} is offloaded, please remove the accelerate hooks and move the model to a device "
+                "before saving it."
+            )
+        if (module_name in quantized_layers and tensor_name == "weight") or tensor.data_ptr() in data_ptrs:
+            continue
+        data_ptrs.add(tensor.data_ptr())
+        tensors[name] = tensor.detach().cpu().contiguous()
+
+    save_file(tensors, str(save_directory / QUANTIZED_WEIGHTS_NAME), metadata={"format": "pt"})
+
+    config = {
+        "quant_method": "brevitas",
+        "format_version": QUANTIZATION_FORMAT_VERSION,
+        "model_name_or_path": model_name_or_path,
+        "torch_dtype": str(dtype).replace("torch.", ""),
+        "quantization_config": asdict(quantization_config),
+        "quantized_layers": quantized_layers,
+    }
+    with open(save_directory / QUANTIZATION_CONFIG_NAME, "w") as config_file:
+        json.dump(config, config_file, indent=4)
+
+
+def load_quantization_config(save_directory: Union[str, Path]) -> Tuple[BrevitasQuantizationConfig, Dict[str, Any]]:
+    """
+    Returns the quantization configuration of a model saved with
+    [`~optimum.amd.brevitas.serialization.save_quantized_model`], and the whole saved configuration.
+    """
+    config_path = Path(save_directory) / QUANTIZATION_CONFIG_NAME
+    if not config_path.is_file():
+        raise ValueError(f"No {QUANTIZATION_CONFIG_NAME} found in {save_directory}, it is not a quantized model.")
+
+    with open(config_path, "r") as config_file:
+        config = json.load(config_file)
+    if config.get("quant_method") != "brevitas" or config.get("format_version", 0) > QUANTIZATION_FORMAT_VERSION:
+        raise ValueError(
+            f"The model in {save_directory} was not saved by this version of optimum-amd, please update optimum-amd."
+        )
+
+    return BrevitasQuantizationConfig(**config["quantization_config"]), config
+
+
+def load_quantized_state(model: torch.nn.Module, save_directory: Union[str, Path]):
+    """
+    Loads in place the state saved with [`~optimum.amd.brevitas.serialization.save_quantized_model`] into a model with
+    the same quantized layers, dequantizing the packed weights. The file is memory-mapped, and read tensor by tensor.
+    """
+    _, config = load_quantization_config(save_directory)
+    quantized_layers = config["quantized_layers"]
+
+    state = model.state_dict(keep_vars=True)
+    modules = dict(model.named_modules())
+    loaded_data_ptrs = set()
+    with torch.no_grad(), safe_open(str(Path(save_directory) / QUANTIZED_WEIGHTS_NAME), framework="pt") as state_file:
+        keys = set(state_file.keys())
+        for key in keys:
+            module_name, _, tensor_name = key.rpartition(".")
+            if module_name in quantized_layers and tensor_name.startswith("weight_"):
+                continue
+            if key not in state:
+                module = modules.get(module_name)
+                if tensor_name != "bias" or module is None or getattr(module, "bias", 0) is not None:
+                    raise ValueError(f"The saved tensor {key} does not match any tensor of the model.")
+                # Bias correction adds a bias to the layers that had none.
+                module.bias = torch.nn.Parameter(state_file.get_tensor(key).to(module.weight.device))
+                state[key] = module.bias
+            state[key].copy_(state_file.get_tensor(key))
+            loaded_data_ptrs.add(state[key].data_ptr())
+
+        for name, layer in quantized_layers.items():
+            weight = modules[name].weight
+            int_weight = unpack_int_tensor(
+                state_file.get_tensor(f"{name}.weight_packed"), layer["bit_width"], layer["signed"], layer["shape"]
+            )
+            weight.copy_(
+                dequantize_int_tensor(
+                    int_weight,
+                    state_file.get_tensor(f"{name}.weight_scale"),
+                    state_file.get_tensor(f"{name}.weight_zero_point"),
+                    weight.dtype,
+                )
+            )
+            loaded_data_ptrs.add(weight.data_ptr())
+
+    missing = [name for name, tensor in state.items() if tensor.data_ptr() not in loaded_data_ptrs]
+    if missing:
+        raise ValueError(f"The tensors {missing} of the model are missing from {save_directory}.")
@@ -1,24 +1,139 @@
+import json
 import os
+import shutil
+import signal
+import subprocess
 import sys
-from argparse import ArgumentParser
+import threading
+from argparse import REMAINDER, ArgumentParser
 
-from .topology_utils import extract_max_avg_bandwidth_cluster, get_bandwidth_matrix
+from .topology_utils import (
+    CLUSTER_OBJECTIVES,
+    TOPOLOGY_CACHE_DIR,
+    AmdSmiTopologySource,
+    FileTopologySource,
+    format_cpu_list,
+    get_available_devices,
+    get_rank_affinities,
+    get_topology,
+    select_bandwidth_cluster,
+)
 
 
-def amdrun():
+NUMA_POLICIES = ["bind", "preferred", "none"]
+
+# The rendezvous and elasticity options forwarded to torchrun, with their argparse keyword arguments.
+TORCHRUN_ARGUMENTS = {
+    "--nnodes": {"type": str, "help": "Number of nodes, or the range `MIN:MAX` of nodes of an elastic job."},
+    "--node_rank": {"type": int, "help": "Rank of the node for multi-node static rendezvous."},
+    "--master_addr": {"type": str, "help": "Address of the master node for static rendezvous."},
+    "--master_port": {"type": int, "help": "Port on the master node for static rendezvous."},
+    "--rdzv_backend": {"type": str, "help": "Rendezvous backend, e.g. `c10d`."},
+    "--rdzv_endpoint": {"type": str, "help": "Rendezvous backend endpoint, usually `<host>:<port>`."},
+    "--rdzv_id": {"type": str, "help": "User-defined id of the job, shared by its nodes."},
+    "--rdzv_conf": {"type": str, "help": "Additional rendezvous configuration, `<key1>=<value1>,...`."},
+    "--standalone": {"action": "store_true", "help": "Single-node job with a local rendezvous."},
+    "--max_restarts": {"type": int, "help": "Maximum number of worker group restarts before failing."},
+    "--monitor_interval": {"type": float, "help": "Interval in seconds to monitor the state of the workers."},
+    "--role": {"type": str, "help": "User-defined role of the workers."},
+    "--log_dir": {"type": str, "help": "Base directory of the logs of the workers."},
+    "--local_addr": {"type": str, "help": "Address of the local node."},
+}
+
+
+def get_rank_command(script, script_args, affinity, numa_policy="preferred", numactl=None):
+    """
+    Returns the command running `script` for a rank with the given affinity, and the CPUs to bind the rank to when
+    `numactl` is not available (`None` if `numactl` does the binding or there is nothing to bind).
+    """
+    command = [sys.executable, "-u", script, *script_args]
+
+    if numa_policy == "none" or affinity is None or affinity["numa_node"] < 0 or not affinity["cpus"]:
+        return command, None
+
+    if numactl is None:
+        return command, affinity["cpus"]
+
+    memory_policy = "--membind" if numa_policy == "bind" else "--preferred"
+    return [
+        numactl,
+        f"--physcpubind={format_cpu_list(affinity['cpus'])}",
+        f"{memory_policy}={affinity['numa_node']}",
+        *command,
+    ], None
+
+
+def get_launch_command(
+    script, script_args, nproc_per_node, cluster, affinities, numa_policy="preferred", torchrun_args=None
+):
+    """
+    Returns the `torchrun` command and the environment launching `script` on the devices of `cluster`, each rank going
+    through the rank launcher of this module to be bound to its NUMA node.
+    """
+    env = dict(os.environ)
+    env["CUDA_VISIBLE_DEVICES"] = ",".join(map(str, cluster))
+    env["AMDRUN_NUMA_POLICY"] = numa_policy
+    env["AMDRUN_RANK_AFFINITY"] = json.dumps(affinities)
+
+    command = [sys.executable, "-m", "torch.distributed.run", f"--nproc_per_node={nproc_per_node}"]
+    command.extend(torchrun_args or [])
+    command.extend(["-m", "optimum.amd.cli", script, *script_args])
+    return command, env
+
+
+def get_torchrun_args(args):
     """
-    An alternative to torchrun that's optimized to maximize inter-devices bandwidth.
+    Returns the torchrun options set in the parsed `args`, as command line arguments.
+    """
+    torchrun_args = []
+    for option, kwargs in TORCHRUN_ARGUMENTS.items():
+        value = getattr(args, option[2:])
+        if kwargs.get("action") == "store_true":
+            if value:
+                torchrun_args.append(option)
+        elif value is not None:
+            torchrun_args.append(f"{option}={value}")
+
+    return torchrun_args
 
-    Usage: amdrun --ngpus <num_gpus> <script> <script_args>
+
+def run_with_signal_forwarding(command, env=None, signals=None):
+    """
+    Runs a command in a subprocess, forwarding to it the given signals (SIGINT, SIGTERM and SIGHUP by default) received
+    by this process, and returns its exit code. A subprocess killed by a signal returns `128 + signal`, as in shells.
     """
+    if signals is None:
+        signals = [signal.SIGINT, signal.SIGTERM] + ([signal.SIGHUP] if hasattr(signal, "SIGHUP") else [])
 
-    # 4 is the minimum number of arguments required (amdrun --ngpus <num_gpus> <script>)
-    assert len(sys.argv) >= 4, "Usage: amdrun --ngpus <num_gpus> <script> <script_args>"
+    process = subprocess.Popen(command, env=env)
 
-    script, *script_args = sys.argv[3:]
-    sys.argv = sys.argv[:3]
+    def forward(signum, frame):
+        process.send_signal(signum)
 
-    parser = ArgumentParser()
+    # Signal handlers can only be set from the main thread, other threads just wait for the subprocess.
+    previous_handlers = {}
+    if threading.current_thread() is threading.main_thread():
+        previous_handlers = {signum: signal.signal(signum, forward) for signum in signals}
+    try:
+        returncode = process.wait()
+    finally:
+        for signum, handler in previous_handlers.items():
+            signal.signal(signum, handler)
+
+    return 128 - returncode if returncode < 0 else returncode
+
+
+def amdrun(argv=None):
+    """
+    An alternative to torchrun that's optimized to maximize inter-devices bandwidth, and that binds each rank to the
+    CPUs and memory of the NUMA node of its device. The ranks are ordered along the fastest ring through the devices.
+
+    For multi-node jobs, amdrun is run on every node with the rendezvous options of torchrun, each node selecting its
+    own devices from its local topology.
+
+    Usage: amdrun --ngpus <num_gpus> [--nnodes <num_nodes> --rdzv_endpoint <host:port> ...] <script> <script_args>
+    """
+    parser = ArgumentParser(prog="amdrun")
     parser.add_argument(
         "--nproc_per_node",
         "--ngpus",
@@ -26,22 +141,149 @@ def amdrun():
         default=2,
         help="Number of processes to run per node or equivalently the number of GPUs to use",
     )
+    parser.add_argument(
+        "--cluster-objective",
+        choices=CLUSTER_OBJECTIVES,
+        default="avg",
+        help=(
+            "How to select the devices: `avg` maximizes the average bandwidth between devices, `min_link` the slowest "
+            "link between any two devices, `ring` the slowest link of the ring through the devices, and `allreduce` "
+            "minimizes the estimated time of a ring all-reduce, accounting for the latency of multi-hop routes."
+        ),
+    )
+    parser.add_argument(
+        "--allreduce-message-size",
+        type=float,
+        default=64,
+        help="Message size in MB of the all-reduce estimated by the `allreduce` objective.",
+    )
+    parser.add_argument(
+        "--link-latency",
+        type=float,
+        default=10,
+        help="Latency in microseconds of each hop of a route, used by the `allreduce` objective.",
+    )
+    parser.add_argument(
+        "--numa-policy",
+        choices=NUMA_POLICIES,
+        default="preferred",
+        help=(
+            "Memory policy of the ranks on the NUMA node of their device: `bind` restricts the allocations to it, "
+            "`preferred` falls back to other nodes when it is full, `none` disables the CPU and memory binding."
+        ),
+    )
+    parser.add_argument(
+        "--topology-file",
+        type=str,
+        default=os.environ.get("AMDRUN_TOPOLOGY_FILE"),
+        help="A JSON file describing a simulated topology, used instead of querying amdsmi.",
+    )
+    parser.add_argument("--no-topology-cache", action="store_true", help="Always query the topology.")
+    parser.add_argument(
+        "--topology-cache-dir",
+        type=str,
+        default=os.environ.get("AMDRUN_TOPOLOGY_CACHE_DIR", TOPOLOGY_CACHE_DIR),
+        help="Directory where the topology of the host is cached.",
+    )
+    parser.add_argument(
+        "--min-free-memory",
+        type=float,
+        default=None,
+        help="Only use the devices with at least this much free memory in MB at launch time.",
+    )
+    parser.add_argument(
+        "--max-utilization",
+        type=float,
+        default=None,
+        help="Only use the devices with at most this utilization in percent at launch time.",
+    )
+    parser.add_argument("--dry-run", action="store_true", help="Print the launch command without running it.")
+    for option, kwargs in TORCHRUN_ARGUMENTS.items():
+        parser.add_argument(option, option.replace("_", "-"), dest=option[2:], default=None, **kwargs)
+    parser.add_argument("script", type=str, help="The script to launch.")
+    parser.add_argument("script_args", nargs=REMAINDER, help="The arguments of the script.")
 
-    args = parser.parse_args()
-    ngpus = args.ngpus
+    args = parser.parse_args(argv)
+    ngpus = args.nproc_per_node
 
-    bandwidth_matrix = get_bandwidth_matrix()
-    max_avg_bandwidth_cluster, max_avg_bandwidth = extract_max_avg_bandwidth_cluster(bandwidth_matrix, ngpus)
+    source = FileTopologySource(args.topology_file) if args.topology_file else AmdSmiTopologySource()
+    topology = get_topology(source, cache_dir=args.topology_cache_dir, use_cache=not args.no_topology_cache)
 
-    print(f"MaxAvg NUMA bandwidth cluster: {max_avg_bandwidth_cluster}")
-    print(f"MaxAvg NUMA bandwidth: {max_avg_bandwidth}")
+    devices = None
+    if args.min_free_memory is not None or args.max_utilization is not None:
+        # The usage of the devices is live, hence never cached.
+        devices = get_available_devices(source.query_usage(), args.min_free_memory, args.max_utilization)
+        print(f"Available devices: {devices}")
+        if len(devices) < ngpus:
+            parser.error(
+                f"Only {len(devices)} devices have at least {args.min_free_memory} MB of free memory and at most "
+                f"{args.max_utilization}% of utilization, {ngpus} are required."
+            )
 
-    CUDA_VISIBLE_DEVICES = ",".join(list(map(str, max_avg_bandwidth_cluster)))
+    cluster, value = select_bandwidth_cluster(
+        topology["bandwidth_matrix"],
+        ngpus,
+        devices=devices,
+        objective=args.cluster_objective,
+        link_hops=topology.get("link_hops"),
+        message_size=args.allreduce_message_size,
+        link_latency=args.link_latency * 1e-6,
+    )
 
-    # run the script
-    if len(script_args) > 0:
-        os.system(
-            f"CUDA_VISIBLE_DEVICES={CUDA_VISIBLE_DEVICES} torchrun --nproc_per_node={ngpus} {script} {' '.join(script_args)}"
-        )
+    print(f"Best {args.cluster_objective} cluster in ring order: {cluster}")
+    if args.cluster_objective == "allreduce":
+        print(f"Estimated all-reduce time of {args.allreduce_message_size} MB: {value * 1e3:.3f} ms")
     else:
-        os.system(f"CUDA_VISIBLE_DEVICES={CUDA_VISIBLE_DEVICES} torchrun --nproc_per_node={ngpus} {script}")
+        print(f"{args.cluster_objective} bandwidth: {value}")
+
+    affinities = get_rank_affinities(topology, cluster)
+    if args.numa_policy != "none":
+        for rank, affinity in enumerate(affinities):
+            if affinity["cpus"]:
+                print(
+                    f"Rank {rank}: device {affinity['device']}, NUMA node {affinity['numa_node']}, "
+                    f"CPUs {format_cpu_list(affinity['cpus'])}"
+                )
+            else:
+                print(f"Rank {rank}: device {affinity['device']}, no known NUMA affinity")
+
+    command, env = get_launch_command(
+        args.script, args.script_args, ngpus, cluster, affinities, args.numa_policy, get_torchrun_args(args)
+    )
+    print(f"CUDA_VISIBLE_DEVICES={env['CUDA_VISIBLE_DEVICES']} {' '.join(command)}")
+    if args.dry_run:
+        return 0
+
+    # run the script
+    return run_with_signal_forwarding(command, env=env)
+
+
+def launch_rank():
+    """
+    Runs a script for the local rank set by `torchrun`, bound to the CPUs and NUMA node given by `amdrun`.
+
+    Usage: python -m optimum.amd.cli <script> <script_args>
+    """
+    script, *script_args = sys.argv[1:]
+
+    affinities = json.loads(os.environ.get("AMDRUN_RANK_AFFINITY", "[]"))
+    local_rank = int(os.environ.get("LOCAL_RANK", 0))
+    affinity = affinities[local_rank] if local_rank < len(affinities) else None
+
+    command, cpus = get_rank_command(
+        script,
+        script_args,
+        affinity,
+        numa_policy=os.environ.get("AMDRUN_NUMA_POLICY", "preferred"),
+        numactl=shutil.which("numactl"),
+    )
+    if cpus is not None and hasattr(os, "sched_setaffinity"):
+        # Without numactl, only the CPU binding is applied; the memory follows the first-touch policy of the kernel.
+        os.sched_setaffinity(0, cpus)
+
+    sys.stdout.flush()
+    os.execvp(command[0], command)
+
+
+if __name__ == "__main__":
+    launch_rank()
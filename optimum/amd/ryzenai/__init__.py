@@ -7,6 +7,7 @@ from transformers.utils import OptionalDependencyNotAvailable, _LazyModule
 
 
 _import_structure = {
+    "benchmark": ["RyzenAIBenchmarkReport", "RyzenAIBenchmarkResult"],
     "configuration": ["RyzenAIConfig", "QuantizationConfig", "AutoQuantizationConfig"],
     "modeling": [
         "RyzenAIModel",
@@ -15,14 +16,22 @@ _import_structure = {
         "RyzenAIModelForImageSegmentation",
         "RyzenAIModelForImageToImage",
         "RyzenAIModelForObjectDetection",
+        "RyzenAIShapeBucketedModel",
     ],
+    "operators": ["RyzenAIOperatorsDiff", "RyzenAIOperatorsReport"],
+    "partition": ["RyzenAIPartitionPreview"],
+    "processing": ["RyzenAIDetectionPostprocessor", "RyzenAIDetections", "RyzenAIImagePreprocessor"],
+    "profiling": ["RyzenAINodeProfile", "RyzenAIProfilingReport"],
     "quantization": ["RyzenAIOnnxQuantizer"],
+    "sensitivity": ["RyzenAILayerSensitivity", "RyzenAISensitivityReport"],
+    "sweep": ["RyzenAISweepReport", "RyzenAISweepResult"],
     "version": ["__version__"],
 }
 
 
 # Direct imports for type-checking
 if TYPE_CHECKING:
+    from .benchmark import RyzenAIBenchmarkReport, RyzenAIBenchmarkResult
     from .configuration import AutoQuantizationConfig, QuantizationConfig, RyzenAIConfig
     from .modeling import (
         RyzenAIModel,
@@ -31,8 +40,15 @@ if TYPE_CHECKING:
         RyzenAIModelForImageSegmentation,
         RyzenAIModelForImageToImage,
         RyzenAIModelForObjectDetection,
+        RyzenAIShapeBucketedModel,
     )
+    from .operators import RyzenAIOperatorsDiff, RyzenAIOperatorsReport
+    from .partition import RyzenAIPartitionPreview
+    from .processing import RyzenAIDetectionPostprocessor, RyzenAIDetections, RyzenAIImagePreprocessor
+    from .profiling import RyzenAINodeProfile, RyzenAIProfilingReport
     from .quantization import RyzenAIOnnxQuantizer
+    from .sensitivity import RyzenAILayerSensitivity, RyzenAISensitivityReport
+    from .sweep import RyzenAISweepReport, RyzenAISweepResult
     from .version import __version__
 else:
     import sys
@@ -0,0 +1,377 @@
+# Copyright 2024 The HuggingFace Team. All rights reserved.
+# Licensed under the MIT License.
+"""Latency, throughput, load time and memory benchmark of RyzenAIModel classes."""
+
+import inspect
+import json
+import os
+import platform
+import sys
+import time
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Type, Union
+
+import numpy as np
+import onnx
+import onnxruntime as ort
+
+from transformers import PretrainedConfig
+
+from ..version import __version__
+from .modeling import RyzenAIModel, _get_numpy_dtype
+
+
+@dataclass
+class RyzenAIBenchmarkResult:
+    """
+    The measures of one model for one batch size and one number of threads.
+
+    Args:
+        model_name (`str`):
+            The name of the benchmarked model.
+        batch_size (`int`):
+            The number of samples per run.
+        num_threads (`int`):
+            The number of intra-op threads of the session, `0` for the ONNX Runtime default.
+        load_time_s (`float`):
+            The time to create the model, i.e. its inference session, in seconds.
+        latencies_ms (`List[float]`):
+            The latency of each run, warmup runs excluded, in milliseconds.
+        peak_rss_mb (`float`):
+            The peak resident memory of the process at the end of the runs, in MiB.
+    """
+
+    model_name: str
+    batch_size: int
+    num_threads: int
+    load_time_s: float
+    latencies_ms: List[float]
+    peak_rss_mb: float
+
+    def percentile_ms(self, percentile: float) -> float:
+        return float(np.percentile(self.latencies_ms, percentile)) if self.latencies_ms else 0.0
+
+    @property
+    def throughput(self) -> float:
+        """
+        The number of samples processed per second.
+        """
+        total_time_s = sum(self.latencies_ms) / 1000
+        return self.batch_size * len(self.latencies_ms) / total_time_s if total_time_s else 0.0
+
+    def to_dict(self, include_latencies: bool = False) -> Dict[str, Any]:
+        result = asdict(self)
+        if not include_latencies:
+            result.pop("latencies_ms")
+        result.update(
+            num_runs=len(self.latencies_ms),
+            mean_ms=float(np.mean(self.latencies_ms)) if self.latencies_ms else 0.0,
+            p50_ms=self.percentile_ms(50),
+            p95_ms=self.percentile_ms(95),
+            p99_ms=self.percentile_ms(99),
+            throughput=self.throughput,
+        )
+        return result
+
+
+@dataclass
+class RyzenAIBenchmarkReport:
+    """
+    The benchmark results of several models, with the environment they were measured in.
+
+    Args:
+        results (`List[RyzenAIBenchmarkResult]`):
+            The results, one per model, batch size and number of threads.
+        environment (`Dict[str, Any]`, defaults to the current environment):
+            The versions of the libraries, the platform and the number of CPUs.
+    """
+
+    results: List[RyzenAIBenchmarkResult]
+    environment: Dict[str, Any] = field(default_factory=lambda: get_environment())
+
+    def to_dict(self, include_latencies: bool = False) -> Dict[str, Any]:
+        return {
+            "environment": self.environment,
+            "results": [result.to_dict(include_latencies=include_latencies) for result in self.results],
+        }
+
+    def save(self, save_path: Union[str, Path], include_latencies: bool = False):
+        """
+        Saves the report as JSON.
+        """
+        with open(save_path, "w") as save_file:
+            json.dump(self.to_dict(include_latencies=include_latencies), save_file, indent=2)
+
+    @staticmethod
+    def load_results(report_path: Union[str, Path]) -> List[Dict[str, Any]]:
+        """
+        Loads the results of a report saved with [`~RyzenAIBenchmarkReport.save`].
+        """
+        with open(report_path, "r") as report_file:
+            return json.load(report_file)["results"]
+
+    def compare(
+        self, baseline_results: List[Dict[str, Any]], metric: str = "p50_ms", tolerance: float = 0.1
+    ) -> List[Dict[str, Any]]:
+        """
+        Compares the results to the results of a previous report, e.g. of the previous release.
+
+        Args:
+            baseline_results (`List[Dict[str, Any]]`):
+                The baseline results, e.g. from [`~RyzenAIBenchmarkReport.load_results`].
+            metric (`str`, defaults to `"p50_ms"`):
+                The compared metric. Higher is worse, except for `"throughput"`.
+            tolerance (`float`, defaults to `0.1`):
+                The relative degradation tolerated before a result is flagged as a regression.
+
+        Returns:
+            `List[Dict[str, Any]]`: The model, batch size, number of threads, baseline and current values, relative
+            change and regression flag of every result found in the baseline.
+        """
+        baseline = {
+            (result["model_name"], result["batch_size"], result["num_threads"]): result[metric]
+            for result in baseline_results
+        }
+        higher_is_better = metric == "throughput"
+
+        comparisons = []
+        for result in self.results:
+            key = (result.model_name, result.batch_size, result.num_threads)
+            if key not in baseline:
+                continue
+            value = result.to_dict()[metric]
+            change = (value - baseline[key]) / baseline[key] if baseline[key] else 0.0
+            comparisons.append(
+                {
+                    "model_name": result.model_name,
+                    "batch_size": result.batch_size,
+                    "num_threads": result.num_threads,
+                    "baseline": baseline[key],
+                    "current": value,
+                    "change": change,
+                    "regression": -change > tolerance if higher_is_better else change > tolerance,
+                }
+            )
+
+        return comparisons
+
+    def summary(self) -> str:
+        """
+        Returns a human readable table of the results.
+        """
+        lines = [
+            f"{'Model':<40} {'Batch':>5} {'Threads':>7} {'Load (s)':>9} {'p50 (ms)':>9} {'p95 (ms)':>9} "
+            f"{'p99 (ms)':>9} {'Samples/s':>10} {'RSS (MiB)':>10}"
+        ]
+        for result in self.results:
+            lines.append(
+                f"{result.model_name[:40]:<40} {result.batch_size:>5} {result.num_threads:>7} "
+                f"{result.load_time_s:>9.3f} {result.percentile_ms(50):>9.3f} {result.percentile_ms(95):>9.3f} "
+                f"{result.percentile_ms(99):>9.3f} {result.throughput:>10.1f} {result.peak_rss_mb:>10.1f}"
+            )
+
+        return "\n".join(lines)
+
+
+def get_environment() -> Dict[str, Any]:
+    """
+    Returns the versions and the platform the benchmark runs on, to tell apart results from different environments.
+    """
+    return {
+        "optimum_amd_version": __version__,
+        "onnxruntime_version": ort.__version__,
+        "onnx_version": onnx.__version__,
+        "numpy_version": np.__version__,
+        "python_version": platform.python_version(),
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "available_providers": ort.get_available_providers(),
+    }
+
+
+def get_peak_rss_mb() -> float:
+    """
+    Returns the peak resident memory of the current process, in MiB.
+    """
+    if sys.platform == "win32":
+        import ctypes
+        from ctypes import wintypes
+
+        class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+            _fields_ = [
+                ("cb", wintypes.DWORD),
+                ("PageFaultCount", wintypes.DWORD),
+                ("PeakWorkingSetSize", ctypes.c_size_t),
+                ("WorkingSetSize", ctypes.c_size_t),
+                ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                ("PagefileUsage", ctypes.c_size_t),
+                ("PeakPagefileUsage", ctypes.c_size_t),
+            ]
+
+        counters = PROCESS_MEMORY_COUNTERS()
+        counters.cb = ctypes.sizeof(counters)
+        process = ctypes.windll.kernel32.GetCurrentProcess()
+        ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb)
+        return counters.PeakWorkingSetSize / 2**20
+
+    import resource
+
+    # `ru_maxrss` is in bytes on macOS and in kilobytes on Linux.
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak_rss / 2**20 if sys.platform == "darwin" else peak_rss / 2**10
+
+
+def get_dummy_inputs(model: RyzenAIModel, batch_size: int, seed: int = 0) -> Dict[str, np.ndarray]:
+    """
+    Returns random inputs of the given batch size, matching the other dimensions and the types of the model inputs.
+    """
+    rng = np.random.default_rng(seed)
+    inputs = {}
+    for model_input in model.model.get_inputs():
+        shape = (batch_size, *model_input.shape[1:])
+        if not all(isinstance(dim, int) and dim > 0 for dim in shape):
+            raise ValueError(f"The input {model_input.name} has dynamic dimensions {model_input.shape}.")
+        dtype = _get_numpy_dtype(model_input.type)
+        if np.issubdtype(dtype, np.floating):
+            inputs[model_input.name] = rng.standard_normal(shape).astype(dtype)
+        else:
+            inputs[model_input.name] = rng.integers(0, 2, size=shape).astype(dtype)
+
+    return inputs
+
+
+def measure_latencies(
+    model: RyzenAIModel, inputs: Dict[str, np.ndarray], num_runs: int = 100, num_warmup_runs: int = 10
+) -> List[float]:
+    """
+    Runs the model `forward` on the inputs and returns the latency of each run, warmup runs excluded, in milliseconds.
+    """
+    if num_runs <= 0:
+        raise ValueError(f"num_runs should be >= 1 (got: {num_runs}).")
+
+    # The task-specific `forward`s take the pixel values positionally, the custom tasks take the inputs by name.
+    takes_kwargs = any(
+        parameter.kind == inspect.Parameter.VAR_KEYWORD
+        for parameter in inspect.signature(model.forward).parameters.values()
+    )
+
+    def run():
+        return model(**inputs) if takes_kwargs else model(*inputs.values())
+
+    for _ in range(num_warmup_runs):
+        run()
+
+    latencies = []
+    for _ in range(num_runs):
+        start = time.perf_counter()
+        run()
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    return latencies
+
+
+def benchmark_model(
+    load_model: Callable[[ort.SessionOptions], RyzenAIModel],
+    model_name: str,
+    batch_sizes: List[int],
+    num_threads: List[int],
+    num_runs: int = 100,
+    num_warmup_runs: int = 10,
+    session_options: Optional[Dict[str, Any]] = None,
+) -> List[RyzenAIBenchmarkResult]:
+    """
+    Benchmarks a model for every combination of batch size and number of intra-op threads.
+
+    A session is created per number of threads, as the thread pools are fixed at session creation. The peak resident
+    memory is process wide and never decreases, so the models should be benchmarked in separate processes to compare
+    their memory usage.
+
+    Args:
+        load_model (`Callable[[onnxruntime.SessionOptions], RyzenAIModel]`):
+            Creates the model with the given session options, e.g. `RyzenAIModelForImageClassification.from_pretrained`.
+        model_name (`str`):
+            The name of the model in the results.
+        batch_sizes (`List[int]`):
+            The batch sizes to benchmark. Batches larger than the static batch size of the model are split.
+        num_threads (`List[int]`):
+            The numbers of intra-op threads to benchmark, `0` for the ONNX Runtime default.
+        num_runs (`int`, defaults to `100`):
+            The number of measured runs.
+        num_warmup_runs (`int`, defaults to `10`):
+            The number of runs before the measures.
+        session_options (`Optional[Dict[str, Any]]`, defaults to `None`):
+            Other `onnxruntime.SessionOptions` attributes to set, e.g.
+            `{"graph_optimization_level": onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL}`.
+
+    Returns:
+        `List[RyzenAIBenchmarkResult]`: The results, per number of threads and batch size.
+    """
+    results = []
+    for threads in num_threads:
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = threads
+        for name, value in (session_options or {}).items():
+            if not hasattr(options, name):
+                raise ValueError(f"onnxruntime.SessionOptions has no attribute {name}.")
+            setattr(options, name, value)
+
+        start = time.perf_counter()
+        model = load_model(options)
+        load_time_s = time.perf_counter() - start
+
+        for batch_size in batch_sizes:
+            latencies_ms = measure_latencies(
+                model, get_dummy_inputs(model, batch_size), num_runs=num_runs, num_warmup_runs=num_warmup_runs
+            )
+            results.append(
+                RyzenAIBenchmarkResult(
+                    model_name=model_name,
+                    batch_size=batch_size,
+                    num_threads=threads,
+                    load_time_s=load_time_s,
+                    latencies_ms=latencies_ms,
+                    peak_rss_mb=get_peak_rss_mb(),
+                )
+            )
+
+        del model
+
+    return results
+
+
+def benchmark_model_path(
+    model_path: Union[str, Path],
+    model_class: Type[RyzenAIModel],
+    provider: str = "CPUExecutionProvider",
+    provider_options: Optional[Dict[str, Any]] = None,
+    model_name: Optional[str] = None,
+    **kwargs,
+) -> List[RyzenAIBenchmarkResult]:
+    """
+    Benchmarks a local ONNX model loaded with a RyzenAIModel class, see [`benchmark_model`] for the other arguments.
+
+    Args:
+        model_path (`Union[str, Path]`):
+            Path to the ONNX model.
+        model_class (`Type[RyzenAIModel]`):
+            The class running the model, e.g. `RyzenAIModelForImageClassification`.
+        provider (`str`, defaults to `"CPUExecutionProvider"`):
+            The ONNX Runtime provider to run the model with.
+        provider_options (`Optional[Dict[str, Any]]`, defaults to `None`):
+            The provider options.
+        model_name (`Optional[str]`, defaults to `None`):
+            The name of the model in the results. Defaults to the file name.
+    """
+
+    def load_model(session_options):
+        session = RyzenAIModel.load_model(
+            model_path, provider=provider, session_options=session_options, provider_options=provider_options
+        )
+        return model_class(session, config=PretrainedConfig())
+
+    return benchmark_model(load_model, model_name or Path(model_path).name, **kwargs)
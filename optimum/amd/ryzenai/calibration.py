@@ -0,0 +1,533 @@
+# Copyright 2024 The HuggingFace Team. All rights reserved.
+# Licensed under the MIT License.
+"""Calibration data reading and sharded collection of the activations statistics used for static quantization."""
+
+import hashlib
+import itertools
+import logging
+import math
+import multiprocessing
+import os
+import random
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from queue import Full, Queue
+from tempfile import TemporaryDirectory
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+import onnx
+import onnxruntime as ort
+from datasets import Dataset
+from onnxruntime.quantization import CalibrationDataReader
+
+from .utils import hash_file
+
+
+LOGGER = logging.getLogger(__name__)
+
+# Calibration methods computing the ranges from the minimum and maximum of the activations, that are merged exactly
+# across shards. The ranges of the other methods depend on the order of the batches (e.g. the bins of the Percentile
+# histograms), or on the search of vai_q_onnx (MinMSE), and are left to vai_q_onnx.
+SHARDED_CALIBRATION_METHODS = ("MinMax", "NonOverflow")
+
+
+class RyzenAICalibrationDataReader(CalibrationDataReader):
+    """
+    Feeds a calibration dataset to the quantizer by batches of `batch_size` samples, stacked as `[batch_size, ...]`
+    arrays.
+
+    Batches of a `datasets.Dataset` are read as contiguous slices of its Arrow table with `with_format("numpy")`, other
+    iterables are collated sample by sample. The batches are copied into preallocated buffers, and the next batch is
+    prepared on a background thread while the current one runs. As the buffers are reused, the arrays returned by
+    `get_next` are only valid until the next call. The background thread is stopped by `close`, or when exiting the
+    reader used as a context manager, so that a reader left before its last batch does not keep it running.
+
+    Args:
+        dataset (`Union[Dataset, Iterable[Dict[str, Any]]]`):
+            The calibration dataset.
+        batch_size (`int`, defaults to `1`):
+            The number of samples per batch.
+        drop_last (`bool`, defaults to `False`):
+            Whether to drop the last batch if it has less than `batch_size` samples, e.g. for models with a static batch
+            size.
+        prefetch (`bool`, defaults to `True`):
+            Whether to prepare the next batch on a background thread.
+        num_buffers (`int`, defaults to `3`):
+            The number of preallocated buffers, at least one being consumed, one waiting and one being filled when
+            prefetching.
+    """
+
+    __slots__ = [
+        "batch_size",
+        "dataset",
+        "drop_last",
+        "prefetch",
+        "num_buffers",
+        "_buffers",
+        "_buffer_index",
+        "_batches",
+        "_queue",
+        "_stop_event",
+        "_thread",
+    ]
+
+    def __init__(
+        self,
+        dataset: Union[Dataset, Iterable[Dict[str, Any]]],
+        batch_size: int = 1,
+        drop_last: bool = False,
+        prefetch: bool = True,
+        num_buffers: int = 3,
+    ):
+        if dataset is None:
+            raise ValueError("Provided dataset is None.")
+
+        if batch_size <= 0:
+            raise ValueError(f"Provided batch_size should be >= 1 (got: {batch_size}).")
+
+        if num_buffers < (3 if prefetch else 1):
+            raise ValueError(f"Provided num_buffers is too small (got: {num_buffers}).")
+
+        self.dataset = dataset
+        self.batch_size = batch_size
+        self.drop_last = drop_last
+        self.prefetch = prefetch
+        self.num_buffers = num_buffers
+
+        self._buffers = [{} for _ in range(num_buffers)]
+        self._thread = None
+        self.rewind()
+
+    def _iter_raw_batches(self) -> Iterator[Dict[str, np.ndarray]]:
+        if isinstance(self.dataset, Dataset):
+            numpy_dataset = self.dataset.with_format("numpy")
+            num_samples = len(numpy_dataset)
+            for start in range(0, num_samples, self.batch_size):
+                yield numpy_dataset[start : start + self.batch_size]
+        else:
+            samples = []
+            for sample in self.dataset:
+                samples.append(sample)
+                if len(samples) == self.batch_size:
+                    yield {name: [sample[name] for sample in samples] for name in samples[0]}
+                    samples = []
+            if samples:
+                yield {name: [sample[name] for sample in samples] for name in samples[0]}
+
+    def _collate(self, raw_batch: Dict[str, Any]) -> Dict[str, np.ndarray]:
+        buffers = self._buffers[self._buffer_index]
+        self._buffer_index = (self._buffer_index + 1) % self.num_buffers
+
+        batch = {}
+        for name, values in raw_batch.items():
+            if not isinstance(values, np.ndarray) or values.dtype == object:
+                # Ragged Arrow columns and plain iterables yield one array per sample.
+                values = [np.asarray(value) for value in values]
+                num_samples, sample_shape, dtype = len(values), values[0].shape, values[0].dtype
+            else:
+                num_samples, sample_shape, dtype = values.shape[0], values.shape[1:], values.dtype
+
+            buffer = buffers.get(name)
+            if buffer is None or buffer.shape[1:] != sample_shape or buffer.dtype != dtype:
+                buffer = np.empty((self.batch_size, *sample_shape), dtype=dtype)
+                buffers[name] = buffer
+
+            if isinstance(values, list):
+                np.stack(values, out=buffer[:num_samples])
+            else:
+                np.copyto(buffer[:num_samples], values)
+            batch[name] = buffer[:num_samples]
+
+        return batch
+
+    def _iter_batches(self) -> Iterator[Dict[str, np.ndarray]]:
+        for raw_batch in self._iter_raw_batches():
+            num_samples = len(next(iter(raw_batch.values()))) if raw_batch else 0
+            if num_samples == 0 or (self.drop_last and num_samples < self.batch_size):
+                continue
+            yield self._collate(raw_batch)
+
+    def _produce(self, batches: Iterator[Dict[str, np.ndarray]], stop_event: threading.Event, batch_queue: Queue):
+        def put(item) -> bool:
+            while not stop_event.is_set():
+                try:
+                    batch_queue.put(item, timeout=0.1)
+                    return True
+                except Full:
+                    continue
+            return False
+
+        try:
+            for batch in batches:
+                if not put(batch):
+                    return
+            put(None)
+        except Exception as exception:
+            put(exception)
+
+    def close(self):
+        """
+        Stops the background thread preparing the next batch, if any. The reader returns no more batches until
+        `rewind` is called.
+        """
+        if self._thread is not None:
+            self._stop_event.set()
+            self._thread.join()
+            self._thread = None
+        self._batches = iter(())
+
+    def __enter__(self) -> "RyzenAICalibrationDataReader":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def rewind(self):
+        """
+        Restarts the reader from the first batch.
+        """
+        self.close()
+
+        self._buffer_index = 0
+        self._batches = self._iter_batches()
+
+        if self.prefetch:
+            self._stop_event = threading.Event()
+            self._queue = Queue(maxsize=1)
+            self._thread = threading.Thread(
+                target=self._produce, args=(self._batches, self._stop_event, self._queue), daemon=True
+            )
+            self._thread.start()
+
+    def get_next(self) -> Optional[Dict[str, np.ndarray]]:
+        if not self.prefetch:
+            return next(self._batches, None)
+
+        if self._thread is None:
+            return None
+
+        batch = self._queue.get()
+        if batch is None or isinstance(batch, Exception):
+            self._thread.join()
+            self._thread = None
+            if isinstance(batch, Exception):
+                raise batch
+
+        return batch
+
+
+def reservoir_sample(
+    samples: Iterable[Any], num_samples: int, seed: Optional[int] = None, num_candidates: Optional[int] = None
+) -> List[Any]:
+    """
+    Draws `num_samples` samples uniformly from an iterable in a single pass, without knowing its length.
+
+    Args:
+        samples (`Iterable[Any]`):
+            The samples to draw from, e.g. a streaming dataset.
+        num_samples (`int`):
+            The number of samples to draw. All the samples are returned if there are fewer.
+        seed (`Optional[int]`, defaults to `None`):
+            The random seed.
+        num_candidates (`Optional[int]`, defaults to `None`):
+            The number of leading samples to draw from. Defaults to the whole iterable.
+
+    Returns:
+        `List[Any]`: The drawn samples.
+    """
+    if num_samples <= 0:
+        raise ValueError(f"num_samples should be >= 1 (got: {num_samples}).")
+
+    rng = random.Random(seed)
+    reservoir = []
+    for index, sample in enumerate(itertools.islice(samples, num_candidates)):
+        if index < num_samples:
+            reservoir.append(sample)
+        else:
+            position = rng.randint(0, index)
+            if position < num_samples:
+                reservoir[position] = sample
+
+    return reservoir
+
+
+@dataclass
+class RyzenAICalibrationStatistics:
+    """
+    Per-tensor activations ranges, that can be merged exactly across calibration shards.
+
+    Args:
+        min_values (`Dict[str, np.ndarray]`, defaults to `{}`):
+            The minimum value of each tensor.
+        max_values (`Dict[str, np.ndarray]`, defaults to `{}`):
+            The maximum value of each tensor.
+    """
+
+    min_values: Dict[str, np.ndarray] = field(default_factory=dict)
+    max_values: Dict[str, np.ndarray] = field(default_factory=dict)
+
+    def update_range(self, name: str, value: np.ndarray):
+        value_min, value_max = np.min(value), np.max(value)
+        if name in self.min_values:
+            value_min = np.minimum(self.min_values[name], value_min)
+            value_max = np.maximum(self.max_values[name], value_max)
+        self.min_values[name], self.max_values[name] = value_min, value_max
+
+    def merge(self, other: "RyzenAICalibrationStatistics") -> "RyzenAICalibrationStatistics":
+        """
+        Merges the statistics of another shard into these statistics.
+        """
+        for name, value_min in other.min_values.items():
+            if name in self.min_values:
+                self.min_values[name] = np.minimum(self.min_values[name], value_min)
+                self.max_values[name] = np.maximum(self.max_values[name], other.max_values[name])
+            else:
+                self.min_values[name], self.max_values[name] = value_min, other.max_values[name]
+
+        return self
+
+    def save(self, save_path: Union[str, Path]):
+        """
+        Saves the statistics as a `.npz` archive.
+        """
+        arrays = {
+            "range_names": np.array(list(self.min_values), dtype=str),
+            "min_values": np.array(list(self.min_values.values())),
+            "max_values": np.array([self.max_values[name] for name in self.min_values]),
+        }
+
+        # Write to a temporary file first so that concurrent processes never load a partially written archive.
+        save_path = Path(save_path)
+        tmp_path = save_path.with_name(f"{save_path.stem}.{os.getpid()}.tmp.npz")
+        np.savez(tmp_path, **arrays)
+        os.replace(tmp_path, save_path)
+
+    @classmethod
+    def load(cls, load_path: Union[str, Path]) -> "RyzenAICalibrationStatistics":
+        """
+        Loads statistics saved with [`~RyzenAICalibrationStatistics.save`].
+        """
+        statistics = cls()
+        with np.load(load_path, allow_pickle=False) as arrays:
+            for name, value_min, value_max in zip(
+                arrays["range_names"].tolist(), arrays["min_values"], arrays["max_values"]
+            ):
+                statistics.min_values[name], statistics.max_values[name] = value_min, value_max
+
+        return statistics
+
+
+def _get_method_name(calibration_method: Any) -> str:
+    return getattr(calibration_method, "name", str(calibration_method))
+
+
+def get_calibration_tensors(model: onnx.ModelProto) -> List[onnx.ValueInfoProto]:
+    """
+    Returns the float activations of a model, i.e. the inputs and outputs of its nodes that are not initializers.
+    """
+    model = onnx.shape_inference.infer_shapes(model)
+    value_infos = {
+        value_info.name: value_info
+        for value_info in list(model.graph.value_info) + list(model.graph.input) + list(model.graph.output)
+    }
+    initializers = {initializer.name for initializer in model.graph.initializer}
+    float_types = (onnx.TensorProto.FLOAT, onnx.TensorProto.FLOAT16)
+
+    tensors = {}
+    for node in model.graph.node:
+        for name in list(node.input) + list(node.output):
+            value_info = value_infos.get(name)
+            if name in tensors or name in initializers or value_info is None:
+                continue
+            if value_info.type.HasField("tensor_type") and value_info.type.tensor_type.elem_type in float_types:
+                tensors[name] = value_info
+
+    return list(tensors.values())
+
+
+def augment_model_for_calibration(model_path: Union[str, Path], save_path: Union[str, Path]) -> List[str]:
+    """
+    Saves a copy of the model exposing all its float activations as outputs.
+
+    Returns:
+        `List[str]`: The names of the calibrated tensors.
+    """
+    model = onnx.load(model_path)
+    tensors = get_calibration_tensors(model)
+
+    graph_outputs = {output.name for output in model.graph.output}
+    graph_inputs = {graph_input.name for graph_input in model.graph.input}
+    for value_info in tensors:
+        if value_info.name not in graph_outputs and value_info.name not in graph_inputs:
+            model.graph.output.append(value_info)
+
+    onnx.save(model, save_path, save_as_external_data=model.ByteSize() > onnx.checker.MAXIMUM_PROTOBUF)
+
+    return [value_info.name for value_info in tensors]
+
+
+def _collect_shard_statistics(
+    model_path: str,
+    dataset: Dataset,
+    tensor_names: List[str],
+    batch_size: int,
+    drop_last: bool,
+    num_threads: int,
+) -> RyzenAICalibrationStatistics:
+    """
+    Runs one calibration shard, collecting the ranges of the tensors.
+    """
+    session_options = ort.SessionOptions()
+    session_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_DISABLE_ALL
+    if num_threads > 0:
+        session_options.intra_op_num_threads = num_threads
+    session = ort.InferenceSession(model_path, session_options, providers=["CPUExecutionProvider"])
+
+    input_names = {graph_input.name for graph_input in session.get_inputs()}
+    input_tensor_names = [name for name in tensor_names if name in input_names]
+    output_tensor_names = [name for name in tensor_names if name not in input_names]
+
+    statistics = RyzenAICalibrationStatistics()
+    reader = RyzenAICalibrationDataReader(dataset, batch_size, drop_last=drop_last, prefetch=False, num_buffers=1)
+    while True:
+        inputs = reader.get_next()
+        if inputs is None:
+            break
+
+        outputs = session.run(output_tensor_names, inputs)
+        values = dict(zip(output_tensor_names, outputs))
+        values.update({name: inputs[name] for name in input_tensor_names})
+        for name, value in values.items():
+            statistics.update_range(name, value)
+
+    return statistics
+
+
+def collect_calibration_statistics(
+    model_path: Union[str, Path],
+    dataset: Dataset,
+    calibration_method: Any,
+    batch_size: int = 1,
+    drop_last: bool = False,
+    num_workers: int = 1,
+    cache_dir: Optional[Union[str, Path]] = None,
+) -> RyzenAICalibrationStatistics:
+    """
+    Collects the activations ranges of a model on a calibration dataset, sharded across `num_workers` processes.
+
+    Each worker runs the shards of the dataset through a copy of the model exposing its activations as outputs, with
+    the CPU execution provider. The minimum and maximum of the shards are merged exactly, so that the results do not
+    depend on `num_workers`.
+
+    Args:
+        model_path (`Union[str, Path]`):
+            Path to the ONNX model.
+        dataset (`Dataset`):
+            The calibration dataset.
+        calibration_method (`Any`):
+            The calibration method, `CalibrationMethod.MinMax` or `PowerOfTwoMethod.NonOverflow`.
+        batch_size (`int`, defaults to `1`):
+            The calibration batch size.
+        drop_last (`bool`, defaults to `False`):
+            Whether to drop the last incomplete batch of each shard.
+        num_workers (`int`, defaults to `1`):
+            The number of worker processes. With 1, the statistics are collected in the current process.
+        cache_dir (`Optional[Union[str, Path]]`, defaults to `None`):
+            The directory to cache the ranges in, keyed by the hash of the model, the fingerprint of the dataset and the
+            batching. They are shared by the supported calibration methods.
+    """
+    method_name = _get_method_name(calibration_method)
+    if method_name not in SHARDED_CALIBRATION_METHODS:
+        raise ValueError(
+            f"The calibration method {method_name} is not supported for sharded calibration, supported methods are "
+            f"{SHARDED_CALIBRATION_METHODS}."
+        )
+
+    if not isinstance(dataset, Dataset):
+        raise ValueError(f"Sharded calibration requires a `datasets.Dataset`, got {type(dataset)}.")
+
+    if num_workers <= 0:
+        raise ValueError(f"num_workers should be >= 1 (got: {num_workers}).")
+
+    # Shards are made of full batches, so that the batches, and the incomplete batch dropped with `drop_last`, are the
+    # same as in a serial run.
+    shard_size = math.ceil(len(dataset) / num_workers / batch_size) * batch_size
+    shards = [
+        dataset.select(range(start, min(start + shard_size, len(dataset))))
+        for start in range(0, len(dataset), shard_size)
+    ]
+    num_threads = max(1, (os.cpu_count() or 1) // len(shards)) if len(shards) > 1 else 0
+
+    cache_path = None
+    if cache_dir is not None:
+        cache_dir = Path(cache_dir)
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        cache_key = get_calibration_cache_key(hash_file(model_path), dataset._fingerprint, batch_size, drop_last)
+        cache_path = cache_dir / f"ranges_{cache_key}.npz"
+        if cache_path.exists():
+            LOGGER.info(f"Loading the cached calibration ranges from {cache_path}.")
+            return RyzenAICalibrationStatistics.load(cache_path)
+
+    with TemporaryDirectory() as tmpdir:
+        augmented_model_path = os.path.join(tmpdir, "augmented_model.onnx")
+        tensor_names = augment_model_for_calibration(model_path, augmented_model_path)
+        kwargs = {
+            "model_path": augmented_model_path,
+            "tensor_names": tensor_names,
+            "batch_size": batch_size,
+            "drop_last": drop_last,
+            "num_threads": num_threads,
+        }
+
+        LOGGER.info(f"Collecting the ranges of {len(tensor_names)} tensors on {len(shards)} shard(s)...")
+        if len(shards) > 1:
+            with ProcessPoolExecutor(len(shards), mp_context=multiprocessing.get_context("spawn")) as executor:
+                futures = [executor.submit(_collect_shard_statistics, dataset=shard, **kwargs) for shard in shards]
+                results = [future.result() for future in futures]
+        else:
+            results = [_collect_shard_statistics(dataset=shard, **kwargs) for shard in shards]
+
+    statistics = RyzenAICalibrationStatistics()
+    for result in results:
+        statistics.merge(result)
+    if cache_path is not None:
+        statistics.save(cache_path)
+
+    return statistics
+
+
+def get_calibration_cache_key(*parts: Any) -> str:
+    """
+    Returns the key of cached calibration statistics, hashing the given parts.
+    """
+    return hashlib.sha256("|".join(str(part) for part in parts).encode()).hexdigest()[:32]
+
+
+def compute_tensors_range(
+    statistics: RyzenAICalibrationStatistics, calibration_method: Any
+) -> Dict[str, Tuple[np.ndarray, np.ndarray]]:
+    """
+    Computes the quantization range of each tensor from merged calibration statistics.
+
+    Args:
+        statistics (`RyzenAICalibrationStatistics`):
+            The statistics collected by [`collect_calibration_statistics`].
+        calibration_method (`Any`):
+            The calibration method the statistics were collected for, `CalibrationMethod.MinMax` or
+            `PowerOfTwoMethod.NonOverflow`. The power-of-two scales of NonOverflow are derived from the ranges by
+            vai_q_onnx.
+
+    Returns:
+        `Dict[str, Tuple[np.ndarray, np.ndarray]]`: The `(min, max)` range of each tensor.
+    """
+    method_name = _get_method_name(calibration_method)
+    if method_name not in SHARDED_CALIBRATION_METHODS:
+        raise ValueError(f"Unsupported calibration method {method_name}.")
+
+    return {
+        name: (np.asarray(value_min), np.asarray(statistics.max_values[name]))
+        for name, value_min in statistics.min_values.items()
+    }
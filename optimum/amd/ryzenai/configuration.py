@@ -2,9 +2,9 @@
 # Licensed under the MIT License.
 """Configuration classes for quantization with RyzenAI."""
 
-from dataclasses import asdict, dataclass
+from dataclasses import asdict, dataclass, field
 from enum import Enum
-from typing import Optional
+from typing import List, Optional
 
 import vai_q_onnx
 from onnxruntime.quantization import CalibrationMethod, QuantFormat, QuantType
@@ -38,6 +38,9 @@ class QuantizationConfig:
         enable_dpu (`bool`, defaults to `True`):
             Determines whether to generate a quantized model that is suitable for the DPU. If set to True, the quantization
             process will create a model that is optimized for DPU computations.
+        nodes_to_exclude (`List[str]`, defaults to `[]`):
+            The names of the nodes to keep in float, e.g. the most sensitive ones found by
+            [`~optimum.amd.ryzenai.sensitivity.analyze_quantization_sensitivity`].
 
     """
 
@@ -48,6 +51,7 @@ class QuantizationConfig:
     weights_dtype: QuantType = QuantType.QInt8
     weights_symmetric: bool = True
     enable_dpu: bool = True
+    nodes_to_exclude: List[str] = field(default_factory=list)
 
     @staticmethod
     def quantization_type_str(activations_dtype: QuantType, weights_dtype: QuantType) -> str:
@@ -2,20 +2,23 @@
 # Licensed under the MIT License.
 """RyzenAIModelForXXX classes, allowing to run ONNX Models with ONNX Runtime VITIS-AI EP using the same API as Transformers."""
 
+import hashlib
 import logging
 import os
 import shutil
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from tempfile import TemporaryDirectory
-from typing import Any, Dict, List, Optional, Tuple, Union
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
 
+import numpy as np
 import onnx
 import onnxruntime as ort
 import torch
 from huggingface_hub import HfApi, HfFolder, hf_hub_download
 from huggingface_hub.utils import EntryNotFoundError
 from onnx import shape_inference
-from onnx.tools import update_model_dims
 
 from optimum.exporters import TasksManager
 from optimum.modeling_base import FROM_PRETRAINED_START_DOCSTRING, OptimizedModel
@@ -30,9 +33,22 @@ from transformers import (
 from transformers.file_utils import add_start_docstrings
 from transformers.modeling_outputs import ImageClassifierOutput, ModelOutput
 
+from .partition import RyzenAIPartitionPreview, preview_partition
+from .processing import (
+    DETECTION_DECODERS,
+    RyzenAIDetectionPostprocessor,
+    RyzenAIDetections,
+    RyzenAIImagePreprocessor,
+    format_classification_outputs,
+    top_k_logits,
+)
+from .profiling import VITISAI_EP_REPORT_NAME, RyzenAIProfilingReport
 from .utils import (
     ONNX_WEIGHTS_NAME,
     ONNX_WEIGHTS_NAME_STATIC,
+    get_onnx_graph_io,
+    get_value_info_shape,
+    hash_file,
     validate_provider_availability,
 )
 
@@ -41,6 +57,107 @@ logger = logging.getLogger(__name__)
 
 CONFIG_NAME = "config.json"
 
+ORT_TO_NP_TYPE = {
+    "tensor(float)": np.float32,
+    "tensor(float16)": np.float16,
+    "tensor(double)": np.float64,
+    "tensor(int8)": np.int8,
+    "tensor(uint8)": np.uint8,
+    "tensor(int16)": np.int16,
+    "tensor(uint16)": np.uint16,
+    "tensor(int32)": np.int32,
+    "tensor(uint32)": np.uint32,
+    "tensor(int64)": np.int64,
+    "tensor(uint64)": np.uint64,
+    "tensor(bool)": np.bool_,
+}
+
+
+def _get_numpy_dtype(ort_type: str) -> type:
+    if ort_type not in ORT_TO_NP_TYPE:
+        raise ValueError(f"The ONNX Runtime type {ort_type} has no NumPy equivalent.")
+    return ORT_TO_NP_TYPE[ort_type]
+
+
+def _copy_session_options(session_options: ort.SessionOptions) -> ort.SessionOptions:
+    """
+    Copies the settable attributes of session options: the options of a session are shared with it, and
+    `ort.SessionOptions` can't be copied nor pickled.
+    """
+    copied_options = ort.SessionOptions()
+    for name in dir(ort.SessionOptions):
+        attribute = getattr(ort.SessionOptions, name)
+        if isinstance(attribute, property) and attribute.fset is not None:
+            setattr(copied_options, name, getattr(session_options, name))
+    return copied_options
+
+
+def _iter_tensors(graph: onnx.GraphProto) -> Iterator[onnx.TensorProto]:
+    yield from graph.initializer
+    for node in graph.node:
+        for attribute in node.attribute:
+            if attribute.HasField("t"):
+                yield attribute.t
+            yield from attribute.tensors
+            for subgraph in [attribute.g] if attribute.HasField("g") else attribute.graphs:
+                yield from _iter_tensors(subgraph)
+
+
+def _set_value_info_shape(value_info: onnx.ValueInfoProto, shape: Tuple[Union[int, str], ...]):
+    dims = value_info.type.tensor_type.shape.dim
+    if len(dims) != len(shape):
+        raise ValueError(f"The shape {shape} of {value_info.name} does not match its rank {len(dims)}.")
+    for index, (dim, size) in enumerate(zip(dims, shape)):
+        if isinstance(size, str):
+            dim.dim_param = size
+        elif size >= 0:
+            dim.dim_value = size
+        else:
+            # As `onnx.tools.update_model_dims`, unknown dimensions get a unique symbolic name.
+            dim.dim_param = f"{value_info.name}_{index}"
+
+
+def _save_reshaped_model(
+    model_path: Union[str, Path],
+    save_path: Path,
+    input_shape_dict: Dict[str, Tuple[Union[int, str], ...]],
+    output_shape_dict: Dict[str, Tuple[Union[int, str], ...]],
+):
+    """
+    Saves a copy of an ONNX model with the given input and output shapes, propagated on its layers.
+
+    Only the graph of the model is loaded: its external data files are copied next to `save_path` as
+    `<save_path name>_data`, `<save_path name>_data_1`, etc., and the shapes are inferred on the saved file, so that
+    models above the 2GB protobuf limit can be reshaped.
+    """
+    model_path = Path(model_path)
+    model = onnx.load(str(model_path), load_external_data=False)
+
+    # Models with an IR version below 4 list their initializers as graph inputs, their shapes are kept.
+    initializers = {initializer.name for initializer in model.graph.initializer}
+    for values, shape_dict in [(model.graph.input, input_shape_dict), (model.graph.output, output_shape_dict)]:
+        for value in values:
+            if value.name in shape_dict and value.name not in initializers:
+                _set_value_info_shape(value, shape_dict[value.name])
+    # The shapes of the intermediate values are inferred again from the new shapes.
+    del model.graph.value_info[:]
+
+    locations = {}
+    for tensor in _iter_tensors(model.graph):
+        if tensor.data_location != onnx.TensorProto.EXTERNAL:
+            continue
+        for entry in tensor.external_data:
+            if entry.key != "location":
+                continue
+            if entry.value not in locations:
+                location = f"{save_path.name}_data" + (f"_{len(locations)}" if locations else "")
+                shutil.copyfile(model_path.parent / entry.value, save_path.parent / location)
+                locations[entry.value] = location
+            entry.value = locations[entry.value]
+
+    onnx.save(model, str(save_path))
+    shape_inference.infer_shapes_path(str(save_path), str(save_path))
+
 
 class classproperty:
     def __init__(self, getter):
@@ -145,6 +262,190 @@ class RyzenAIModel(OptimizedModel):
         # Necessary for compatibility with transformer pipelines
         return self
 
+    def profile(
+        self,
+        *args,
+        num_runs: int = 10,
+        num_warmup_runs: int = 1,
+        profile_dir: Optional[Union[str, Path]] = None,
+        ep_report_path: Optional[Union[str, Path]] = None,
+        **kwargs,
+    ) -> RyzenAIProfilingReport:
+        """
+        Runs the model with ONNX Runtime profiling enabled and returns its per-operator latency breakdown.
+
+        A profiling session is created with the same provider and provider options as the model, and the inputs are
+        run through the regular `forward`. The kernel time of each node is then joined with the device it ran on:
+        subgraphs offloaded by the VitisAI EP are reported on the DPU, and all the other nodes as CPU fallbacks.
+
+        Args:
+            num_runs (`int`, defaults to `10`):
+                The number of profiled runs.
+            num_warmup_runs (`int`, defaults to `1`):
+                The number of runs excluded from the report.
+            profile_dir (`Optional[Union[str, Path]]`, defaults to `None`):
+                The directory to write the ONNX Runtime profiling trace to. Defaults to a temporary directory.
+            ep_report_path (`Optional[Union[str, Path]]`, defaults to `None`):
+                Path to the `vitisai_ep_report.json` to read the per-device node counts from. Defaults to the report
+                in the `cacheDir`/`cacheKey` directory of the VitisAI EP, if any.
+
+        Returns:
+            `RyzenAIProfilingReport`: The latency breakdown of the model.
+        """
+        if num_runs <= 0:
+            raise ValueError(f"num_runs should be >= 1 (got: {num_runs}).")
+
+        provider = self.providers[0]
+        provider_options = self.model.get_provider_options().get(provider) or None
+
+        if ep_report_path is None and provider_options is not None and "cacheDir" in provider_options:
+            candidate = (
+                Path(provider_options["cacheDir"]) / provider_options.get("cacheKey", "") / VITISAI_EP_REPORT_NAME
+            )
+            ep_report_path = candidate if candidate.exists() else None
+
+        with TemporaryDirectory() as tmpdir:
+            session_options = _copy_session_options(self.model.get_session_options())
+            session_options.enable_profiling = True
+            session_options.profile_file_prefix = str(Path(profile_dir or tmpdir) / f"{self.model_path.stem}_profile")
+
+            model = self.model
+            self.model = RyzenAIModel.load_model(
+                self.model_path,
+                provider=provider,
+                session_options=session_options,
+                provider_options=provider_options,
+            )
+            try:
+                for _ in range(num_warmup_runs + num_runs):
+                    self.forward(*args, **kwargs)
+                profile_path = self.model.end_profiling()
+            finally:
+                self.model = model
+
+            return RyzenAIProfilingReport.from_profile(
+                profile_path, num_warmup_runs=num_warmup_runs, ep_report_path=ep_report_path
+            )
+
+    @property
+    def static_batch_size(self) -> Optional[int]:
+        """
+        The batch size the model was exported with, or `None` if its batch axis is dynamic.
+        """
+        shape = self.model.get_inputs()[0].shape
+        batch_size = shape[0] if shape else None
+        return batch_size if isinstance(batch_size, int) and batch_size > 0 else None
+
+    def _run_batched(self, onnx_inputs: Dict[str, np.ndarray]) -> List[np.ndarray]:
+        """
+        Runs inputs of any batch size through the model.
+
+        When the model has a static batch size, the inputs are split in chunks of that size, the last one being padded
+        with zeros. Each chunk is bound to the session with no copy and its outputs are written in place in the outputs
+        of the whole batch, so that they do not need to be concatenated.
+        """
+        static_batch_size = self.static_batch_size
+        batch_size = next(iter(onnx_inputs.values())).shape[0]
+        if static_batch_size is None or batch_size == static_batch_size:
+            return self.model.run(None, onnx_inputs)
+
+        if any(value.shape[0] != batch_size for value in onnx_inputs.values()):
+            raise ValueError(
+                "All the inputs should have the same batch size, got "
+                f"{ {name: value.shape[0] for name, value in onnx_inputs.items()} }."
+            )
+
+        output_infos = self.model.get_outputs()
+        for output in output_infos:
+            if (
+                not output.shape
+                or output.shape[0] != static_batch_size
+                or not all(isinstance(d, int) for d in output.shape)
+            ):
+                raise ValueError(
+                    f"Splitting a batch of {batch_size} in batches of {static_batch_size} requires static outputs batched "
+                    f"along their first axis, but the output {output.name} has the shape {output.shape}."
+                )
+
+        outputs = [
+            np.empty((batch_size, *output.shape[1:]), dtype=_get_numpy_dtype(output.type)) for output in output_infos
+        ]
+        onnx_inputs = {name: np.ascontiguousarray(value) for name, value in onnx_inputs.items()}
+
+        io_binding = self.model.io_binding()
+        for start in range(0, batch_size, static_batch_size):
+            stop = start + static_batch_size
+            if stop <= batch_size:
+                # Slices along the first axis of C-contiguous arrays are contiguous views.
+                chunk_inputs = {name: value[start:stop] for name, value in onnx_inputs.items()}
+                chunk_outputs = [output[start:stop] for output in outputs]
+            else:
+                padding = [(0, stop - batch_size)]
+                chunk_inputs = {
+                    name: np.pad(value[start:], padding + [(0, 0)] * (value.ndim - 1))
+                    for name, value in onnx_inputs.items()
+                }
+                chunk_outputs = [np.empty((static_batch_size, *output.shape[1:]), output.dtype) for output in outputs]
+
+            for name, value in chunk_inputs.items():
+                io_binding.bind_cpu_input(name, value)
+            for output, value in zip(output_infos, chunk_outputs):
+                io_binding.bind_output(output.name, "cpu", 0, value.dtype, value.shape, value.ctypes.data)
+            self.model.run_with_iobinding(io_binding)
+
+            if stop > batch_size:
+                for output, value in zip(outputs, chunk_outputs):
+                    output[start:] = value[: batch_size - start]
+
+        return outputs
+
+    def with_batch_size(self, batch_size: int) -> "RyzenAIModel":
+        """
+        Returns a variant of the model with another static batch size, e.g. a larger one for a higher throughput. The
+        model is reshaped with [`~RyzenAIModel.reshape_batch_size`] and loaded with the same provider and options, a
+        `cacheKey` being suffixed with the batch size to compile it separately.
+
+        Args:
+            batch_size (`int`):
+                The static batch size of the new model.
+
+        Returns:
+            `RyzenAIModel`: The model with the new batch size, of the same class.
+        """
+        static_model_path = self.reshape_batch_size(self.model_path, batch_size)
+
+        provider = self.providers[0]
+        provider_options = self.model.get_provider_options().get(provider) or None
+        if provider_options is not None and "cacheKey" in provider_options:
+            provider_options = dict(provider_options, cacheKey=f"{provider_options['cacheKey']}_batch_{batch_size}")
+
+        model = RyzenAIModel.load_model(
+            static_model_path,
+            provider=provider,
+            session_options=self.model.get_session_options(),
+            provider_options=provider_options,
+        )
+        return self.__class__(
+            model=model,
+            config=self.config,
+            vaip_config=self.vaip_config,
+            model_save_dir=self.model_save_dir,
+            preprocessors=self.preprocessors,
+        )
+
+    def preview_partition(self, supported_op_types: Optional[List[str]] = None) -> RyzenAIPartitionPreview:
+        """
+        Predicts the DPU/CPU partitioning of the model from its `vaip_config.json`, without compiling it for the NPU.
+
+        Args:
+            supported_op_types (`Optional[List[str]]`, defaults to `None`):
+                Overrides the operator types supported by the DPU.
+
+        Returns:
+            `RyzenAIPartitionPreview`: The predicted node placement, DPU subgraphs and CPU/DPU boundaries.
+        """
+        return preview_partition(self.model_path, vaip_config=self.vaip_config, supported_op_types=supported_op_types)
+
     @staticmethod
     def load_model(
         path: Union[str, Path],
@@ -515,30 +816,20 @@ class RyzenAIModel(OptimizedModel):
     def _check_uses_static_shape(model_path: Union[str, Path]):
         is_dynamic = False
         if Path(model_path).suffix == ".onnx":
-            model = onnx.load(model_path)
+            graph_io = get_onnx_graph_io(model_path)
             is_dynamic = any(
-                any(dim.dim_param for dim_index, dim in enumerate(inp.type.tensor_type.shape.dim) if dim_index != 0)
-                for inp in model.graph.input
+                any(dim.dim_param for dim_index, dim in enumerate(value.type.tensor_type.shape.dim) if dim_index != 0)
+                for value in graph_io.inputs + graph_io.outputs
             )
 
         return is_dynamic
 
-    @staticmethod
-    def _update_inputs_outputs_dims(
-        model_path: Union[str, Path],
-        input_shape_dict: Dict[str, Tuple[int]],
-        output_shape_dict: Dict[str, Tuple[int]],
-    ) -> onnx.ModelProto:
-        model = onnx.load(model_path)
-
-        updated_model = update_model_dims.update_inputs_outputs_dims(model, input_shape_dict, output_shape_dict)
-        return shape_inference.infer_shapes(updated_model)
-
     @staticmethod
     def reshape(
         model_path: Union[str, Path],
         input_shape_dict: Dict[str, Tuple[int]],
         output_shape_dict: Dict[str, Tuple[int]],
+        file_name: str = ONNX_WEIGHTS_NAME_STATIC,
     ) -> Union[str, Path]:
         """
         Propagates the given input shapes on the model's layers, fixing the input shapes of the model.
@@ -550,6 +841,8 @@ class RyzenAIModel(OptimizedModel):
                 Input shapes for the model.
             output_shape_dict (Dict[str, Tuple[int]]):
                 Output shapes for the model.
+            file_name (`str`, defaults to `"model_static.onnx"`):
+                The file name of the static model, saved next to the original model.
 
         Returns:
             Union[str, Path]:
@@ -559,15 +852,246 @@ class RyzenAIModel(OptimizedModel):
             ValueError: If the model provided has dynamic axes in input/output and no input/output shape is provided.
         """
         if isinstance(model_path, (str, Path)) and Path(model_path).suffix == ".onnx":
-            model = RyzenAIModel._update_inputs_outputs_dims(model_path, input_shape_dict, output_shape_dict)
-
-            static_model_path = Path(model_path).parent / ONNX_WEIGHTS_NAME_STATIC
-            onnx.save(model, static_model_path)
+            static_model_path = Path(model_path).parent / file_name
+            _save_reshaped_model(model_path, static_model_path, input_shape_dict, output_shape_dict)
 
             return static_model_path
 
         return model_path
 
+    @staticmethod
+    def reshape_batch_size(
+        model_path: Union[str, Path], batch_size: int, file_name: Optional[str] = None
+    ) -> Union[str, Path]:
+        """
+        Sets the batch size, i.e. the first axis of all the inputs and outputs, of a model and propagates it on its
+        layers, like [`~RyzenAIModel.reshape`]. The operators of the model must not hardcode the batch size, e.g. in
+        the shapes of `Reshape` nodes.
+
+        Args:
+            model_path (`Union[str, Path]`):
+                Path to the model.
+            batch_size (`int`):
+                The new batch size.
+            file_name (`Optional[str]`, defaults to `None`):
+                The file name of the new model, saved next to the original model. Defaults to
+                `"<model name>_batch_<batch_size>.onnx"`.
+
+        Returns:
+            `Union[str, Path]`: Path to the model with the new batch size.
+        """
+        if batch_size <= 0:
+            raise ValueError(f"batch_size should be >= 1 (got: {batch_size}).")
+
+        if Path(model_path).suffix != ".onnx":
+            return model_path
+
+        graph_io = get_onnx_graph_io(model_path)
+        input_shape_dict, output_shape_dict = (
+            {
+                value.name: (batch_size, *get_value_info_shape(value)[1:])
+                for value in values
+                if get_value_info_shape(value)
+            }
+            for values in (graph_io.inputs, graph_io.outputs)
+        )
+
+        static_model_path = Path(model_path).parent / (file_name or f"{Path(model_path).stem}_batch_{batch_size}.onnx")
+        _save_reshaped_model(model_path, static_model_path, input_shape_dict, output_shape_dict)
+
+        return static_model_path
+
+
+class RyzenAIShapeBucketedModel:
+    """
+    Runs an ONNX model with dynamic axes through a set of static-shape variants ("buckets"), as required by the
+    VitisAI execution provider.
+
+    The static model of a bucket is only created the first time an input is routed to it, and is saved under a file
+    name derived from the hash of the original model and of the bucket shapes, so that it is reused across runs and
+    processes. At most `max_sessions` inference sessions are kept alive, the least recently used one being released
+    first.
+
+    Each call is routed to the smallest bucket whose shapes are greater or equal to the input shapes on every axis, and
+    the inputs are padded with `pad_value` up to the bucket shapes. Outputs are cropped back along the axes sharing the
+    symbolic dimension name (e.g. `sequence_length`) of a padded input axis, and along their first axis when the batch
+    axis is padded.
+
+    Args:
+        model_path (`Union[str, Path]`):
+            Path to the ONNX model with dynamic axes.
+        buckets (`List[Union[Dict[str, Tuple[int, ...]], Tuple[int, ...]]]`):
+            The static input shapes to serve, as dictionaries mapping input names to shapes, or as shapes for models
+            having a single input.
+        provider (`str`, defaults to `"VitisAIExecutionProvider"`):
+            ONNX Runtime provider to use for loading the static models.
+        session_options (`Optional[onnxruntime.SessionOptions]`, defaults to `None`):
+            ONNX Runtime session options to use for loading the static models.
+        provider_options (`Optional[Dict[str, Any]]`, defaults to `None`):
+            Provider options. A `cacheKey` is suffixed with the bucket hash, to compile each bucket separately.
+        cache_dir (`Optional[Union[str, Path]]`, defaults to `None`):
+            The directory to save the static models to. Defaults to the directory of the original model.
+        max_sessions (`int`, defaults to `2`):
+            The maximum number of inference sessions kept alive.
+        pad_value (`float`, defaults to `0`):
+            The value to pad the inputs with.
+    """
+
+    def __init__(
+        self,
+        model_path: Union[str, Path],
+        buckets: List[Union[Dict[str, Tuple[int, ...]], Tuple[int, ...]]],
+        provider: str = "VitisAIExecutionProvider",
+        session_options: Optional[ort.SessionOptions] = None,
+        provider_options: Optional[Dict[str, Any]] = None,
+        cache_dir: Optional[Union[str, Path]] = None,
+        max_sessions: int = 2,
+        pad_value: float = 0,
+    ):
+        if max_sessions <= 0:
+            raise ValueError(f"max_sessions should be >= 1 (got: {max_sessions}).")
+
+        self.model_path = Path(model_path)
+        self.provider = provider
+        self.session_options = session_options
+        self.provider_options = provider_options
+        self.cache_dir = Path(cache_dir) if cache_dir is not None else self.model_path.parent
+        self.max_sessions = max_sessions
+        self.pad_value = pad_value
+
+        graph_io = get_onnx_graph_io(self.model_path)
+        self.input_names = [inp.name for inp in graph_io.inputs]
+        self._input_shape_dict = {inp.name: get_value_info_shape(inp) for inp in graph_io.inputs}
+        self._output_shape_dict = {out.name: get_value_info_shape(out) for out in graph_io.outputs}
+
+        self.buckets = []
+        for bucket in buckets:
+            if not isinstance(bucket, dict):
+                if len(self.input_names) != 1:
+                    raise ValueError("Buckets must be given as dictionaries for models with several inputs.")
+                bucket = {self.input_names[0]: bucket}
+            if set(bucket) != set(self.input_names):
+                raise ValueError(f"The bucket {bucket} does not match the model inputs {self.input_names}.")
+            self.buckets.append({name: tuple(shape) for name, shape in bucket.items()})
+
+        # Smallest buckets first, so that the first fitting bucket is the smallest one.
+        self.buckets.sort(key=lambda bucket: sum(np.prod(shape) for shape in bucket.values()))
+
+        self._model_hash = None
+        self._sessions = OrderedDict()
+
+    def select_bucket(self, input_shapes: Dict[str, Tuple[int, ...]]) -> Dict[str, Tuple[int, ...]]:
+        """
+        Returns the smallest bucket fitting the given input shapes.
+        """
+        for bucket in self.buckets:
+            if all(
+                len(bucket[name]) == len(shape) and all(b >= s for b, s in zip(bucket[name], shape))
+                for name, shape in input_shapes.items()
+            ):
+                return bucket
+
+        raise ValueError(f"No bucket fits the input shapes {input_shapes}, the available buckets are {self.buckets}.")
+
+    def _bucket_hash(self, bucket: Dict[str, Tuple[int, ...]]) -> str:
+        if self._model_hash is None:
+            # The model file and its external data files, if any.
+            model_paths = _get_external_data_paths([self.model_path], [self.model_path])[0]
+            self._model_hash = ",".join(hash_file(path) for path in dict.fromkeys(model_paths))
+        bucket_key = ";".join(f"{name}:{','.join(map(str, bucket[name]))}" for name in sorted(bucket))
+        return hashlib.sha256(f"{self._model_hash}|{bucket_key}".encode()).hexdigest()[:16]
+
+    def get_static_model_path(self, bucket: Dict[str, Tuple[int, ...]]) -> Path:
+        """
+        Returns the path to the static model of a bucket, creating it if needed.
+        """
+        bucket_hash = self._bucket_hash(bucket)
+        static_model_path = self.cache_dir / f"{self.model_path.stem}_static_{bucket_hash}.onnx"
+
+        if not static_model_path.exists():
+            logger.info(f"Creating the static model {static_model_path} for the input shapes {bucket}.")
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            # Write to a temporary directory first, and move the model file last, so that concurrent processes never
+            # load a partially written model.
+            with TemporaryDirectory(dir=self.cache_dir) as tmpdir:
+                tmp_path = Path(tmpdir) / static_model_path.name
+                _save_reshaped_model(self.model_path, tmp_path, bucket, self._output_shape_dict)
+                for path in sorted(Path(tmpdir).iterdir(), key=lambda path: path == tmp_path):
+                    os.replace(path, self.cache_dir / path.name)
+
+        return static_model_path
+
+    def get_session(self, bucket: Dict[str, Tuple[int, ...]]) -> ort.InferenceSession:
+        """
+        Returns the inference session of a bucket, loading it if needed and releasing the least recently used session
+        if more than `max_sessions` are alive.
+        """
+        key = tuple(sorted(bucket.items()))
+        if key in self._sessions:
+            self._sessions.move_to_end(key)
+            return self._sessions[key]
+
+        provider_options = self.provider_options
+        if provider_options is not None and "cacheKey" in provider_options:
+            provider_options = dict(
+                provider_options, cacheKey=f"{provider_options['cacheKey']}_{self._bucket_hash(bucket)}"
+            )
+
+        session = RyzenAIModel.load_model(
+            self.get_static_model_path(bucket),
+            provider=self.provider,
+            session_options=self.session_options,
+            provider_options=provider_options,
+        )
+
+        self._sessions[key] = session
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+
+        return session
+
+    def __call__(self, **inputs: np.ndarray) -> Dict[str, np.ndarray]:
+        """
+        Runs the inputs through the smallest fitting bucket.
+
+        Returns:
+            `Dict[str, np.ndarray]`: The outputs of the model, cropped to the input shapes.
+        """
+        input_shapes = {name: tuple(inputs[name].shape) for name in self.input_names}
+        bucket = self.select_bucket(input_shapes)
+
+        onnx_inputs = {}
+        for name in self.input_names:
+            padding = [(0, b - s) for b, s in zip(bucket[name], input_shapes[name])]
+            if any(after for _, after in padding):
+                onnx_inputs[name] = np.pad(inputs[name], padding, constant_values=self.pad_value)
+            else:
+                onnx_inputs[name] = inputs[name]
+
+        session = self.get_session(bucket)
+        onnx_outputs = session.run(None, onnx_inputs)
+
+        # The sizes of the padded symbolic axes, e.g. {"sequence_length": 7}.
+        padded_sizes = {}
+        for name in self.input_names:
+            for dim, size, bucket_size in zip(self._input_shape_dict[name], input_shapes[name], bucket[name]):
+                if isinstance(dim, str) and size != bucket_size:
+                    padded_sizes[dim] = size
+
+        batch_size, bucket_batch_size = input_shapes[self.input_names[0]][0], bucket[self.input_names[0]][0]
+        outputs = {}
+        for output, value in zip(session.get_outputs(), onnx_outputs):
+            output_shape = self._output_shape_dict.get(output.name, ())
+            crop = [
+                slice(padded_sizes[dim]) if dim in padded_sizes else slice(None)
+                for dim, _ in zip(output_shape, value.shape)
+            ]
+            if batch_size != bucket_batch_size and value.ndim > 0 and value.shape[0] == bucket_batch_size:
+                crop[:1] = [slice(batch_size)]
+            outputs[output.name] = value[tuple(crop)] if crop else value
+
+        return outputs
+
 
 class RyzenAIModelForCustomTasks(RyzenAIModel):
     def forward(self, **kwargs):
@@ -576,7 +1100,7 @@ class RyzenAIModelForCustomTasks(RyzenAIModel):
         onnx_inputs = self._prepare_onnx_inputs(use_torch=use_torch, **kwargs)
 
         # run inference
-        onnx_outputs = self.model.run(None, onnx_inputs)
+        onnx_outputs = self._run_batched(onnx_inputs)
         outputs = self._prepare_onnx_outputs(onnx_outputs, use_torch=use_torch)
 
         # converts output to namedtuple for pipelines post-processing
@@ -617,11 +1141,104 @@ class RyzenAIModelForImageClassification(RyzenAIModelForCustomTasks):
         }
 
         # run inference
-        onnx_outputs = self.model.run(None, onnx_inputs)
+        onnx_outputs = self._run_batched(onnx_inputs)
         outputs = self._prepare_onnx_outputs(onnx_outputs, use_torch=use_torch)
 
         return ImageClassifierOutput(logits=next(iter(outputs.values())))
 
+    @property
+    def image_preprocessor(self) -> RyzenAIImagePreprocessor:
+        """
+        The vectorized preprocessing stage used by [`~RyzenAIModelForImageClassification.predict`], built from the
+        image processor found in `preprocessors` and the layout of the model input. Can be overridden by assigning a
+        [`~ryzenai.RyzenAIImagePreprocessor`].
+        """
+        if getattr(self, "_image_preprocessor", None) is None:
+            image_processor = next((p for p in self.preprocessors if hasattr(p, "image_mean")), None)
+            if image_processor is None:
+                raise ValueError(
+                    "No image processor was found in the preprocessors of the model. Please set "
+                    "`model.image_preprocessor` to a `RyzenAIImagePreprocessor`."
+                )
+
+            model_input = self.model.get_inputs()[0]
+            shape = model_input.shape
+            channels_last = len(shape) == 4 and shape[-1] in (1, 3) and shape[1] not in (1, 3)
+            self._image_preprocessor = RyzenAIImagePreprocessor.from_image_processor(
+                image_processor,
+                channels_last=channels_last,
+                dtype=_get_numpy_dtype(model_input.type),
+            )
+
+        return self._image_preprocessor
+
+    @image_preprocessor.setter
+    def image_preprocessor(self, image_preprocessor: RyzenAIImagePreprocessor):
+        self._image_preprocessor = image_preprocessor
+
+    def postprocess(self, logits: Union[np.ndarray, torch.Tensor], top_k: int = 5) -> List[List[Dict[str, Any]]]:
+        """
+        Converts a batch of logits to the top-k `[{"score": ..., "label": ...}]` predictions of each sample.
+        """
+        if isinstance(logits, torch.Tensor):
+            logits = logits.cpu().detach().numpy()
+        scores, indices = top_k_logits(logits, k=top_k)
+        id2label = getattr(self.config, "id2label", None) if self.config is not None else None
+        return format_classification_outputs(scores, indices, id2label)
+
+    def predict(
+        self,
+        images: List[Any],
+        top_k: int = 5,
+        batch_size: int = 1,
+        overlap_preprocessing: bool = False,
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Classifies raw images end-to-end: vectorized preprocessing with `image_preprocessor`, inference and top-k
+        postprocessing.
+
+        Args:
+            images (`List[Any]`):
+                The images to classify, as PIL images or `(height, width, channels)` arrays.
+            top_k (`int`, defaults to `5`):
+                The number of predictions to return per image.
+            batch_size (`int`, defaults to `1`):
+                The number of images per inference call.
+            overlap_preprocessing (`bool`, defaults to `False`):
+                Whether to preprocess the next batch in a background thread while the current batch runs.
+
+        Returns:
+            `List[List[Dict[str, Any]]]`: The `[{"score": ..., "label": ...}]` predictions of each image.
+        """
+        if batch_size <= 0:
+            raise ValueError(f"Provided batch_size should be >= 1 (got: {batch_size}).")
+
+        preprocessor = self.image_preprocessor
+        if overlap_preprocessing and preprocessor.num_buffers < 2:
+            raise ValueError(
+                "Overlapping preprocessing and inference requires an image_preprocessor with num_buffers >= 2."
+            )
+
+        input_name = list(self.inputs_names.keys())[0]
+        batches = [images[i : i + batch_size] for i in range(0, len(images), batch_size)]
+
+        predictions = []
+        if overlap_preprocessing:
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                future = executor.submit(preprocessor, batches[0]) if batches else None
+                for next_batch in batches[1:] + [None]:
+                    pixel_values = future.result()
+                    if next_batch is not None:
+                        future = executor.submit(preprocessor, next_batch)
+                    logits = self._run_batched({input_name: pixel_values})[0]
+                    predictions.extend(self.postprocess(logits, top_k=top_k))
+        else:
+            for batch in batches:
+                logits = self._run_batched({input_name: preprocessor(batch)})[0]
+                predictions.extend(self.postprocess(logits, top_k=top_k))
+
+        return predictions
+
 
 class RyzenAIModelForObjectDetection(RyzenAIModelForCustomTasks):
     def forward(self, pixel_values):
@@ -633,11 +1250,53 @@ class RyzenAIModelForObjectDetection(RyzenAIModelForCustomTasks):
         }
 
         # run inference
-        onnx_outputs = self.model.run(None, onnx_inputs)
+        onnx_outputs = self._run_batched(onnx_inputs)
         outputs = self._prepare_onnx_outputs(onnx_outputs, use_torch=use_torch)
 
         return ModelOutput(outputs)
 
+    @property
+    def detection_postprocessor(self) -> RyzenAIDetectionPostprocessor:
+        """
+        The box decoding and non-maximum suppression stage used by
+        [`~RyzenAIModelForObjectDetection.postprocess`]. The architecture is inferred from the model type or the model
+        path, and the postprocessor can be overridden by assigning a [`~ryzenai.RyzenAIDetectionPostprocessor`].
+        """
+        if getattr(self, "_detection_postprocessor", None) is None:
+            candidates = [getattr(self.config, "model_type", None) or "", self.model_path.as_posix()]
+            architecture = next(
+                (arch for arch in DETECTION_DECODERS for candidate in candidates if arch in candidate.lower()), None
+            )
+            if architecture is None:
+                raise ValueError(
+                    "Could not infer the detection architecture of the model. Please set `model.detection_postprocessor` "
+                    f"to a `RyzenAIDetectionPostprocessor`, supported architectures are {list(DETECTION_DECODERS)}."
+                )
+            self._detection_postprocessor = RyzenAIDetectionPostprocessor(architecture)
+
+        return self._detection_postprocessor
+
+    @detection_postprocessor.setter
+    def detection_postprocessor(self, detection_postprocessor: RyzenAIDetectionPostprocessor):
+        self._detection_postprocessor = detection_postprocessor
+
+    def postprocess(self, outputs: ModelOutput) -> List[RyzenAIDetections]:
+        """
+        Decodes the raw outputs returned by the model into per-image detections, using `detection_postprocessor`.
+        """
+        outputs = [
+            output.cpu().detach().numpy() if isinstance(output, torch.Tensor) else output
+            for output in outputs.values()
+        ]
+
+        shape = self.model.get_inputs()[0].shape
+        channels_last = shape[-1] in (1, 3) and shape[1] not in (1, 3)
+        input_size = tuple(shape[1:3]) if channels_last else tuple(shape[2:4])
+        if not all(isinstance(dim, int) for dim in input_size):
+            raise ValueError(f"The postprocessing requires a model with a static input size, got {shape}.")
+
+        return self.detection_postprocessor(outputs, input_size=input_size)
+
 
 class RyzenAIModelForImageSegmentation(RyzenAIModelForObjectDetection):
     pass
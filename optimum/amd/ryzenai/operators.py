@@ -0,0 +1,248 @@
+# Copyright 2024 The HuggingFace Team. All rights reserved.
+# Licensed under the MIT License.
+"""Operator placement reports of the VitisAI EP, and their comparison to a baseline."""
+
+import json
+import os
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from .profiling import VITISAI_EP_REPORT_NAME, parse_vitisai_ep_report
+
+
+DEVICES = ("all", "dpu", "cpu")
+
+_BASELINE_CACHE: Dict[str, Tuple[Tuple[int, int], Dict[str, "RyzenAIOperatorsReport"]]] = {}
+_BASELINE_CACHE_LOCK = threading.Lock()
+
+
+@dataclass
+class RyzenAIOperatorsReport:
+    """
+    The placement of the nodes of a model compiled by the VitisAI EP.
+
+    Args:
+        num_nodes (`Dict[str, int]`):
+            The number of nodes of the model (`"all"`) and placed on each device (`"dpu"`, `"cpu"`).
+        op_types (`Dict[str, List[str]]`, defaults to `{}`):
+            The operator types placed on each device.
+    """
+
+    num_nodes: Dict[str, int]
+    op_types: Dict[str, List[str]] = field(default_factory=dict)
+
+    @classmethod
+    def from_ep_report(cls, report_path: Union[str, Path]) -> "RyzenAIOperatorsReport":
+        """
+        Reads a `vitisai_ep_report.json` written by the VitisAI EP in its cache directory.
+        """
+        device_stats = parse_vitisai_ep_report(report_path)
+        num_nodes = dict.fromkeys(DEVICES, 0)
+        op_types = {}
+        for device, stats in device_stats.items():
+            num_nodes[device] = stats["num_nodes"]
+            if device != "all":
+                op_types[device] = sorted(stats["op_types"])
+
+        return cls(num_nodes=num_nodes, op_types=op_types)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "RyzenAIOperatorsReport":
+        """
+        Reads an entry of an operators baseline, with or without the operator types.
+        """
+        return cls(
+            num_nodes={device: value for device, value in data.items() if device != "op_types"},
+            op_types={device: list(values) for device, values in data.get("op_types", {}).items()},
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = dict(self.num_nodes)
+        if self.op_types:
+            data["op_types"] = {device: list(values) for device, values in sorted(self.op_types.items())}
+        return data
+
+    @property
+    def dpu_coverage(self) -> float:
+        """
+        The share of the nodes of the model placed on the DPU.
+        """
+        total = self.num_nodes.get("all", 0)
+        return self.num_nodes.get("dpu", 0) / total if total else 0.0
+
+
+@dataclass
+class RyzenAIOperatorsDiff:
+    """
+    The change of the operator placement of a model relatively to the baseline.
+
+    Args:
+        model_name (`str`):
+            The name of the model, i.e. of its cache directory.
+        baseline (`Optional[RyzenAIOperatorsReport]`):
+            The placement in the baseline, `None` for new models.
+        current (`Optional[RyzenAIOperatorsReport]`):
+            The current placement, `None` for models missing from the current reports.
+        new_cpu_op_types (`List[str]`, defaults to `[]`):
+            The operator types now placed on the CPU that were not in the baseline.
+    """
+
+    model_name: str
+    baseline: Optional[RyzenAIOperatorsReport]
+    current: Optional[RyzenAIOperatorsReport]
+    new_cpu_op_types: List[str] = field(default_factory=list)
+
+    @property
+    def coverage_delta(self) -> float:
+        """
+        The change of DPU coverage, negative when nodes fell back to the CPU.
+        """
+        if self.baseline is None or self.current is None:
+            return 0.0
+        return self.current.dpu_coverage - self.baseline.dpu_coverage
+
+    def is_regression(self, tolerance: float = 0.0) -> bool:
+        """
+        Whether the DPU coverage dropped by more than `tolerance`, e.g. `0.01` for one percent of the nodes.
+        """
+        return self.coverage_delta < -tolerance
+
+
+def collect_operators_reports(
+    cache_dir: Union[str, Path], num_workers: Optional[int] = None
+) -> Dict[str, RyzenAIOperatorsReport]:
+    """
+    Reads the `vitisai_ep_report.json` of every model compiled in a VitisAI EP cache directory, concurrently.
+
+    Args:
+        cache_dir (`Union[str, Path]`):
+            The cache directory, containing one subdirectory per cache key.
+        num_workers (`Optional[int]`, defaults to `None`):
+            The number of threads reading the reports. Defaults to the `concurrent.futures` default.
+
+    Returns:
+        `Dict[str, RyzenAIOperatorsReport]`: The reports keyed by lower-cased cache key, sorted by name.
+    """
+    report_paths = {}
+    with os.scandir(cache_dir) as entries:
+        for entry in entries:
+            report_path = os.path.join(entry.path, VITISAI_EP_REPORT_NAME)
+            if entry.is_dir() and os.path.isfile(report_path):
+                report_paths[entry.name.lower()] = report_path
+
+    with ThreadPoolExecutor(num_workers) as executor:
+        reports = dict(zip(report_paths, executor.map(RyzenAIOperatorsReport.from_ep_report, report_paths.values())))
+
+    return dict(sorted(reports.items()))
+
+
+def op_type_placement_histogram(reports: Dict[str, RyzenAIOperatorsReport]) -> Dict[str, Dict[str, int]]:
+    """
+    Counts, for each operator type, the number of models placing it on each device.
+
+    Args:
+        reports (`Dict[str, RyzenAIOperatorsReport]`):
+            The reports of the models.
+
+    Returns:
+        `Dict[str, Dict[str, int]]`: The number of models per device, keyed by operator type.
+    """
+    histogram = defaultdict(lambda: defaultdict(int))
+    for report in reports.values():
+        for device, op_types in report.op_types.items():
+            for op_type in op_types:
+                histogram[op_type][device] += 1
+
+    return {op_type: dict(sorted(counts.items())) for op_type, counts in sorted(histogram.items())}
+
+
+def save_operators_baseline(reports: Dict[str, RyzenAIOperatorsReport], save_path: Union[str, Path]):
+    """
+    Saves the reports as an operators baseline JSON file.
+    """
+    with open(save_path, "w") as save_file:
+        json.dump({name: report.to_dict() for name, report in sorted(reports.items())}, save_file, indent=2)
+
+
+def load_operators_baseline(baseline_path: Union[str, Path]) -> Dict[str, RyzenAIOperatorsReport]:
+    """
+    Loads an operators baseline JSON file. The result is cached per file, and invalidated when the file modification
+    time or size changes, so it must not be modified.
+
+    Args:
+        baseline_path (`Union[str, Path]`):
+            Path to the baseline.
+
+    Returns:
+        `Dict[str, RyzenAIOperatorsReport]`: The reports keyed by model name.
+    """
+    baseline_path = os.path.abspath(baseline_path)
+    stat = os.stat(baseline_path)
+    key = (stat.st_mtime_ns, stat.st_size)
+
+    with _BASELINE_CACHE_LOCK:
+        cached = _BASELINE_CACHE.get(baseline_path)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+
+    with open(baseline_path, "r") as baseline_file:
+        baseline = {name: RyzenAIOperatorsReport.from_dict(data) for name, data in json.load(baseline_file).items()}
+
+    with _BASELINE_CACHE_LOCK:
+        _BASELINE_CACHE[baseline_path] = (key, baseline)
+
+    return baseline
+
+
+def diff_operators_baseline(
+    baseline: Dict[str, RyzenAIOperatorsReport], current: Dict[str, RyzenAIOperatorsReport]
+) -> List[RyzenAIOperatorsDiff]:
+    """
+    Compares the current operator placement of models to the baseline.
+
+    Args:
+        baseline (`Dict[str, RyzenAIOperatorsReport]`):
+            The baseline reports, e.g. from [`load_operators_baseline`].
+        current (`Dict[str, RyzenAIOperatorsReport]`):
+            The current reports, e.g. from [`collect_operators_reports`].
+
+    Returns:
+        `List[RyzenAIOperatorsDiff]`: The differences of all the models, sorted by increasing DPU coverage change so
+        that the largest regressions come first.
+    """
+    diffs = []
+    for model_name in sorted(set(baseline) | set(current)):
+        baseline_report, current_report = baseline.get(model_name), current.get(model_name)
+        new_cpu_op_types = []
+        if baseline_report is not None and current_report is not None and baseline_report.op_types:
+            baseline_cpu_op_types = set(baseline_report.op_types.get("cpu", []))
+            new_cpu_op_types = sorted(set(current_report.op_types.get("cpu", [])) - baseline_cpu_op_types)
+
+        diffs.append(RyzenAIOperatorsDiff(model_name, baseline_report, current_report, new_cpu_op_types))
+
+    return sorted(diffs, key=lambda diff: diff.coverage_delta)
+
+
+def format_operators_diff(diffs: List[RyzenAIOperatorsDiff], tolerance: float = 0.0) -> str:
+    """
+    Returns a human readable table of the differences, the regressions being marked with a `!`.
+    """
+    lines = [f"  {'Model':<40} {'DPU nodes':>17} {'DPU coverage':>21}  New CPU op types"]
+    for diff in diffs:
+        if diff.baseline is None or diff.current is None:
+            status = "new" if diff.baseline is None else "missing"
+            lines.append(f"  {diff.model_name[:40]:<40} {status:>17}")
+            continue
+
+        dpu_nodes = f"{diff.baseline.num_nodes.get('dpu', 0)} -> {diff.current.num_nodes.get('dpu', 0)}"
+        coverage = f"{diff.baseline.dpu_coverage:.1%} -> {diff.current.dpu_coverage:.1%}"
+        lines.append(
+            f"{'!' if diff.is_regression(tolerance) else ' '} {diff.model_name[:40]:<40} {dpu_nodes:>17} "
+            f"{coverage:>21}  {', '.join(diff.new_cpu_op_types)}"
+        )
+
+    return "\n".join(lines)
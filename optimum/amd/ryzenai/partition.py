@@ -0,0 +1,335 @@
+# Copyright 2024 The HuggingFace Team. All rights reserved.
+# Licensed under the MIT License.
+"""Offline preview of the DPU/CPU partitioning of a quantized ONNX model by the VitisAI EP, without a NPU."""
+
+import json
+from collections import defaultdict
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Union
+
+import onnx
+
+from .operators import RyzenAIOperatorsReport
+
+
+QDQ_OP_TYPES = frozenset({"QuantizeLinear", "DequantizeLinear"})
+
+# Operators the DPU compiles when their activations are quantized.
+DPU_OP_TYPES = frozenset(
+    {
+        "Add",
+        "AveragePool",
+        "Clip",
+        "Concat",
+        "Conv",
+        "ConvTranspose",
+        "DepthToSpace",
+        "Flatten",
+        "Gemm",
+        "GlobalAveragePool",
+        "HardSwish",
+        "Identity",
+        "LeakyRelu",
+        "MatMul",
+        "MaxPool",
+        "Relu",
+        "Reshape",
+        "Resize",
+        "Sigmoid",
+        "Slice",
+        "SpaceToDepth",
+        "Split",
+        "Squeeze",
+        "Transpose",
+        "Unsqueeze",
+    }
+)
+
+# Operators only mapped to DPU operators when the `vaip_config.json` pass rewriting them is enabled.
+PASS_OP_TYPES = {
+    "const_fold_batchnorm_to_scale": ("BatchNormalization",),
+    "convert_softmax_to_hard_softmax": ("Softmax",),
+    "merge_hard_sigmoid": ("HardSigmoid",),
+    "merge_mul": ("Mul",),
+    "merge_pad": ("Pad",),
+}
+
+# The plugin of the pass partitioning the graph for the DPU, nothing is offloaded when it is disabled.
+DPU_PASS_PLUGIN = "vaip-pass_level1_dpu"
+
+# Layout operators left to the CPU at the end of the graph by the `convert_ending_blacklist_ops_to_unknown_op` pass.
+ENDING_BLACKLIST_PASS = "convert_ending_blacklist_ops_to_unknown_op"
+ENDING_BLACKLIST_OP_TYPES = frozenset({"Flatten", "Reshape", "Squeeze", "Transpose", "Unsqueeze"})
+
+# The number of leading inputs carrying activations, the other inputs being shapes, scales or axes.
+_NUM_DATA_INPUTS = {
+    "Clip": 1,
+    "Pad": 1,
+    "Reshape": 1,
+    "Resize": 1,
+    "Slice": 1,
+    "Split": 1,
+    "Squeeze": 1,
+    "Unsqueeze": 1,
+}
+
+
+@dataclass
+class RyzenAIPartitionPreview:
+    """
+    The predicted placement of the nodes of a quantized model by the VitisAI EP.
+
+    Args:
+        num_nodes (`Dict[str, int]`):
+            The number of nodes of the model (`"all"`) and predicted on each device (`"dpu"`, `"cpu"`).
+        op_types (`Dict[str, Dict[str, int]]`):
+            The number of nodes of each operator type, per device.
+        cpu_nodes (`List[str]`):
+            The names of the nodes predicted to fall back to the CPU, in topological order.
+        num_subgraphs (`int`):
+            The number of connected DPU subgraphs.
+        boundary_tensors (`List[str]`, defaults to `[]`):
+            The tensors crossing between the CPU and the DPU, graph inputs and outputs included. Each of them is a host
+            round trip.
+    """
+
+    num_nodes: Dict[str, int]
+    op_types: Dict[str, Dict[str, int]]
+    cpu_nodes: List[str]
+    num_subgraphs: int
+    boundary_tensors: List[str] = field(default_factory=list)
+
+    @property
+    def num_boundaries(self) -> int:
+        return len(self.boundary_tensors)
+
+    @property
+    def dpu_coverage(self) -> float:
+        """
+        The share of the nodes of the model predicted on the DPU.
+        """
+        return self.to_operators_report().dpu_coverage
+
+    def to_operators_report(self) -> RyzenAIOperatorsReport:
+        """
+        Converts the preview to the format of the operators baseline, to compare it with [`diff_operators_baseline`].
+        """
+        return RyzenAIOperatorsReport(
+            num_nodes=dict(self.num_nodes),
+            op_types={device: sorted(counts) for device, counts in self.op_types.items() if counts},
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(asdict(self), num_boundaries=self.num_boundaries)
+
+    def save(self, save_path: Union[str, Path]):
+        with open(save_path, "w") as save_file:
+            json.dump(self.to_dict(), save_file, indent=2)
+
+    def summary(self) -> str:
+        lines = [
+            f"Nodes: {self.num_nodes['all']} ({self.num_nodes['dpu']} DPU, {self.num_nodes['cpu']} CPU, "
+            f"{self.dpu_coverage:.1%} DPU coverage)",
+            f"DPU subgraphs: {self.num_subgraphs}, CPU/DPU boundaries: {self.num_boundaries}",
+        ]
+        cpu_op_types = self.op_types.get("cpu", {})
+        if cpu_op_types:
+            counts = ", ".join(f"{op_type} x{count}" for op_type, count in sorted(cpu_op_types.items()))
+            lines.append(f"CPU fallbacks: {counts}")
+
+        return "\n".join(lines)
+
+
+def get_enabled_vaip_passes(vaip_config: Union[str, Path]) -> List[Dict[str, Any]]:
+    """
+    Lists the enabled passes of a `vaip_config.json`, the sub-passes of the DPU pass included, in order.
+    """
+    with open(vaip_config, "r") as config_file:
+        config = json.load(config_file)
+
+    def walk(passes):
+        for vaip_pass in passes:
+            if vaip_pass.get("disabled", False):
+                continue
+            yield vaip_pass
+            yield from walk(vaip_pass.get("passDpuParam", {}).get("subPass", []))
+
+    return list(walk(config.get("passes", [])))
+
+
+def get_dpu_op_types(vaip_config: Optional[Union[str, Path]] = None) -> FrozenSet[str]:
+    """
+    Returns the operator types the VitisAI EP offloads to the DPU with a given configuration.
+
+    `vaip_config.json` does not list the supported operators: they are implemented by its passes. The operators natively
+    compiled for the DPU are extended with the ones rewritten by the enabled passes.
+
+    Args:
+        vaip_config (`Optional[Union[str, Path]]`, defaults to `None`):
+            Path to the `vaip_config.json`. Defaults to the operators natively compiled for the DPU.
+
+    Returns:
+        `FrozenSet[str]`: The supported operator types.
+    """
+    if vaip_config is None:
+        return DPU_OP_TYPES
+
+    enabled_passes = get_enabled_vaip_passes(vaip_config)
+    if not any(vaip_pass.get("plugin") == DPU_PASS_PLUGIN for vaip_pass in enabled_passes):
+        return frozenset()
+
+    op_types = set(DPU_OP_TYPES)
+    for vaip_pass in enabled_passes:
+        op_types.update(PASS_OP_TYPES.get(vaip_pass.get("name"), ()))
+
+    return frozenset(op_types)
+
+
+def preview_partition(
+    model: Union[str, Path, onnx.ModelProto],
+    vaip_config: Optional[Union[str, Path]] = None,
+    supported_op_types: Optional[Iterable[str]] = None,
+) -> RyzenAIPartitionPreview:
+    """
+    Predicts the DPU/CPU partitioning of a quantized (QDQ) ONNX model by the VitisAI EP, without compiling it.
+
+    A node is predicted on the DPU when its operator type is supported and all its activation inputs are quantized,
+    i.e. come from a `DequantizeLinear` or from another DPU node. `QuantizeLinear` nodes follow the node producing their
+    input, and `DequantizeLinear` nodes the nodes consuming their output, so that the quantization of the graph inputs
+    and the dequantization of the graph outputs run on the CPU.
+
+    Args:
+        model (`Union[str, Path, onnx.ModelProto]`):
+            The quantized model, or its path. The external data is not loaded.
+        vaip_config (`Optional[Union[str, Path]]`, defaults to `None`):
+            Path to the `vaip_config.json` the model would be compiled with.
+        supported_op_types (`Optional[Iterable[str]]`, defaults to `None`):
+            Overrides the operator types supported by the DPU. Defaults to [`get_dpu_op_types`] of `vaip_config`.
+
+    Returns:
+        `RyzenAIPartitionPreview`: The predicted partitioning.
+    """
+    if not isinstance(model, onnx.ModelProto):
+        model = onnx.load(str(model), load_external_data=False)
+    graph = model.graph
+
+    if supported_op_types is None:
+        supported_op_types = get_dpu_op_types(vaip_config)
+    supported_op_types = frozenset(supported_op_types)
+    ending_blacklist = vaip_config is not None and any(
+        vaip_pass.get("name") == ENDING_BLACKLIST_PASS for vaip_pass in get_enabled_vaip_passes(vaip_config)
+    )
+
+    nodes = list(graph.node)
+    node_names = [node.name or f"{node.op_type}_{idx}" for idx, node in enumerate(nodes)]
+    constants = {initializer.name for initializer in graph.initializer}
+    constants.update(output for node in nodes if node.op_type == "Constant" for output in node.output)
+    graph_outputs = {output.name for output in graph.output}
+
+    producers = {}
+    consumers = defaultdict(list)
+    for idx, node in enumerate(nodes):
+        for output in node.output:
+            producers[output] = idx
+        for name in node.input:
+            if name:
+                consumers[name].append(idx)
+
+    def upstream(tensor: str) -> Optional[int]:
+        # The node producing `tensor`, through Q/DQ nodes. `None` for graph inputs.
+        idx = producers.get(tensor)
+        if idx is not None and nodes[idx].op_type in QDQ_OP_TYPES:
+            return upstream(nodes[idx].input[0])
+        return idx
+
+    def downstream(tensor: str) -> List[Optional[int]]:
+        # The nodes consuming `tensor`, through Q/DQ nodes. `None` stands for a graph output.
+        endpoints = [None] if tensor in graph_outputs else []
+        for idx in consumers[tensor]:
+            if nodes[idx].op_type in QDQ_OP_TYPES:
+                for output in nodes[idx].output:
+                    endpoints.extend(downstream(output))
+            else:
+                endpoints.append(idx)
+        return endpoints
+
+    devices = [None] * len(nodes)
+
+    # The nodes are topologically sorted, so the producers of the inputs of a node are placed before it.
+    for idx, node in enumerate(nodes):
+        if node.op_type in QDQ_OP_TYPES or node.op_type == "Constant":
+            continue
+
+        num_data_inputs = _NUM_DATA_INPUTS.get(node.op_type, len(node.input))
+        data_inputs = [name for name in node.input[:num_data_inputs] if name and name not in constants]
+        is_quantized = all(
+            name in producers
+            and (nodes[producers[name]].op_type == "DequantizeLinear" or devices[producers[name]] == "dpu")
+            for name in data_inputs
+        )
+        devices[idx] = "dpu" if node.op_type in supported_op_types and data_inputs and is_quantized else "cpu"
+
+    if ending_blacklist:
+        for idx in reversed(range(len(nodes))):
+            if nodes[idx].op_type not in ENDING_BLACKLIST_OP_TYPES or devices[idx] != "dpu":
+                continue
+            endpoints = [endpoint for output in nodes[idx].output for endpoint in downstream(output)]
+            if all(
+                endpoint is None
+                or (nodes[endpoint].op_type in ENDING_BLACKLIST_OP_TYPES and devices[endpoint] == "cpu")
+                for endpoint in endpoints
+            ):
+                devices[idx] = "cpu"
+
+    for idx, node in enumerate(nodes):
+        if devices[idx] is not None:
+            continue
+
+        if node.op_type == "QuantizeLinear" and node.input[0] not in constants:
+            producer = upstream(node.input[0])
+            devices[idx] = "cpu" if producer is None else devices[producer]
+        else:
+            # Weights, constants and dequantized activations live on the device of their consumers.
+            endpoints = [endpoint for output in node.output for endpoint in downstream(output)]
+            on_dpu = endpoints and all(endpoint is not None and devices[endpoint] == "dpu" for endpoint in endpoints)
+            devices[idx] = "dpu" if on_dpu else "cpu"
+
+    # DPU subgraphs are the connected components of the DPU nodes.
+    parents = list(range(len(nodes)))
+
+    def find(idx: int) -> int:
+        while parents[idx] != idx:
+            parents[idx] = parents[parents[idx]]
+            idx = parents[idx]
+        return idx
+
+    boundary_tensors = []
+    for tensor in sorted(set(producers) | set(consumers), key=lambda name: (producers.get(name, -1), name)):
+        if tensor in constants:
+            continue
+        producer = producers.get(tensor)
+        producer_device = devices[producer] if producer is not None else "cpu"
+        consumer_devices = {devices[idx] for idx in consumers[tensor]}
+        if tensor in graph_outputs:
+            consumer_devices.add("cpu")
+
+        if consumer_devices - {producer_device}:
+            boundary_tensors.append(tensor)
+        if producer_device == "dpu" and producer is not None:
+            for idx in consumers[tensor]:
+                if devices[idx] == "dpu":
+                    parents[find(idx)] = find(producer)
+
+    num_nodes = {"all": len(nodes), "dpu": devices.count("dpu"), "cpu": devices.count("cpu")}
+    op_types = {"dpu": defaultdict(int), "cpu": defaultdict(int)}
+    for node, device in zip(nodes, devices):
+        op_types[device][node.op_type] += 1
+
+    return RyzenAIPartitionPreview(
+        num_nodes=num_nodes,
+        op_types={device: dict(sorted(counts.items())) for device, counts in op_types.items()},
+        cpu_nodes=[name for name, device in zip(node_names, devices) if device == "cpu"],
+        num_subgraphs=len({find(idx) for idx, device in enumerate(devices) if device == "dpu"}),
+        boundary_tensors=boundary_tensors,
+    )
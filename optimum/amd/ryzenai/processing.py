@@ -0,0 +1,754 @@
+# Copyright 2024 The HuggingFace Team. All rights reserved.
+# Licensed under the MIT License.
+"""Vectorized pre/post-processing stages for the RyzenAIModelForXXX classes."""
+
+from collections import defaultdict
+from dataclasses import dataclass
+from functools import partial
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+
+IMAGENET_DEFAULT_MEAN = (0.485, 0.456, 0.406)
+IMAGENET_DEFAULT_STD = (0.229, 0.224, 0.225)
+
+DETECTION_DEFAULT_STRIDES = (8, 16, 32)
+# (width, height) anchors in pixels for each stride, shared by the COCO YOLOv3 and YOLOv5 models.
+YOLO_DEFAULT_ANCHORS = (
+    ((10, 13), (16, 30), (33, 23)),
+    ((30, 61), (62, 45), (59, 119)),
+    ((116, 90), (156, 198), (373, 326)),
+)
+RETINAFACE_DEFAULT_MIN_SIZES = ((16, 32), (64, 128), (256, 512))
+RETINAFACE_DEFAULT_VARIANCES = (0.1, 0.2)
+
+# Fixed-point precision of the resampling coefficients of Pillow.
+_PIL_PRECISION_BITS = 22
+
+
+def _to_hwc_uint8(image: Any) -> np.ndarray:
+    if hasattr(image, "convert"):  # PIL.Image.Image
+        image = image.convert("RGB")
+    image = np.asarray(image)
+    if image.ndim == 2:
+        image = image[..., None]
+    if image.ndim != 3 or image.shape[-1] not in (1, 3, 4):
+        raise ValueError(
+            f"Expected an image of shape (height, width, channels) with 1, 3 or 4 channels, got shape {image.shape}."
+        )
+    if image.shape[-1] == 1:
+        image = np.repeat(image, 3, axis=-1)
+    elif image.shape[-1] == 4:
+        # The alpha channel is dropped, as PIL.Image.convert("RGB") does.
+        image = image[..., :3]
+    if image.dtype != np.uint8:
+        image = np.clip(np.rint(image), 0, 255).astype(np.uint8)
+    return image
+
+
+def _interpolation_indices(
+    in_size: int, out_size: int, crop_offset: int, crop_length: int
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # Half-pixel centers (align_corners=False), restricted to the cropped window of the resized image.
+    coords = (np.arange(crop_offset, crop_offset + crop_length, dtype=np.float32) + 0.5) * (in_size / out_size) - 0.5
+    coords = np.clip(coords, 0, in_size - 1)
+    low = np.floor(coords).astype(np.intp)
+    high = np.minimum(low + 1, in_size - 1)
+    return low, high, coords - low
+
+
+def _sinc(x: np.ndarray) -> np.ndarray:
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(x == 0, 1.0, np.sin(np.pi * x) / (np.pi * x))
+
+
+def _bicubic_filter(x: np.ndarray) -> np.ndarray:
+    a = -0.5
+    x = np.abs(x)
+    return np.where(x < 1, ((a + 2) * x - (a + 3)) * x * x + 1, np.where(x < 2, (((x - 5) * x + 8) * x - 4) * a, 0.0))
+
+
+# The filters of Pillow and their support, indexed by their `PIL.Image.Resampling` value.
+_PIL_FILTERS = {
+    1: (lambda x: np.where((x >= -3) & (x < 3), _sinc(x) * _sinc(x / 3), 0.0), 3.0),  # LANCZOS
+    2: (lambda x: np.maximum(1 - np.abs(x), 0.0), 1.0),  # BILINEAR
+    3: (_bicubic_filter, 2.0),  # BICUBIC
+    4: (lambda x: np.where((x > -0.5) & (x <= 0.5), 1.0, 0.0), 0.5),  # BOX
+    5: (lambda x: np.where(np.abs(x) < 1, _sinc(x) * (0.54 + 0.46 * np.cos(np.pi * x)), 0.0), 1.0),  # HAMMING
+}
+
+
+def _pil_nearest_indices(in_size: int, out_size: int, crop_offset: int, crop_length: int) -> np.ndarray:
+    # Pillow accumulates the sampling coordinates, whose rounding errors decide the sampled pixels.
+    steps = np.full(out_size, in_size / out_size)
+    steps[0] /= 2
+    indices = np.minimum(np.cumsum(steps).astype(np.intp), in_size - 1)
+    return indices[crop_offset : crop_offset + crop_length]
+
+
+def _pil_resample_weights(
+    in_size: int, out_size: int, crop_offset: int, crop_length: int, resample: int
+) -> Tuple[np.ndarray, int, int]:
+    # The fixed-point coefficients of Pillow's antialiased resampling, restricted to the cropped window of the resized
+    # image. Returns them with the range of input pixels they use.
+    filter_fn, support = _PIL_FILTERS[resample]
+    scale = in_size / out_size
+    filter_scale = max(scale, 1.0)
+    support *= filter_scale
+
+    weights = []
+    for x in range(crop_offset, crop_offset + crop_length):
+        center = (x + 0.5) * scale
+        x_min = max(int(center - support + 0.5), 0)
+        x_max = min(int(center + support + 0.5), in_size)
+        coefficients = filter_fn((np.arange(x_min, x_max) - center + 0.5) * (1.0 / filter_scale))
+        total = sum(coefficients.tolist())
+        if total != 0:
+            coefficients = coefficients / total
+        weights.append(
+            (x_min, np.trunc(coefficients * (1 << _PIL_PRECISION_BITS) + np.where(coefficients < 0, -0.5, 0.5)))
+        )
+
+    start = min(x_min for x_min, _ in weights)
+    stop = max(x_min + len(coefficients) for x_min, coefficients in weights)
+    matrix = np.zeros((crop_length, stop - start))
+    for row, (x_min, coefficients) in zip(matrix, weights):
+        row[x_min - start : x_min - start + len(coefficients)] = coefficients
+    return matrix, start, stop
+
+
+def _pil_round(values: np.ndarray) -> np.ndarray:
+    values += 1 << (_PIL_PRECISION_BITS - 1)
+    values /= 1 << _PIL_PRECISION_BITS
+    return np.clip(np.floor(values, out=values), 0, 255, out=values)
+
+
+class RyzenAIImagePreprocessor:
+    """
+    Batched NumPy implementation of the resize, center crop, rescale and normalize steps of image processors, writing
+    the model inputs into reusable buffers.
+
+    Resizing is fused with center cropping by only interpolating the cropped window. By default, it uses bilinear
+    interpolation with half-pixel centers. With a `resample` filter, it instead reproduces the antialiased resampling
+    of Pillow used by Transformers image processors, up to rare rounding ties. Rescaling and normalization are folded
+    into a single per-channel multiply-add.
+
+    Args:
+        size (`Union[int, Tuple[int, int]]`):
+            The `(height, width)` to resize the images to, or an `int` to resize the shortest edge to, keeping the
+            aspect ratio.
+        crop_size (`Optional[Tuple[int, int]]`, defaults to `None`):
+            The `(height, width)` of the center crop applied after resizing, if any.
+        rescale_factor (`float`, defaults to `1 / 255`):
+            The factor to rescale the pixel values by.
+        image_mean (`Optional[Sequence[float]]`, defaults to the ImageNet mean):
+            The per-channel mean to normalize with. Set to `None` to skip normalization.
+        image_std (`Optional[Sequence[float]]`, defaults to the ImageNet standard deviation):
+            The per-channel standard deviation to normalize with.
+        resample (`Optional[int]`, defaults to `None`):
+            The `PIL.Image.Resampling` filter to resize with, as Pillow does (e.g. `3` for bicubic). If `None`, images
+            are resized with the faster bilinear interpolation without antialiasing.
+        channels_last (`bool`, defaults to `False`):
+            Whether to produce NHWC instead of NCHW inputs.
+        dtype (`np.dtype`, defaults to `np.float32`):
+            The data type of the produced inputs.
+        num_buffers (`int`, defaults to `2`):
+            The number of output buffers to cycle through per batch size. The array returned by a call is reused and
+            overwritten `num_buffers` calls later.
+    """
+
+    def __init__(
+        self,
+        size: Union[int, Tuple[int, int]],
+        crop_size: Optional[Tuple[int, int]] = None,
+        rescale_factor: float = 1 / 255,
+        image_mean: Optional[Sequence[float]] = IMAGENET_DEFAULT_MEAN,
+        image_std: Optional[Sequence[float]] = IMAGENET_DEFAULT_STD,
+        resample: Optional[int] = None,
+        channels_last: bool = False,
+        dtype: np.dtype = np.float32,
+        num_buffers: int = 2,
+    ):
+        if num_buffers <= 0:
+            raise ValueError(f"num_buffers should be >= 1 (got: {num_buffers}).")
+        if resample is not None and int(resample) != 0 and int(resample) not in _PIL_FILTERS:
+            raise ValueError(f"Unsupported resample filter {resample}, expected a PIL.Image.Resampling value.")
+        if crop_size is None and isinstance(size, int):
+            raise ValueError("A crop_size is required when resizing the shortest edge, to get a fixed output size.")
+
+        self.size = size
+        self.crop_size = tuple(crop_size) if crop_size is not None else None
+        self.output_size = self.crop_size if self.crop_size is not None else tuple(size)
+        self.resample = int(resample) if resample is not None else None
+        self.channels_last = channels_last
+        self.dtype = np.dtype(dtype)
+        self.num_buffers = num_buffers
+
+        mean = np.zeros(3) if image_mean is None else np.asarray(image_mean, dtype=np.float64)
+        std = np.ones(3) if image_std is None else np.asarray(image_std, dtype=np.float64)
+        self._scale = (rescale_factor / std).astype(np.float32)
+        self._offset = (-mean / std).astype(np.float32)
+
+        self._indices_cache = {}
+        self._buffers = defaultdict(list)
+        self._buffer_index = defaultdict(int)
+
+    @classmethod
+    def from_image_processor(
+        cls, image_processor: Any, channels_last: bool = False, dtype: np.dtype = np.float32, num_buffers: int = 2
+    ) -> "RyzenAIImagePreprocessor":
+        """
+        Instantiates a `RyzenAIImagePreprocessor` from the attributes of a Transformers image processor (e.g. one of
+        the `preprocessors` loaded along a `RyzenAIModel`), resizing with its `resample` filter (bilinear if it has
+        none) to produce the same inputs.
+        """
+        size = getattr(image_processor, "size", None)
+        if not getattr(image_processor, "do_resize", True) or size is None:
+            raise ValueError(f"{image_processor.__class__.__name__} does not resize to a fixed size.")
+        if isinstance(size, int):
+            size = {"shortest_edge": size}
+
+        crop_size = None
+        if getattr(image_processor, "do_center_crop", False):
+            crop = image_processor.crop_size
+            crop_size = (crop, crop) if isinstance(crop, int) else (crop["height"], crop["width"])
+
+        if "height" in size and "width" in size:
+            resize = (size["height"], size["width"])
+        elif "shortest_edge" in size:
+            shortest_edge = size["shortest_edge"]
+            crop_pct = getattr(image_processor, "crop_pct", None)
+            if crop_pct is not None and crop_size is None:
+                # ConvNext-style: resize by 1 / crop_pct then center crop below 384, warp above.
+                if shortest_edge < 384:
+                    resize, crop_size = int(shortest_edge / crop_pct), (shortest_edge, shortest_edge)
+                else:
+                    resize = (shortest_edge, shortest_edge)
+            else:
+                resize = shortest_edge
+        else:
+            raise ValueError(f"Unsupported image processor size {size}.")
+
+        do_normalize = getattr(image_processor, "do_normalize", True)
+        return cls(
+            size=resize,
+            crop_size=crop_size,
+            rescale_factor=image_processor.rescale_factor if getattr(image_processor, "do_rescale", True) else 1.0,
+            image_mean=image_processor.image_mean if do_normalize else None,
+            image_std=image_processor.image_std if do_normalize else None,
+            resample=getattr(image_processor, "resample", 2),
+            channels_last=channels_last,
+            dtype=dtype,
+            num_buffers=num_buffers,
+        )
+
+    def _resized_size(self, height: int, width: int) -> Tuple[int, int]:
+        if not isinstance(self.size, int):
+            return self.size
+        if height <= width:
+            return self.size, int(self.size * width / height)
+        return int(self.size * height / width), self.size
+
+    def _get_indices(self, height: int, width: int):
+        key = (height, width)
+        if key not in self._indices_cache:
+            resized_height, resized_width = self._resized_size(height, width)
+            out_height, out_width = self.output_size
+            top = int((resized_height - out_height) / 2)
+            left = int((resized_width - out_width) / 2)
+            if self.resample is None:
+                get_indices = _interpolation_indices
+            elif self.resample == 0:
+                get_indices = _pil_nearest_indices
+            else:
+                get_indices = partial(_pil_resample_weights, resample=self.resample)
+            self._indices_cache[key] = (
+                get_indices(height, resized_height, top, out_height),
+                get_indices(width, resized_width, left, out_width),
+            )
+        return self._indices_cache[key]
+
+    def _get_buffer(self, batch_size: int) -> np.ndarray:
+        buffers = self._buffers[batch_size]
+        index = self._buffer_index[batch_size]
+        self._buffer_index[batch_size] = (index + 1) % self.num_buffers
+        if index == len(buffers):
+            height, width = self.output_size
+            shape = (batch_size, height, width, 3) if self.channels_last else (batch_size, 3, height, width)
+            buffers.append(np.empty(shape, dtype=self.dtype))
+        return buffers[index]
+
+    def resize(self, images: np.ndarray) -> np.ndarray:
+        """
+        Resizes and center crops a `(batch_size, height, width, channels)` batch of same-size images, returning
+        `float32` pixel values.
+        """
+        if self.resample == 0:
+            y_indices, x_indices = self._get_indices(*images.shape[1:3])
+            return images[:, y_indices][:, :, x_indices].astype(np.float32)
+        if self.resample is not None:
+            # Horizontal then vertical pass, each rounded to 8 bits as in Pillow. The float64 sums of the fixed-point
+            # coefficients are exact. Only the rows used by the vertical pass go through the horizontal pass.
+            (y_weights, y_start, y_stop), (x_weights, x_start, x_stop) = self._get_indices(*images.shape[1:3])
+            rows = images[:, y_start:y_stop, x_start:x_stop].astype(np.float64).transpose(0, 1, 3, 2)
+            rows = _pil_round(rows @ x_weights.T).transpose(0, 2, 1, 3)
+            return _pil_round(y_weights @ rows).transpose(0, 2, 3, 1).astype(np.float32)
+
+        (y_low, y_high, y_weight), (x_low, x_high, x_weight) = self._get_indices(*images.shape[1:3])
+        top = images[:, y_low].astype(np.float32)
+        rows = top + (images[:, y_high] - top) * y_weight[None, :, None, None]
+        left = rows[:, :, x_low]
+        return left + (rows[:, :, x_high] - left) * x_weight[None, None, :, None]
+
+    def __call__(self, images: Union[Any, Sequence[Any]]) -> np.ndarray:
+        """
+        Preprocesses a batch of images (PIL images or `(height, width, channels)` arrays). Grayscale images are
+        converted to RGB and the alpha channel of RGBA images is dropped. Arrays of another type than `uint8` are
+        expected in the `[0, 255]` range, and are rounded to `uint8`.
+
+        Images sharing the same size are resized together in a single vectorized pass.
+
+        Returns:
+            `np.ndarray`: The model inputs, in one of the reusable buffers.
+        """
+        if not isinstance(images, (list, tuple)):
+            images = [images]
+
+        images = [_to_hwc_uint8(image) for image in images]
+        groups = defaultdict(list)
+        for index, image in enumerate(images):
+            groups[image.shape].append(index)
+
+        output = self._get_buffer(len(images))
+        for indices in groups.values():
+            pixel_values = self.resize(np.stack([images[index] for index in indices]))
+            pixel_values *= self._scale
+            pixel_values += self._offset
+            if not self.channels_last:
+                pixel_values = pixel_values.transpose(0, 3, 1, 2)
+            if len(indices) == len(images):
+                output[...] = pixel_values
+            else:
+                output[indices] = pixel_values
+
+        return output
+
+
+def top_k_logits(logits: np.ndarray, k: int = 5, apply_softmax: bool = True) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Returns the top-k scores and class indices of a `(batch_size, num_labels)` logits array, sorted by decreasing
+    score.
+
+    Args:
+        logits (`np.ndarray`):
+            The classification logits.
+        k (`int`, defaults to `5`):
+            The number of classes to keep.
+        apply_softmax (`bool`, defaults to `True`):
+            Whether to return softmax probabilities rather than raw logits as scores.
+    """
+    logits = np.asarray(logits)
+    k = min(k, logits.shape[-1])
+
+    indices = np.argpartition(-logits, k - 1, axis=-1)[:, :k]
+    scores = np.take_along_axis(logits, indices, axis=-1)
+    order = np.argsort(-scores, axis=-1, kind="stable")
+    indices = np.take_along_axis(indices, order, axis=-1)
+    scores = np.take_along_axis(scores, order, axis=-1)
+
+    if apply_softmax:
+        max_logits = logits.max(axis=-1, keepdims=True)
+        normalizer = np.exp(logits - max_logits).sum(axis=-1, keepdims=True)
+        scores = np.exp(scores - max_logits) / normalizer
+
+    return scores, indices
+
+
+def format_classification_outputs(
+    scores: np.ndarray, indices: np.ndarray, id2label: Optional[Dict[int, str]] = None
+) -> List[List[Dict[str, Any]]]:
+    """
+    Formats the outputs of [`top_k_logits`] as the `[{"score": ..., "label": ...}]` lists returned by the Transformers
+    image classification pipeline.
+    """
+    id2label = id2label or {}
+    return [
+        [
+            {"score": float(score), "label": id2label.get(int(index), str(int(index)))}
+            for score, index in zip(sample_scores, sample_indices)
+        ]
+        for sample_scores, sample_indices in zip(scores, indices)
+    ]
+
+
+@dataclass
+class RyzenAIDetections:
+    """
+    The detections of a single image, as returned by [`~ryzenai.RyzenAIDetectionPostprocessor`].
+
+    Args:
+        boxes (`np.ndarray`):
+            The `(num_detections, 4)` boxes, as `(x1, y1, x2, y2)` in model input pixels.
+        scores (`np.ndarray`):
+            The `(num_detections,)` confidence scores.
+        labels (`np.ndarray`):
+            The `(num_detections,)` class indices.
+        keypoints (`Optional[np.ndarray]`, defaults to `None`):
+            The `(num_detections, num_keypoints, 2)` keypoints, for architectures predicting them (RetinaFace).
+    """
+
+    boxes: np.ndarray
+    scores: np.ndarray
+    labels: np.ndarray
+    keypoints: Optional[np.ndarray] = None
+
+    def __len__(self):
+        return len(self.scores)
+
+
+def _sigmoid(x: np.ndarray) -> np.ndarray:
+    return 1.0 / (1.0 + np.exp(-x))
+
+
+def _softmax(x: np.ndarray, axis: int = -1) -> np.ndarray:
+    x = np.exp(x - x.max(axis=axis, keepdims=True))
+    return x / x.sum(axis=axis, keepdims=True)
+
+
+def _to_channels_last(output: np.ndarray, num_channels: int) -> np.ndarray:
+    # Heads may be exported either as NCHW or NHWC.
+    if output.shape[-1] == num_channels and output.shape[1] != num_channels:
+        return output
+    return output.transpose(0, 2, 3, 1)
+
+
+def _sort_by_stride(outputs: Sequence[np.ndarray], num_channels: int) -> List[np.ndarray]:
+    outputs = [_to_channels_last(np.asarray(output), num_channels) for output in outputs]
+    return sorted(outputs, key=lambda output: -output.shape[1] * output.shape[2])
+
+
+def _grid(height: int, width: int) -> np.ndarray:
+    grid_y, grid_x = np.meshgrid(
+        np.arange(height, dtype=np.float32), np.arange(width, dtype=np.float32), indexing="ij"
+    )
+    return np.stack((grid_x, grid_y), axis=-1)
+
+
+def _xywh_to_xyxy(xy: np.ndarray, wh: np.ndarray) -> np.ndarray:
+    return np.concatenate((xy - wh / 2, xy + wh / 2), axis=-1)
+
+
+def decode_yolo_anchors(
+    outputs: Sequence[np.ndarray],
+    input_size: Tuple[int, int],
+    anchors: Sequence[Sequence[Tuple[float, float]]] = YOLO_DEFAULT_ANCHORS,
+    num_classes: int = 80,
+    version: str = "yolov5",
+) -> Tuple[np.ndarray, np.ndarray, None]:
+    """
+    Decodes the raw outputs of anchor-based YOLOv3 / YOLOv5 heads, one `(batch_size, num_anchors * (5 + num_classes),
+    height, width)` output per stride (NCHW or NHWC).
+
+    Returns the `(batch_size, num_boxes, 4)` boxes as `(x1, y1, x2, y2)` and the `(batch_size, num_boxes, num_classes)`
+    class scores, multiplied by the objectness.
+    """
+    num_anchors = len(anchors[0])
+    num_outputs = 5 + num_classes
+    boxes, scores = [], []
+    for output, level_anchors in zip(_sort_by_stride(outputs, num_anchors * num_outputs), anchors):
+        batch_size, height, width, _ = output.shape
+        stride = input_size[0] / height
+        output = output.reshape(batch_size, height, width, num_anchors, num_outputs).astype(np.float32)
+        grid = _grid(height, width)[None, :, :, None, :]
+        level_anchors = np.asarray(level_anchors, dtype=np.float32)
+
+        if version == "yolov5":
+            output = _sigmoid(output)
+            xy = (output[..., 0:2] * 2 - 0.5 + grid) * stride
+            wh = (output[..., 2:4] * 2) ** 2 * level_anchors
+            confidences = output[..., 4:]
+        elif version == "yolov3":
+            xy = (_sigmoid(output[..., 0:2]) + grid) * stride
+            wh = np.exp(output[..., 2:4]) * level_anchors
+            confidences = _sigmoid(output[..., 4:])
+        else:
+            raise ValueError(f"Unsupported YOLO version {version}.")
+
+        boxes.append(_xywh_to_xyxy(xy, wh).reshape(batch_size, -1, 4))
+        scores.append((confidences[..., 1:] * confidences[..., 0:1]).reshape(batch_size, -1, num_classes))
+
+    return np.concatenate(boxes, axis=1), np.concatenate(scores, axis=1), None
+
+
+def decode_yolov8(
+    outputs: Sequence[np.ndarray],
+    input_size: Tuple[int, int],
+    num_classes: int = 80,
+    reg_max: int = 16,
+) -> Tuple[np.ndarray, np.ndarray, None]:
+    """
+    Decodes the raw outputs of anchor-free YOLOv8 heads, one `(batch_size, 4 * reg_max + num_classes, height, width)`
+    output per stride (NCHW or NHWC), with distribution focal loss box regression.
+
+    A single already decoded `(batch_size, 4 + num_classes, num_boxes)` output (`(center_x, center_y, width, height)`
+    boxes followed by class scores) is supported as well.
+    """
+    if len(outputs) == 1 and np.asarray(outputs[0]).ndim == 3:
+        output = np.asarray(outputs[0], dtype=np.float32).transpose(0, 2, 1)
+        return _xywh_to_xyxy(output[..., 0:2], output[..., 2:4]), output[..., 4:], None
+
+    boxes, scores = [], []
+    for output in _sort_by_stride(outputs, 4 * reg_max + num_classes):
+        batch_size, height, width, _ = output.shape
+        stride = input_size[0] / height
+        output = output.reshape(batch_size, height * width, -1).astype(np.float32)
+
+        distribution = _softmax(output[..., : 4 * reg_max].reshape(batch_size, -1, 4, reg_max))
+        distances = distribution @ np.arange(reg_max, dtype=np.float32)
+        anchor_points = _grid(height, width).reshape(1, -1, 2) + 0.5
+
+        boxes.append(
+            np.concatenate((anchor_points - distances[..., :2], anchor_points + distances[..., 2:]), -1) * stride
+        )
+        scores.append(_sigmoid(output[..., 4 * reg_max :]))
+
+    return np.concatenate(boxes, axis=1), np.concatenate(scores, axis=1), None
+
+
+def decode_yolox(
+    outputs: Sequence[np.ndarray],
+    input_size: Tuple[int, int],
+    num_classes: int = 80,
+    apply_sigmoid: bool = True,
+) -> Tuple[np.ndarray, np.ndarray, None]:
+    """
+    Decodes the raw outputs of YOLOX heads, one `(batch_size, 5 + num_classes, height, width)` output per stride (NCHW
+    or NHWC). Set `apply_sigmoid=False` for exports where the objectness and class scores are already activated.
+    """
+    boxes, scores = [], []
+    for output in _sort_by_stride(outputs, 5 + num_classes):
+        batch_size, height, width, _ = output.shape
+        stride = input_size[0] / height
+        output = output.reshape(batch_size, height * width, -1).astype(np.float32)
+        grid = _grid(height, width).reshape(1, -1, 2)
+
+        xy = (output[..., 0:2] + grid) * stride
+        wh = np.exp(output[..., 2:4]) * stride
+        confidences = _sigmoid(output[..., 4:]) if apply_sigmoid else output[..., 4:]
+
+        boxes.append(_xywh_to_xyxy(xy, wh))
+        scores.append(confidences[..., 1:] * confidences[..., 0:1])
+
+    return np.concatenate(boxes, axis=1), np.concatenate(scores, axis=1), None
+
+
+def retinaface_priors(
+    input_size: Tuple[int, int],
+    min_sizes: Sequence[Sequence[int]] = RETINAFACE_DEFAULT_MIN_SIZES,
+    strides: Sequence[int] = DETECTION_DEFAULT_STRIDES,
+) -> np.ndarray:
+    """
+    Returns the `(num_priors, 4)` RetinaFace prior boxes as `(center_x, center_y, width, height)`, normalized by the
+    input size.
+    """
+    height, width = input_size
+    priors = []
+    for stride, level_min_sizes in zip(strides, min_sizes):
+        grid = _grid(int(np.ceil(height / stride)), int(np.ceil(width / stride))).reshape(-1, 1, 2)
+        centers = np.broadcast_to((grid + 0.5) * stride / (width, height), (grid.shape[0], len(level_min_sizes), 2))
+        sizes = np.broadcast_to(
+            np.asarray(level_min_sizes, dtype=np.float32)[:, None] / (width, height), centers.shape
+        )
+        priors.append(np.concatenate((centers, sizes), axis=-1).reshape(-1, 4))
+    return np.concatenate(priors).astype(np.float32)
+
+
+def decode_retinaface(
+    outputs: Sequence[np.ndarray],
+    input_size: Tuple[int, int],
+    min_sizes: Sequence[Sequence[int]] = RETINAFACE_DEFAULT_MIN_SIZES,
+    strides: Sequence[int] = DETECTION_DEFAULT_STRIDES,
+    variances: Tuple[float, float] = RETINAFACE_DEFAULT_VARIANCES,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Decodes the `(batch_size, num_priors, 4)` box regression, `(batch_size, num_priors, 2)` classification and
+    `(batch_size, num_priors, 10)` landmark outputs of RetinaFace (in any order).
+    """
+    outputs_by_size = {np.asarray(output).shape[-1]: np.asarray(output, dtype=np.float32) for output in outputs}
+    locations, confidences, landmarks = outputs_by_size[4], outputs_by_size[2], outputs_by_size.get(10)
+
+    priors = retinaface_priors(input_size, min_sizes, strides)[None]
+    scale = np.asarray(input_size[::-1], dtype=np.float32)
+
+    centers = priors[..., :2] + locations[..., :2] * variances[0] * priors[..., 2:]
+    sizes = priors[..., 2:] * np.exp(locations[..., 2:] * variances[1])
+    boxes = _xywh_to_xyxy(centers * scale, sizes * scale)
+    scores = _softmax(confidences)[..., 1:]
+
+    keypoints = None
+    if landmarks is not None:
+        landmarks = landmarks.reshape(*landmarks.shape[:2], -1, 2)
+        keypoints = (priors[..., None, :2] + landmarks * variances[0] * priors[..., None, 2:]) * scale
+
+    return boxes, scores, keypoints
+
+
+DETECTION_DECODERS = {
+    "yolov3": partial(decode_yolo_anchors, version="yolov3"),
+    "yolov5": partial(decode_yolo_anchors, version="yolov5"),
+    "yolov8": decode_yolov8,
+    "yolox": decode_yolox,
+    "retinaface": decode_retinaface,
+}
+
+
+def non_max_suppression(
+    boxes: np.ndarray,
+    scores: np.ndarray,
+    iou_threshold: float,
+    labels: Optional[np.ndarray] = None,
+    max_output: Optional[int] = None,
+) -> np.ndarray:
+    """
+    Greedy non-maximum suppression. Each kept box is compared against all the remaining candidates at once, and the
+    loop stops as soon as `max_output` boxes are kept. When `labels` are given, boxes of different classes never
+    suppress each other.
+
+    Returns:
+        `np.ndarray`: The indices of the kept boxes, sorted by decreasing score.
+    """
+    order = np.argsort(-scores, kind="stable")
+    if len(order) == 0:
+        return order
+
+    boxes = boxes[order]
+    if labels is not None:
+        # Offset each class to disjoint coordinates so that boxes of different classes never overlap.
+        boxes = boxes + (labels[order] * (boxes.max() + 1))[:, None]
+    x1, y1, x2, y2 = (np.ascontiguousarray(boxes[:, i]) for i in range(4))
+    areas = (x2 - x1) * (y2 - y1)
+
+    max_output = len(order) if max_output is None else max_output
+    keep = []
+    remaining = np.arange(len(order))
+    while len(remaining) > 0 and len(keep) < max_output:
+        keep.append(remaining[0])
+
+        width = np.clip(np.minimum(x2[0], x2[1:]) - np.maximum(x1[0], x1[1:]), 0, None)
+        height = np.clip(np.minimum(y2[0], y2[1:]) - np.maximum(y1[0], y1[1:]), 0, None)
+        intersection = width * height
+        mask = intersection <= iou_threshold * (areas[0] + areas[1:] - intersection)
+
+        # Compact the remaining candidates so that each iteration only touches the surviving boxes.
+        remaining, x1, y1, x2, y2, areas = (array[1:][mask] for array in (remaining, x1, y1, x2, y2, areas))
+
+    return order[keep]
+
+
+class RyzenAIDetectionPostprocessor:
+    """
+    Vectorized NumPy box decoding and non-maximum suppression for the raw outputs of object detection heads.
+
+    Args:
+        architecture (`str`):
+            The detection head to decode, one of `"yolov3"`, `"yolov5"`, `"yolov8"`, `"yolox"` or `"retinaface"`.
+        score_threshold (`Union[float, Sequence[float]]`, defaults to `0.25`):
+            The minimum score of a detection, either shared by all classes or given per class. With per-class
+            thresholds, a box is labelled with its highest scoring class among the ones reaching their threshold.
+        iou_threshold (`float`, defaults to `0.45`):
+            The IoU above which the lower scoring of two overlapping boxes of the same class is suppressed.
+        pre_nms_top_k (`int`, defaults to `1000`):
+            The maximum number of candidates per image entering non-maximum suppression.
+        max_detections (`int`, defaults to `300`):
+            The maximum number of detections returned per image.
+        class_agnostic (`bool`, defaults to `False`):
+            Whether boxes of different classes may suppress each other.
+        decoder_kwargs (`Dict[str, Any]`):
+            Passed to the decoding function of the architecture, e.g. `anchors`, `num_classes` or `min_sizes`.
+    """
+
+    def __init__(
+        self,
+        architecture: str,
+        score_threshold: Union[float, Sequence[float]] = 0.25,
+        iou_threshold: float = 0.45,
+        pre_nms_top_k: int = 1000,
+        max_detections: int = 300,
+        class_agnostic: bool = False,
+        **decoder_kwargs,
+    ):
+        if architecture not in DETECTION_DECODERS:
+            raise ValueError(
+                f"Unsupported architecture {architecture}, the supported architectures are {list(DETECTION_DECODERS)}."
+            )
+
+        self.architecture = architecture
+        self.score_threshold = np.asarray(score_threshold, dtype=np.float32)
+        self.iou_threshold = iou_threshold
+        self.pre_nms_top_k = pre_nms_top_k
+        self.max_detections = max_detections
+        self.class_agnostic = class_agnostic
+        self.decoder_kwargs = decoder_kwargs
+
+    def decode(
+        self, outputs: Sequence[np.ndarray], input_size: Tuple[int, int]
+    ) -> Tuple[np.ndarray, np.ndarray, Optional[np.ndarray]]:
+        """
+        Decodes the raw outputs to `(batch_size, num_boxes, 4)` boxes, `(batch_size, num_boxes, num_classes)` scores
+        and, if any, `(batch_size, num_boxes, num_keypoints, 2)` keypoints.
+        """
+        return DETECTION_DECODERS[self.architecture](outputs, input_size, **self.decoder_kwargs)
+
+    def __call__(self, outputs: Sequence[np.ndarray], input_size: Tuple[int, int]) -> List[RyzenAIDetections]:
+        """
+        Decodes the raw outputs of a batch and applies score thresholding, top-k selection and non-maximum suppression.
+
+        Args:
+            outputs (`Sequence[np.ndarray]`):
+                The raw outputs of the model.
+            input_size (`Tuple[int, int]`):
+                The `(height, width)` of the model input.
+
+        Returns:
+            `List[RyzenAIDetections]`: The detections of each image of the batch.
+        """
+        boxes, scores, keypoints = self.decode(outputs, input_size)
+        height, width = input_size
+
+        detections = []
+        for index in range(boxes.shape[0]):
+            class_scores = scores[index]
+            if self.score_threshold.ndim > 0:
+                # Each box is labelled with its highest scoring class among the ones reaching their threshold.
+                class_scores = np.where(class_scores >= self.score_threshold, class_scores, -np.inf)
+            labels = class_scores.argmax(axis=-1)
+            confidences = np.take_along_axis(class_scores, labels[:, None], axis=-1)[:, 0]
+
+            candidates = np.flatnonzero(confidences >= self.score_threshold.min())
+            if len(candidates) > self.pre_nms_top_k:
+                top_k = np.argpartition(-confidences[candidates], self.pre_nms_top_k - 1)[: self.pre_nms_top_k]
+                candidates = candidates[top_k]
+
+            candidate_boxes = boxes[index, candidates]
+            candidate_boxes[:, 0::2] = np.clip(candidate_boxes[:, 0::2], 0, width)
+            candidate_boxes[:, 1::2] = np.clip(candidate_boxes[:, 1::2], 0, height)
+
+            keep = non_max_suppression(
+                candidate_boxes,
+                confidences[candidates],
+                self.iou_threshold,
+                labels=None if self.class_agnostic else labels[candidates],
+                max_output=self.max_detections,
+            )
+
+            detections.append(
+                RyzenAIDetections(
+                    boxes=candidate_boxes[keep],
+                    scores=confidences[candidates][keep],
+                    labels=labels[candidates][keep],
+                    keypoints=keypoints[index, candidates][keep] if keypoints is not None else None,
+                )
+            )
+
+        return detections
@@ -0,0 +1,261 @@
+# Copyright 2024 The HuggingFace Team. All rights reserved.
+# Licensed under the MIT License.
+"""Per-operator latency breakdown of ONNX Runtime inference sessions, joined with the VitisAI EP device placement."""
+
+import json
+from collections import defaultdict
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Union
+
+
+VITISAI_EP_REPORT_NAME = "vitisai_ep_report.json"
+
+# Nodes run by these providers are offloaded, all the other nodes fall back to the CPU.
+PROVIDER_TO_DEVICE = {"VitisAIExecutionProvider": "DPU"}
+
+_KERNEL_TIME_SUFFIX = "_kernel_time"
+
+
+@dataclass
+class RyzenAINodeProfile:
+    """
+    The aggregated timings of one node of the graph, over the profiled runs.
+
+    Args:
+        name (`str`):
+            The node name. Nodes fused by the VitisAI EP appear as a single node running the whole DPU subgraph.
+        op_type (`str`):
+            The operator type of the node.
+        provider (`str`):
+            The execution provider that ran the node.
+        device (`str`):
+            The device the node ran on, `"DPU"` or `"CPU"`.
+        total_time_us (`float`, defaults to `0.0`):
+            The cumulated kernel time of the node over the profiled runs, in microseconds.
+        num_calls (`int`, defaults to `0`):
+            The number of times the node was run.
+    """
+
+    name: str
+    op_type: str
+    provider: str
+    device: str
+    total_time_us: float = 0.0
+    num_calls: int = 0
+
+    @property
+    def mean_time_us(self) -> float:
+        return self.total_time_us / self.num_calls if self.num_calls else 0.0
+
+
+@dataclass
+class RyzenAIProfilingReport:
+    """
+    Latency breakdown of a model, built from the ONNX Runtime profiling trace of several runs.
+
+    Args:
+        nodes (`List[RyzenAINodeProfile]`):
+            The per-node timings, sorted by decreasing total time.
+        num_runs (`int`):
+            The number of profiled runs, warmup runs excluded.
+        run_times_us (`List[float]`):
+            The end-to-end latency of each profiled run, in microseconds.
+        device_stats (`Dict[str, Dict[str, Any]]`, defaults to `{}`):
+            The per-device node counts and operator types read from the VitisAI EP report, when available.
+    """
+
+    nodes: List[RyzenAINodeProfile]
+    num_runs: int
+    run_times_us: List[float]
+    device_stats: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+
+    @classmethod
+    def from_profile(
+        cls,
+        profile_path: Union[str, Path],
+        num_warmup_runs: int = 0,
+        ep_report_path: Optional[Union[str, Path]] = None,
+    ) -> "RyzenAIProfilingReport":
+        """
+        Builds a report from an ONNX Runtime profiling JSON trace.
+
+        Args:
+            profile_path (`Union[str, Path]`):
+                Path to the trace written by `InferenceSession.end_profiling()`.
+            num_warmup_runs (`int`, defaults to `0`):
+                The number of leading runs to exclude from the report.
+            ep_report_path (`Optional[Union[str, Path]]`, defaults to `None`):
+                Path to the `vitisai_ep_report.json` written by the VitisAI EP in its cache directory.
+        """
+        with open(profile_path, "r") as profile_file:
+            events = json.load(profile_file)
+
+        # Older ONNX Runtime versions wrap the events in a `traceEvents` key.
+        if isinstance(events, dict):
+            events = events.get("traceEvents", [])
+
+        runs = sorted(
+            (event for event in events if event.get("cat") == "Session" and event.get("name") == "model_run"),
+            key=lambda event: event["ts"],
+        )
+        if num_warmup_runs >= len(runs) and len(runs) > 0:
+            raise ValueError(
+                f"The trace contains {len(runs)} runs, which is not more than the {num_warmup_runs} warmup runs."
+            )
+        runs = runs[num_warmup_runs:]
+        start_ts = runs[0]["ts"] if runs else 0
+
+        nodes = {}
+        for event in events:
+            if event.get("cat") != "Node" or not event.get("name", "").endswith(_KERNEL_TIME_SUFFIX):
+                continue
+            if event["ts"] < start_ts:
+                continue
+
+            name = event["name"][: -len(_KERNEL_TIME_SUFFIX)]
+            args = event.get("args", {})
+            provider = args.get("provider", "CPUExecutionProvider")
+            if name not in nodes:
+                nodes[name] = RyzenAINodeProfile(
+                    name=name,
+                    op_type=args.get("op_name", ""),
+                    provider=provider,
+                    device=PROVIDER_TO_DEVICE.get(provider, "CPU"),
+                )
+            nodes[name].total_time_us += event["dur"]
+            nodes[name].num_calls += 1
+
+        device_stats = parse_vitisai_ep_report(ep_report_path) if ep_report_path is not None else {}
+
+        return cls(
+            nodes=sorted(nodes.values(), key=lambda node: -node.total_time_us),
+            num_runs=len(runs),
+            run_times_us=[float(run["dur"]) for run in runs],
+            device_stats=device_stats,
+        )
+
+    @property
+    def total_node_time_us(self) -> float:
+        return sum(node.total_time_us for node in self.nodes)
+
+    @property
+    def mean_latency_us(self) -> float:
+        return sum(self.run_times_us) / len(self.run_times_us) if self.run_times_us else 0.0
+
+    def device_breakdown(self) -> Dict[str, Dict[str, float]]:
+        """
+        Returns the number of nodes, the total kernel time and the share of the kernel time of each device.
+        """
+        total_time = self.total_node_time_us
+        breakdown = defaultdict(lambda: {"num_nodes": 0, "total_time_us": 0.0, "time_share": 0.0})
+        for node in self.nodes:
+            breakdown[node.device]["num_nodes"] += 1
+            breakdown[node.device]["total_time_us"] += node.total_time_us
+
+        for stats in breakdown.values():
+            stats["time_share"] = stats["total_time_us"] / total_time if total_time else 0.0
+
+        return dict(breakdown)
+
+    def op_type_breakdown(self) -> List[Dict[str, Any]]:
+        """
+        Returns the timings aggregated by operator type and device, sorted by decreasing total time.
+        """
+        total_time = self.total_node_time_us
+        aggregated = {}
+        for node in self.nodes:
+            key = (node.op_type, node.device)
+            if key not in aggregated:
+                aggregated[key] = {
+                    "op_type": node.op_type,
+                    "device": node.device,
+                    "num_nodes": 0,
+                    "total_time_us": 0.0,
+                }
+            aggregated[key]["num_nodes"] += 1
+            aggregated[key]["total_time_us"] += node.total_time_us
+
+        breakdown = sorted(aggregated.values(), key=lambda stats: -stats["total_time_us"])
+        for stats in breakdown:
+            stats["mean_time_per_run_us"] = stats["total_time_us"] / self.num_runs if self.num_runs else 0.0
+            stats["time_share"] = stats["total_time_us"] / total_time if total_time else 0.0
+
+        return breakdown
+
+    def hotspots(self, top_k: int = 10) -> List[RyzenAINodeProfile]:
+        """
+        Returns the `top_k` nodes with the largest total time.
+        """
+        return self.nodes[:top_k]
+
+    @property
+    def cpu_fallback_time_us(self) -> float:
+        """
+        The mean time per run spent in nodes falling back to the CPU.
+        """
+        cpu_time = sum(node.total_time_us for node in self.nodes if node.device == "CPU")
+        return cpu_time / self.num_runs if self.num_runs else 0.0
+
+    def to_dict(self, top_k: int = 10) -> Dict[str, Any]:
+        return {
+            "num_runs": self.num_runs,
+            "mean_latency_us": self.mean_latency_us,
+            "mean_node_time_per_run_us": self.total_node_time_us / self.num_runs if self.num_runs else 0.0,
+            "cpu_fallback_time_per_run_us": self.cpu_fallback_time_us,
+            "devices": self.device_breakdown(),
+            "op_types": self.op_type_breakdown(),
+            "hotspots": [dict(asdict(node), mean_time_us=node.mean_time_us) for node in self.hotspots(top_k)],
+            "device_stats": self.device_stats,
+        }
+
+    def save(self, save_path: Union[str, Path], top_k: int = 10):
+        """
+        Saves the report as JSON.
+        """
+        with open(save_path, "w") as save_file:
+            json.dump(self.to_dict(top_k=top_k), save_file, indent=2)
+
+    def summary(self, top_k: int = 10) -> str:
+        """
+        Returns a human readable table of the hotspots and of the CPU fallback cost.
+        """
+        total_time = self.total_node_time_us
+        lines = [
+            f"Mean latency: {self.mean_latency_us / 1000:.3f} ms over {self.num_runs} runs",
+            f"CPU fallback: {self.cpu_fallback_time_us / 1000:.3f} ms per run "
+            f"({self.device_breakdown().get('CPU', {}).get('time_share', 0.0):.1%} of the kernel time)",
+            "",
+            f"{'Node':<48} {'Op type':<24} {'Device':<6} {'Mean (us)':>12} {'Share':>8}",
+        ]
+        for node in self.hotspots(top_k):
+            share = node.total_time_us / total_time if total_time else 0.0
+            lines.append(
+                f"{node.name[:48]:<48} {node.op_type[:24]:<24} {node.device:<6} {node.mean_time_us:>12.1f} {share:>8.1%}"
+            )
+
+        return "\n".join(lines)
+
+
+def parse_vitisai_ep_report(report_path: Union[str, Path]) -> Dict[str, Dict[str, Any]]:
+    """
+    Parses the per-device statistics of a `vitisai_ep_report.json`.
+
+    Args:
+        report_path (`Union[str, Path]`):
+            Path to the report.
+
+    Returns:
+        `Dict[str, Dict[str, Any]]`: The number of nodes and the supported operator types, keyed by lower-cased device
+        name (`"all"`, `"cpu"`, `"dpu"`).
+    """
+    with open(report_path, "r") as report_file:
+        data = json.load(report_file)
+
+    return {
+        entry["name"].lower(): {
+            "num_nodes": entry.get("nodeNum", 0),
+            "op_types": list(entry.get("supportedOpType", [])),
+        }
+        for entry in data.get("deviceStat", [])
+    }
@@ -5,58 +5,145 @@
 
 import logging
 import os
-from collections import defaultdict
+import sys
+import threading
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Callable, List, Optional, Union
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Tuple, Union
 
+import datasets
+import numpy as np
 import onnx
-from datasets import Dataset, load_dataset
-from onnxruntime.quantization import CalibrationDataReader
+from datasets import Dataset, IterableDataset, load_dataset
+from datasets.features.features import require_decoding
+from datasets.table import embed_table_storage
+from onnxruntime.quantization import CalibrationDataReader, CalibrationMethod
 from vai_q_onnx import quantize_static
 
 from optimum.quantization_base import OptimumQuantizer
 from transformers import PretrainedConfig
 
+from .calibration import (
+    SHARDED_CALIBRATION_METHODS,
+    RyzenAICalibrationDataReader,
+    _get_method_name,
+    collect_calibration_statistics,
+    compute_tensors_range,
+    get_calibration_cache_key,
+    get_calibration_tensors,
+    reservoir_sample,
+)
 from .configuration import QuantizationConfig, RyzenAIConfig
+from .utils import get_onnx_graph_io
+
+
+if TYPE_CHECKING:
+    from .sweep import RyzenAISweepReport
 
 
 LOGGER = logging.getLogger(__name__)
 
+# Serializes the calls to `quantize_static` of `RyzenAIOnnxQuantizer`, see `_precomputed_calibration`.
+_QUANTIZE_LOCK = threading.Lock()
+
 
-class RyzenAICalibrationDataReader(CalibrationDataReader):
-    __slots__ = ["batch_size", "dataset", "_dataset_iter"]
+class _PrecomputedCalibrator:
+    """
+    Stands for the vai_q_onnx calibrator when the tensors ranges are computed beforehand.
+    """
 
-    def __init__(self, dataset: Dataset, batch_size: int = 1):
-        if dataset is None:
-            raise ValueError("Provided dataset is None.")
+    def __init__(self, tensors_range: Dict[str, Tuple[Union[float, np.ndarray], Union[float, np.ndarray]]]):
+        self.tensors_range = {
+            name: tuple(
+                value if isinstance(value, np.ndarray) else np.array(value, dtype=np.float32) for value in pair
+            )
+            for name, pair in tensors_range.items()
+        }
 
-        if batch_size <= 0:
-            raise ValueError(f"Provided batch_size should be >= 1 (got: {batch_size}).")
+    def augment_graph(self):
+        pass
 
-        self.dataset = dataset
-        self.batch_size = batch_size
+    def create_inference_session(self):
+        pass
 
-        self._dataset_iter = iter(self.dataset)
+    def collect_data(self, data_reader: CalibrationDataReader):
+        pass
 
-    def get_next(self):
-        featurized_samples = None
+    def clear_collected_data(self):
+        pass
+
+    def compute_range(self) -> Dict[str, Tuple[np.ndarray, np.ndarray]]:
+        return self.tensors_range
+
+    def compute_data(self):
         try:
-            if self.batch_size == 1:
-                featurized_samples = {key: [value] for key, value in next(self._dataset_iter).items()}
-            else:
-                featurized_samples = defaultdict(list)
-                for _ in range(self.batch_size):
-                    sample = next(self._dataset_iter)
+            from onnxruntime.quantization.calibrate import TensorsData
+        except ImportError:
+            return self.tensors_range
+
+        return TensorsData(CalibrationMethod.MinMax, self.tensors_range)
+
+
+def _get_tensors_without_range(tensors_range: Dict, model: Union[str, Path, onnx.ModelProto]) -> List[str]:
+    """
+    Returns the activations of the model calibrated by vai_q_onnx that have no range in `tensors_range`.
+    """
+    if not isinstance(model, onnx.ModelProto):
+        model = onnx.load(str(model), load_external_data=False)
+    return [value_info.name for value_info in get_calibration_tensors(model) if value_info.name not in tensors_range]
+
+
+@contextmanager
+def _precomputed_calibration(tensors_range: Dict[str, Tuple[np.ndarray, np.ndarray]], fallback: bool = False):
+    """
+    Makes `quantize_static` use the given tensors ranges instead of running its own calibration.
+
+    vai_q_onnx has no option to pass precomputed ranges, so the `create_calibrator*` factories of the module of
+    `quantize_static` are replaced for the duration of the call. As they are replaced for the whole process, the calls
+    of `RyzenAIOnnxQuantizer` are serialized with `_QUANTIZE_LOCK`, but a `quantize_static` call made directly from
+    another thread at the same time would also use the given ranges.
+
+    The ranges are computed on the model given to `quantize_static`, while vai_q_onnx calibrates the model it gets after
+    its own graph optimizations, that may rename activations (e.g. when folding batch normalizations). If an activation
+    of the calibrated model has no range, the calibrator of vai_q_onnx is used with `fallback=True`, and a `ValueError`
+    is raised otherwise.
+    """
+
+    def get_factory(factory: Callable) -> Callable:
+        def create_calibrator(*args, **kwargs):
+            # The calibrated model is the first argument of the factories.
+            missing = _get_tensors_without_range(tensors_range, args[0] if args else kwargs["model"])
+            if not missing:
+                return _PrecomputedCalibrator(tensors_range)
+            if not fallback:
+                raise ValueError(
+                    f"The activations {missing[:10]} of the model calibrated by vai_q_onnx have no precomputed range, "
+                    "the graph was likely modified by its optimizations."
+                )
+            LOGGER.warning(
+                f"The activations {missing[:10]} of the model calibrated by vai_q_onnx have no precomputed range, the "
+                "graph was likely modified by its optimizations. The model is calibrated by vai_q_onnx."
+            )
+            return factory(*args, **kwargs)
 
-                    for name, value in sample.items():
-                        featurized_samples[name] += [value]
+        return create_calibrator
 
-        except StopIteration:
-            pass
+    module = sys.modules[quantize_static.__module__]
+    factory_names = [name for name in dir(module) if name.startswith("create_calibrator")]
+    if len(factory_names) == 0:
+        raise RuntimeError(
+            "The installed vai_q_onnx version does not allow to quantize a model from precomputed tensors ranges."
+        )
 
-        if featurized_samples is not None and len(featurized_samples) > 0:
-            return featurized_samples
-        return None
+    with _QUANTIZE_LOCK:
+        factories = {name: getattr(module, name) for name in factory_names}
+        try:
+            for name, factory in factories.items():
+                setattr(module, name, get_factory(factory))
+            yield
+        finally:
+            for name, factory in factories.items():
+                setattr(module, name, factory)
 
 
 class RyzenAIOnnxQuantizer(OptimumQuantizer):
@@ -131,8 +218,11 @@ class RyzenAIOnnxQuantizer(OptimumQuantizer):
         quantization_config: QuantizationConfig,
         dataset: Dataset,
         save_dir: Union[str, Path],
-        batch_size: int = 1,
+        batch_size: Optional[int] = None,
         file_suffix: Optional[str] = "quantized",
+        num_workers: int = 1,
+        calibration_tensors_range: Optional[Dict[str, Tuple[float, float]]] = None,
+        calibration_cache_dir: Optional[Union[str, Path]] = None,
     ) -> Path:
         """
         Quantizes a model given the optimization specifications defined in `quantization_config`.
@@ -140,12 +230,36 @@ class RyzenAIOnnxQuantizer(OptimumQuantizer):
         Args:
             quantization_config (`QuantizationConfig`):
                 The configuration containing the parameters related to quantization.
+            dataset (`Dataset`):
+                The calibration dataset. Unused if `calibration_tensors_range` is provided.
             save_dir (`Union[str, Path]`):
                 The directory where the quantized model should be saved.
+            batch_size (`Optional[int]`, defaults to `None`):
+                The calibration batch size. Defaults to the batch size of the model if it is static, and to 1 otherwise.
+                For models with a static batch size, the last incomplete batch is dropped.
             file_suffix (`Optional[str]`, defaults to `"quantized"`):
                 The file_suffix used to save the quantized model.
+            num_workers (`int`, defaults to `1`):
+                The number of worker processes collecting the calibration ranges. With more than one worker, the
+                dataset is sharded and the ranges of the shards are merged exactly, see
+                [`~optimum.amd.ryzenai.calibration.collect_calibration_statistics`], before quantizing the model once
+                from the computed ranges. vai_q_onnx having no option for precomputed ranges, its calibrator factories
+                are replaced during the quantization: the quantizations of `RyzenAIOnnxQuantizer` are serialized in a
+                process, but no other thread should call `vai_q_onnx.quantize_static` meanwhile.
             calibration_tensors_range (`Optional[Dict[str, Tuple[float, float]]]`, defaults to `None`):
-                The dictionary mapping the nodes name to their quantization ranges, used and required only when applying static quantization.
+                The dictionary mapping the tensors name to their quantization ranges, as returned by
+                [`~RyzenAIOnnxQuantizer.compute_calibration_tensors_range`]. If provided, the calibration step is
+                skipped.
+            calibration_cache_dir (`Optional[Union[str, Path]]`, defaults to `None`):
+                The directory to cache the calibration ranges in, keyed by the model hash and the dataset fingerprint,
+                so that quantizing the same model with other configurations skips the calibration runs. Like
+                `num_workers > 1`, it makes the ranges be computed by
+                [`~optimum.amd.ryzenai.calibration.collect_calibration_statistics`] rather than by vai_q_onnx.
+
+        The sharded and cached calibrations support the MinMax and NonOverflow methods, whose ranges are merged exactly.
+        With another calibration method, e.g. Percentile, MinMSE or Entropy, `num_workers` and `calibration_cache_dir`
+        are ignored with a warning, and the model is calibrated by vai_q_onnx in a single process. The model is also
+        calibrated by vai_q_onnx if its graph optimizations rename activations whose ranges were computed beforehand.
 
         Returns:
             The path of the resulting quantized model.
@@ -153,26 +267,56 @@ class RyzenAIOnnxQuantizer(OptimumQuantizer):
         save_dir = Path(save_dir)
         save_dir.mkdir(parents=True, exist_ok=True)
 
-        reader = RyzenAICalibrationDataReader(dataset, batch_size)
-
         suffix = f"_{file_suffix}" if file_suffix else ""
         quantized_model_path = save_dir.joinpath(f"{self.onnx_model_path.stem}{suffix}").with_suffix(".onnx")
 
-        LOGGER.info("Quantizing model...")
-        quantize_static(
-            model_input=Path(self.onnx_model_path).as_posix(),
-            model_output=quantized_model_path.as_posix(),
-            calibration_data_reader=reader,
-            quant_format=quantization_config.format,
-            calibrate_method=quantization_config.calibration_method,
-            weight_type=quantization_config.weights_dtype,
-            activation_type=quantization_config.activations_dtype,
-            enable_dpu=quantization_config.enable_dpu,
-            extra_options={
-                "WeightSymmetric": quantization_config.weights_symmetric,
-                "ActivationSymmetric": quantization_config.activations_symmetric,
-            },
+        use_sharded_calibration = calibration_tensors_range is None and (
+            num_workers > 1 or calibration_cache_dir is not None
         )
+        method_name = _get_method_name(quantization_config.calibration_method)
+        if use_sharded_calibration and method_name not in SHARDED_CALIBRATION_METHODS:
+            LOGGER.warning(
+                f"The calibration method {method_name} does not support sharded or cached calibration, the model is "
+                "calibrated by vai_q_onnx in a single process."
+            )
+            use_sharded_calibration = False
+
+        if calibration_tensors_range is not None:
+            calibration = _precomputed_calibration(calibration_tensors_range)
+            reader = RyzenAICalibrationDataReader([])
+        else:
+            batch_size, static_batch_size = self._get_calibration_batch_size(batch_size)
+            if use_sharded_calibration:
+                tensors_range = self.compute_calibration_tensors_range(
+                    quantization_config,
+                    dataset,
+                    batch_size=batch_size,
+                    num_workers=num_workers,
+                    cache_dir=calibration_cache_dir,
+                )
+                # The reader is only consumed if vai_q_onnx falls back to its own calibration.
+                calibration = _precomputed_calibration(tensors_range, fallback=True)
+            else:
+                calibration = _QUANTIZE_LOCK
+            reader = RyzenAICalibrationDataReader(dataset, batch_size, drop_last=static_batch_size is not None)
+
+        LOGGER.info("Quantizing model...")
+        with calibration, reader:
+            quantize_static(
+                model_input=Path(self.onnx_model_path).as_posix(),
+                model_output=quantized_model_path.as_posix(),
+                calibration_data_reader=reader,
+                quant_format=quantization_config.format,
+                calibrate_method=quantization_config.calibration_method,
+                weight_type=quantization_config.weights_dtype,
+                activation_type=quantization_config.activations_dtype,
+                enable_dpu=quantization_config.enable_dpu,
+                nodes_to_exclude=quantization_config.nodes_to_exclude,
+                extra_options={
+                    "WeightSymmetric": quantization_config.weights_symmetric,
+                    "ActivationSymmetric": quantization_config.activations_symmetric,
+                },
+            )
 
         LOGGER.info(f"Saved quantized model at: {save_dir}")
 
@@ -185,6 +329,148 @@ class RyzenAIOnnxQuantizer(OptimumQuantizer):
 
         return Path(save_dir)
 
+    def compute_calibration_tensors_range(
+        self,
+        quantization_config: QuantizationConfig,
+        dataset: Dataset,
+        batch_size: Optional[int] = None,
+        num_workers: int = 1,
+        cache_dir: Optional[Union[str, Path]] = None,
+    ) -> Dict[str, Tuple[np.ndarray, np.ndarray]]:
+        """
+        Computes the quantization ranges of the model activations on a calibration dataset, to be passed as
+        `calibration_tensors_range` to [`~RyzenAIOnnxQuantizer.quantize`].
+
+        Args:
+            quantization_config (`QuantizationConfig`):
+                The configuration to compute the ranges for. Only the calibration method is used, that must be
+                `CalibrationMethod.MinMax` or `PowerOfTwoMethod.NonOverflow`.
+            dataset (`Dataset`):
+                The calibration dataset.
+            batch_size (`Optional[int]`, defaults to `None`):
+                The calibration batch size. Defaults to the batch size of the model if it is static, and to 1 otherwise.
+            num_workers (`int`, defaults to `1`):
+                The number of worker processes collecting the calibration statistics.
+            cache_dir (`Optional[Union[str, Path]]`, defaults to `None`):
+                The directory to cache the calibration ranges in, shared by all the configurations.
+
+        Returns:
+            `Dict[str, Tuple[np.ndarray, np.ndarray]]`: The `(min, max)` range of each activation.
+        """
+        batch_size, static_batch_size = self._get_calibration_batch_size(batch_size)
+
+        statistics = collect_calibration_statistics(
+            self.onnx_model_path,
+            dataset,
+            quantization_config.calibration_method,
+            batch_size=batch_size,
+            drop_last=static_batch_size is not None,
+            num_workers=num_workers,
+            cache_dir=cache_dir,
+        )
+
+        return compute_tensors_range(statistics, quantization_config.calibration_method)
+
+    def sweep(
+        self,
+        quantization_configs: Union[List[QuantizationConfig], Dict[str, QuantizationConfig]],
+        calibration_dataset: Dataset,
+        evaluation_dataset: Dataset,
+        save_dir: Union[str, Path],
+        batch_size: Optional[int] = None,
+        num_workers: int = 1,
+        metric: str = "cosine_similarity",
+        min_cosine_similarity: Optional[float] = None,
+        min_sqnr_db: Optional[float] = None,
+        num_early_batches: int = 1,
+        num_latency_runs: int = 20,
+        calibration_cache_dir: Optional[Union[str, Path]] = None,
+    ) -> "RyzenAISweepReport":
+        """
+        Quantizes the model with each of the given configurations, and scores them on a held-out dataset against the
+        float model, to pick the best accuracy / latency trade-off without a full evaluation of every variant.
+
+        With `num_workers > 1` or a `calibration_cache_dir`, the ranges of the `MinMax` and `NonOverflow` calibration
+        methods are computed once and shared by all the configurations (see [`~RyzenAIOnnxQuantizer.quantize`]).
+        Otherwise, each configuration is calibrated along its quantization. The configurations are quantized in
+        `num_workers` parallel processes, and scored with the cosine similarity and the signal to quantization noise
+        ratio (SQNR) of their outputs. Configurations below `min_cosine_similarity` or `min_sqnr_db` on the first
+        `num_early_batches` held-out batches are pruned without being evaluated further. The latency of the remaining
+        ones is then measured one at a time with the CPU execution provider. An error while quantizing a configuration
+        is raised, while a quantized model that fails to run is reported as a pruned configuration with its error.
+
+        Args:
+            quantization_configs (`Union[List[QuantizationConfig], Dict[str, QuantizationConfig]]`):
+                The configurations to sweep, optionally named, e.g. built with
+                [`~optimum.amd.ryzenai.sweep.quantization_config_grid`].
+            calibration_dataset (`Dataset`):
+                The calibration dataset.
+            evaluation_dataset (`Dataset`):
+                The held-out dataset the configurations are scored on.
+            save_dir (`Union[str, Path]`):
+                The directory where the quantized models, in one subdirectory per configuration, and the
+                `sweep_report.json` report should be saved.
+            batch_size (`Optional[int]`, defaults to `None`):
+                The calibration and evaluation batch size. Defaults to the batch size of the model if it is static, and
+                to 1 otherwise.
+            num_workers (`int`, defaults to `1`):
+                The number of worker processes collecting the calibration statistics and quantizing the configurations.
+            metric (`str`, defaults to `"cosine_similarity"`):
+                The accuracy proxy of the Pareto front, `"cosine_similarity"` or `"sqnr_db"`.
+            min_cosine_similarity (`Optional[float]`, defaults to `None`):
+                The cosine similarity below which a configuration is pruned.
+            min_sqnr_db (`Optional[float]`, defaults to `None`):
+                The SQNR, in dB, below which a configuration is pruned.
+            num_early_batches (`int`, defaults to `1`):
+                The number of held-out batches a configuration is scored on before being pruned or evaluated on the
+                whole held-out dataset.
+            num_latency_runs (`int`, defaults to `20`):
+                The number of timed runs of the latency measurements.
+            calibration_cache_dir (`Optional[Union[str, Path]]`, defaults to `None`):
+                The directory to cache the calibration statistics in, shared with later sweeps and quantizations.
+
+        Returns:
+            [`~optimum.amd.ryzenai.sweep.RyzenAISweepReport`]: The scores of the configurations, with their Pareto front.
+        """
+        from .sweep import run_quantization_sweep
+
+        return run_quantization_sweep(
+            self,
+            quantization_configs,
+            calibration_dataset,
+            evaluation_dataset,
+            save_dir,
+            batch_size=batch_size,
+            num_workers=num_workers,
+            metric=metric,
+            min_cosine_similarity=min_cosine_similarity,
+            min_sqnr_db=min_sqnr_db,
+            num_early_batches=num_early_batches,
+            num_latency_runs=num_latency_runs,
+            calibration_cache_dir=calibration_cache_dir,
+        )
+
+    def _get_calibration_batch_size(self, batch_size: Optional[int] = None) -> Tuple[int, Optional[int]]:
+        """
+        Returns the calibration batch size and the static batch size of the model, if any.
+        """
+        static_batch_size = None
+        for model_input in get_onnx_graph_io(self.onnx_model_path).inputs:
+            dims = model_input.type.tensor_type.shape.dim
+            if len(dims) > 0 and dims[0].HasField("dim_value") and dims[0].dim_value > 0:
+                static_batch_size = dims[0].dim_value
+                break
+
+        if batch_size is None:
+            batch_size = static_batch_size or 1
+        elif static_batch_size is not None and batch_size != static_batch_size:
+            raise ValueError(
+                f"The model {self.onnx_model_path} has a static batch size of {static_batch_size}, but the calibration "
+                f"batch_size is {batch_size}."
+            )
+
+        return batch_size, static_batch_size
+
     def get_calibration_dataset(
         self,
         dataset_name: str,
@@ -196,6 +482,9 @@ class RyzenAIOnnxQuantizer(OptimumQuantizer):
         seed: Optional[bool] = 2016,
         token: bool = None,
         streaming: bool = False,
+        num_proc: Optional[int] = None,
+        num_candidates: Optional[int] = None,
+        cache_dir: Optional[Union[str, Path]] = None,
     ) -> Dataset:
         """
         Creates the calibration `datasets.Dataset` to use for the post-training static quantization calibration step.
@@ -215,40 +504,121 @@ class RyzenAIOnnxQuantizer(OptimumQuantizer):
             preprocess_batch (`bool`, defaults to `True`):
                 Whether the `preprocess_function` should be batched.
             seed (`int`, defaults to 2016):
-                The random seed to use when shuffling the calibration dataset.
+                The random seed to use when sampling the calibration dataset.
             token (`bool`, defaults to `False`):
                 Whether to use the token generated when running `transformers-cli login` (necessary for some datasets
                 like ImageNet).
+            streaming (`bool`, defaults to `False`):
+                Whether to stream the dataset instead of downloading the whole split. The samples are drawn with
+                reservoir sampling from the first `num_candidates` samples of the stream, without decoding the rejected
+                ones, and saved to `cache_dir`. The calibration dataset is then a memory-mapped `datasets.Dataset`, and
+                later calls with the same arguments do not stream the dataset again.
+            num_proc (`Optional[int]`, defaults to `None`):
+                The number of processes running `preprocess_function`. Requires `num_samples` when streaming.
+            num_candidates (`Optional[int]`, defaults to `None`):
+                The number of leading samples of the stream to draw the calibration samples from when streaming.
+                Defaults to `10 * num_samples`. Larger values give a more uniform sample at the cost of streaming more
+                data.
+            cache_dir (`Optional[Union[str, Path]]`, defaults to `None`):
+                The directory to save the samples drawn from the stream in. Defaults to a `ryzenai_calibration`
+                subdirectory of the `datasets` cache. The preprocessed dataset is cached next to them.
         Returns:
             The calibration `datasets.Dataset` to use for the post-training static quantization calibration
             step.
         """
+        if streaming and num_samples is not None:
+            calib_dataset = self._get_streamed_calibration_samples(
+                dataset_name,
+                num_samples,
+                dataset_config_name=dataset_config_name,
+                dataset_split=dataset_split,
+                seed=seed,
+                token=token,
+                num_candidates=num_candidates if num_candidates is not None else 10 * num_samples,
+                cache_dir=cache_dir,
+            )
+        else:
+            calib_dataset = load_dataset(
+                dataset_name, name=dataset_config_name, split=dataset_split, token=token, streaming=streaming
+            )
 
-        calib_dataset = load_dataset(
-            dataset_name, name=dataset_config_name, split=dataset_split, token=token, streaming=streaming
-        )
-
-        if num_samples is not None:
-            if streaming is True:
-                calib_dataset = calib_dataset.shuffle(seed=seed)
-                calib_dataset = calib_dataset.take(num_samples)
-            else:
+            if num_samples is not None:
+                # Draw sorted indices rather than shuffling the whole index, the samples are then read close to each
+                # other in the Arrow table.
                 num_samples = min(num_samples, len(calib_dataset))
-                calib_dataset = calib_dataset.shuffle(seed=seed).select(range(num_samples))
+                indices = np.random.default_rng(seed).choice(len(calib_dataset), num_samples, replace=False)
+                calib_dataset = calib_dataset.select(np.sort(indices))
 
         ignored_columns = self.identify_unused_columns(calib_dataset)
 
+        # Streamed datasets without `num_samples` are preprocessed lazily, in a single process.
+        map_kwargs = {"num_proc": num_proc} if isinstance(calib_dataset, Dataset) else {}
         if preprocess_function is not None:
             processed_calib_dataset = calib_dataset.map(
-                preprocess_function, batched=preprocess_batch, remove_columns=ignored_columns
+                preprocess_function, batched=preprocess_batch, remove_columns=ignored_columns, **map_kwargs
             )
         else:
             processed_calib_dataset = calib_dataset.remove_columns(ignored_columns)
 
         return processed_calib_dataset
 
-    def identify_unused_columns(self, dataset: Dataset) -> List[str]:
-        model = onnx.load(self.onnx_model_path)
-        model_inputs = {input.name for input in model.graph.input}
-        ignored_columns = list(set(dataset.column_names) - model_inputs)
+    def _get_streamed_calibration_samples(
+        self,
+        dataset_name: str,
+        num_samples: int,
+        dataset_config_name: Optional[str] = None,
+        dataset_split: Optional[str] = None,
+        seed: Optional[int] = None,
+        token: bool = None,
+        num_candidates: Optional[int] = None,
+        cache_dir: Optional[Union[str, Path]] = None,
+    ) -> Dataset:
+        """
+        Draws the calibration samples from a streamed dataset, and saves them to disk as a `datasets.Dataset`.
+        """
+        if cache_dir is None:
+            cache_dir = Path(datasets.config.HF_DATASETS_CACHE) / "ryzenai_calibration"
+
+        cache_key = get_calibration_cache_key(
+            dataset_name, dataset_config_name, dataset_split, num_samples, seed, num_candidates
+        )
+        save_path = Path(cache_dir) / f"{dataset_name.replace('/', '--')}_{cache_key}"
+        if save_path.exists():
+            LOGGER.info(f"Loading the calibration samples from {save_path}.")
+            return datasets.load_from_disk(save_path.as_posix())
+
+        stream = load_dataset(dataset_name, name=dataset_config_name, split=dataset_split, token=token, streaming=True)
+        features = stream.features
+        # Images and audio are decoded once drawn, not while skimming through the candidates.
+        if hasattr(stream, "decode"):
+            stream = stream.decode(False)
+
+        LOGGER.info(
+            f"Drawing {num_samples} calibration samples from the first {num_candidates} samples of the stream..."
+        )
+        samples = reservoir_sample(stream, num_samples, seed=seed, num_candidates=num_candidates)
+        if len(samples) == 0:
+            raise ValueError(f"The dataset {dataset_name} does not contain any sample.")
+
+        calib_dataset = Dataset.from_list(samples, features=features)
+        if features is not None and any(require_decoding(feature) for feature in features.values()):
+            # Media files may only be referenced by their remote path, their content is embedded to be cached.
+            calib_dataset = calib_dataset.with_format("arrow").map(embed_table_storage, batched=True).with_format(None)
+
+        # Saved to a temporary directory first, so that an interrupted run does not leave an incomplete dataset.
+        tmp_path = save_path.with_name(f"{save_path.name}.tmp{os.getpid()}")
+        calib_dataset.save_to_disk(tmp_path.as_posix())
+        os.replace(tmp_path, save_path)
+
+        return datasets.load_from_disk(save_path.as_posix())
+
+    def identify_unused_columns(self, dataset: Union[Dataset, IterableDataset]) -> List[str]:
+        model_inputs = {input.name for input in get_onnx_graph_io(self.onnx_model_path).inputs}
+
+        column_names = dataset.column_names
+        if column_names is None:
+            # The columns of a streamed dataset are unknown until its first sample is read when it has no features.
+            column_names = list(next(iter(dataset), {}).keys())
+
+        ignored_columns = list(set(column_names) - model_inputs)
         return ignored_columns
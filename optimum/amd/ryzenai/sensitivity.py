@@ -0,0 +1,364 @@
+# Copyright 2024 The HuggingFace Team. All rights reserved.
+# Licensed under the MIT License.
+"""Layer-wise quantization sensitivity analysis of QDQ models, comparing their activations to the float model."""
+
+import json
+import math
+import os
+from dataclasses import asdict, dataclass, field, replace
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional, Set, Tuple, Union
+
+import numpy as np
+import onnx
+import onnxruntime as ort
+from datasets import Dataset
+
+from .calibration import RyzenAICalibrationDataReader
+from .configuration import QuantizationConfig
+
+
+if TYPE_CHECKING:
+    from .quantization import RyzenAIOnnxQuantizer
+
+
+QUANTIZE_OP_TYPES = ("QuantizeLinear", "VitisQuantizeLinear")
+DEQUANTIZE_OP_TYPES = ("DequantizeLinear", "VitisDequantizeLinear")
+
+
+@dataclass
+class RyzenAILayerSensitivity:
+    """
+    The quantization error of one quantized activation, and of the nodes computing it from the previous quantized
+    activations.
+
+    Args:
+        tensor_name (`str`):
+            The name of the activation in the float model.
+        node_names (`List[str]`):
+            The nodes computing the activation from the previous quantized activations, e.g. a convolution and its
+            fused activation function.
+        op_types (`List[str]`):
+            The operator types of the nodes.
+        sqnr_db (`float`):
+            The signal to quantization noise ratio of the activation, in dB.
+        input_sqnr_db (`float`):
+            The lowest SQNR of the quantized activations the nodes take as inputs, in dB. Infinite if the nodes only
+            take float inputs.
+    """
+
+    tensor_name: str
+    node_names: List[str]
+    op_types: List[str]
+    sqnr_db: float
+    input_sqnr_db: float
+
+    @property
+    def degradation_db(self) -> float:
+        """
+        The SQNR lost by the nodes, that is the quantization error they add on top of the error of their inputs.
+
+        Nodes only taking float inputs have no finite reference, their degradation is the negated SQNR of their output,
+        so that they are not ranked first whatever their error.
+        """
+        if math.isinf(self.sqnr_db):
+            return 0.0
+        if math.isinf(self.input_sqnr_db):
+            return -self.sqnr_db
+        return self.input_sqnr_db - self.sqnr_db
+
+
+@dataclass
+class RyzenAISensitivityReport:
+    """
+    The layers of a quantized model, sorted by decreasing SQNR degradation.
+
+    Args:
+        layers (`List[RyzenAILayerSensitivity]`, defaults to `[]`):
+            The sensitivity of each quantized activation.
+        num_samples (`int`, defaults to `0`):
+            The number of samples the models were compared on.
+    """
+
+    layers: List[RyzenAILayerSensitivity] = field(default_factory=list)
+    num_samples: int = 0
+
+    def worst_layers(self, top_k: int = 10) -> List[RyzenAILayerSensitivity]:
+        """
+        Returns the `top_k` layers with the largest SQNR degradation.
+        """
+        return self.layers[:top_k]
+
+    def worst_nodes(self, top_k: int = 10) -> List[str]:
+        """
+        Returns the nodes of the `top_k` layers with the largest SQNR degradation, e.g. to be kept in float with
+        [`quantize_mixed_precision`].
+        """
+        return [name for layer in self.worst_layers(top_k) for name in layer.node_names]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "num_samples": self.num_samples,
+            "layers": [dict(asdict(layer), degradation_db=layer.degradation_db) for layer in self.layers],
+        }
+
+    def save(self, save_path: Union[str, Path]):
+        """
+        Saves the report as JSON, infinite SQNRs being written as `Infinity`.
+        """
+        with open(save_path, "w") as save_file:
+            json.dump(self.to_dict(), save_file, indent=2)
+
+    def summary(self, top_k: int = 10) -> str:
+        """
+        Returns a human readable table of the `top_k` most sensitive layers.
+        """
+        lines = [f"{'Tensor':<40} {'Op types':<32} {'SQNR (dB)':>10} {'Input SQNR':>11} {'Loss (dB)':>10}"]
+        for layer in self.worst_layers(top_k):
+            op_types = "+".join(layer.op_types)
+            lines.append(
+                f"{layer.tensor_name[:40]:<40} {op_types[:32]:<32} {layer.sqnr_db:>10.2f} "
+                f"{layer.input_sqnr_db:>11.2f} {layer.degradation_db:>10.2f}"
+            )
+
+        return "\n".join(lines)
+
+
+def get_qdq_activation_pairs(model: onnx.ModelProto) -> Dict[str, str]:
+    """
+    Maps the activations of the float model to their dequantized counterpart in a QDQ model. Weights, quantized
+    offline without a `QuantizeLinear` node, are not included.
+
+    Args:
+        model (`onnx.ModelProto`):
+            The QDQ model.
+
+    Returns:
+        `Dict[str, str]`: The name of the dequantized activation for each float activation.
+    """
+    producers = {output: node for node in model.graph.node for output in node.output}
+
+    pairs = {}
+    for node in model.graph.node:
+        if node.op_type not in DEQUANTIZE_OP_TYPES:
+            continue
+        quantize_node = producers.get(node.input[0])
+        if quantize_node is None or quantize_node.op_type not in QUANTIZE_OP_TYPES:
+            continue
+
+        # Activations consumed by several nodes may have one DequantizeLinear node per consumer.
+        pairs.setdefault(quantize_node.input[0], node.output[0])
+
+    return pairs
+
+
+def _match_float_tensors(float_model: onnx.ModelProto, pairs: Dict[str, str]) -> Dict[str, str]:
+    float_tensors = {name for node in float_model.graph.node for name in node.output}
+    float_tensors |= {graph_input.name for graph_input in float_model.graph.input}
+
+    matched = {}
+    for quantized_input, dequantized_output in pairs.items():
+        # Graph outputs keep their name after the DequantizeLinear node, the float tensor being renamed.
+        if quantized_input in float_tensors:
+            matched[quantized_input] = dequantized_output
+        elif dequantized_output in float_tensors:
+            matched[dequantized_output] = dequantized_output
+
+    return matched
+
+
+def _save_with_outputs(model: onnx.ModelProto, output_names: Iterable[str], save_path: str):
+    """
+    Saves a copy of a model exposing the given tensors as outputs.
+    """
+    model_copy = onnx.ModelProto()
+    model_copy.CopyFrom(model)
+
+    # ONNX Runtime infers the type of untyped outputs, whether the model runs in float32 or float16.
+    del model_copy.graph.output[:]
+    model_copy.graph.output.extend(onnx.ValueInfoProto(name=name) for name in output_names)
+
+    onnx.save(model_copy, save_path, save_as_external_data=model_copy.ByteSize() > onnx.checker.MAXIMUM_PROTOBUF)
+
+
+def _get_layers(
+    float_model: onnx.ModelProto, sqnrs_db: Dict[str, float]
+) -> List[Tuple[str, List[onnx.NodeProto], float]]:
+    """
+    Returns, for each quantized activation, the nodes computing it from the previous quantized activations and the
+    lowest SQNR of these activations.
+    """
+    producers = {output: node for node in float_model.graph.node for output in node.output}
+
+    layers = []
+    for tensor_name in sqnrs_db:
+        if tensor_name not in producers:
+            continue
+
+        nodes = []
+        input_sqnr_db = math.inf
+        visited: Set[int] = set()
+        stack = [producers[tensor_name]]
+        while stack:
+            node = stack.pop()
+            if id(node) in visited:
+                continue
+            visited.add(id(node))
+            nodes.append(node)
+            for name in node.input:
+                if name in sqnrs_db:
+                    input_sqnr_db = min(input_sqnr_db, sqnrs_db[name])
+                elif name in producers:
+                    stack.append(producers[name])
+
+        layers.append((tensor_name, nodes[::-1], input_sqnr_db))
+
+    return layers
+
+
+def analyze_quantization_sensitivity(
+    float_model_path: Union[str, Path],
+    quantized_model_path: Union[str, Path],
+    dataset: Dataset,
+    batch_size: int = 1,
+    num_tensors_per_run: Optional[int] = None,
+) -> RyzenAISensitivityReport:
+    """
+    Runs a float model and its QDQ quantized version side by side with the CPU execution provider, and measures the
+    signal to quantization noise ratio (SQNR) of every activation quantized with a `QuantizeLinear` /
+    `DequantizeLinear` pair.
+
+    Each activation is attributed to the nodes computing it from the previous quantized activations, and the layers
+    are ranked by the SQNR these nodes lose, so that the layers adding the most quantization error come first, rather
+    than the ones at the end of the model accumulating the error of all the previous ones.
+
+    Args:
+        float_model_path (`Union[str, Path]`):
+            Path to the float ONNX model.
+        quantized_model_path (`Union[str, Path]`):
+            Path to the QDQ model, e.g. quantized by [`~RyzenAIOnnxQuantizer.quantize`].
+        dataset (`Dataset`):
+            The samples to compare the models on, e.g. a slice of the calibration dataset.
+        batch_size (`int`, defaults to `1`):
+            The batch size the models are run with.
+        num_tensors_per_run (`Optional[int]`, defaults to `None`):
+            The number of activations captured by each pass over the dataset. The activations are reduced to their SQNR
+            batch by batch, so the memory used is bounded by `batch_size * num_tensors_per_run` activations. Defaults
+            to all the activations in a single pass.
+
+    Returns:
+        [`RyzenAISensitivityReport`]: The layers sorted by decreasing SQNR degradation.
+    """
+    if num_tensors_per_run is not None and num_tensors_per_run <= 0:
+        raise ValueError(f"num_tensors_per_run should be >= 1 (got: {num_tensors_per_run}).")
+
+    float_model = onnx.load(float_model_path)
+    quantized_model = onnx.load(quantized_model_path)
+
+    pairs = _match_float_tensors(float_model, get_qdq_activation_pairs(quantized_model))
+    if len(pairs) == 0:
+        raise ValueError(f"The model {quantized_model_path} does not contain any quantized activation.")
+
+    float_names = list(pairs.keys())
+    num_tensors_per_run = num_tensors_per_run or len(float_names)
+    signal_power = dict.fromkeys(float_names, 0.0)
+    noise_power = dict.fromkeys(float_names, 0.0)
+
+    reader = RyzenAICalibrationDataReader(dataset, batch_size, prefetch=False)
+    num_samples = 0
+    with TemporaryDirectory() as tmpdir:
+        float_path = os.path.join(tmpdir, "float.onnx")
+        quantized_path = os.path.join(tmpdir, "quantized.onnx")
+        for start in range(0, len(float_names), num_tensors_per_run):
+            names = float_names[start : start + num_tensors_per_run]
+            _save_with_outputs(float_model, names, float_path)
+            _save_with_outputs(quantized_model, [pairs[name] for name in names], quantized_path)
+            float_session = ort.InferenceSession(float_path, providers=["CPUExecutionProvider"])
+            quantized_session = ort.InferenceSession(quantized_path, providers=["CPUExecutionProvider"])
+
+            reader.rewind()
+            num_samples = 0
+            for batch in iter(reader.get_next, None):
+                float_outputs = float_session.run(None, batch)
+                quantized_outputs = quantized_session.run(None, batch)
+                for name, reference, quantized in zip(names, float_outputs, quantized_outputs):
+                    reference = reference.astype(np.float64)
+                    signal_power[name] += float(np.sum(reference**2))
+                    noise_power[name] += float(np.sum((reference - quantized.astype(np.float64)) ** 2))
+                num_samples += len(next(iter(batch.values())))
+
+            del float_session, quantized_session
+
+    sqnrs_db = {}
+    for name in float_names:
+        if noise_power[name] == 0.0:
+            sqnrs_db[name] = math.inf
+        elif signal_power[name] == 0.0:
+            sqnrs_db[name] = -math.inf
+        else:
+            sqnrs_db[name] = 10.0 * math.log10(signal_power[name] / noise_power[name])
+
+    layers = [
+        RyzenAILayerSensitivity(
+            tensor_name=tensor_name,
+            node_names=[node.name for node in nodes],
+            op_types=[node.op_type for node in nodes],
+            sqnr_db=sqnrs_db[tensor_name],
+            input_sqnr_db=input_sqnr_db,
+        )
+        for tensor_name, nodes, input_sqnr_db in _get_layers(float_model, sqnrs_db)
+    ]
+    layers.sort(key=lambda layer: -layer.degradation_db)
+
+    return RyzenAISensitivityReport(layers=layers, num_samples=num_samples)
+
+
+def quantize_mixed_precision(
+    quantizer: "RyzenAIOnnxQuantizer",
+    quantization_config: QuantizationConfig,
+    report: RyzenAISensitivityReport,
+    save_dir: Union[str, Path],
+    top_k: int = 1,
+    dataset: Optional[Dataset] = None,
+    file_suffix: Optional[str] = "mixed_precision",
+    **kwargs,
+) -> Path:
+    """
+    Quantizes a model again, keeping the nodes of the `top_k` most sensitive layers of `report` in float.
+
+    The nodes are excluded from the quantization rather than removed from the QDQ model, so that the fusions done by
+    the quantizer, e.g. of a `Relu` into the quantization of its input, stay consistent.
+
+    Args:
+        quantizer (`RyzenAIOnnxQuantizer`):
+            The quantizer of the float model.
+        quantization_config (`QuantizationConfig`):
+            The configuration the model was quantized with.
+        report (`RyzenAISensitivityReport`):
+            The sensitivity of the quantized model, as returned by [`analyze_quantization_sensitivity`].
+        save_dir (`Union[str, Path]`):
+            The directory where the mixed-precision model should be saved.
+        top_k (`int`, defaults to `1`):
+            The number of layers to keep in float.
+        dataset (`Optional[Dataset]`, defaults to `None`):
+            The calibration dataset. Unused if `calibration_tensors_range` is passed, e.g. as computed by
+            [`~RyzenAIOnnxQuantizer.compute_calibration_tensors_range`] to skip the calibration.
+        file_suffix (`Optional[str]`, defaults to `"mixed_precision"`):
+            The file_suffix used to save the mixed-precision model.
+        kwargs:
+            Passed to [`~RyzenAIOnnxQuantizer.quantize`].
+
+    Returns:
+        The path of the directory of the mixed-precision model.
+    """
+    nodes_to_exclude = list(quantization_config.nodes_to_exclude)
+    nodes_to_exclude += [name for name in report.worst_nodes(top_k) if name not in nodes_to_exclude]
+
+    return quantizer.quantize(
+        replace(quantization_config, nodes_to_exclude=nodes_to_exclude),
+        dataset,
+        save_dir,
+        file_suffix=file_suffix,
+        **kwargs,
+    )
@@ -0,0 +1,493 @@
+# Copyright 2024 The HuggingFace Team. All rights reserved.
+# Licensed under the MIT License.
+"""Sweeps over quantization configurations, scored against the float model with cheap accuracy proxies."""
+
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field, replace
+from enum import Enum
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+import onnxruntime as ort
+from datasets import Dataset
+
+from .calibration import SHARDED_CALIBRATION_METHODS, RyzenAICalibrationDataReader, _get_method_name
+from .configuration import QuantizationConfig, RyzenAIConfig
+
+
+if TYPE_CHECKING:
+    from .quantization import RyzenAIOnnxQuantizer
+
+
+LOGGER = logging.getLogger(__name__)
+
+PROXY_METRICS = ("cosine_similarity", "sqnr_db")
+
+
+@dataclass
+class RyzenAISweepResult:
+    """
+    The scores of one quantization configuration of a sweep.
+
+    Args:
+        name (`str`):
+            The name of the configuration, also the name of the directory of the quantized model.
+        config (`QuantizationConfig`):
+            The quantization configuration.
+        model_path (`Optional[str]`, defaults to `None`):
+            Path to the quantized model.
+        cosine_similarity (`Optional[float]`, defaults to `None`):
+            The mean cosine similarity between the outputs of the quantized and of the float model, for the worst
+            output of the model.
+        sqnr_db (`Optional[float]`, defaults to `None`):
+            The signal to quantization noise ratio of the outputs of the quantized model, in dB, for the worst output of
+            the model.
+        latency_ms (`Optional[float]`, defaults to `None`):
+            The median latency of the quantized model with the CPU execution provider, in milliseconds. Not measured for
+            pruned configurations.
+        num_evaluated_batches (`int`, defaults to `0`):
+            The number of held-out batches the configuration was scored on.
+        pruned (`bool`, defaults to `False`):
+            Whether the configuration was rejected for not reaching the accuracy thresholds, or because its quantized
+            model failed to run.
+        error (`Optional[str]`, defaults to `None`):
+            The error raised while running the quantized model, if any.
+    """
+
+    name: str
+    config: QuantizationConfig
+    model_path: Optional[str] = None
+    cosine_similarity: Optional[float] = None
+    sqnr_db: Optional[float] = None
+    latency_ms: Optional[float] = None
+    num_evaluated_batches: int = 0
+    pruned: bool = False
+    error: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "config": RyzenAIConfig.dataclass_to_dict(self.config),
+            "model_path": self.model_path,
+            "cosine_similarity": self.cosine_similarity,
+            "sqnr_db": self.sqnr_db,
+            "latency_ms": self.latency_ms,
+            "num_evaluated_batches": self.num_evaluated_batches,
+            "pruned": self.pruned,
+            "error": self.error,
+        }
+
+
+@dataclass
+class RyzenAISweepReport:
+    """
+    The results of a sweep over quantization configurations.
+
+    Args:
+        results (`List[RyzenAISweepResult]`):
+            The results of the configurations, in the order of the sweep.
+        metric (`str`, defaults to `"cosine_similarity"`):
+            The accuracy proxy the Pareto front is computed on, `"cosine_similarity"` or `"sqnr_db"`.
+        reference_latency_ms (`Optional[float]`, defaults to `None`):
+            The median latency of the float model with the CPU execution provider, in milliseconds.
+    """
+
+    results: List[RyzenAISweepResult] = field(default_factory=list)
+    metric: str = "cosine_similarity"
+    reference_latency_ms: Optional[float] = None
+
+    def pareto_front(self) -> List[RyzenAISweepResult]:
+        """
+        Returns the configurations that are not pruned and not dominated by another one, that is faster and at least
+        as accurate, sorted by increasing latency.
+        """
+        candidates = [
+            result
+            for result in self.results
+            if not result.pruned and result.latency_ms is not None and getattr(result, self.metric) is not None
+        ]
+        candidates.sort(key=lambda result: (result.latency_ms, -getattr(result, self.metric)))
+
+        front = []
+        for result in candidates:
+            if len(front) == 0 or getattr(result, self.metric) > getattr(front[-1], self.metric):
+                front.append(result)
+
+        return front
+
+    def to_dict(self) -> Dict[str, Any]:
+        front = {result.name for result in self.pareto_front()}
+        return {
+            "metric": self.metric,
+            "reference_latency_ms": self.reference_latency_ms,
+            "results": [dict(result.to_dict(), pareto=result.name in front) for result in self.results],
+        }
+
+    def save(self, save_path: Union[str, Path]):
+        """
+        Saves the report as JSON.
+        """
+        with open(save_path, "w") as save_file:
+            json.dump(self.to_dict(), save_file, indent=2)
+
+    def summary(self) -> str:
+        """
+        Returns a human readable table of the results, the Pareto optimal configurations being marked with a `*`.
+        """
+        front = {result.name for result in self.pareto_front()}
+        lines = [
+            f"Float model latency: {self.reference_latency_ms:.3f} ms" if self.reference_latency_ms else "",
+            f"  {'Configuration':<48} {'Cosine':>8} {'SQNR (dB)':>10} {'Latency (ms)':>13} {'Speedup':>8}  Status",
+        ]
+        for result in self.results:
+            speedup = (
+                f"{self.reference_latency_ms / result.latency_ms:.2f}x"
+                if self.reference_latency_ms and result.latency_ms
+                else "-"
+            )
+            status = "error" if result.error is not None else "pruned" if result.pruned else ""
+            lines.append(
+                f"{'*' if result.name in front else ' '} {result.name[:48]:<48} "
+                f"{_format_score(result.cosine_similarity, '.5f'):>8} {_format_score(result.sqnr_db, '.2f'):>10} "
+                f"{_format_score(result.latency_ms, '.3f'):>13} {speedup:>8}  {status}"
+            )
+
+        return "\n".join(line for line in lines if line)
+
+
+def _format_score(value: Optional[float], format_spec: str) -> str:
+    return "-" if value is None else format(value, format_spec)
+
+
+def quantization_config_grid(base_config: QuantizationConfig, **options: List[Any]) -> Dict[str, QuantizationConfig]:
+    """
+    Builds the cartesian product of quantization configurations, overriding the fields of `base_config`.
+
+    Example:
+
+    ```python
+    >>> from onnxruntime.quantization import CalibrationMethod
+    >>> from optimum.amd.ryzenai import AutoQuantizationConfig
+    >>> from optimum.amd.ryzenai.sweep import quantization_config_grid
+
+    >>> configs = quantization_config_grid(
+    ...     AutoQuantizationConfig.cpu_cnn_config(),
+    ...     calibration_method=[CalibrationMethod.MinMax, CalibrationMethod.Percentile],
+    ...     activations_symmetric=[False, True],
+    ... )
+    ```
+
+    Args:
+        base_config (`QuantizationConfig`):
+            The configuration whose fields are overridden.
+        options (`List[Any]`):
+            The values to sweep for each field of `QuantizationConfig`.
+
+    Returns:
+        `Dict[str, QuantizationConfig]`: The configurations, named after their overridden fields.
+    """
+    names = list(options.keys())
+    grid = {}
+    for values in itertools.product(*options.values()):
+        overrides = dict(zip(names, values))
+        name = ",".join(
+            f"{key}={value.name if isinstance(value, Enum) else value}" for key, value in overrides.items()
+        )
+        grid[name or "base"] = replace(base_config, **overrides)
+
+    return grid
+
+
+def compute_proxy_metrics(
+    reference_outputs: List[List[np.ndarray]], outputs: List[List[np.ndarray]]
+) -> Tuple[float, float]:
+    """
+    Compares the outputs of a quantized model to the outputs of the float model.
+
+    Args:
+        reference_outputs (`List[List[np.ndarray]]`):
+            The outputs of the float model, for each batch.
+        outputs (`List[List[np.ndarray]]`):
+            The outputs of the quantized model, for each batch.
+
+    Returns:
+        `Tuple[float, float]`: The mean cosine similarity of the samples and the signal to quantization noise ratio in
+        dB, each for the worst output of the model.
+    """
+    cosine_similarities = []
+    sqnrs_db = []
+    for output_index in range(len(reference_outputs[0])):
+        similarities = []
+        signal_power = noise_power = 0.0
+        for reference_batch, batch in zip(reference_outputs, outputs):
+            reference = (
+                reference_batch[output_index].astype(np.float64).reshape(len(reference_batch[output_index]), -1)
+            )
+            quantized = batch[output_index].astype(np.float64).reshape(reference.shape)
+
+            norms = np.linalg.norm(reference, axis=1) * np.linalg.norm(quantized, axis=1)
+            dots = np.sum(reference * quantized, axis=1)
+            # Two null vectors are identical, a null vector and a non-null one are orthogonal.
+            similarities.append(
+                np.where(
+                    norms > 0,
+                    dots / np.maximum(norms, np.finfo(np.float64).tiny),
+                    np.all(reference == quantized, axis=1),
+                )
+            )
+
+            signal_power += float(np.sum(reference**2))
+            noise_power += float(np.sum((reference - quantized) ** 2))
+
+        cosine_similarities.append(float(np.mean(np.concatenate(similarities))))
+        if noise_power == 0.0:
+            sqnrs_db.append(float("inf"))
+        elif signal_power == 0.0:
+            sqnrs_db.append(float("-inf"))
+        else:
+            sqnrs_db.append(10.0 * float(np.log10(signal_power / noise_power)))
+
+    return min(cosine_similarities), min(sqnrs_db)
+
+
+def _get_calibration_key(config: QuantizationConfig) -> Tuple[str, str, bool]:
+    return _get_method_name(config.calibration_method), config.activations_dtype.name, config.activations_symmetric
+
+
+def _run_session(session: ort.InferenceSession, batches: List[Dict[str, np.ndarray]]) -> List[List[np.ndarray]]:
+    return [session.run(None, batch) for batch in batches]
+
+
+def _create_cpu_session(model_path: Union[str, Path], num_threads: int = 0) -> ort.InferenceSession:
+    session_options = ort.SessionOptions()
+    session_options.intra_op_num_threads = num_threads
+    return ort.InferenceSession(str(model_path), session_options, providers=["CPUExecutionProvider"])
+
+
+def _is_below_thresholds(
+    cosine_similarity: float, sqnr_db: float, min_cosine_similarity: Optional[float], min_sqnr_db: Optional[float]
+) -> bool:
+    return (min_cosine_similarity is not None and cosine_similarity < min_cosine_similarity) or (
+        min_sqnr_db is not None and sqnr_db < min_sqnr_db
+    )
+
+
+def _quantize_and_evaluate(
+    model_path: str,
+    model_config: Any,
+    name: str,
+    quantization_config: QuantizationConfig,
+    tensors_range: Optional[Dict[str, Tuple[np.ndarray, np.ndarray]]],
+    calibration_dataset: Optional[Dataset],
+    batch_size: int,
+    save_dir: str,
+    batches: List[Dict[str, np.ndarray]],
+    reference_outputs: List[List[np.ndarray]],
+    num_early_batches: int,
+    min_cosine_similarity: Optional[float],
+    min_sqnr_db: Optional[float],
+    num_threads: int,
+) -> RyzenAISweepResult:
+    """
+    Quantizes the model with one configuration from precomputed ranges, or on `calibration_dataset` without them, and
+    scores it on the held-out batches, stopping after the first `num_early_batches` if the configuration does not reach
+    the thresholds. Runs in a worker process.
+    """
+    from .quantization import RyzenAIOnnxQuantizer
+
+    quantizer = RyzenAIOnnxQuantizer(Path(model_path), config=model_config)
+    quantized_dir = quantizer.quantize(
+        quantization_config,
+        calibration_dataset,
+        save_dir,
+        batch_size=batch_size,
+        calibration_tensors_range=tensors_range,
+    )
+    quantized_model_path = quantized_dir / f"{Path(model_path).stem}_quantized.onnx"
+
+    result = RyzenAISweepResult(name=name, config=quantization_config, model_path=quantized_model_path.as_posix())
+    try:
+        session = _create_cpu_session(quantized_model_path, num_threads)
+        outputs = _run_session(session, batches[:num_early_batches])
+    except Exception as exception:
+        # The quantized model can be rejected by the CPU execution provider, e.g. with an operator type it does not
+        # implement: the configuration is reported as failed, the other ones are still evaluated.
+        LOGGER.warning(f"The quantized model of the configuration {name} failed to run: {exception}")
+        result.pruned = True
+        result.error = repr(exception)
+        return result
+
+    if num_early_batches < len(batches):
+        result.cosine_similarity, result.sqnr_db = compute_proxy_metrics(
+            reference_outputs[:num_early_batches], outputs
+        )
+        result.num_evaluated_batches = len(outputs)
+        if _is_below_thresholds(result.cosine_similarity, result.sqnr_db, min_cosine_similarity, min_sqnr_db):
+            result.pruned = True
+            return result
+
+        outputs += _run_session(session, batches[num_early_batches:])
+
+    result.cosine_similarity, result.sqnr_db = compute_proxy_metrics(reference_outputs, outputs)
+    result.num_evaluated_batches = len(outputs)
+    result.pruned = _is_below_thresholds(result.cosine_similarity, result.sqnr_db, min_cosine_similarity, min_sqnr_db)
+    return result
+
+
+def measure_latency(
+    model_path: Union[str, Path], inputs: Dict[str, np.ndarray], num_runs: int = 20, num_warmup_runs: int = 3
+) -> float:
+    """
+    Measures the median latency of a model with the CPU execution provider, in milliseconds.
+
+    Args:
+        model_path (`Union[str, Path]`):
+            Path to the ONNX model.
+        inputs (`Dict[str, np.ndarray]`):
+            The inputs to run the model on.
+        num_runs (`int`, defaults to `20`):
+            The number of timed runs.
+        num_warmup_runs (`int`, defaults to `3`):
+            The number of untimed runs before the timed ones.
+    """
+    session = _create_cpu_session(model_path)
+    for _ in range(num_warmup_runs):
+        session.run(None, inputs)
+
+    latencies = []
+    for _ in range(num_runs):
+        start = time.perf_counter()
+        session.run(None, inputs)
+        latencies.append(time.perf_counter() - start)
+
+    return float(np.median(latencies)) * 1000
+
+
+def run_quantization_sweep(
+    quantizer: "RyzenAIOnnxQuantizer",
+    quantization_configs: Union[List[QuantizationConfig], Dict[str, QuantizationConfig]],
+    calibration_dataset: Dataset,
+    evaluation_dataset: Dataset,
+    save_dir: Union[str, Path],
+    batch_size: Optional[int] = None,
+    num_workers: int = 1,
+    metric: str = "cosine_similarity",
+    min_cosine_similarity: Optional[float] = None,
+    min_sqnr_db: Optional[float] = None,
+    num_early_batches: int = 1,
+    num_latency_runs: int = 20,
+    calibration_cache_dir: Optional[Union[str, Path]] = None,
+) -> RyzenAISweepReport:
+    """
+    Quantizes and scores a model with each quantization configuration. See [`~RyzenAIOnnxQuantizer.sweep`].
+    """
+    if metric not in PROXY_METRICS:
+        raise ValueError(f"Unsupported metric {metric}, supported metrics are {PROXY_METRICS}.")
+
+    if num_workers <= 0:
+        raise ValueError(f"num_workers should be >= 1 (got: {num_workers}).")
+
+    if num_early_batches <= 0:
+        raise ValueError(f"num_early_batches should be >= 1 (got: {num_early_batches}).")
+
+    if not isinstance(quantization_configs, dict):
+        quantization_configs = {f"config_{index}": config for index, config in enumerate(quantization_configs)}
+
+    if len(quantization_configs) == 0:
+        raise ValueError("No quantization configuration to sweep.")
+
+    save_dir = Path(save_dir)
+    save_dir.mkdir(parents=True, exist_ok=True)
+
+    batch_size, static_batch_size = quantizer._get_calibration_batch_size(batch_size)
+    reader = RyzenAICalibrationDataReader(
+        evaluation_dataset, batch_size, drop_last=static_batch_size is not None, prefetch=False
+    )
+    # The reader reuses its buffers, the batches are copied to be sent to the workers.
+    batches = [{name: value.copy() for name, value in batch.items()} for batch in iter(reader.get_next, None)]
+    if len(batches) == 0:
+        raise ValueError("The evaluation dataset does not contain any full batch.")
+
+    reference_outputs = _run_session(_create_cpu_session(quantizer.onnx_model_path), batches)
+
+    # As with `quantize`, the activations ranges are only precomputed, once per calibration method and activations
+    # type, for the methods whose sharded statistics match the serial calibration, and when sharding or caching is
+    # requested. The other configurations are calibrated by vai_q_onnx along their quantization.
+    precompute_ranges = num_workers > 1 or calibration_cache_dir is not None
+    tensors_ranges = {}
+    for config in quantization_configs.values():
+        calibration_key = _get_calibration_key(config)
+        if calibration_key in tensors_ranges:
+            continue
+        if precompute_ranges and _get_method_name(config.calibration_method) in SHARDED_CALIBRATION_METHODS:
+            tensors_ranges[calibration_key] = quantizer.compute_calibration_tensors_range(
+                config,
+                calibration_dataset,
+                batch_size=batch_size,
+                num_workers=num_workers,
+                cache_dir=calibration_cache_dir,
+            )
+        else:
+            tensors_ranges[calibration_key] = None
+
+    num_processes = min(num_workers, len(quantization_configs))
+    executor = None
+    if num_processes > 1:
+        executor = ProcessPoolExecutor(num_processes, mp_context=multiprocessing.get_context("spawn"))
+
+    LOGGER.info(
+        f"Quantizing and evaluating {len(quantization_configs)} configurations with {num_processes} worker(s)..."
+    )
+    jobs = {}
+    try:
+        for name, config in quantization_configs.items():
+            tensors_range = tensors_ranges[_get_calibration_key(config)]
+            kwargs = {
+                "model_path": Path(quantizer.onnx_model_path).as_posix(),
+                "model_config": quantizer.config,
+                "name": name,
+                "quantization_config": config,
+                "tensors_range": tensors_range,
+                "calibration_dataset": calibration_dataset if tensors_range is None else None,
+                "batch_size": batch_size,
+                "save_dir": (save_dir / name).as_posix(),
+                "batches": batches,
+                "reference_outputs": reference_outputs,
+                "num_early_batches": num_early_batches,
+                "min_cosine_similarity": min_cosine_similarity,
+                "min_sqnr_db": min_sqnr_db,
+                "num_threads": max(1, (os.cpu_count() or 1) // num_processes) if executor is not None else 0,
+            }
+            jobs[name] = executor.submit(_quantize_and_evaluate, **kwargs) if executor is not None else kwargs
+
+        results = [job.result() if executor is not None else _quantize_and_evaluate(**job) for job in jobs.values()]
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    # Latencies are measured sequentially once the workers are done, so that the configurations do not compete for the
+    # CPU, and only for the configurations that survived the accuracy thresholds.
+    report = RyzenAISweepReport(
+        results=results,
+        metric=metric,
+        reference_latency_ms=measure_latency(quantizer.onnx_model_path, batches[0], num_runs=num_latency_runs),
+    )
+    for result in results:
+        if result.pruned:
+            LOGGER.info(
+                f"Pruned {result.name} (cosine similarity: {result.cosine_similarity}, SQNR: {result.sqnr_db} dB)."
+            )
+            continue
+        result.latency_ms = measure_latency(result.model_path, batches[0], num_runs=num_latency_runs)
+
+    report.save(save_dir / "sweep_report.json")
+    LOGGER.info(f"Quantization sweep results:\n{report.summary()}")
+
+    return report
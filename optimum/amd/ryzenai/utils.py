@@ -1,13 +1,36 @@
 # Copyright 2023 The HuggingFace Team. All rights reserved.
 # Licensed under the MIT License.
 
+import hashlib
+import os
+import threading
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterator, NamedTuple, Tuple, Union
 
+import onnx
 import onnxruntime as ort
 
 
 ONNX_WEIGHTS_NAME = "model.onnx"
 ONNX_WEIGHTS_NAME_STATIC = "model_static.onnx"
 
+# Protobuf field numbers, see https://github.com/onnx/onnx/blob/main/onnx/onnx.proto
+_MODEL_PROTO_GRAPH_FIELD = 7
+_GRAPH_PROTO_INPUT_FIELD = 11
+_GRAPH_PROTO_OUTPUT_FIELD = 12
+
+_GRAPH_IO_CACHE: Dict[str, Tuple[Tuple[int, int], "OnnxGraphIO"]] = {}
+_GRAPH_IO_CACHE_LOCK = threading.Lock()
+
+
+class OnnxGraphIO(NamedTuple):
+    """
+    The inputs and outputs of an ONNX graph, as read by [`get_onnx_graph_io`].
+    """
+
+    inputs: Tuple[onnx.ValueInfoProto, ...]
+    outputs: Tuple[onnx.ValueInfoProto, ...]
+
 
 def validate_provider_availability(provider: str):
     """
@@ -21,3 +44,117 @@ def validate_provider_availability(provider: str):
         raise ValueError(
             f"Asked to use {provider} as an ONNX Runtime execution provider, but the available execution providers are {available_providers}."
         )
+
+
+def _read_varint(stream: BinaryIO) -> int:
+    result = 0
+    shift = 0
+    while True:
+        byte = stream.read(1)
+        if not byte:
+            raise EOFError("Unexpected end of file while reading a protobuf varint.")
+        result |= (byte[0] & 0x7F) << shift
+        if not byte[0] & 0x80:
+            return result
+        shift += 7
+
+
+def _iter_length_delimited_fields(stream: BinaryIO, end: int) -> Iterator[Tuple[int, int, int]]:
+    """
+    Iterates over the length-delimited fields of a serialized protobuf message, seeking over their payload rather than
+    reading it. Yields `(field_number, payload_offset, payload_length)`.
+    """
+    while stream.tell() < end:
+        key = _read_varint(stream)
+        field_number, wire_type = key >> 3, key & 0x7
+        if wire_type == 0:
+            _read_varint(stream)
+        elif wire_type == 1:
+            stream.seek(8, os.SEEK_CUR)
+        elif wire_type == 5:
+            stream.seek(4, os.SEEK_CUR)
+        elif wire_type == 2:
+            length = _read_varint(stream)
+            offset = stream.tell()
+            yield field_number, offset, length
+            stream.seek(offset + length)
+        else:
+            raise ValueError(f"Unsupported protobuf wire type {wire_type}.")
+
+
+def _parse_onnx_graph_io(model_path: str) -> OnnxGraphIO:
+    inputs, outputs = [], []
+    with open(model_path, "rb") as stream:
+        end = stream.seek(0, os.SEEK_END)
+        stream.seek(0)
+        for field_number, offset, length in _iter_length_delimited_fields(stream, end):
+            if field_number != _MODEL_PROTO_GRAPH_FIELD:
+                continue
+            for graph_field_number, _, graph_field_length in _iter_length_delimited_fields(stream, offset + length):
+                if graph_field_number in (_GRAPH_PROTO_INPUT_FIELD, _GRAPH_PROTO_OUTPUT_FIELD):
+                    value_info = onnx.ValueInfoProto()
+                    value_info.ParseFromString(stream.read(graph_field_length))
+                    if graph_field_number == _GRAPH_PROTO_INPUT_FIELD:
+                        inputs.append(value_info)
+                    else:
+                        outputs.append(value_info)
+
+    return OnnxGraphIO(inputs=tuple(inputs), outputs=tuple(outputs))
+
+
+def get_onnx_graph_io(model_path: Union[str, Path]) -> OnnxGraphIO:
+    """
+    Reads the inputs and outputs of an ONNX graph without loading the model.
+
+    Only the `graph.input` and `graph.output` entries of the protobuf are parsed: nodes and initializers are skipped
+    over and external data is never read. The result is cached per file, and invalidated when the file modification
+    time or size changes.
+
+    Args:
+        model_path (`Union[str, Path]`):
+            Path to the ONNX model.
+
+    Returns:
+        `OnnxGraphIO`: The graph inputs and outputs, as `onnx.ValueInfoProto`.
+    """
+    model_path = os.path.abspath(model_path)
+    stat = os.stat(model_path)
+    key = (stat.st_mtime_ns, stat.st_size)
+
+    with _GRAPH_IO_CACHE_LOCK:
+        cached = _GRAPH_IO_CACHE.get(model_path)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+
+    try:
+        graph_io = _parse_onnx_graph_io(model_path)
+    except (EOFError, ValueError):
+        model = onnx.load(model_path, load_external_data=False)
+        graph_io = OnnxGraphIO(inputs=tuple(model.graph.input), outputs=tuple(model.graph.output))
+
+    with _GRAPH_IO_CACHE_LOCK:
+        _GRAPH_IO_CACHE[model_path] = (key, graph_io)
+
+    return graph_io
+
+
+def get_value_info_shape(value_info: onnx.ValueInfoProto) -> Tuple[Union[int, str], ...]:
+    """
+    Returns the shape of an ONNX value, with `int` static dimensions, `str` symbolic dimensions and `-1` for unknown
+    dimensions.
+    """
+    return tuple(
+        dim.dim_value if dim.HasField("dim_value") else (dim.dim_param or -1)
+        for dim in value_info.type.tensor_type.shape.dim
+    )
+
+
+def hash_file(path: Union[str, Path], chunk_size: int = 1 << 20) -> str:
+    """
+    Returns the SHA-256 hex digest of a file, read by chunks.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as stream:
+        for chunk in iter(lambda: stream.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
@@ -1,13 +1,325 @@
-from itertools import combinations
+import hashlib
+import json
+import os
+import socket
+from itertools import permutations
+from pathlib import Path
 
-import amdsmi
 import numpy as np
 
 
-def get_bandwidth_matrix():
+CLUSTER_OBJECTIVES = ["avg", "min_link", "ring", "allreduce"]
+
+TOPOLOGY_CACHE_DIR = Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache")) / "optimum-amd" / "topology"
+
+
+def parse_cpu_list(cpu_list):
+    """
+    Parses a Linux CPU list such as `"0-3,8,10-11"` into a sorted list of CPU ids.
+    """
+    if isinstance(cpu_list, (list, tuple)):
+        return sorted(int(cpu) for cpu in cpu_list)
+
+    cpus = set()
+    for part in cpu_list.strip().split(","):
+        if not part:
+            continue
+        if "-" in part:
+            start, end = part.split("-")
+            cpus.update(range(int(start), int(end) + 1))
+        else:
+            cpus.add(int(part))
+
+    return sorted(cpus)
+
+
+def format_cpu_list(cpus):
+    """
+    Formats CPU ids as a compact Linux CPU list such as `"0-3,8"`, as accepted by `numactl` and `taskset`.
+    """
+    ranges = []
+    for cpu in sorted(cpus):
+        if ranges and cpu == ranges[-1][1] + 1:
+            ranges[-1][1] = cpu
+        else:
+            ranges.append([cpu, cpu])
+
+    return ",".join(str(start) if start == end else f"{start}-{end}" for start, end in ranges)
+
+
+def get_pci_device_numa_info(bdf, sysfs_root="/sys/bus/pci/devices"):
+    """
+    Returns the NUMA node of a PCI device (-1 if unknown) and the CPUs local to it, as read from sysfs.
+    """
+    device_dir = Path(sysfs_root) / bdf.lower()
+    try:
+        numa_node = int((device_dir / "numa_node").read_text().strip())
+    except (OSError, ValueError):
+        numa_node = -1
+    try:
+        cpus = parse_cpu_list((device_dir / "local_cpulist").read_text())
+    except (OSError, ValueError):
+        cpus = []
+
+    return numa_node, cpus
+
+
+class TopologySource:
+    """
+    Provides the topology of the GPU devices of a host: the bandwidth matrix between devices, and the NUMA node and
+    local CPUs of each device.
+
+    The topology is a dictionary `{"devices": [{"bdf": str, "numa_node": int, "cpus": List[int]}, ...],
+    "bandwidth_matrix": List[List[float]], "link_hops": List[List[int]]}`, the devices being ordered as the visible
+    device indices, `link_hops` giving the number of hops of the route between devices.
+    """
+
+    def fingerprint(self):
+        """
+        Returns a string identifying the devices of the host, cheap to compute compared to the full topology.
+        """
+        raise NotImplementedError
+
+    def query(self):
+        """
+        Returns the full topology.
+        """
+        raise NotImplementedError
+
+    def query_usage(self):
+        """
+        Returns the live free memory in MB and utilization in percent of each device, as a list of dictionaries
+        `{"free_memory": float, "utilization": float}`, the values being `None` when unknown.
+        """
+        raise NotImplementedError
+
+
+class AmdSmiTopologySource(TopologySource):
     """
-    Returns a matrix of bandwidths between all GPU devices in the system.
+    Queries the topology with `amdsmi`, and the NUMA affinity of the devices from sysfs.
     """
+
+    def _get_bdfs(self):
+        import amdsmi
+
+        amdsmi.amdsmi_init()
+        try:
+            return [str(amdsmi.amdsmi_get_device_bdf(device)) for device in amdsmi.amdsmi_get_device_handles()]
+        finally:
+            amdsmi.amdsmi_shut_down()
+
+    def fingerprint(self):
+        return f"{socket.gethostname()}:{','.join(self._get_bdfs())}"
+
+    def query(self):
+        devices = []
+        for bdf in self._get_bdfs():
+            numa_node, cpus = get_pci_device_numa_info(bdf)
+            devices.append({"bdf": bdf, "numa_node": numa_node, "cpus": cpus})
+
+        bandwidth_matrix, link_hops = get_bandwidth_matrix(return_hops=True)
+        return {"devices": devices, "bandwidth_matrix": bandwidth_matrix, "link_hops": link_hops}
+
+    def query_usage(self):
+        import amdsmi
+
+        amdsmi.amdsmi_init()
+        try:
+            usage = []
+            for device in amdsmi.amdsmi_get_device_handles():
+                memory = amdsmi.amdsmi_get_gpu_vram_usage(device)
+                activity = amdsmi.amdsmi_get_gpu_activity(device)
+                usage.append(
+                    {
+                        "free_memory": memory["vram_total"] - memory["vram_used"],
+                        "utilization": activity["gfx_activity"],
+                    }
+                )
+            return usage
+        finally:
+            amdsmi.amdsmi_shut_down()
+
+
+class FileTopologySource(TopologySource):
+    """
+    Reads a simulated topology from a JSON file, in the format returned by [`TopologySource.query`]. The `cpus` of the
+    devices can be given as Linux CPU lists such as `"0-15"`, and their simulated usage with `free_memory` (MB) and
+    `utilization` (percent). The bandwidth matrix only needs the direct links, the missing ones (`null` or 0) being
+    filled as in [`get_bandwidth_matrix`].
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+
+    def query(self):
+        with open(self.path, "r") as topology_file:
+            topology = json.load(topology_file)
+
+        num_devices = len(topology["bandwidth_matrix"])
+        devices = topology.get("devices") or [{} for _ in range(num_devices)]
+        if len(devices) != num_devices:
+            raise ValueError(
+                f"The topology file {self.path} has {len(devices)} devices but a {num_devices}x{num_devices} bandwidth "
+                "matrix."
+            )
+
+        bandwidth_matrix, link_hops = compute_widest_path_bandwidths(topology["bandwidth_matrix"])
+
+        return {
+            "devices": [
+                {
+                    "bdf": device.get("bdf", f"simulated:{idx}"),
+                    "numa_node": device.get("numa_node", -1),
+                    "cpus": parse_cpu_list(device.get("cpus", [])),
+                }
+                for idx, device in enumerate(devices)
+            ],
+            "bandwidth_matrix": bandwidth_matrix,
+            "link_hops": link_hops,
+        }
+
+    def query_usage(self):
+        with open(self.path, "r") as topology_file:
+            topology = json.load(topology_file)
+
+        devices = topology.get("devices") or [{} for _ in range(len(topology["bandwidth_matrix"]))]
+        return [
+            {"free_memory": device.get("free_memory"), "utilization": device.get("utilization")} for device in devices
+        ]
+
+    def fingerprint(self):
+        with open(self.path, "rb") as topology_file:
+            return f"{self.path.resolve()}:{hashlib.sha256(topology_file.read()).hexdigest()}"
+
+
+def get_topology(source=None, cache_dir=TOPOLOGY_CACHE_DIR, use_cache=True):
+    """
+    Returns the topology of the host, cached per host and invalidated when the fingerprint of the devices changes.
+
+    Args:
+        source (`Optional[TopologySource]`, defaults to `None`):
+            The topology source. Defaults to a [`FileTopologySource`] reading the `AMDRUN_TOPOLOGY_FILE` environment
+            variable if set, and to [`AmdSmiTopologySource`] otherwise.
+        cache_dir (`Union[str, Path]`, defaults to `~/.cache/optimum-amd/topology`):
+            The directory of the cache.
+        use_cache (`bool`, defaults to `True`):
+            Whether to read and write the cache.
+    """
+    if source is None:
+        topology_file = os.environ.get("AMDRUN_TOPOLOGY_FILE")
+        source = FileTopologySource(topology_file) if topology_file else AmdSmiTopologySource()
+
+    if not use_cache:
+        return source.query()
+
+    fingerprint = source.fingerprint()
+    key = hashlib.sha256(f"{type(source).__name__}|{fingerprint}".encode()).hexdigest()[:16]
+    cache_path = Path(cache_dir) / f"{socket.gethostname()}_{key}.json"
+
+    if cache_path.exists():
+        with open(cache_path, "r") as cache_file:
+            cached = json.load(cache_file)
+        if cached.get("fingerprint") == fingerprint:
+            return cached["topology"]
+
+    topology = source.query()
+
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    # Write to a temporary file first so that concurrent launches never read a partially written cache.
+    tmp_path = cache_path.with_suffix(f".{os.getpid()}.tmp")
+    with open(tmp_path, "w") as cache_file:
+        json.dump({"fingerprint": fingerprint, "topology": topology}, cache_file)
+    os.replace(tmp_path, cache_path)
+
+    return topology
+
+
+def get_available_devices(usage, min_free_memory=None, max_utilization=None):
+    """
+    Returns the devices with at least `min_free_memory` MB of free memory and at most `max_utilization` percent of
+    utilization, as returned by [`TopologySource.query_usage`]. Devices with unknown usage are considered available.
+    """
+    available = []
+    for device, device_usage in enumerate(usage):
+        free_memory, utilization = device_usage.get("free_memory"), device_usage.get("utilization")
+        if min_free_memory is not None and free_memory is not None and free_memory < min_free_memory:
+            continue
+        if max_utilization is not None and utilization is not None and utilization > max_utilization:
+            continue
+        available.append(device)
+
+    return available
+
+
+def get_rank_affinities(topology, cluster):
+    """
+    Returns the NUMA node and the CPUs to bind each local rank to, rank `i` using the device `cluster[i]`.
+
+    The CPUs local to a NUMA node are split in disjoint contiguous sets between the ranks whose devices are attached
+    to it. Ranks whose device has no known NUMA affinity get no binding (`numa_node` of -1 and no CPUs).
+    """
+    devices = topology["devices"]
+
+    ranks_per_node = {}
+    for rank, device in enumerate(cluster):
+        ranks_per_node.setdefault(devices[device]["numa_node"], []).append(rank)
+
+    affinities = [{"device": device, "numa_node": -1, "cpus": []} for device in cluster]
+    for numa_node, ranks in ranks_per_node.items():
+        cpus = sorted(set().union(*(devices[cluster[rank]]["cpus"] for rank in ranks)))
+        if numa_node < 0 or not cpus:
+            continue
+        for idx, rank in enumerate(ranks):
+            start, end = idx * len(cpus) // len(ranks), (idx + 1) * len(cpus) // len(ranks)
+            affinities[rank].update(numa_node=numa_node, cpus=cpus[start:end] or cpus)
+
+    return affinities
+
+
+def compute_widest_path_bandwidths(bandwidth_matrix):
+    """
+    Returns the bandwidth matrix where the missing links (`None` or 0) are filled with the bandwidth of the widest
+    path between the devices, that is the multi-hop route whose slowest link is the fastest, and the number of hops of
+    these routes. Direct links are kept as is, with one hop. Devices without any route get a bandwidth of 0 and 0 hops.
+
+    The widest paths are computed with a max-min Floyd-Warshall algorithm, preferring the routes with the fewest hops
+    on ties.
+    """
+    direct = np.array(
+        [[0 if bandwidth is None else bandwidth for bandwidth in row] for row in bandwidth_matrix], dtype=np.float64
+    )
+    np.fill_diagonal(direct, 0)
+
+    bandwidths = direct.copy()
+    hops = (direct > 0).astype(np.int64)
+    for k in range(len(bandwidths)):
+        via_bandwidths = np.minimum(bandwidths[:, k, None], bandwidths[None, k, :])
+        via_hops = hops[:, k, None] + hops[None, k, :]
+        better = (via_bandwidths > bandwidths) | (
+            (via_bandwidths == bandwidths) & (via_bandwidths > 0) & (via_hops < hops)
+        )
+        bandwidths = np.where(better, via_bandwidths, bandwidths)
+        hops = np.where(better, via_hops, hops)
+
+    bandwidths = np.where(direct > 0, direct, bandwidths)
+    hops = np.where(direct > 0, 1, hops)
+    np.fill_diagonal(bandwidths, np.inf)
+    np.fill_diagonal(hops, 0)
+
+    return bandwidths.tolist(), hops.tolist()
+
+
+def get_bandwidth_matrix(return_hops=False):
+    """
+    Returns a matrix of bandwidths between all GPU devices in the system. Devices that are not directly linked get the
+    bandwidth of the widest multi-hop route between them, see [`compute_widest_path_bandwidths`].
+
+    Args:
+        return_hops (`bool`, defaults to `False`):
+            Whether to also return the matrix of the number of hops of the route between devices.
+    """
+    import amdsmi
+
     amdsmi.amdsmi_init()
     devices = amdsmi.amdsmi_get_device_handles()
 
@@ -17,9 +329,7 @@ def get_bandwidth_matrix():
     # direct bandwidth
     for i, src_device in enumerate(devices):
         for j, dst_device in enumerate(devices):
-            if i == j:
-                bandwidth_matrix[i][j] = float("inf")
-            else:
+            if i != j:
                 try:
                     curr_bandwidth = amdsmi.amdsmi_get_minmax_bandwidth(src_device, dst_device)["max_bandwidth"]
                     if curr_bandwidth != 0:
@@ -27,31 +337,227 @@ def get_bandwidth_matrix():
                 except Exception:
                     pass
 
+    amdsmi.amdsmi_shut_down()
+
     # indirect bandwidth
-    for i in range(num_devices):
-        for j in range(num_devices):
-            if bandwidth_matrix[i][j] is None:
-                maxmin_bandwidth = 0
-                for k in range(num_devices):
-                    if k == i or k == j:
-                        continue
-                    elif bandwidth_matrix[i][k] is not None and bandwidth_matrix[k][j] is not None:
-                        min_bandwidth = min(bandwidth_matrix[i][k], bandwidth_matrix[k][j])
-                        if min_bandwidth > maxmin_bandwidth:
-                            bandwidth_matrix[i][j] = min_bandwidth
-                            maxmin_bandwidth = min_bandwidth
-
-    # fill missing values
-    for i in range(num_devices):
-        for j in range(num_devices):
-            if bandwidth_matrix[i][j] is None:
-                bandwidth_matrix[i][j] = 0
+    bandwidth_matrix, link_hops = compute_widest_path_bandwidths(bandwidth_matrix)
 
-    amdsmi.amdsmi_shut_down()
+    if return_hops:
+        return bandwidth_matrix, link_hops
 
     return bandwidth_matrix
 
 
+def get_pair_bandwidth_array(bandwidth_matrix):
+    """
+    Returns the bandwidth matrix as a symmetric array `W` where `W[i, j]` is the sum of the bandwidths from `i` to `j`
+    and from `j` to `i`, with a zero diagonal, so that the total bandwidth of a cluster is the sum of `W` over its
+    pairs of devices.
+    """
+    bandwidths = np.array(
+        [[0 if bandwidth is None else bandwidth for bandwidth in row] for row in bandwidth_matrix], dtype=np.float64
+    )
+    if bandwidths.ndim != 2 or bandwidths.shape[0] != bandwidths.shape[1]:
+        raise ValueError(f"The bandwidth matrix should be square, got a matrix of shape {bandwidths.shape}.")
+
+    np.fill_diagonal(bandwidths, 0)
+    return bandwidths + bandwidths.T
+
+
+def get_cluster_avg_bandwidth(bandwidth_matrix, cluster):
+    """
+    Returns the average bandwidth between the devices of a cluster.
+    """
+    if len(cluster) < 2:
+        return float("inf")
+
+    pair_bandwidths = get_pair_bandwidth_array(bandwidth_matrix)
+    cluster = np.asarray(cluster)
+    return float(pair_bandwidths[np.ix_(cluster, cluster)].sum() / 2 / (len(cluster) * (len(cluster) - 1)))
+
+
+def _local_search(pair_bandwidths, cluster, candidates):
+    # Swaps a device of the cluster with a candidate as long as it increases the total bandwidth of the cluster. The
+    # gain of swapping `i` for `j` is `g[j] - g[i] - W[i, j]`, `g` being the bandwidth of each device to the cluster.
+    cluster = np.array(sorted(cluster))
+    while True:
+        outside = np.setdiff1d(candidates, cluster, assume_unique=True)
+        if len(outside) == 0:
+            return cluster
+
+        gains = pair_bandwidths[:, cluster].sum(axis=1)
+        swap_gains = gains[outside][None, :] - gains[cluster][:, None] - pair_bandwidths[np.ix_(cluster, outside)]
+        i, j = np.unravel_index(np.argmax(swap_gains), swap_gains.shape)
+        if swap_gains[i, j] <= 1e-9 * max(gains.max(), 1):
+            return cluster
+
+        cluster[i] = outside[j]
+        cluster.sort()
+
+
+def _greedy_cluster(pair_bandwidths, cluster_num_devices, candidates):
+    # Grows a cluster from each candidate by adding the device with the highest bandwidth to the cluster, refines it
+    # with a local search and keeps the best one.
+    best_cluster, best_total = None, -np.inf
+    for seed in candidates:
+        cluster = [seed]
+        gains = pair_bandwidths[seed].copy()
+        available = np.zeros(len(pair_bandwidths), dtype=bool)
+        available[candidates] = True
+        available[seed] = False
+        for _ in range(cluster_num_devices - 1):
+            device = int(np.argmax(np.where(available, gains, -np.inf)))
+            cluster.append(device)
+            available[device] = False
+            gains += pair_bandwidths[device]
+
+        cluster = _local_search(pair_bandwidths, cluster, candidates)
+        total = pair_bandwidths[np.ix_(cluster, cluster)].sum() / 2
+        if total > best_total:
+            best_cluster, best_total = cluster, total
+
+    return [int(device) for device in best_cluster], best_total
+
+
+def _branch_and_bound_cluster(pair_bandwidths, cluster_num_devices, candidates, lower_bound):
+    # Enumerates the clusters in lexicographic order, pruning the branches whose upper bound does not exceed the best
+    # total found so far. Adding `r` devices from the candidates `C` to a partial cluster `S` adds at most the sum of the
+    # `r` highest `W[c, S] + 1/2 * sum(top r - 1 of W[c, C])`, each new pair being counted half from both its ends.
+    best = {"cluster": None, "total": lower_bound}
+
+    def search(cluster, total, gains, start):
+        remaining = cluster_num_devices - len(cluster)
+        if remaining == 0:
+            if total > best["total"]:
+                best["cluster"], best["total"] = list(cluster), total
+            return
+
+        next_candidates = candidates[start:]
+        if len(next_candidates) < remaining:
+            return
+
+        bounds = gains[next_candidates]
+        if remaining > 1:
+            pairs = pair_bandwidths[np.ix_(next_candidates, next_candidates)]
+            top_pairs = -np.partition(-pairs, remaining - 2, axis=1)[:, : remaining - 1]
+            bounds = bounds + top_pairs.sum(axis=1) / 2
+        upper_bound = total + -np.partition(-bounds, remaining - 1)[:remaining].sum()
+        if upper_bound <= best["total"]:
+            return
+
+        for idx in range(start, len(candidates) - remaining + 1):
+            device = candidates[idx]
+            cluster.append(int(device))
+            search(cluster, total + gains[device], gains + pair_bandwidths[device], idx + 1)
+            cluster.pop()
+
+    search([], 0.0, np.zeros(len(pair_bandwidths)), 0)
+    return best["cluster"], best["total"]
+
+
+def find_max_bandwidth_cluster(bandwidth_matrix, cluster_num_devices, devices=None, method="auto"):
+    """
+    Returns the cluster of a given number of devices that has the maximum total (equivalently average) bandwidth
+    between devices, and its total bandwidth.
+
+    Args:
+        bandwidth_matrix (`List[List[float]]`):
+            The bandwidths between devices, as returned by [`get_bandwidth_matrix`].
+        cluster_num_devices (`int`):
+            The number of devices of the cluster.
+        devices (`Optional[List[int]]`, defaults to `None`):
+            The devices to choose from, all the devices by default.
+        method (`str`, defaults to `"auto"`):
+            `"exact"` for a branch and bound search returning the optimal cluster (the first one in lexicographic
+            order on ties), `"greedy"` for a greedy construction refined by local search, that scales to large nodes
+            but may miss the optimum. `"auto"` uses the exact search for up to 16 devices.
+    """
+    if method not in ("auto", "exact", "greedy"):
+        raise ValueError(f"Unknown method {method}, expected one of 'auto', 'exact', 'greedy'.")
+
+    pair_bandwidths = get_pair_bandwidth_array(bandwidth_matrix)
+    candidates = np.arange(len(pair_bandwidths)) if devices is None else np.array(sorted(devices), dtype=np.int64)
+    if not 1 <= cluster_num_devices <= len(candidates):
+        raise ValueError(
+            f"Number of devices in the cluster should be between 1 and the number of available devices "
+            f"({len(candidates)}), got {cluster_num_devices}."
+        )
+
+    if method == "auto":
+        method = "exact" if len(candidates) <= 16 else "greedy"
+
+    cluster, total = _greedy_cluster(pair_bandwidths, cluster_num_devices, candidates)
+    if method == "exact":
+        # The greedy total, lowered by a tolerance, bounds the search from below while still letting the exact search
+        # return the first optimal cluster in lexicographic order.
+        exact_cluster, exact_total = _branch_and_bound_cluster(
+            pair_bandwidths, cluster_num_devices, candidates, total - 1e-9 * max(abs(total), 1)
+        )
+        if exact_cluster is not None:
+            cluster, total = exact_cluster, exact_total
+
+    return cluster, float(total)
+
+
+def partition_bandwidth_clusters(bandwidth_matrix, cluster_sizes, method="auto"):
+    """
+    Partitions the devices into disjoint clusters of the given sizes with a high total intra-cluster bandwidth, for
+    example to pack several jobs on a node. Returns the clusters, in the order of `cluster_sizes`.
+
+    The clusters are selected one after the other from the largest to the smallest with
+    [`find_max_bandwidth_cluster`], then refined by swapping devices between clusters (and the unused devices) as long
+    as it increases the total bandwidth within the clusters.
+
+    Args:
+        bandwidth_matrix (`List[List[float]]`):
+            The bandwidths between devices, as returned by [`get_bandwidth_matrix`].
+        cluster_sizes (`List[int]`):
+            The number of devices of each cluster.
+        method (`str`, defaults to `"auto"`):
+            The method used to select each cluster, see [`find_max_bandwidth_cluster`].
+    """
+    pair_bandwidths = get_pair_bandwidth_array(bandwidth_matrix)
+    num_devices = len(pair_bandwidths)
+    if any(size < 1 for size in cluster_sizes) or sum(cluster_sizes) > num_devices:
+        raise ValueError(
+            f"The cluster sizes should be positive and sum to at most the number of devices ({num_devices}), got "
+            f"{cluster_sizes}."
+        )
+
+    clusters = [None] * len(cluster_sizes)
+    available = list(range(num_devices))
+    for idx in sorted(range(len(cluster_sizes)), key=lambda idx: -cluster_sizes[idx]):
+        clusters[idx], _ = find_max_bandwidth_cluster(bandwidth_matrix, cluster_sizes[idx], available, method)
+        available = [device for device in available if device not in clusters[idx]]
+
+    # The unused devices form a group that does not count in the total bandwidth.
+    groups = [np.array(cluster) for cluster in clusters] + [np.array(available, dtype=np.int64)]
+    improved = True
+    while improved:
+        improved = False
+        for a in range(len(groups)):
+            for b in range(a + 1, len(groups)):
+                if len(groups[a]) == 0 or len(groups[b]) == 0:
+                    continue
+                # Gain of swapping `i` of group `a` with `j` of group `b`, ignoring the group of unused devices.
+                gains_a = pair_bandwidths[:, groups[a]].sum(axis=1)
+                gains_b = pair_bandwidths[:, groups[b]].sum(axis=1) if b < len(clusters) else np.zeros(num_devices)
+                cross = pair_bandwidths[np.ix_(groups[a], groups[b])]
+                swap_gains = (
+                    gains_a[groups[b]][None, :]
+                    - gains_a[groups[a]][:, None]
+                    + gains_b[groups[a]][:, None]
+                    - gains_b[groups[b]][None, :]
+                    - cross * (2 if b < len(clusters) else 1)
+                )
+                i, j = np.unravel_index(np.argmax(swap_gains), swap_gains.shape)
+                if swap_gains[i, j] > 1e-9 * max(pair_bandwidths.max(), 1):
+                    groups[a][i], groups[b][j] = groups[b][j], groups[a][i]
+                    improved = True
+
+    return [sorted(int(device) for device in group) for group in groups[: len(clusters)]]
+
+
 def extract_max_avg_bandwidth_cluster(bandwidth_matrix, cluster_num_devices):
     """
     Returns the cluster of a given number of devices that has the maximum average bandwidth between devices.
@@ -62,16 +568,280 @@ def extract_max_avg_bandwidth_cluster(bandwidth_matrix, cluster_num_devices):
     if cluster_num_devices == 1:
         return [0], float("inf")
 
-    num_devices = range(len(bandwidth_matrix))
+    cluster, total = find_max_bandwidth_cluster(bandwidth_matrix, cluster_num_devices)
+
+    return cluster, total / (cluster_num_devices * (cluster_num_devices - 1))
+
+
+def get_link_bandwidth_array(bandwidth_matrix):
+    """
+    Returns the bandwidth of the links between devices as a symmetric array, a link being as fast as its slowest
+    direction, with a zero diagonal.
+    """
+    bandwidths = np.array(
+        [[0 if bandwidth is None else bandwidth for bandwidth in row] for row in bandwidth_matrix], dtype=np.float64
+    )
+    bandwidths = np.minimum(bandwidths, bandwidths.T)
+    np.fill_diagonal(bandwidths, 0)
+    return bandwidths
+
+
+def get_allreduce_link_bandwidth_array(
+    bandwidth_matrix, ring_num_devices, link_hops=None, message_size=64, link_latency=1e-5
+):
+    """
+    Returns the effective bandwidth of the links during a ring all-reduce of a message of `message_size` over
+    `ring_num_devices` devices, accounting for a latency of `link_latency` seconds per hop of the links. The message
+    size is in the unit of the bandwidth times seconds, that is MB for the bandwidths reported by amdsmi in MB/s.
+
+    A ring all-reduce of `k` devices runs `2 * (k - 1)` steps in which every device sends a chunk of `message_size / k`
+    to its neighbour, each step lasting as long as the slowest transfer. A transfer on a link takes
+    `hops * link_latency + chunk / bandwidth`, hence an effective bandwidth of `chunk / (hops * link_latency + chunk /
+    bandwidth)`: the fastest ring is the one whose slowest link has the highest effective bandwidth.
+    """
+    bandwidths = get_link_bandwidth_array(bandwidth_matrix)
+    hops = np.ones_like(bandwidths) if link_hops is None else np.maximum(np.array(link_hops, dtype=np.float64), 1)
+
+    chunk = message_size / ring_num_devices
+    with np.errstate(divide="ignore"):
+        effective = np.where(bandwidths > 0, chunk / (hops * link_latency + chunk / bandwidths), 0)
+    np.fill_diagonal(effective, 0)
+    return effective
+
+
+def estimate_allreduce_time(bandwidth_matrix, ring, link_hops=None, message_size=64, link_latency=1e-5):
+    """
+    Returns the estimated time in seconds of a ring all-reduce of `message_size` over the devices of `ring`, in the
+    order of the ring. See [`get_allreduce_link_bandwidth_array`] for the units and the model.
+    """
+    if len(ring) < 2:
+        return 0.0
+
+    bandwidths = get_link_bandwidth_array(bandwidth_matrix)
+    hops = np.ones_like(bandwidths) if link_hops is None else np.maximum(np.array(link_hops, dtype=np.float64), 1)
+
+    ring = np.asarray(ring)
+    edges = (ring, np.roll(ring, -1))
+    chunk = message_size / len(ring)
+    step_time = np.max(hops[edges] * link_latency + chunk / bandwidths[edges])
+    return float(2 * (len(ring) - 1) * step_time)
+
+
+def _canonical_ring(ring):
+    # Starts the ring at its lowest device, in the direction of its lowest neighbour.
+    ring = [int(device) for device in ring]
+    start = ring.index(min(ring))
+    ring = ring[start:] + ring[:start]
+    if len(ring) > 2 and ring[-1] < ring[1]:
+        ring = ring[:1] + ring[1:][::-1]
+    return ring
+
+
+def _ring_score(link_bandwidths, ring):
+    edges = link_bandwidths[ring, np.roll(ring, -1)]
+    return edges.min(), edges.sum()
+
+
+def find_best_ring(link_bandwidths, cluster):
+    """
+    Returns the order of the devices of a cluster forming the ring whose slowest link is the fastest (then the ring with
+    the highest total bandwidth), and the bandwidth of its slowest link.
+
+    The rings are enumerated up to 9 devices. Larger clusters use a greedy construction refined by 2-opt moves.
+
+    Args:
+        link_bandwidths (`np.ndarray`):
+            A symmetric array of link bandwidths, as returned by [`get_link_bandwidth_array`].
+        cluster (`List[int]`):
+            The devices of the cluster.
+    """
+    cluster = [int(device) for device in cluster]
+    if len(cluster) < 2:
+        return cluster, float("inf")
+    if len(cluster) <= 3:
+        return _canonical_ring(cluster), float(_ring_score(link_bandwidths, np.array(cluster))[0])
+
+    cluster = np.array(sorted(cluster))
+    if len(cluster) <= 9:
+        # The rings starting with the first device, vectorized over all the orders of the other devices.
+        orders = np.array(list(permutations(range(1, len(cluster)))))
+        rings = cluster[np.concatenate([np.zeros((len(orders), 1), dtype=np.int64), orders], axis=1)]
+        edges = link_bandwidths[rings, np.roll(rings, -1, axis=1)]
+        bottlenecks, totals = edges.min(axis=1), edges.sum(axis=1)
+        best = np.lexsort((totals, bottlenecks))[-1]
+        return _canonical_ring(rings[best]), float(bottlenecks[best])
+
+    best_ring, best_score = None, None
+    for start in range(len(cluster)):
+        ring = [cluster[start]]
+        remaining = set(cluster.tolist()) - {cluster[start]}
+        while remaining:
+            device = max(sorted(remaining), key=lambda device: link_bandwidths[ring[-1], device])
+            ring.append(device)
+            remaining.remove(device)
+        ring = np.array(ring)
+
+        improved = True
+        while improved:
+            improved = False
+            score = _ring_score(link_bandwidths, ring)
+            for i in range(1, len(ring) - 1):
+                for j in range(i + 1, len(ring)):
+                    candidate = np.concatenate([ring[:i], ring[i : j + 1][::-1], ring[j + 1 :]])
+                    candidate_score = _ring_score(link_bandwidths, candidate)
+                    if candidate_score > score:
+                        ring, score, improved = candidate, candidate_score, True
+
+        if best_score is None or score > best_score:
+            best_ring, best_score = ring, score
+
+    return _canonical_ring(best_ring), float(best_score[0])
+
+
+def _find_ring(adjacency, link_bandwidths, ring_num_devices, candidates, max_expansions=100_000):
+    # Depth-first search of a simple cycle of `ring_num_devices` devices in the graph of `adjacency`, starting from its
+    # lowest device and visiting the fastest links first. Gives up after `max_expansions` expansions.
+    num_expansions = 0
+    candidates = sorted(int(device) for device in candidates)
+
+    def extend(ring, visited):
+        nonlocal num_expansions
+        num_expansions += 1
+        if num_expansions > max_expansions:
+            return None
+        if len(ring) == ring_num_devices:
+            return list(ring) if adjacency[ring[-1], ring[0]] else None
+
+        neighbours = [device for device in candidates if device > ring[0] and device not in visited]
+        neighbours = [device for device in neighbours if adjacency[ring[-1], device]]
+        for device in sorted(neighbours, key=lambda device: -link_bandwidths[ring[-1], device]):
+            ring.append(device)
+            visited.add(device)
+            found = extend(ring, visited)
+            ring.pop()
+            visited.remove(device)
+            if found is not None:
+                return found
+        return None
+
+    for start in candidates:
+        found = extend([start], {start})
+        if found is not None or num_expansions > max_expansions:
+            return found
+    return None
+
+
+def _max_threshold(thresholds, is_feasible):
+    # Binary search of the highest threshold that is feasible, the feasibility being monotonic.
+    thresholds = np.unique(thresholds)
+    low, high, best = 0, len(thresholds) - 1, None
+    while low <= high:
+        middle = (low + high) // 2
+        result = is_feasible(thresholds[middle])
+        if result is not None:
+            best, low = result, middle + 1
+        else:
+            high = middle - 1
+    return best
+
+
+def select_bandwidth_cluster(
+    bandwidth_matrix,
+    cluster_num_devices,
+    objective="avg",
+    link_hops=None,
+    message_size=64,
+    link_latency=1e-5,
+    devices=None,
+    method="auto",
+):
+    """
+    Returns the best cluster of a given number of devices for an objective, ordered as the ring of the cluster whose
+    slowest link is the fastest, and the value of the objective.
+
+    Args:
+        bandwidth_matrix (`List[List[float]]`):
+            The bandwidths between devices, as returned by [`get_bandwidth_matrix`].
+        cluster_num_devices (`int`):
+            The number of devices of the cluster.
+        objective (`str`, defaults to `"avg"`):
+            The objective to optimize, one of:
+            - `"avg"`: the maximum average bandwidth between the devices, see [`find_max_bandwidth_cluster`].
+            - `"min_link"`: the maximum bandwidth of the slowest link between any two devices (then the maximum
+              average bandwidth), for collectives where every device talks to every other device.
+            - `"ring"`: the maximum bandwidth of the slowest link of the best ring through the devices, that bounds
+              the bandwidth of ring collectives such as the all-reduce.
+            - `"allreduce"`: the minimum estimated time of a ring all-reduce, that also accounts for the latency of the
+              multi-hop routes, see [`estimate_allreduce_time`]. The returned value is the time in seconds.
+        link_hops (`Optional[List[List[int]]]`, defaults to `None`):
+            The number of hops of the route between devices, as returned by [`get_bandwidth_matrix`]. Only used by the
+            `"allreduce"` objective, all the routes being direct if `None`.
+        message_size (`float`, defaults to 64):
+            The size of the message of the `"allreduce"` objective, in MB for bandwidths in MB/s.
+        link_latency (`float`, defaults to 1e-5):
+            The latency of each hop of the `"allreduce"` objective, in seconds.
+        devices (`Optional[List[int]]`, defaults to `None`):
+            The devices to choose from, all the devices by default.
+        method (`str`, defaults to `"auto"`):
+            The search method, see [`find_max_bandwidth_cluster`]. The `"ring"` and `"allreduce"` objectives search a
+            ring with a bounded depth-first search, that may miss the optimum on large nodes.
+    """
+    if objective not in CLUSTER_OBJECTIVES:
+        raise ValueError(f"Unknown objective {objective}, expected one of {CLUSTER_OBJECTIVES}.")
+
+    num_devices = len(bandwidth_matrix)
+    candidates = np.arange(num_devices) if devices is None else np.array(sorted(devices), dtype=np.int64)
+    if not 1 <= cluster_num_devices <= len(candidates):
+        raise ValueError(
+            f"Number of devices in the cluster should be between 1 and the number of available devices "
+            f"({len(candidates)}), got {cluster_num_devices}."
+        )
+
+    if objective == "allreduce":
+        link_bandwidths = get_allreduce_link_bandwidth_array(
+            bandwidth_matrix, cluster_num_devices, link_hops, message_size, link_latency
+        )
+    else:
+        link_bandwidths = get_link_bandwidth_array(bandwidth_matrix)
+
+    if cluster_num_devices == 1:
+        cluster = [int(candidates[0])]
+    elif objective == "avg":
+        cluster, _ = find_max_bandwidth_cluster(bandwidth_matrix, cluster_num_devices, candidates, method)
+    elif objective == "min_link":
+        pair_bandwidths = get_pair_bandwidth_array(bandwidth_matrix)
+        penalty = pair_bandwidths.sum() + 1
+
+        def find_clique(threshold):
+            # The clusters with a link slower than the threshold have a negative total bandwidth.
+            penalized = np.where(link_bandwidths >= threshold, pair_bandwidths, -penalty)
+            np.fill_diagonal(penalized, 0)
+            if method == "greedy" or (method == "auto" and len(candidates) > 16):
+                cluster, total = _greedy_cluster(penalized, cluster_num_devices, candidates)
+            else:
+                cluster, total = _branch_and_bound_cluster(penalized, cluster_num_devices, candidates, -1)
+            return cluster if total >= 0 else None
+
+        cluster = _max_threshold(link_bandwidths[np.ix_(candidates, candidates)], find_clique)
+    else:
+        cluster = _max_threshold(
+            link_bandwidths[np.ix_(candidates, candidates)],
+            lambda threshold: _find_ring(
+                link_bandwidths >= threshold, link_bandwidths, cluster_num_devices, candidates
+            ),
+        )
+        if cluster is None:
+            cluster, _ = find_max_bandwidth_cluster(bandwidth_matrix, cluster_num_devices, candidates, method)
 
-    max_avg_bandwidth = 0
-    max_bandwidth_cluster = None
+    ring, ring_bandwidth = find_best_ring(link_bandwidths, cluster)
 
-    for cluster in combinations(num_devices, cluster_num_devices):
-        curr_bandwidth_matrix = [[bandwidth_matrix[i][j] for i in cluster] for j in cluster]
-        curr_avg_bandwidth = np.mean(curr_bandwidth_matrix, where=~np.eye(len(curr_bandwidth_matrix), dtype=bool))
-        if curr_avg_bandwidth > max_avg_bandwidth:
-            max_avg_bandwidth = curr_avg_bandwidth
-            max_bandwidth_cluster = list(cluster)
+    if objective == "avg":
+        value = get_cluster_avg_bandwidth(bandwidth_matrix, ring)
+    elif objective == "min_link":
+        value = float(link_bandwidths[np.ix_(ring, ring)][~np.eye(len(ring), dtype=bool)].min(initial=np.inf))
+    elif objective == "ring":
+        value = ring_bandwidth
+    else:
+        value = estimate_allreduce_time(bandwidth_matrix, ring, link_hops, message_size, link_latency)
 
-    return max_bandwidth_cluster, max_avg_bandwidth
+    return ring, value
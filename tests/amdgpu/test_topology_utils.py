@@ -0,0 +1,401 @@
+# Copyright 2024 The HuggingFace Team. All rights reserved.
+# Licensed under the MIT License.
+
+import contextlib
+import io
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import unittest
+from itertools import combinations, permutations
+
+import numpy as np
+
+from optimum.amd.cli import amdrun, get_launch_command, get_rank_command, run_with_signal_forwarding
+from optimum.amd.topology_utils import (
+    FileTopologySource,
+    compute_widest_path_bandwidths,
+    estimate_allreduce_time,
+    extract_max_avg_bandwidth_cluster,
+    find_max_bandwidth_cluster,
+    format_cpu_list,
+    get_available_devices,
+    get_cluster_avg_bandwidth,
+    get_link_bandwidth_array,
+    get_rank_affinities,
+    get_topology,
+    parse_cpu_list,
+    partition_bandwidth_clusters,
+    select_bandwidth_cluster,
+)
+
+
+SIMULATED_TOPOLOGY = {
+    "devices": [
+        {"bdf": "0000:c1:00.0", "numa_node": 0, "cpus": "0-15"},
+        {"bdf": "0000:c6:00.0", "numa_node": 0, "cpus": "0-15"},
+        {"bdf": "0000:29:00.0", "numa_node": 1, "cpus": [16, 17, 18, 19]},
+        {"bdf": "0000:2e:00.0", "numa_node": -1},
+    ],
+    "bandwidth_matrix": [
+        [None, 200, 50, 50],
+        [200, None, 50, 50],
+        [50, 50, None, 100],
+        [50, 50, 100, None],
+    ],
+}
+
+
+class CountingTopologySource(FileTopologySource):
+    def __init__(self, path):
+        super().__init__(path)
+        self.num_queries = 0
+
+    def query(self):
+        self.num_queries += 1
+        return super().query()
+
+
+class TopologyUtilsTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.topology_file = os.path.join(self.tmpdir.name, "topology.json")
+        with open(self.topology_file, "w") as topology_file:
+            json.dump(SIMULATED_TOPOLOGY, topology_file)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_cpu_list(self):
+        self.assertEqual(parse_cpu_list("0-3,8,10-11\n"), [0, 1, 2, 3, 8, 10, 11])
+        self.assertEqual(parse_cpu_list(""), [])
+        self.assertEqual(format_cpu_list([11, 0, 1, 2, 3, 8, 10]), "0-3,8,10-11")
+
+    def test_file_source(self):
+        topology = FileTopologySource(self.topology_file).query()
+
+        self.assertEqual(topology["devices"][0]["cpus"], list(range(16)))
+        self.assertEqual(topology["devices"][3]["cpus"], [])
+        cluster, _ = extract_max_avg_bandwidth_cluster(topology["bandwidth_matrix"], 2)
+        self.assertEqual(list(cluster), [0, 1])
+
+    def test_cache(self):
+        cache_dir = os.path.join(self.tmpdir.name, "cache")
+        source = CountingTopologySource(self.topology_file)
+
+        topology = get_topology(source, cache_dir=cache_dir)
+        self.assertEqual(get_topology(source, cache_dir=cache_dir), json.loads(json.dumps(topology)))
+        self.assertEqual(source.num_queries, 1)
+
+        # A change of the devices invalidates the cache.
+        SIMULATED_TOPOLOGY["devices"][2]["numa_node"] = 0
+        try:
+            with open(self.topology_file, "w") as topology_file:
+                json.dump(SIMULATED_TOPOLOGY, topology_file)
+        finally:
+            SIMULATED_TOPOLOGY["devices"][2]["numa_node"] = 1
+        self.assertEqual(get_topology(source, cache_dir=cache_dir)["devices"][2]["numa_node"], 0)
+        self.assertEqual(source.num_queries, 2)
+
+        get_topology(source, cache_dir=cache_dir, use_cache=False)
+        self.assertEqual(source.num_queries, 3)
+
+    def test_rank_affinities(self):
+        topology = FileTopologySource(self.topology_file).query()
+        affinities = get_rank_affinities(topology, [1, 2, 0, 3])
+
+        # Ranks 0 and 2 share the NUMA node 0 and split its CPUs.
+        self.assertEqual(affinities[0], {"device": 1, "numa_node": 0, "cpus": list(range(8))})
+        self.assertEqual(affinities[2], {"device": 0, "numa_node": 0, "cpus": list(range(8, 16))})
+        self.assertEqual(affinities[1]["cpus"], [16, 17, 18, 19])
+        self.assertEqual(affinities[3], {"device": 3, "numa_node": -1, "cpus": []})
+
+    def test_commands(self):
+        affinity = {"device": 2, "numa_node": 1, "cpus": [16, 17, 18, 19]}
+
+        command, cpus = get_rank_command("train.py", ["--lr", "1"], affinity, "bind", numactl="numactl")
+        self.assertEqual(command[:3], ["numactl", "--physcpubind=16-19", "--membind=1"])
+        self.assertEqual(command[-3:], ["train.py", "--lr", "1"])
+        self.assertIsNone(cpus)
+
+        command, cpus = get_rank_command("train.py", [], affinity, "preferred", numactl=None)
+        self.assertEqual(command[-1], "train.py")
+        self.assertEqual(cpus, [16, 17, 18, 19])
+
+        self.assertEqual(get_rank_command("train.py", [], affinity, "none", numactl="numactl")[1], None)
+
+        command, env = get_launch_command("train.py", ["--lr", "1"], 2, [2, 3], [affinity, None])
+        self.assertEqual(command[-5:], ["-m", "optimum.amd.cli", "train.py", "--lr", "1"])
+        self.assertEqual(env["CUDA_VISIBLE_DEVICES"], "2,3")
+        self.assertEqual(json.loads(env["AMDRUN_RANK_AFFINITY"])[0], affinity)
+
+
+def _make_hierarchical_bandwidth_matrix(num_devices, seed=0):
+    # Devices paired on packages, packages grouped by four, with shuffled device indices.
+    rng = np.random.default_rng(seed)
+    devices = rng.permutation(num_devices)
+    bandwidths = np.where(
+        devices[:, None] // 2 == devices[None, :] // 2,
+        200.0,
+        np.where(devices[:, None] // 8 == devices[None, :] // 8, 100.0, 50.0),
+    )
+    np.fill_diagonal(bandwidths, np.inf)
+    return bandwidths.tolist(), devices
+
+
+class ClusterSelectionTest(unittest.TestCase):
+    def test_exact_matches_enumeration(self):
+        rng = np.random.default_rng(0)
+        for _ in range(20):
+            num_devices = int(rng.integers(2, 9))
+            cluster_num_devices = int(rng.integers(2, num_devices + 1))
+            bandwidth_matrix = rng.integers(1, 4, (num_devices, num_devices)) * 50.0
+            bandwidth_matrix = (bandwidth_matrix + bandwidth_matrix.T).tolist()
+
+            expected = max(
+                combinations(range(num_devices), cluster_num_devices),
+                key=lambda cluster: get_cluster_avg_bandwidth(bandwidth_matrix, cluster),
+            )
+            cluster, avg_bandwidth = extract_max_avg_bandwidth_cluster(bandwidth_matrix, cluster_num_devices)
+
+            # Ties are broken by the lexicographic order, as with the enumeration of the combinations.
+            self.assertEqual(cluster, list(expected))
+            self.assertAlmostEqual(avg_bandwidth, get_cluster_avg_bandwidth(bandwidth_matrix, expected))
+
+    def test_large_node(self):
+        bandwidth_matrix, devices = _make_hierarchical_bandwidth_matrix(64)
+
+        for method in ["greedy", "exact"]:
+            cluster, total = find_max_bandwidth_cluster(bandwidth_matrix, 8, method=method)
+            self.assertEqual(len(set(devices[cluster] // 8)), 1)
+            self.assertEqual(total, 4 * 2 * 200 + 24 * 2 * 100)
+
+        cluster, _ = find_max_bandwidth_cluster(bandwidth_matrix, 2, devices=np.flatnonzero(devices >= 62))
+        self.assertEqual(sorted(devices[cluster]), [62, 63])
+
+    def test_partition(self):
+        bandwidth_matrix, devices = _make_hierarchical_bandwidth_matrix(32, seed=1)
+
+        clusters = partition_bandwidth_clusters(bandwidth_matrix, [2, 8, 8, 4])
+
+        self.assertEqual([len(cluster) for cluster in clusters], [2, 8, 8, 4])
+        self.assertEqual(len(set().union(*clusters)), 22)
+        for cluster in clusters:
+            # Each cluster is made of full packages of a single group.
+            self.assertEqual(len(set(devices[cluster] // 8)), 1)
+            self.assertEqual(len(set(devices[cluster] // 2)), len(cluster) // 2)
+
+        with self.assertRaises(ValueError):
+            partition_bandwidth_clusters(bandwidth_matrix, [16, 16, 2])
+
+
+class ClusterObjectivesTest(unittest.TestCase):
+    def test_widest_path(self):
+        # 0 - 1 - 2 - 3 chain, with a slow direct link between 0 and 3.
+        bandwidth_matrix = [
+            [None, 100, None, 10],
+            [100, None, 50, None],
+            [None, 50, None, 200],
+            [10, None, 200, None],
+        ]
+
+        bandwidths, hops = compute_widest_path_bandwidths(bandwidth_matrix)
+
+        self.assertEqual(bandwidths[0], [float("inf"), 100, 50, 10])
+        self.assertEqual(hops[0], [0, 1, 2, 1])
+        # 1 -> 3 goes through 2 rather than through the slow direct link of 0.
+        self.assertEqual((bandwidths[1][3], hops[1][3]), (50, 2))
+
+    def test_objectives_match_enumeration(self):
+        rng = np.random.default_rng(0)
+        for _ in range(10):
+            num_devices = int(rng.integers(3, 8))
+            cluster_num_devices = int(rng.integers(2, num_devices + 1))
+            bandwidth_matrix = rng.integers(1, 6, (num_devices, num_devices)) * 25.0
+            bandwidth_matrix = (bandwidth_matrix + bandwidth_matrix.T).tolist()
+            links = get_link_bandwidth_array(bandwidth_matrix)
+
+            def rings(cluster):
+                return [[cluster[0], *order] for order in permutations(cluster[1:])]
+
+            clusters = list(combinations(range(num_devices), cluster_num_devices))
+            expected = {
+                "min_link": max(min(links[i, j] for i, j in combinations(cluster, 2)) for cluster in clusters),
+                "ring": max(
+                    min(links[ring[i - 1], ring[i]] for i in range(len(ring)))
+                    for cluster in clusters
+                    for ring in rings(cluster)
+                ),
+                "allreduce": min(
+                    estimate_allreduce_time(bandwidth_matrix, ring, message_size=1, link_latency=1e-3)
+                    for cluster in clusters
+                    for ring in rings(cluster)
+                ),
+            }
+            for objective, value in expected.items():
+                ring, selected_value = select_bandwidth_cluster(
+                    bandwidth_matrix, cluster_num_devices, objective, message_size=1, link_latency=1e-3
+                )
+                self.assertEqual(len(set(ring)), cluster_num_devices)
+                self.assertAlmostEqual(selected_value, value, msg=objective)
+
+    def test_ring_order(self):
+        # Packages of two devices linked in a ring 0-1 = 2-3 = 4-5 = 6-7 = 0.
+        bandwidth_matrix = np.zeros((8, 8))
+        for device in range(0, 8, 2):
+            bandwidth_matrix[device, device + 1] = bandwidth_matrix[device + 1, device] = 200
+            bandwidth_matrix[device + 1, (device + 2) % 8] = bandwidth_matrix[(device + 2) % 8, device + 1] = 100
+        bandwidths, hops = compute_widest_path_bandwidths(bandwidth_matrix.tolist())
+
+        ring, bandwidth = select_bandwidth_cluster(bandwidths, 8, "ring")
+        self.assertEqual((ring, bandwidth), ([0, 1, 2, 3, 4, 5, 6, 7], 100))
+
+        # Small messages are bound by the latency and avoid the multi-hop routes.
+        ring, _ = select_bandwidth_cluster(bandwidths, 4, "allreduce", link_hops=hops, message_size=1e-3)
+        self.assertEqual(ring, [0, 1, 3, 2])
+        self.assertLess(
+            estimate_allreduce_time(bandwidths, ring, hops, message_size=1e-3),
+            estimate_allreduce_time(bandwidths, [0, 1, 2, 3], hops, message_size=1e-3),
+        )
+
+
+WORKER_SCRIPT = """
+import json
+import os
+import sys
+
+import torch
+import torch.distributed as dist
+
+dist.init_process_group("gloo")
+tensor = torch.ones(1)
+dist.all_reduce(tensor)
+with open(os.path.join(sys.argv[1], f"rank_{dist.get_rank()}.json"), "w") as output_file:
+    json.dump(
+        {
+            "world_size": int(tensor.item()),
+            "node_rank": int(os.environ["GROUP_RANK"]),
+            "devices": os.environ["CUDA_VISIBLE_DEVICES"],
+        },
+        output_file,
+    )
+dist.destroy_process_group()
+sys.exit(int(sys.argv[2]) if len(sys.argv) > 2 else 0)
+"""
+
+
+def _get_free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class AmdrunLaunchTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.script = os.path.join(self.tmpdir.name, "worker.py")
+        with open(self.script, "w") as script_file:
+            script_file.write(WORKER_SCRIPT)
+
+        # Two simulated nodes whose fastest pairs of devices differ, the device 1 of the second one being busy.
+        self.topology_files = []
+        for node_rank, (fast_pairs, busy_device) in enumerate([([(0, 1)], None), ([(1, 3), (0, 3)], 1)]):
+            bandwidth_matrix = np.full((4, 4), 50.0)
+            for bandwidth, pair in zip([200, 100], fast_pairs):
+                bandwidth_matrix[pair, pair[::-1]] = bandwidth
+            devices = [{"free_memory": 1000, "utilization": 0} for _ in range(4)]
+            if busy_device is not None:
+                devices[busy_device]["utilization"] = 100
+            topology_file = os.path.join(self.tmpdir.name, f"node_{node_rank}.json")
+            with open(topology_file, "w") as output_file:
+                json.dump({"devices": devices, "bandwidth_matrix": bandwidth_matrix.tolist()}, output_file)
+            self.topology_files.append(topology_file)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def amdrun_command(self, node_rank, *args):
+        return [
+            sys.executable,
+            "-c",
+            "import sys; from optimum.amd.cli import amdrun; sys.exit(amdrun())",
+            "--ngpus=2",
+            f"--topology-file={self.topology_files[node_rank]}",
+            "--no-topology-cache",
+            "--max-utilization=50",
+            "--monitor_interval=0.1",
+            *args,
+        ]
+
+    def test_torchrun_args(self):
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            amdrun(
+                self.amdrun_command(0, "--nnodes=1:4", "--rdzv-backend=c10d", "--max_restarts=3", "--dry-run")[3:]
+                + [self.script, "--nnodes=2"]
+            )
+
+        command = output.getvalue().strip().splitlines()[-1]
+        self.assertIn("--nnodes=1:4 --rdzv_backend=c10d --max_restarts=3 --monitor_interval=0.1 -m", command)
+        self.assertTrue(command.endswith(f"{self.script} --nnodes=2"))
+
+    def test_multi_node_gloo(self):
+        port = _get_free_port()
+        processes = [
+            subprocess.Popen(
+                self.amdrun_command(
+                    node_rank,
+                    "--nnodes=2",
+                    f"--node_rank={node_rank}",
+                    "--master_addr=127.0.0.1",
+                    f"--master_port={port}",
+                    self.script,
+                    self.tmpdir.name,
+                ),
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+            for node_rank in range(2)
+        ]
+        self.assertEqual([process.wait(timeout=120) for process in processes], [0, 0])
+
+        results = []
+        for rank in range(4):
+            with open(os.path.join(self.tmpdir.name, f"rank_{rank}.json")) as result_file:
+                results.append(json.load(result_file))
+        self.assertEqual({result["world_size"] for result in results}, {4})
+        # Each node selects its own devices from its topology and usage: the device 1 of the node 1 is busy.
+        self.assertEqual({result["node_rank"]: result["devices"] for result in results}, {0: "0,1", 1: "0,3"})
+
+    def test_exit_code(self):
+        command = self.amdrun_command(0, "--standalone", "--max-utilization=100", self.script, self.tmpdir.name, "3")
+        self.assertNotEqual(subprocess.call(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL), 0)
+
+    @unittest.skipIf(not hasattr(signal, "SIGUSR1"), "Requires POSIX signals.")
+    def test_signal_forwarding(self):
+        handler = "import signal, sys, time; signal.signal(signal.SIGUSR1, lambda *args: sys.exit(7)); time.sleep(30)"
+        timer = threading.Timer(1, os.kill, (os.getpid(), signal.SIGUSR1))
+        timer.start()
+        try:
+            returncode = run_with_signal_forwarding([sys.executable, "-c", handler], signals=[signal.SIGUSR1])
+        finally:
+            timer.cancel()
+        self.assertEqual(returncode, 7)
+
+        self.assertEqual(
+            run_with_signal_forwarding([sys.executable, "-c", "import os, signal; os.kill(os.getpid(), 9)"]), 128 + 9
+        )
+
+    def test_available_devices(self):
+        usage = [
+            {"free_memory": 100, "utilization": 0},
+            {"free_memory": 1000, "utilization": 90},
+            {"free_memory": None, "utilization": None},
+        ]
+        self.assertEqual(get_available_devices(usage, min_free_memory=500), [1, 2])
+        self.assertEqual(get_available_devices(usage, min_free_memory=500, max_utilization=50), [2])
@@ -0,0 +1,190 @@
+# Copyright 2024 The HuggingFace Team. All rights reserved.
+# Licensed under the MIT License.
+
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import torch
+from testing_utils import SUPPORTED_MODELS_TINY
+
+from optimum.amd.brevitas import (
+    BrevitasQuantizationCallback,
+    BrevitasQuantizationCheckpoint,
+    BrevitasQuantizationConfig,
+    BrevitasQuantizer,
+)
+from optimum.amd.brevitas.data_utils import get_dataset_for_model
+from transformers import AutoConfig, AutoTokenizer
+
+
+class Preemption(Exception):
+    pass
+
+
+class PreemptAtStage(BrevitasQuantizationCallback):
+    def __init__(self, name=None):
+        self.name = name
+        self.stages = []
+
+    def on_stage_begin(self, name):
+        if name == self.name:
+            raise Preemption()
+        self.stages.append(name)
+
+
+def get_model():
+    torch.manual_seed(0)
+    return torch.nn.Sequential(torch.nn.Linear(8, 8, bias=False), torch.nn.Linear(8, 8))
+
+
+class TestQuantizationCheckpoint(unittest.TestCase):
+    def test_resume(self):
+        qconfig = BrevitasQuantizationConfig(apply_gptq=True)
+        dataset = [{"input_ids": torch.tensor([[1, 2, 3]])}]
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            model = get_model()
+            checkpoint = BrevitasQuantizationCheckpoint(tmpdir, qconfig, dataset, "model")
+            self.assertTrue(checkpoint.should_run("quantize_model", structural=True))
+            checkpoint.complete("quantize_model", model, structural=True)
+            self.assertTrue(checkpoint.should_run("bias_correction"))
+            with torch.no_grad():
+                model[0].weight.mul_(2)
+                model[0].bias = torch.nn.Parameter(torch.ones(8))
+            checkpoint.complete("bias_correction", model)
+            self.assertTrue(checkpoint.should_run("gptq"))
+            with torch.no_grad():
+                model[1].weight.add_(1)
+            checkpoint.save_gptq_step(model, ["1"])
+            expected_state = model.state_dict()
+
+            resumed_model = get_model()
+            checkpoint = BrevitasQuantizationCheckpoint(tmpdir, qconfig, dataset, "model")
+            self.assertEqual(checkpoint.completed_stages, ["quantize_model", "bias_correction"])
+            # Structural stages always run, the completed stages updating values are skipped.
+            self.assertTrue(checkpoint.should_run("quantize_model", structural=True))
+            checkpoint.complete("quantize_model", resumed_model, structural=True)
+            self.assertFalse(checkpoint.should_run("bias_correction"))
+            checkpoint.complete("bias_correction", resumed_model)
+            self.assertTrue(torch.equal(resumed_model[0].bias, expected_state["0.bias"]))
+
+            self.assertTrue(checkpoint.should_run("gptq"))
+            self.assertEqual(checkpoint.get_gptq_completed_layers(), [["1"]])
+            checkpoint.restore_gptq_steps(resumed_model)
+            for name, tensor in resumed_model.state_dict().items():
+                self.assertTrue(torch.equal(tensor, expected_state[name]), name)
+
+            checkpoint.complete("gptq", resumed_model)
+            self.assertEqual(sorted(os.listdir(tmpdir)), ["model.safetensors", "quantization_checkpoint.json"])
+
+    def test_mismatch(self):
+        qconfig = BrevitasQuantizationConfig(apply_gptq=True)
+        dataset = [{"input_ids": torch.tensor([[1, 2, 3]])}]
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            BrevitasQuantizationCheckpoint(tmpdir, qconfig, dataset, "model")
+
+            with self.assertRaisesRegex(ValueError, "calibration dataset"):
+                BrevitasQuantizationCheckpoint(tmpdir, qconfig, [{"input_ids": torch.tensor([[1, 2, 4]])}], "model")
+            with self.assertRaisesRegex(ValueError, "quantization configuration"):
+                BrevitasQuantizationCheckpoint(tmpdir, BrevitasQuantizationConfig(apply_gptq=False), dataset, "model")
+            with self.assertRaisesRegex(ValueError, "model"):
+                BrevitasQuantizationCheckpoint(tmpdir, qconfig, dataset, "other_model")
+
+    def test_quantize_resume(self):
+        model_id = next(iter(SUPPORTED_MODELS_TINY["opt"]))
+        qconfig = BrevitasQuantizationConfig(is_static=True, apply_gptq=True, apply_weight_equalization=True)
+        calibration_dataset = get_dataset_for_model(
+            model_id,
+            qconfig=qconfig,
+            dataset_name="wikitext2",
+            tokenizer=AutoTokenizer.from_pretrained(model_id),
+            nsamples=4,
+            seqlen=32,
+            split="train",
+        )
+        inputs = calibration_dataset[0]
+
+        with torch.no_grad():
+            expected_logits = BrevitasQuantizer.from_pretrained(model_id).quantize(qconfig, calibration_dataset)(
+                **inputs
+            )["logits"]
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with self.assertRaises(Preemption):
+                BrevitasQuantizer.from_pretrained(model_id).quantize(
+                    qconfig, calibration_dataset, callbacks=[PreemptAtStage("calibration")], checkpoint_dir=tmpdir
+                )
+
+            callback = PreemptAtStage()
+            model = BrevitasQuantizer.from_pretrained(model_id).quantize(
+                qconfig, calibration_dataset, callbacks=[callback], checkpoint_dir=tmpdir
+            )
+            self.assertEqual(callback.stages, ["tracing", "quantize_model", "calibration"])
+
+        with torch.no_grad():
+            logits = model(**inputs)["logits"]
+        self.assertTrue(torch.allclose(logits, expected_logits, atol=1e-5))
+
+    def test_gptq_resume(self):
+        self._check_gptq_resume()
+
+    def test_gptq_resume_parallel_layers(self):
+        model_id = next(iter(SUPPORTED_MODELS_TINY["opt"]))
+        num_hidden_layers = AutoConfig.from_pretrained(model_id).num_hidden_layers
+        # Each group of parallel layers is updated, and checkpointed, in a single GPTQ step.
+        group_of_parallel_layers = [
+            [f"model.decoder.layers.{i}.self_attn.{name}_proj" for name in ("q", "k", "v")]
+            for i in range(num_hidden_layers)
+        ]
+        self._check_gptq_resume(group_of_parallel_layers)
+
+    def _check_gptq_resume(self, group_of_parallel_layers=None):
+        model_id = next(iter(SUPPORTED_MODELS_TINY["opt"]))
+
+        def get_quantizer():
+            quantizer = BrevitasQuantizer.from_pretrained(model_id)
+            quantizer.group_of_parallel_layers = group_of_parallel_layers
+            return quantizer
+
+        qconfig = BrevitasQuantizationConfig(apply_gptq=True)
+        calibration_dataset = get_dataset_for_model(
+            model_id,
+            qconfig=qconfig,
+            dataset_name="wikitext2",
+            tokenizer=AutoTokenizer.from_pretrained(model_id),
+            nsamples=4,
+            seqlen=32,
+            split="train",
+        )
+        expected_state = get_quantizer().quantize(qconfig, calibration_dataset).state_dict()
+
+        save_gptq_step = BrevitasQuantizationCheckpoint.save_gptq_step
+        saved_steps = []
+        preempt = True
+
+        def preempted_save_gptq_step(checkpoint, model, layer_names):
+            save_gptq_step(checkpoint, model, layer_names)
+            saved_steps.append(layer_names)
+            if preempt and len(saved_steps) == 2:
+                raise Preemption()
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with patch.object(BrevitasQuantizationCheckpoint, "save_gptq_step", preempted_save_gptq_step):
+                with self.assertRaises(Preemption):
+                    get_quantizer().quantize(qconfig, calibration_dataset, checkpoint_dir=tmpdir)
+
+                # GPTQ resumes after the two saved steps, and only updates the remaining layers.
+                completed_layers = {name for layer_names in saved_steps for name in layer_names}
+                saved_steps.clear()
+                preempt = False
+                model = get_quantizer().quantize(qconfig, calibration_dataset, checkpoint_dir=tmpdir)
+
+        self.assertGreater(len(saved_steps), 0)
+        self.assertFalse(completed_layers & {name for layer_names in saved_steps for name in layer_names})
+        state = model.state_dict()
+        self.assertEqual(state.keys(), expected_state.keys())
+        for name, tensor in state.items():
+            self.assertTrue(torch.allclose(tensor, expected_state[name], atol=1e-6), name)
@@ -5,15 +5,25 @@ import os
 import tempfile
 import unittest
 from pathlib import Path
-from typing import Dict
+from typing import Dict, Optional
+from unittest.mock import patch
 
+import numpy as np
 import onnx
+import onnxruntime
 import torch
 from brevitas.export.onnx.standard.qcdq.manager import StdQCDQONNXManager
 from brevitas_examples.llm.llm_quant.export import brevitas_proxy_export_mode
+from onnx import helper, numpy_helper
 from parameterized import parameterized
 from testing_utils import SUPPORTED_MODELS_TINY, VALIDATE_EXPORT_ON_SHAPES, get_quantized_model
 
+from optimum.amd.brevitas.export import (
+    onnx_export_from_quantized_model,
+    pack_int4_matmul_weights,
+    pack_onnx_int4_weights,
+    save_onnx_external_data,
+)
 from optimum.exporters import TasksManager
 from optimum.exporters.onnx import (
     export_models,
@@ -54,7 +64,12 @@ def _get_models_to_test(export_models_dict: Dict, library_name: str = "transform
 
 
 def export_and_validate(
-    model: torch.nn.Module, task: str, export_output_dir: str, onnx_config_class_constructor, shapes_to_validate: Dict
+    model: torch.nn.Module,
+    task: str,
+    export_output_dir: str,
+    onnx_config_class_constructor,
+    shapes_to_validate: Dict,
+    pack_int4_weights: bool = False,
 ):
     with torch.no_grad(), brevitas_proxy_export_mode(model, export_manager=StdQCDQONNXManager):
         library_name = TasksManager._infer_library_from_model(model)
@@ -103,6 +118,10 @@ def export_and_validate(
             do_constant_folding=False,
         )
 
+    if pack_int4_weights:
+        for onnx_file_subpath in onnx_files_subpaths:
+            pack_onnx_int4_weights(output / onnx_file_subpath)
+
     onnx_config = onnx_config_class_constructor(model.config)
 
     input_shapes_iterator = grid_parameters(shapes_to_validate, yield_dict=True, add_test_name=False)
@@ -151,3 +170,215 @@ class TestOnnxExport(unittest.TestCase):
             for node in onnx_model.graph.node:
                 # Check that we have MatmulInteger, etc.
                 pass
+
+    @parameterized.expand(_get_models_to_test(SUPPORTED_MODELS_TINY))
+    def test_int4_weights(
+        self,
+        test_name,
+        model_type,
+        model_name,
+        task,
+        onnx_config_class_constructor,
+    ):
+        model = get_quantized_model(
+            model_name,
+            weights_bitwidth=4,
+            weights_quant_granularity="per_channel",
+            is_static=False,
+            apply_gptq=False,
+            apply_weight_equalization=False,
+            activations_equalization=None,
+        )
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            # Check that PyTorch and ORT outputs match with the packed weights.
+            export_and_validate(
+                model=model,
+                task=task,
+                export_output_dir=tmpdir,
+                onnx_config_class_constructor=onnx_config_class_constructor,
+                shapes_to_validate=VALIDATE_EXPORT_ON_SHAPES,
+                pack_int4_weights=True,
+            )
+
+            onnx_model = onnx.load(os.path.join(tmpdir, "model.onnx"))
+
+        self.assertTrue(any(node.op_type == "MatMulNBits" for node in onnx_model.graph.node))
+
+    def test_sharded_export(self):
+        model_name = next(iter(SUPPORTED_MODELS_TINY["opt"]))
+        model = get_quantized_model(
+            model_name,
+            is_static=False,
+            apply_gptq=False,
+            apply_weight_equalization=False,
+            activations_equalization=None,
+        )
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            onnx_export_from_quantized_model(model, tmpdir, task="text-generation", max_shard_size=4096)
+
+            data_files = [name for name in os.listdir(tmpdir) if name.startswith("model.onnx_data")]
+            self.assertGreater(len(data_files), 1)
+            onnxruntime.InferenceSession(os.path.join(tmpdir, "model.onnx"), providers=["CPUExecutionProvider"])
+
+
+def get_qcdq_linear_model(weight_format: str, signed: bool, group_size: Optional[int] = None):
+    out_features, in_features = 32, 64
+    num_groups = in_features // group_size if group_size is not None else 1
+    low, high = (-8, 7) if signed else (0, 15)
+    dtype = np.int8 if signed else np.uint8
+
+    rng = np.random.default_rng(0)
+    int_weight = rng.integers(low, high + 1, (out_features * num_groups, in_features // num_groups)).astype(dtype)
+    scale = (rng.random(out_features * num_groups) * 0.1 + 0.01).astype(np.float32)
+    zero_point = (
+        np.zeros(out_features * num_groups, dtype) if signed else rng.integers(4, 12, scale.shape).astype(dtype)
+    )
+    initializers = [numpy_helper.from_array(scale, "scale"), numpy_helper.from_array(zero_point, "zero_point")]
+
+    nodes = []
+    if weight_format == "float":
+        # The weights are quantized by QuantizeLinear and Clip, as with `export_weight_q_node=True`.
+        weight = (int_weight.astype(np.float32) - zero_point[:, None]) * scale[:, None]
+        initializers += [
+            numpy_helper.from_array(weight, "weight"),
+            numpy_helper.from_array(np.array(low, dtype), "low"),
+            numpy_helper.from_array(np.array(high, dtype), "high"),
+        ]
+        nodes += [
+            helper.make_node("QuantizeLinear", ["weight", "scale", "zero_point"], ["weight_q"], axis=0),
+            helper.make_node("Clip", ["weight_q", "low", "high"], ["weight_int"]),
+        ]
+    else:
+        initializers.append(numpy_helper.from_array(int_weight, "weight_int"))
+    nodes.append(helper.make_node("DequantizeLinear", ["weight_int", "scale", "zero_point"], ["weight_dq"], axis=0))
+    if group_size is not None:
+        initializers.append(numpy_helper.from_array(np.array([out_features, in_features]), "shape"))
+        nodes.append(helper.make_node("Reshape", ["weight_dq", "shape"], ["weight_dq_reshaped"]))
+    nodes += [
+        helper.make_node("Transpose", [nodes[-1].output[0]], ["weight_t"], perm=[1, 0]),
+        helper.make_node("MatMul", ["x", "weight_t"], ["y"], name="/linear/MatMul"),
+    ]
+
+    graph = helper.make_graph(
+        nodes,
+        "linear",
+        [helper.make_tensor_value_info("x", onnx.TensorProto.FLOAT, ["batch_size", "sequence_length", in_features])],
+        [helper.make_tensor_value_info("y", onnx.TensorProto.FLOAT, None)],
+        initializers,
+    )
+    return helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)], ir_version=8)
+
+
+class TestPackInt4Weights(unittest.TestCase):
+    @parameterized.expand([("int", True, None), ("float", True, None), ("int", False, 16), ("float", False, 32)])
+    def test_pack(self, weight_format, signed, group_size):
+        onnx_model = get_qcdq_linear_model(weight_format, signed, group_size)
+        inputs = {"x": np.random.default_rng(1).standard_normal((2, 3, 64)).astype(np.float32)}
+
+        # Disable the optimizations of ONNX Runtime, that may fuse the QDQ nodes of the reference.
+        session_options = onnxruntime.SessionOptions()
+        session_options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_DISABLE_ALL
+        expected_output = onnxruntime.InferenceSession(
+            onnx_model.SerializeToString(), session_options, providers=["CPUExecutionProvider"]
+        ).run(None, inputs)[0]
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            onnx_path = os.path.join(tmpdir, "model.onnx")
+            packed_path = os.path.join(tmpdir, "model_int4.onnx")
+            onnx.save(onnx_model, onnx_path)
+            self.assertEqual(pack_onnx_int4_weights(onnx_path, packed_path), 1)
+            self.assertLess(os.path.getsize(packed_path), os.path.getsize(onnx_path))
+
+            packed_model = onnx.load(packed_path)
+            self.assertEqual([node.op_type for node in packed_model.graph.node], ["MatMulNBits"])
+            output = onnxruntime.InferenceSession(packed_path, providers=["CPUExecutionProvider"]).run(None, inputs)[0]
+
+        self.assertTrue(np.allclose(output, expected_output, atol=1e-5))
+
+    def test_pack_external_data(self):
+        onnx_model = get_qcdq_linear_model("float", signed=True)
+        inputs = {"x": np.random.default_rng(1).standard_normal((2, 3, 64)).astype(np.float32)}
+        session_options = onnxruntime.SessionOptions()
+        session_options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_DISABLE_ALL
+        expected_output = onnxruntime.InferenceSession(
+            onnx_model.SerializeToString(), session_options, providers=["CPUExecutionProvider"]
+        ).run(None, inputs)[0]
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            onnx_path = os.path.join(tmpdir, "model.onnx")
+            onnx.save(onnx_model, onnx_path, save_as_external_data=True, location="weights", size_threshold=0)
+
+            # The weights are read from the external data files without loading all of them.
+            load = onnx.load
+
+            def load_without_external_data(*args, **kwargs):
+                self.assertFalse(kwargs.get("load_external_data", True))
+                return load(*args, **kwargs)
+
+            with patch("onnx.load", side_effect=load_without_external_data):
+                self.assertEqual(pack_onnx_int4_weights(onnx_path), 1)
+
+            self.assertFalse(os.path.exists(os.path.join(tmpdir, "weights")))
+            output = onnxruntime.InferenceSession(onnx_path, providers=["CPUExecutionProvider"]).run(None, inputs)[0]
+
+        self.assertTrue(np.allclose(output, expected_output, atol=1e-5))
+
+    def test_not_4_bits(self):
+        onnx_model = get_qcdq_linear_model("int", signed=True)
+        onnx_model.graph.initializer[-1].CopyFrom(
+            numpy_helper.from_array(np.full((32, 64), 100, dtype=np.int8), "weight_int")
+        )
+        self.assertEqual(pack_int4_matmul_weights(onnx_model), 0)
+
+        with self.assertRaises(ValueError):
+            pack_int4_matmul_weights(onnx_model, block_size=48)
+
+
+class TestSaveExternalData(unittest.TestCase):
+    def test_shard_deduplicate(self):
+        rng = np.random.default_rng(0)
+        weight = rng.standard_normal((32, 32)).astype(np.float32)
+        initializers = [
+            numpy_helper.from_array(weight, "weight"),
+            numpy_helper.from_array(weight.copy(), "tied_weight"),
+            numpy_helper.from_array(rng.standard_normal((32, 32)).astype(np.float32), "other_weight"),
+            numpy_helper.from_array(np.array(0.5, np.float32), "scale"),
+            numpy_helper.from_array(np.array(0.5, np.float32), "repeated_scale"),
+        ]
+        nodes = [
+            helper.make_node("MatMul", ["x", "weight"], ["x1"]),
+            helper.make_node("MatMul", ["x1", "tied_weight"], ["x2"]),
+            helper.make_node("MatMul", ["x2", "other_weight"], ["x3"]),
+            helper.make_node("Mul", ["x3", "scale"], ["x4"]),
+            helper.make_node("Mul", ["x4", "repeated_scale"], ["y"]),
+        ]
+        graph = helper.make_graph(
+            nodes,
+            "mlp",
+            [helper.make_tensor_value_info("x", onnx.TensorProto.FLOAT, ["batch_size", 32])],
+            [helper.make_tensor_value_info("y", onnx.TensorProto.FLOAT, None)],
+            initializers,
+        )
+        onnx_model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)], ir_version=8)
+        inputs = {"x": rng.standard_normal((2, 32)).astype(np.float32)}
+        expected_output = onnxruntime.InferenceSession(
+            onnx_model.SerializeToString(), providers=["CPUExecutionProvider"]
+        ).run(None, inputs)[0]
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            # One file per initializer, as exported by PyTorch for models larger than 2GB.
+            onnx_path = os.path.join(tmpdir, "model.onnx")
+            onnx.save_model(onnx_model, onnx_path, save_as_external_data=True, all_tensors_to_one_file=False)
+
+            self.assertEqual(save_onnx_external_data(onnx_path, max_shard_size=4096), 2)
+            self.assertEqual(sorted(os.listdir(tmpdir)), ["model.onnx", "model.onnx_data", "model.onnx_data_1"])
+
+            saved_model = onnx.load(onnx_path, load_external_data=False)
+            self.assertEqual(
+                [tensor.name for tensor in saved_model.graph.initializer], ["weight", "other_weight", "scale"]
+            )
+            output = onnxruntime.InferenceSession(onnx_path, providers=["CPUExecutionProvider"]).run(None, inputs)[0]
+
+        self.assertTrue(np.array_equal(output, expected_output))
@@ -0,0 +1,83 @@
+# Copyright 2024 The HuggingFace Team. All rights reserved.
+# Licensed under the MIT License.
+
+import unittest
+
+import torch
+from parameterized import parameterized
+from testing_utils import SUPPORTED_MODELS_TINY
+
+from optimum.amd.brevitas import (
+    BrevitasQuantizationConfig,
+    BrevitasQuantizer,
+    PackedQuantLinear,
+    pack_quantized_linears,
+)
+
+
+def get_quantized_weight(out_features, in_features, num_groups, bit_width, signed, asymmetric):
+    low, high = (-(2 ** (bit_width - 1)), 2 ** (bit_width - 1)) if signed else (0, 2**bit_width)
+    int_weight = torch.randint(low, high, (out_features, in_features))
+    scale = torch.rand(out_features, num_groups) * 0.1 + 0.01
+    zero_point = torch.randint(-2, 3, (out_features, num_groups)).float() if asymmetric else torch.zeros_like(scale)
+
+    weight = (int_weight.reshape(out_features, num_groups, -1) - zero_point[..., None]) * scale[..., None]
+    return int_weight, scale, zero_point, weight.reshape(out_features, in_features)
+
+
+class TestPackedQuantLinear(unittest.TestCase):
+    @parameterized.expand(
+        [
+            ("int4", 64, 256, 2, 4, True, True),
+            ("int4", 64, 256, 1, 4, False, True),
+            ("int8", 64, 256, 1, 8, True, False),
+            ("dequantize", 64, 256, 2, 4, True, True),
+            ("dequantize", 60, 250, 5, 3, True, True),
+            ("dequantize", 32, 64, 1, 8, False, True),
+            ("dequantize", 32, 64, 1, 12, True, False),
+        ]
+    )
+    def test_kernels(self, kernel, out_features, in_features, num_groups, bit_width, signed, asymmetric):
+        int_weight, scale, zero_point, weight = get_quantized_weight(
+            out_features, in_features, num_groups, bit_width, signed, asymmetric
+        )
+        bias = torch.randn(out_features)
+        layer = PackedQuantLinear(int_weight, scale, zero_point, bit_width, signed, bias=bias, kernel=kernel)
+        self.assertEqual(layer.kernel, kernel)
+
+        x = torch.randn(2, 3, in_features)
+        self.assertTrue(torch.allclose(layer(x), torch.nn.functional.linear(x, weight, bias), atol=1e-3))
+
+        # The packed weight is stored on its bit width.
+        packed_bytes = layer.weight_packed.numel() * layer.weight_packed.element_size()
+        self.assertLessEqual(packed_bytes, out_features * in_features * max(bit_width, 8 if bit_width > 4 else 4) / 8)
+
+    def test_default_kernel(self):
+        int_weight, scale, zero_point, _ = get_quantized_weight(64, 256, 2, 4, True, True)
+        self.assertEqual(PackedQuantLinear(int_weight, scale, zero_point, 4, True).kernel, "dequantize")
+        layer = PackedQuantLinear(int_weight, scale, zero_point, 4, True, compute_dtype=torch.bfloat16)
+        self.assertEqual(layer.kernel, "int4")
+        self.assertEqual(layer(torch.randn(3, 256)).dtype, torch.float32)
+
+        with self.assertRaises(ValueError):
+            PackedQuantLinear(int_weight[:60], scale[:60], zero_point[:60], 4, True, kernel="int4")
+
+    @parameterized.expand([(4, "per_channel", True), (8, "per_tensor", False)])
+    def test_pack_quantized_model(self, weights_bitwidth, weights_quant_granularity, weights_only):
+        model_id = next(iter(SUPPORTED_MODELS_TINY["opt"]))
+        qconfig = BrevitasQuantizationConfig(
+            weights_bitwidth=weights_bitwidth,
+            weights_quant_granularity=weights_quant_granularity,
+            weights_only=weights_only,
+            activations_equalization=None,
+        )
+        model = BrevitasQuantizer.from_pretrained(model_id).quantize(qconfig).eval()
+        input_ids = torch.randint(0, 100, (1, 16))
+        with torch.no_grad():
+            expected_logits = model(input_ids=input_ids)["logits"]
+
+        model = pack_quantized_linears(model)
+        self.assertTrue(any(isinstance(module, PackedQuantLinear) for module in model.modules()))
+        with torch.no_grad():
+            logits = model(input_ids=input_ids)["logits"]
+        self.assertTrue(torch.allclose(logits, expected_logits, atol=1e-4))
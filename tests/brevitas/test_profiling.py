@@ -0,0 +1,101 @@
+# Copyright 2024 The HuggingFace Team. All rights reserved.
+# Licensed under the MIT License.
+
+import json
+import os
+import tempfile
+import time
+import unittest
+
+import numpy as np
+from testing_utils import SUPPORTED_MODELS_TINY
+
+from optimum.amd.brevitas import BrevitasQuantizationCallback, BrevitasQuantizationConfig, BrevitasQuantizer
+from optimum.amd.brevitas.data_utils import get_dataset_for_model
+from optimum.amd.brevitas.profiling import BrevitasStageProfiler, get_current_rss_mb
+from transformers import AutoTokenizer
+
+
+class StageRecorder(BrevitasQuantizationCallback):
+    def __init__(self):
+        self.events = []
+
+    def on_stage_begin(self, name):
+        self.events.append(("begin", name))
+
+    def on_stage_end(self, stage):
+        self.events.append(("end", stage.name))
+
+
+class TestStageProfiler(unittest.TestCase):
+    def test_stages(self):
+        recorder = StageRecorder()
+        profiler = BrevitasStageProfiler([recorder])
+
+        with profiler.stage("quantize_model"):
+            start_rss_mb = get_current_rss_mb()
+            buffer = np.ones(64 * 2**20 // 8)
+            # The buffer is alive during several sampling intervals of the profiler.
+            time.sleep(20 * profiler.rss_sample_interval)
+            del buffer
+        with profiler.stage("calibration", num_samples=8):
+            time.sleep(0.05)
+
+        profile = profiler.get_profile("model", {"is_static": True})
+        quantize_stage, calibration_stage = profile.stages
+
+        self.assertEqual(
+            recorder.events,
+            [("begin", "quantize_model"), ("end", "quantize_model"), ("begin", "calibration"), ("end", "calibration")],
+        )
+        # The peak resident memory is sampled during the stage, so that freed buffers are accounted for.
+        self.assertGreaterEqual(quantize_stage.peak_rss_mb, start_rss_mb + 64)
+        self.assertIsNone(quantize_stage.samples_per_second)
+        self.assertAlmostEqual(calibration_stage.samples_per_second, 8 / calibration_stage.wall_time_s)
+        self.assertIn("calibration", profile.summary())
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            profile.save(os.path.join(tmpdir, "profile.json"))
+            with open(os.path.join(tmpdir, "profile.json")) as profile_file:
+                saved = json.load(profile_file)
+        self.assertEqual([stage["name"] for stage in saved["stages"]], ["quantize_model", "calibration"])
+        self.assertAlmostEqual(saved["total_time_s"], profile.total_time_s)
+
+
+class TestQuantizationProfile(unittest.TestCase):
+    def test_quantize(self):
+        model_id = next(iter(SUPPORTED_MODELS_TINY["opt"]))
+        qconfig = BrevitasQuantizationConfig(
+            is_static=True, apply_gptq=True, apply_weight_equalization=True, activations_equalization="cross_layer"
+        )
+        quantizer = BrevitasQuantizer.from_pretrained(model_id)
+        calibration_dataset = get_dataset_for_model(
+            model_id,
+            qconfig=qconfig,
+            dataset_name="wikitext2",
+            tokenizer=AutoTokenizer.from_pretrained(model_id),
+            nsamples=8,
+            seqlen=32,
+            split="train",
+        )
+
+        recorder = StageRecorder()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            profile_path = os.path.join(tmpdir, "profile.json")
+            quantizer.quantize(qconfig, calibration_dataset, callbacks=[recorder], profile_path=profile_path)
+            self.assertTrue(os.path.isfile(profile_path))
+
+        stages = [stage.name for stage in quantizer.quantization_profile.stages]
+        self.assertEqual(
+            stages,
+            [
+                "tracing",
+                "weight_equalization",
+                "activation_equalization",
+                "quantize_model",
+                "gptq",
+                "calibration",
+            ],
+        )
+        self.assertEqual([name for event, name in recorder.events if event == "end"], stages)
+        self.assertEqual(quantizer.quantization_profile.stages[-1].num_samples, 8)
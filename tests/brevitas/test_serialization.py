@@ -0,0 +1,78 @@
+# Copyright 2024 The HuggingFace Team. All rights reserved.
+# Licensed under the MIT License.
+
+import os
+import tempfile
+import unittest
+
+import torch
+from parameterized import parameterized
+from testing_utils import SUPPORTED_MODELS_TINY
+
+from optimum.amd.brevitas import BrevitasQuantizationConfig, BrevitasQuantizer
+from optimum.amd.brevitas.data_utils import get_dataset_for_model
+from optimum.amd.brevitas.serialization import QUANTIZED_WEIGHTS_NAME, pack_int_tensor, unpack_int_tensor
+from transformers import AutoTokenizer
+
+
+class TestIntPacking(unittest.TestCase):
+    @parameterized.expand([(2,), (4,), (6,), (8,), (16,)])
+    def test_pack_unpack(self, bit_width):
+        for signed in [True, False]:
+            low, high = (-(2 ** (bit_width - 1)), 2 ** (bit_width - 1)) if signed else (0, 2**bit_width)
+            tensor = torch.randint(low, high, (5, 7))
+
+            packed = pack_int_tensor(tensor, bit_width, signed)
+            if bit_width <= 4:
+                self.assertEqual(packed.numel(), (tensor.numel() + 1) // 2)
+            self.assertTrue(torch.equal(unpack_int_tensor(packed, bit_width, signed, tensor.shape), tensor))
+
+    def test_out_of_range(self):
+        with self.assertRaises(ValueError):
+            pack_int_tensor(torch.tensor([8]), 4, signed=True)
+
+
+class TestSaveQuantized(unittest.TestCase):
+    @parameterized.expand([(8, "per_tensor", False), (4, "per_channel", True)])
+    def test_save_reload(self, weights_bitwidth, weights_quant_granularity, is_static):
+        model_id = next(iter(SUPPORTED_MODELS_TINY["opt"]))
+        qconfig = BrevitasQuantizationConfig(
+            weights_bitwidth=weights_bitwidth,
+            weights_quant_granularity=weights_quant_granularity,
+            is_static=is_static,
+            apply_gptq=True,
+            activations_equalization="layerwise",
+        )
+        calibration_dataset = get_dataset_for_model(
+            model_id,
+            qconfig=qconfig,
+            dataset_name="wikitext2",
+            tokenizer=AutoTokenizer.from_pretrained(model_id),
+            nsamples=4,
+            seqlen=32,
+            split="train",
+        )
+        inputs = calibration_dataset[0]
+
+        quantizer = BrevitasQuantizer.from_pretrained(model_id)
+        model = quantizer.quantize(qconfig, calibration_dataset)
+        with torch.no_grad():
+            expected_logits = model(**inputs)["logits"]
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            quantizer.save_pretrained(tmpdir)
+            # The weights are stored on their bit width.
+            quantized_size = os.path.getsize(os.path.join(tmpdir, QUANTIZED_WEIGHTS_NAME))
+            float_size = sum(tensor.numel() * tensor.element_size() for tensor in model.state_dict().values())
+            self.assertLess(quantized_size, float_size)
+
+            reloaded_model = BrevitasQuantizer.from_quantized(tmpdir)
+
+        with torch.no_grad():
+            logits = reloaded_model(**inputs)["logits"]
+        self.assertTrue(torch.allclose(logits, expected_logits, atol=1e-5))
+
+    def test_save_not_quantized(self):
+        quantizer = BrevitasQuantizer.from_pretrained(next(iter(SUPPORTED_MODELS_TINY["opt"])))
+        with tempfile.TemporaryDirectory() as tmpdir, self.assertRaises(ValueError):
+            quantizer.save_pretrained(tmpdir)
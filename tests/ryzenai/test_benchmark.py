@@ -0,0 +1,49 @@
+# Copyright 2024 The HuggingFace Team. All rights reserved.
+# Licensed under the MIT License.
+
+import json
+import os
+import tempfile
+import unittest
+
+import onnx
+from testing_utils import make_matmul_model
+
+from optimum.amd.ryzenai import RyzenAIBenchmarkReport, RyzenAIModelForImageClassification
+from optimum.amd.ryzenai.benchmark import benchmark_model_path
+
+
+class RyzenAIBenchmarkTest(unittest.TestCase):
+    def test_benchmark(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            model_path = os.path.join(tmpdir, "model.onnx")
+            # A static batch size of 2: the batches of 3 are split and padded.
+            onnx.save(make_matmul_model(batch_dim=2), model_path)
+
+            results = benchmark_model_path(
+                model_path,
+                RyzenAIModelForImageClassification,
+                batch_sizes=[2, 3],
+                num_threads=[1],
+                num_runs=5,
+                num_warmup_runs=1,
+            )
+            self.assertEqual([(result.batch_size, result.num_threads) for result in results], [(2, 1), (3, 1)])
+            self.assertEqual(len(results[0].latencies_ms), 5)
+            self.assertGreater(results[0].throughput, 0)
+            self.assertGreater(results[0].peak_rss_mb, 0)
+
+            report = RyzenAIBenchmarkReport(results)
+            report_path = os.path.join(tmpdir, "benchmark.json")
+            report.save(report_path)
+            with open(report_path, "r") as report_file:
+                data = json.load(report_file)
+            self.assertIn("onnxruntime_version", data["environment"])
+            self.assertLessEqual(data["results"][0]["p50_ms"], data["results"][0]["p99_ms"])
+            self.assertNotIn("latencies_ms", data["results"][0])
+
+            baseline = RyzenAIBenchmarkReport.load_results(report_path)
+            baseline[0]["p50_ms"] /= 10
+            comparisons = report.compare(baseline, metric="p50_ms", tolerance=0.5)
+            self.assertEqual([comparison["regression"] for comparison in comparisons], [True, False])
+            self.assertIn("model.onnx", report.summary())
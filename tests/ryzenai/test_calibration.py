@@ -0,0 +1,155 @@
+# Copyright 2024 The HuggingFace Team. All rights reserved.
+# Licensed under the MIT License.
+
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import onnxruntime
+from datasets import Dataset
+from onnxruntime.quantization import CalibrationMethod
+from testing_utils import make_conv_model
+
+from optimum.amd.ryzenai.calibration import (
+    RyzenAICalibrationDataReader,
+    augment_model_for_calibration,
+    collect_calibration_statistics,
+    compute_tensors_range,
+    reservoir_sample,
+)
+
+
+class RyzenAICalibrationDataReaderTest(unittest.TestCase):
+    def _read_all(self, reader):
+        batches = []
+        while True:
+            batch = reader.get_next()
+            if batch is None:
+                return batches
+            # The reader reuses its buffers, copy the batches to keep them.
+            batches.append({name: value.copy() for name, value in batch.items()})
+
+    def test_batches(self):
+        pixel_values = np.random.rand(10, 3, 4, 4).astype(np.float32)
+        dataset = Dataset.from_dict({"pixel_values": pixel_values})
+
+        for prefetch in (True, False):
+            batches = self._read_all(RyzenAICalibrationDataReader(dataset, batch_size=4, prefetch=prefetch))
+            self.assertEqual([batch["pixel_values"].shape for batch in batches], [(4, 3, 4, 4)] * 2 + [(2, 3, 4, 4)])
+            self.assertTrue(np.array_equal(np.concatenate([batch["pixel_values"] for batch in batches]), pixel_values))
+
+        batches = self._read_all(RyzenAICalibrationDataReader(dataset, batch_size=4, drop_last=True))
+        self.assertEqual(len(batches), 2)
+
+    def test_iterable_dataset(self):
+        pixel_values = np.random.rand(5, 3, 4, 4).astype(np.float32)
+        dataset = Dataset.from_dict({"pixel_values": pixel_values}).to_iterable_dataset()
+
+        reader = RyzenAICalibrationDataReader(dataset, batch_size=2)
+        batches = self._read_all(reader)
+        self.assertTrue(np.allclose(np.concatenate([batch["pixel_values"] for batch in batches]), pixel_values))
+
+        reader.rewind()
+        self.assertTrue(np.allclose(reader.get_next()["pixel_values"], pixel_values[:2]))
+
+    def test_close(self):
+        dataset = Dataset.from_dict({"pixel_values": np.random.rand(10, 3, 4, 4).astype(np.float32)})
+
+        with RyzenAICalibrationDataReader(dataset, batch_size=2) as reader:
+            reader.get_next()
+            thread = reader._thread
+            self.assertTrue(thread.is_alive())
+        # The reader is left before its last batch, its background thread is stopped.
+        self.assertFalse(thread.is_alive())
+        self.assertIsNone(reader.get_next())
+
+        reader.rewind()
+        self.assertEqual(len(self._read_all(reader)), 5)
+
+
+class ReservoirSampleTest(unittest.TestCase):
+    def test_reservoir_sample(self):
+        samples = reservoir_sample(iter(range(100)), 10, seed=0)
+        self.assertEqual(len(set(samples)), 10)
+        self.assertEqual(samples, reservoir_sample(iter(range(100)), 10, seed=0))
+
+        self.assertEqual(sorted(reservoir_sample(range(5), 10)), list(range(5)))
+        self.assertTrue(all(sample < 20 for sample in reservoir_sample(range(100), 10, num_candidates=20)))
+
+        # Every sample is drawn with the same probability.
+        counts = np.bincount(
+            np.concatenate([reservoir_sample(range(10), 2, seed=seed) for seed in range(2000)]), minlength=10
+        )
+        self.assertLess(np.abs(counts / 2000 - 0.2).max(), 0.05)
+
+
+class CalibrationStatisticsTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.model_path = os.path.join(self.tmpdir.name, "model.onnx")
+        make_conv_model(self.model_path)
+        self.dataset = Dataset.from_dict({"pixel_values": np.random.randn(11, 3, 8, 8).astype(np.float32)})
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_min_max_matches_full_run(self):
+        augmented_model_path = os.path.join(self.tmpdir.name, "augmented.onnx")
+        tensor_names = augment_model_for_calibration(self.model_path, augmented_model_path)
+        self.assertEqual(set(tensor_names), {"pixel_values", "conv", "relu", "logits"})
+
+        session = onnxruntime.InferenceSession(augmented_model_path, providers=["CPUExecutionProvider"])
+        pixel_values = np.asarray(self.dataset["pixel_values"], dtype=np.float32)
+        outputs = dict(
+            zip([output.name for output in session.get_outputs()], session.run(None, {"pixel_values": pixel_values}))
+        )
+
+        statistics = collect_calibration_statistics(
+            self.model_path, self.dataset, CalibrationMethod.MinMax, batch_size=2, num_workers=3
+        )
+        self.assertEqual(statistics.min_values["pixel_values"], pixel_values.min())
+        self.assertEqual(statistics.max_values["pixel_values"], pixel_values.max())
+        for name in ("conv", "relu", "logits"):
+            self.assertTrue(np.isclose(statistics.min_values[name], outputs[name].min(), atol=1e-5))
+            self.assertTrue(np.isclose(statistics.max_values[name], outputs[name].max(), atol=1e-5))
+
+    def test_sharded_matches_serial(self):
+        for method in (CalibrationMethod.MinMax, "NonOverflow"):
+            serial = collect_calibration_statistics(self.model_path, self.dataset, method, batch_size=2, num_workers=1)
+            sharded = collect_calibration_statistics(
+                self.model_path, self.dataset, method, batch_size=2, num_workers=2
+            )
+
+            serial_range = compute_tensors_range(serial, method)
+            sharded_range = compute_tensors_range(sharded, method)
+            self.assertEqual(serial_range.keys(), sharded_range.keys())
+            for name, (value_min, value_max) in serial_range.items():
+                self.assertEqual(value_min, sharded_range[name][0])
+                self.assertEqual(value_max, sharded_range[name][1])
+                self.assertLessEqual(value_min, value_max)
+
+    def test_unsupported_method(self):
+        # The ranges of these methods can not be merged exactly across shards.
+        for method in (CalibrationMethod.Entropy, CalibrationMethod.Percentile, "MinMSE"):
+            with self.assertRaises(ValueError):
+                collect_calibration_statistics(self.model_path, self.dataset, method)
+
+    def test_cache(self):
+        cache_dir = os.path.join(self.tmpdir.name, "cache")
+        kwargs = {"batch_size": 2, "cache_dir": cache_dir}
+
+        statistics = collect_calibration_statistics(self.model_path, self.dataset, "NonOverflow", **kwargs)
+        self.assertEqual(len(os.listdir(cache_dir)), 1)
+
+        # The ranges are shared by the calibration methods.
+        cached = collect_calibration_statistics(self.model_path, self.dataset, CalibrationMethod.MinMax, **kwargs)
+        self.assertEqual(cached.min_values.keys(), statistics.min_values.keys())
+        self.assertEqual(len(os.listdir(cache_dir)), 1)
+        for name, value_min in statistics.min_values.items():
+            self.assertEqual(cached.min_values[name], value_min)
+            self.assertEqual(cached.max_values[name], statistics.max_values[name])
+
+        # Another dataset has another fingerprint.
+        collect_calibration_statistics(self.model_path, self.dataset.select(range(4)), "MinMax", **kwargs)
+        self.assertEqual(len(os.listdir(cache_dir)), 2)
@@ -0,0 +1,91 @@
+# Copyright 2024 The HuggingFace Team. All rights reserved.
+# Licensed under the MIT License.
+
+import json
+import os
+import tempfile
+import unittest
+
+from optimum.amd.ryzenai import RyzenAIOperatorsReport
+from optimum.amd.ryzenai.operators import (
+    collect_operators_reports,
+    diff_operators_baseline,
+    format_operators_diff,
+    load_operators_baseline,
+    op_type_placement_histogram,
+    save_operators_baseline,
+)
+
+
+BASELINE_JSON = os.path.join(os.path.dirname(__file__), "operators_baseline.json")
+
+
+def _write_ep_report(cache_dir, cache_key, num_dpu, num_cpu, cpu_op_types):
+    os.makedirs(os.path.join(cache_dir, cache_key))
+    report = {
+        "deviceStat": [
+            {"name": "all", "nodeNum": num_dpu + num_cpu, "supportedOpType": ["Conv", "Relu"] + cpu_op_types},
+            {"name": "CPU", "nodeNum": num_cpu, "supportedOpType": cpu_op_types},
+            {"name": "DPU", "nodeNum": num_dpu, "supportedOpType": ["Conv", "Relu"]},
+        ]
+    }
+    with open(os.path.join(cache_dir, cache_key, "vitisai_ep_report.json"), "w") as report_file:
+        json.dump(report, report_file)
+
+
+class RyzenAIOperatorsTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cache_dir = os.path.join(self.tmpdir.name, "ryzen_cache")
+        _write_ep_report(self.cache_dir, "AMD_ResNet50", 98, 2, ["QuantizeLinear"])
+        _write_ep_report(self.cache_dir, "amd_yolov5s", 80, 20, ["QuantizeLinear", "Resize"])
+        os.makedirs(os.path.join(self.cache_dir, "no_report"))
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_collect(self):
+        reports = collect_operators_reports(self.cache_dir, num_workers=2)
+
+        self.assertEqual(list(reports), ["amd_resnet50", "amd_yolov5s"])
+        self.assertEqual(reports["amd_resnet50"].num_nodes, {"all": 100, "dpu": 98, "cpu": 2})
+        self.assertAlmostEqual(reports["amd_yolov5s"].dpu_coverage, 0.8)
+        self.assertEqual(
+            op_type_placement_histogram(reports),
+            {"Conv": {"dpu": 2}, "QuantizeLinear": {"cpu": 2}, "Relu": {"dpu": 2}, "Resize": {"cpu": 1}},
+        )
+
+    def test_load_baseline(self):
+        baseline = load_operators_baseline(BASELINE_JSON)
+        self.assertIs(load_operators_baseline(BASELINE_JSON), baseline)
+
+        report = next(iter(baseline.values()))
+        self.assertEqual(set(report.num_nodes), {"all", "dpu", "cpu"})
+        self.assertEqual(report.op_types, {})
+
+        # The cache is invalidated when the baseline is regenerated.
+        baseline_path = os.path.join(self.tmpdir.name, "baseline.json")
+        save_operators_baseline(collect_operators_reports(self.cache_dir), baseline_path)
+        self.assertEqual(len(load_operators_baseline(baseline_path)), 2)
+        save_operators_baseline(
+            {"amd_resnet50": RyzenAIOperatorsReport({"all": 1, "dpu": 1, "cpu": 0})}, baseline_path
+        )
+        self.assertEqual(list(load_operators_baseline(baseline_path)), ["amd_resnet50"])
+
+    def test_diff(self):
+        baseline_path = os.path.join(self.tmpdir.name, "baseline.json")
+        save_operators_baseline(collect_operators_reports(self.cache_dir), baseline_path)
+        baseline = load_operators_baseline(baseline_path)
+
+        current_dir = os.path.join(self.tmpdir.name, "current")
+        _write_ep_report(current_dir, "amd_resnet50", 98, 2, ["QuantizeLinear"])
+        _write_ep_report(current_dir, "amd_yolov5s", 70, 30, ["QuantizeLinear", "Resize", "Concat"])
+        _write_ep_report(current_dir, "amd_yolov8m", 90, 10, ["QuantizeLinear"])
+
+        diffs = diff_operators_baseline(baseline, collect_operators_reports(current_dir))
+        self.assertEqual(diffs[0].model_name, "amd_yolov5s")
+        self.assertAlmostEqual(diffs[0].coverage_delta, -0.1)
+        self.assertEqual(diffs[0].new_cpu_op_types, ["Concat"])
+        self.assertEqual([diff.model_name for diff in diffs if diff.is_regression()], ["amd_yolov5s"])
+        self.assertFalse(diffs[0].is_regression(tolerance=0.2))
+        self.assertIn("new", format_operators_diff(diffs))
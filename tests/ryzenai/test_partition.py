@@ -0,0 +1,129 @@
+# Copyright 2024 The HuggingFace Team. All rights reserved.
+# Licensed under the MIT License.
+
+import json
+import os
+import tempfile
+import unittest
+
+import huggingface_hub
+import numpy as np
+import pytest
+from onnx import TensorProto, helper, numpy_helper
+from parameterized import parameterized
+from testing_utils import RYZEN_PREQUANTIZED_MODEL_IMAGE_CLASSIFICATION, RyzenAITestCaseMixin
+
+from optimum.amd.ryzenai import RyzenAIOperatorsReport, RyzenAIPartitionPreview
+from optimum.amd.ryzenai.operators import diff_operators_baseline
+from optimum.amd.ryzenai.partition import get_dpu_op_types, preview_partition
+
+
+VAIP_CONFIG = os.path.join(os.path.dirname(__file__), "vaip_config.json")
+
+
+def _qdq(name, tensor):
+    scale, zero_point = f"{name}.scale", f"{name}.zero_point"
+    return [
+        helper.make_node("QuantizeLinear", [tensor, scale, zero_point], [f"{tensor}_q"], name=f"{name}_q"),
+        helper.make_node("DequantizeLinear", [f"{tensor}_q", scale, zero_point], [f"{tensor}_dq"], name=f"{name}_dq"),
+    ], [
+        numpy_helper.from_array(np.array(0.1, dtype=np.float32), scale),
+        numpy_helper.from_array(np.array(0, dtype=np.int8), zero_point),
+    ]
+
+
+def _make_qdq_model():
+    # pixel_values -> QDQ -> Conv -> Relu -> QDQ -> Erf -> QDQ -> Conv -> QDQ -> Flatten -> logits
+    nodes, initializers = [], []
+    for name, tensor in [("input", "pixel_values"), ("relu1", "relu1"), ("erf1", "erf1"), ("conv2", "conv2")]:
+        qdq_nodes, qdq_initializers = _qdq(name, tensor)
+        nodes.append(qdq_nodes)
+        initializers.extend(qdq_initializers)
+
+    for name, shape in [("conv1.weight", (4, 3, 3, 3)), ("conv2.weight", (4, 4, 3, 3))]:
+        initializers.append(numpy_helper.from_array(np.ones(shape, dtype=np.int8), f"{name}_q"))
+        nodes.append([helper.make_node("DequantizeLinear", [f"{name}_q", "input.scale"], [name], name=f"{name}_dq")])
+
+    graph = helper.make_graph(
+        nodes[0]
+        + nodes[4]
+        + [
+            helper.make_node("Conv", ["pixel_values_dq", "conv1.weight"], ["conv1"], name="Conv_1", pads=[1, 1, 1, 1]),
+            helper.make_node("Relu", ["conv1"], ["relu1"], name="Relu_1"),
+        ]
+        + nodes[1]
+        + [helper.make_node("Erf", ["relu1_dq"], ["erf1"], name="Erf_1")]
+        + nodes[2]
+        + nodes[5]
+        + [helper.make_node("Conv", ["erf1_dq", "conv2.weight"], ["conv2"], name="Conv_2", pads=[1, 1, 1, 1])]
+        + nodes[3]
+        + [helper.make_node("Flatten", ["conv2_dq"], ["logits"], name="Flatten_1")],
+        "qdq",
+        inputs=[helper.make_tensor_value_info("pixel_values", TensorProto.FLOAT, [1, 3, 8, 8])],
+        outputs=[helper.make_tensor_value_info("logits", TensorProto.FLOAT, [1, 256])],
+        initializer=initializers,
+    )
+    return helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)], ir_version=8)
+
+
+class RyzenAIPartitionPreviewTest(unittest.TestCase):
+    def setUp(self):
+        self.model = _make_qdq_model()
+
+    def test_preview(self):
+        preview = preview_partition(self.model, vaip_config=VAIP_CONFIG)
+
+        self.assertIsInstance(preview, RyzenAIPartitionPreview)
+        self.assertEqual(preview.num_nodes, {"all": 15, "dpu": 9, "cpu": 6})
+        # The graph input quantization, the unsupported Erf and the ending Flatten fall back to the CPU.
+        self.assertEqual(preview.cpu_nodes, ["input_q", "relu1_dq", "Erf_1", "erf1_q", "conv2_dq", "Flatten_1"])
+        self.assertEqual(preview.num_subgraphs, 2)
+        self.assertEqual(preview.boundary_tensors, ["pixel_values_q", "relu1_q", "erf1_q", "conv2_q"])
+        self.assertIn("Erf x1", preview.summary())
+
+    def test_supported_op_types(self):
+        preview = preview_partition(self.model, supported_op_types=get_dpu_op_types() | {"Erf"})
+
+        self.assertEqual(preview.cpu_nodes, ["input_q"])
+        self.assertEqual(preview.num_subgraphs, 1)
+        self.assertEqual(preview.num_boundaries, 2)
+
+    def test_disabled_dpu_pass(self):
+        with open(VAIP_CONFIG, "r") as config_file:
+            config = json.load(config_file)
+        for vaip_pass in config["passes"]:
+            if vaip_pass["name"] == "fuse_DPU":
+                vaip_pass["disabled"] = True
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            vaip_config = os.path.join(tmpdir, "vaip_config.json")
+            with open(vaip_config, "w") as config_file:
+                json.dump(config, config_file)
+
+            preview = preview_partition(self.model, vaip_config=vaip_config)
+
+        self.assertEqual(preview.num_nodes["dpu"], 0)
+        self.assertEqual(preview.num_subgraphs, 0)
+
+    def test_compare_to_baseline(self):
+        report = preview_partition(self.model, vaip_config=VAIP_CONFIG).to_operators_report()
+        baseline = {"qdq": RyzenAIOperatorsReport({"all": 15, "dpu": 11, "cpu": 4})}
+
+        diffs = diff_operators_baseline(baseline, {"qdq": report})
+        self.assertTrue(diffs[0].is_regression())
+        self.assertIn("Erf", report.op_types["cpu"])
+
+
+class RyzenAIPartitionPreviewBaselineTest(unittest.TestCase, RyzenAITestCaseMixin):
+    @parameterized.expand(RYZEN_PREQUANTIZED_MODEL_IMAGE_CLASSIFICATION)
+    @pytest.mark.prequantized_model_test
+    def test_model(self, model_id):
+        cache_key = model_id.replace("/", "_").lower()
+        file_name = [name for name in huggingface_hub.list_repo_files(model_id) if name.endswith(".onnx")][0]
+
+        preview = preview_partition(huggingface_hub.hf_hub_download(model_id, file_name), vaip_config=VAIP_CONFIG)
+        baseline_ops = self.get_baseline_ops(cache_key)
+
+        self.assertAlmostEqual(
+            preview.dpu_coverage, baseline_ops["dpu"] / baseline_ops["all"], delta=0.05, msg=preview.summary()
+        )
@@ -0,0 +1,232 @@
+# Copyright 2024 The HuggingFace Team. All rights reserved.
+# Licensed under the MIT License.
+
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+import onnxruntime
+import torch
+from parameterized import parameterized
+from testing_utils import make_classification_model
+
+from optimum.amd.ryzenai import (
+    RyzenAIDetectionPostprocessor,
+    RyzenAIImagePreprocessor,
+    RyzenAIModelForImageClassification,
+)
+from optimum.amd.ryzenai.processing import YOLO_DEFAULT_ANCHORS, non_max_suppression, retinaface_priors, top_k_logits
+from transformers import BitImageProcessor, ConvNextImageProcessor, PretrainedConfig, ViTImageProcessor
+
+
+TEST_IMAGE_SIZES = [(375, 500), (480, 360), (64, 64), (20, 30)]
+
+
+def _reference_nms(boxes, scores, iou_threshold):
+    def iou(a, b):
+        width = max(0.0, min(a[2], b[2]) - max(a[0], b[0]))
+        height = max(0.0, min(a[3], b[3]) - max(a[1], b[1]))
+        intersection = width * height
+        union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - intersection
+        return intersection / union
+
+    keep = []
+    for index in sorted(range(len(scores)), key=lambda i: -scores[i]):
+        if all(iou(boxes[index], boxes[kept]) <= iou_threshold for kept in keep):
+            keep.append(index)
+    return keep
+
+
+def _random_boxes(num_boxes, size=100.0):
+    top_left = np.random.rand(num_boxes, 2) * size
+    return np.concatenate((top_left, top_left + np.random.rand(num_boxes, 2) * size / 4 + 1), axis=-1)
+
+
+class RyzenAIImagePreprocessorTest(unittest.TestCase):
+    def test_resize_matches_torch(self):
+        images = np.random.randint(0, 256, size=(4, 37, 53, 3), dtype=np.uint8)
+        preprocessor = RyzenAIImagePreprocessor(size=(24, 16), image_mean=None, image_std=None, rescale_factor=1.0)
+
+        reference = torch.nn.functional.interpolate(
+            torch.from_numpy(images).permute(0, 3, 1, 2).float(), size=(24, 16), mode="bilinear", align_corners=False
+        ).numpy()
+
+        self.assertTrue(np.allclose(preprocessor(list(images)), reference, atol=1e-3))
+
+    def test_shortest_edge_center_crop(self):
+        image = np.random.randint(0, 256, size=(30, 60, 3), dtype=np.uint8)
+        preprocessor = RyzenAIImagePreprocessor(
+            size=20, crop_size=(16, 16), image_mean=None, image_std=None, rescale_factor=1.0, channels_last=True
+        )
+
+        resized = torch.nn.functional.interpolate(
+            torch.from_numpy(image).permute(2, 0, 1)[None].float(), size=(20, 40), mode="bilinear", align_corners=False
+        )
+        reference = resized[:, :, 2:18, 12:28].permute(0, 2, 3, 1).numpy()
+
+        self.assertTrue(np.allclose(preprocessor(image), reference, atol=1e-3))
+
+    def test_mixed_sizes_and_buffer_reuse(self):
+        preprocessor = RyzenAIImagePreprocessor(size=(8, 8), num_buffers=2)
+        images = [np.full((10, 10, 3), 255, dtype=np.uint8), np.zeros((20, 12, 3), dtype=np.uint8)]
+
+        first = preprocessor(images)
+        expected_white = (1.0 - np.array([0.485, 0.456, 0.406])) / np.array([0.229, 0.224, 0.225])
+        self.assertTrue(np.allclose(first[0, :, 0, 0], expected_white, atol=1e-5))
+        self.assertTrue(np.allclose(first[1, :, 0, 0], -np.array([0.485, 0.456, 0.406]) / [0.229, 0.224, 0.225]))
+
+        second = preprocessor(images)
+        self.assertIsNot(first, second)
+        self.assertIs(first, preprocessor(images))
+
+    def test_image_types(self):
+        preprocessor = RyzenAIImagePreprocessor(size=(8, 8))
+        image = np.random.randint(0, 256, size=(10, 12, 3), dtype=np.uint8)
+        expected = preprocessor(image).copy()
+
+        rgba = np.concatenate((image, np.full((10, 12, 1), 128, dtype=np.uint8)), axis=-1)
+        self.assertTrue(np.array_equal(preprocessor(rgba), expected))
+        self.assertTrue(np.array_equal(preprocessor(image.astype(np.float32)), expected))
+        self.assertTrue(np.array_equal(preprocessor(image.astype(np.int64)), expected))
+
+        gray = image[..., 0]
+        self.assertTrue(np.array_equal(preprocessor(gray), preprocessor(np.repeat(gray[..., None], 3, axis=-1))))
+
+        with self.assertRaises(ValueError):
+            preprocessor(np.zeros((10, 12, 2), dtype=np.uint8))
+
+    @parameterized.expand(
+        [
+            (BitImageProcessor, {}),  # Bicubic
+            (ViTImageProcessor, {}),  # Bilinear
+            (ConvNextImageProcessor, {}),
+            (BitImageProcessor, {"resample": 0}),
+            (BitImageProcessor, {"resample": 1}),
+            (BitImageProcessor, {"resample": 4}),
+            (BitImageProcessor, {"resample": 5}),
+        ]
+    )
+    def test_matches_image_processor(self, image_processor_class, kwargs):
+        image_processor = image_processor_class(**kwargs)
+        images = [np.random.randint(0, 256, (height, width, 3), dtype=np.uint8) for height, width in TEST_IMAGE_SIZES]
+        expected = image_processor(images, return_tensors="np")["pixel_values"]
+
+        preprocessor = RyzenAIImagePreprocessor.from_image_processor(image_processor)
+        self.assertEqual(preprocessor.resample, int(image_processor.resample))
+        pixel_values = preprocessor(images)
+
+        # Pillow may round the rare pixel values lying at a tie between two 8-bit levels the other way.
+        diff = np.abs(pixel_values - expected)
+        self.assertLessEqual(diff.max(), 1 / 255 / min(image_processor.image_std) + 1e-5)
+        self.assertLess((diff > 1e-5).mean(), 1e-3)
+
+    def test_top_k_logits(self):
+        logits = np.random.rand(3, 100).astype(np.float32)
+        scores, indices = top_k_logits(logits, k=5)
+
+        reference_scores, reference_indices = torch.topk(torch.softmax(torch.from_numpy(logits), dim=-1), k=5)
+        self.assertTrue(np.array_equal(indices, reference_indices.numpy()))
+        self.assertTrue(np.allclose(scores, reference_scores.numpy(), atol=1e-6))
+
+
+class RyzenAIModelForImageClassificationPredictTest(unittest.TestCase):
+    def test_predict(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            model_path = os.path.join(tmpdir, "model.onnx")
+            make_classification_model(model_path)
+
+            session = onnxruntime.InferenceSession(model_path, providers=["CPUExecutionProvider"])
+            config = PretrainedConfig(id2label={i: f"label_{i}" for i in range(10)})
+            image_processor = BitImageProcessor(size={"shortest_edge": 8}, crop_size={"height": 8, "width": 8})
+            model = RyzenAIModelForImageClassification(session, config, preprocessors=[image_processor])
+
+            images = [np.random.randint(0, 256, size=(12, 16, 3), dtype=np.uint8) for _ in range(5)]
+            predictions = model.predict(images, top_k=3, batch_size=2)
+            overlapped_predictions = model.predict(images, top_k=3, batch_size=2, overlap_preprocessing=True)
+
+            self.assertEqual(len(predictions), 5)
+            self.assertEqual(len(predictions[0]), 3)
+            self.assertTrue(predictions[0][0]["label"].startswith("label_"))
+            self.assertEqual(predictions, overlapped_predictions)
+
+            logits = model(torch.from_numpy(model.image_preprocessor(images[:1]).copy())).logits
+            self.assertEqual(model.postprocess(logits, top_k=3)[0], predictions[0])
+
+
+class RyzenAIDetectionPostprocessorTest(unittest.TestCase):
+    def test_non_max_suppression(self):
+        boxes, scores = _random_boxes(200), np.random.rand(200)
+        keep = non_max_suppression(boxes, scores, iou_threshold=0.5)
+        self.assertEqual(keep.tolist(), _reference_nms(boxes, scores, 0.5))
+
+    def test_non_max_suppression_per_class(self):
+        boxes, scores = _random_boxes(200), np.random.rand(200)
+        labels = np.random.randint(0, 3, size=200)
+        keep = non_max_suppression(boxes, scores, iou_threshold=0.5, labels=labels)
+
+        expected = []
+        for label in range(3):
+            indices = np.flatnonzero(labels == label)
+            expected += indices[_reference_nms(boxes[indices], scores[indices], 0.5)].tolist()
+        self.assertEqual(sorted(keep.tolist()), sorted(expected))
+
+    def test_yolov5(self):
+        num_classes, input_size = 2, (64, 64)
+        outputs = [np.random.randn(1, 3 * (5 + num_classes), 64 // s, 64 // s).astype(np.float32) for s in (32, 8, 16)]
+        postprocessor = RyzenAIDetectionPostprocessor(
+            "yolov5", score_threshold=[0.3, 0.6], iou_threshold=0.5, num_classes=num_classes
+        )
+        boxes, scores, _ = postprocessor.decode(outputs, input_size)
+        self.assertEqual(boxes.shape, (1, 3 * (64 + 16 + 4), 4))
+
+        # Per-cell reference decoding of the stride 8 output.
+        output = 1 / (1 + np.exp(-outputs[1][0]))
+        cell = output.reshape(3, 5 + num_classes, 8, 8)[1, :, 2, 5]
+        center = (cell[0:2] * 2 - 0.5 + (5, 2)) * 8
+        size = (cell[2:4] * 2) ** 2 * YOLO_DEFAULT_ANCHORS[0][1]
+        index = (2 * 8 + 5) * 3 + 1
+        self.assertTrue(
+            np.allclose(boxes[0, index], np.concatenate((center - size / 2, center + size / 2)), atol=1e-4)
+        )
+        self.assertTrue(np.allclose(scores[0, index], cell[5:] * cell[4], atol=1e-6))
+
+        detections = postprocessor(outputs, input_size)[0]
+        self.assertTrue(np.all(detections.scores >= np.array([0.3, 0.6])[detections.labels]))
+        self.assertTrue(np.all((detections.boxes >= 0) & (detections.boxes <= 64)))
+        self.assertTrue(np.all(np.diff(detections.scores) <= 0))
+
+    def test_per_class_score_threshold(self):
+        postprocessor = RyzenAIDetectionPostprocessor("yolov5", score_threshold=[0.6, 0.3], num_classes=2)
+        boxes = np.array([[[0, 0, 10, 10], [20, 20, 30, 30], [40, 40, 50, 50]]], dtype=np.float32)
+        scores = np.array([[[0.5, 0.4], [0.7, 0.2], [0.5, 0.1]]], dtype=np.float32)
+
+        # The thresholds apply before picking the class: the first box is kept with its second best class.
+        with patch.object(postprocessor, "decode", return_value=(boxes, scores, None)):
+            detections = postprocessor([], (64, 64))[0]
+        self.assertEqual(detections.labels.tolist(), [0, 1])
+        self.assertTrue(np.allclose(detections.scores, [0.7, 0.4]))
+        self.assertTrue(np.array_equal(detections.boxes, boxes[0, [1, 0]]))
+
+    def test_yolov8(self):
+        outputs = [np.random.randn(2, 64 // s, 64 // s, 4 * 16 + 3).astype(np.float32) for s in (8, 16, 32)]
+        postprocessor = RyzenAIDetectionPostprocessor("yolov8", max_detections=5, num_classes=3)
+        detections = postprocessor(outputs, (64, 64))
+
+        self.assertEqual(len(detections), 2)
+        self.assertLessEqual(len(detections[0]), 5)
+
+    def test_retinaface(self):
+        input_size = (32, 64)
+        num_priors = len(retinaface_priors(input_size))
+        self.assertEqual(num_priors, 2 * (4 * 8 + 2 * 4 + 1 * 2))
+
+        outputs = [
+            np.random.randn(1, num_priors, 4),
+            np.random.randn(1, num_priors, 2) * 4,
+            np.random.randn(1, num_priors, 10),
+        ]
+        detections = RyzenAIDetectionPostprocessor("retinaface", score_threshold=0.5)(outputs, input_size)[0]
+        self.assertEqual(detections.keypoints.shape, (len(detections), 5, 2))
+        self.assertTrue(np.all(detections.labels == 0))
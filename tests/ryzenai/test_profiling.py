@@ -0,0 +1,90 @@
+# Copyright 2024 The HuggingFace Team. All rights reserved.
+# Licensed under the MIT License.
+
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import onnxruntime
+import torch
+from testing_utils import make_classification_model
+
+from optimum.amd.ryzenai import RyzenAIModel, RyzenAIModelForImageClassification, RyzenAIProfilingReport
+from transformers import PretrainedConfig
+
+
+def _node_event(name, op_type, provider, ts, dur):
+    return {
+        "cat": "Node",
+        "name": f"{name}_kernel_time",
+        "ts": ts,
+        "dur": dur,
+        "args": {"op_name": op_type, "provider": provider},
+    }
+
+
+class RyzenAIProfilingReportTest(unittest.TestCase):
+    def test_from_profile(self):
+        events = []
+        for run in range(3):
+            ts = run * 1000
+            events += [
+                {"cat": "Session", "name": "model_run", "ts": ts, "dur": 500},
+                _node_event("vitis_subgraph_0", "super_layer", "VitisAIExecutionProvider", ts + 1, 300),
+                _node_event("Softmax_1", "Softmax", "CPUExecutionProvider", ts + 301, 100),
+                _node_event("Reshape_2", "Reshape", "CPUExecutionProvider", ts + 401, 50),
+            ]
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            profile_path = os.path.join(tmpdir, "profile.json")
+            with open(profile_path, "w") as profile_file:
+                json.dump(events, profile_file)
+
+            ep_report_path = os.path.join(tmpdir, "vitisai_ep_report.json")
+            with open(ep_report_path, "w") as report_file:
+                json.dump({"deviceStat": [{"name": "all", "nodeNum": 5}, {"name": "CPU", "nodeNum": 2}]}, report_file)
+
+            report = RyzenAIProfilingReport.from_profile(
+                profile_path, num_warmup_runs=1, ep_report_path=ep_report_path
+            )
+
+        self.assertEqual(report.num_runs, 2)
+        self.assertEqual(report.mean_latency_us, 500)
+        self.assertEqual([node.name for node in report.hotspots(2)], ["vitis_subgraph_0", "Softmax_1"])
+        self.assertEqual(report.nodes[0].device, "DPU")
+        self.assertEqual(report.nodes[0].num_calls, 2)
+        self.assertEqual(report.cpu_fallback_time_us, 150)
+        self.assertAlmostEqual(report.device_breakdown()["CPU"]["time_share"], 150 / 450)
+        self.assertEqual(report.device_stats["cpu"]["num_nodes"], 2)
+
+    def test_profile_model(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            model_path = os.path.join(tmpdir, "model.onnx")
+            make_classification_model(model_path)
+
+            session_options = onnxruntime.SessionOptions()
+            session_options.intra_op_num_threads = 2
+            session = onnxruntime.InferenceSession(model_path, session_options, providers=["CPUExecutionProvider"])
+            model = RyzenAIModelForImageClassification(session, PretrainedConfig())
+
+            with patch.object(RyzenAIModel, "load_model", side_effect=RyzenAIModel.load_model) as load_model:
+                report = model.profile(torch.rand(2, 3, 8, 8), num_runs=3, profile_dir=tmpdir)
+            self.assertIs(model.model, session)
+
+            # The profiled session keeps the options of the model, which are left untouched.
+            profiled_options = load_model.call_args.kwargs["session_options"]
+            self.assertEqual(profiled_options.intra_op_num_threads, 2)
+            self.assertTrue(profiled_options.enable_profiling)
+            self.assertFalse(session.get_session_options().enable_profiling)
+
+            self.assertEqual(report.num_runs, 3)
+            self.assertEqual({node.op_type for node in report.nodes}, {"GlobalAveragePool", "Flatten", "MatMul"})
+            self.assertTrue(all(node.num_calls == 3 and node.device == "CPU" for node in report.nodes))
+            self.assertEqual(
+                {stats["op_type"] for stats in report.op_type_breakdown()}, {"GlobalAveragePool", "Flatten", "MatMul"}
+            )
+            self.assertIn("MatMul", report.summary())
+
+            report.save(os.path.join(tmpdir, "report.json"))
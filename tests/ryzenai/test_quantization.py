@@ -1,22 +1,31 @@
 # Copyright 2023 The HuggingFace Team. All rights reserved.
 # Licensed under the MIT License.
 
+import os
 import tempfile
 import unittest
 from functools import partial
+from pathlib import Path
 from typing import Dict
+from unittest.mock import patch
 
+import numpy as np
+import onnx
 import pytest
 import timm
 import torch
-from datasets import load_dataset
+import vai_q_onnx
+from datasets import Dataset, IterableDataset, load_dataset
+from onnx import numpy_helper
 from parameterized import parameterized
+from PIL import Image
 from testing_utils import (
     DEFAULT_CACHE_DIR,
     DEFAULT_VAIP_CONFIG,
     PYTORCH_TIMM_MODEL,
     PYTORCH_TIMM_MODEL_SUBSET,
     RyzenAITestCaseMixin,
+    make_conv_model,
 )
 
 from optimum.amd.ryzenai import (
@@ -152,3 +161,176 @@ class TestTimmQuantization(unittest.TestCase, RyzenAITestCaseMixin):
         task: str,
     ):
         self._quantize(model_name=model_name)
+
+
+def _preprocess_image(example):
+    pixel_values = np.asarray(example["image"].convert("RGB"), dtype=np.float32) / 255
+    return {"pixel_values": pixel_values.transpose(2, 0, 1)}
+
+
+class RyzenAICalibrationDatasetTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.dataset_dir = os.path.join(self.tmpdir.name, "images")
+        os.makedirs(os.path.join(self.dataset_dir, "train"))
+        for index in range(10):
+            image = Image.fromarray((np.random.rand(8, 8, 3) * 255).astype(np.uint8))
+            image.save(os.path.join(self.dataset_dir, "train", f"{index}.png"))
+
+        model_path = os.path.join(self.tmpdir.name, "model.onnx")
+        make_conv_model(model_path)
+        self.quantizer = RyzenAIOnnxQuantizer(Path(model_path), config=PretrainedConfig())
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_streaming(self):
+        cache_dir = os.path.join(self.tmpdir.name, "cache")
+        kwargs = {
+            "num_samples": 4,
+            "dataset_split": "train",
+            "preprocess_function": _preprocess_image,
+            "preprocess_batch": False,
+            "streaming": True,
+            "num_proc": 2,
+            "cache_dir": cache_dir,
+        }
+
+        calibration_dataset = self.quantizer.get_calibration_dataset(self.dataset_dir, **kwargs)
+        self.assertIsInstance(calibration_dataset, Dataset)
+        self.assertEqual(calibration_dataset.column_names, ["pixel_values"])
+        self.assertEqual(np.asarray(calibration_dataset.with_format("numpy")["pixel_values"]).shape, (4, 3, 8, 8))
+        self.assertEqual(len(os.listdir(cache_dir)), 1)
+
+        # The drawn samples are cached and embedded, the source images are not read again.
+        for file_name in os.listdir(os.path.join(self.dataset_dir, "train")):
+            os.remove(os.path.join(self.dataset_dir, "train", file_name))
+        cached_dataset = self.quantizer.get_calibration_dataset(self.dataset_dir, **kwargs)
+        self.assertTrue(
+            np.array_equal(
+                cached_dataset.with_format("numpy")["pixel_values"],
+                calibration_dataset.with_format("numpy")["pixel_values"],
+            )
+        )
+
+    def test_non_streaming(self):
+        calibration_dataset = self.quantizer.get_calibration_dataset(
+            self.dataset_dir,
+            num_samples=4,
+            dataset_split="train",
+            preprocess_function=_preprocess_image,
+            preprocess_batch=False,
+            num_proc=2,
+        )
+        self.assertEqual(calibration_dataset.num_rows, 4)
+        self.assertEqual(calibration_dataset.column_names, ["pixel_values"])
+
+    def test_identify_unused_columns(self):
+        dataset = Dataset.from_dict({"pixel_values": np.zeros((2, 3, 8, 8)), "label": [0, 1]})
+
+        def generate():
+            yield from dataset
+
+        self.assertEqual(self.quantizer.identify_unused_columns(dataset.to_iterable_dataset()), ["label"])
+        iterable_dataset = IterableDataset.from_generator(generate)
+        self.assertEqual(self.quantizer.identify_unused_columns(iterable_dataset), ["label"])
+
+
+def _get_qdq_parameters(model_path):
+    model = onnx.load(model_path)
+    initializers = {initializer.name: numpy_helper.to_array(initializer) for initializer in model.graph.initializer}
+    return {
+        node.input[0]: (initializers[node.input[1]], initializers[node.input[2]])
+        for node in model.graph.node
+        if node.op_type == "QuantizeLinear" and node.input[0] not in initializers
+    }
+
+
+class RyzenAIShardedQuantizationTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        model_path = os.path.join(self.tmpdir.name, "model.onnx")
+        make_conv_model(model_path)
+        self.quantizer = RyzenAIOnnxQuantizer(Path(model_path), config=PretrainedConfig())
+        self.dataset = Dataset.from_dict({"pixel_values": np.random.randn(11, 3, 8, 8).astype(np.float32)})
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _quantize_serial_and_sharded(self, quantization_config):
+        # With one worker, the model is calibrated by vai_q_onnx. With two, the ranges are computed on sharded
+        # calibration statistics and passed to vai_q_onnx.
+        parameters = {}
+        for num_workers in (1, 2):
+            save_dir = os.path.join(self.tmpdir.name, f"quantized_{num_workers}")
+            self.quantizer.quantize(quantization_config, self.dataset, save_dir, batch_size=2, num_workers=num_workers)
+            parameters[num_workers] = _get_qdq_parameters(os.path.join(save_dir, "model_quantized.onnx"))
+        return parameters
+
+    def _assert_same_parameters(self, parameters):
+        self.assertGreater(len(parameters[1]), 0)
+        self.assertEqual(parameters[1].keys(), parameters[2].keys())
+        for name, (scale, zero_point) in parameters[1].items():
+            np.testing.assert_allclose(parameters[2][name][0], scale, rtol=1e-6, err_msg=name)
+            np.testing.assert_array_equal(parameters[2][name][1], zero_point, err_msg=name)
+
+    @parameterized.expand(
+        [
+            ("minmax", vai_q_onnx.CalibrationMethod.MinMax),
+            ("nonoverflow", vai_q_onnx.PowerOfTwoMethod.NonOverflow),
+        ]
+    )
+    def test_sharded_matches_serial(self, _, calibration_method):
+        if calibration_method == vai_q_onnx.PowerOfTwoMethod.NonOverflow:
+            quantization_config = AutoQuantizationConfig.ipu_cnn_config()
+        else:
+            quantization_config = AutoQuantizationConfig.cpu_cnn_config(use_symmetric_activations=True)
+        quantization_config.calibration_method = calibration_method
+
+        self._assert_same_parameters(self._quantize_serial_and_sharded(quantization_config))
+
+    def test_missing_range_fallback(self):
+        quantization_config = AutoQuantizationConfig.cpu_cnn_config()
+        compute_calibration_tensors_range = self.quantizer.compute_calibration_tensors_range
+
+        def compute_partial_tensors_range(*args, **kwargs):
+            tensors_range = compute_calibration_tensors_range(*args, **kwargs)
+            # As for an activation renamed by the graph optimizations of vai_q_onnx.
+            del tensors_range["relu"]
+            return tensors_range
+
+        with patch.object(self.quantizer, "compute_calibration_tensors_range", compute_partial_tensors_range):
+            with self.assertLogs("optimum.amd.ryzenai.quantization", level="WARNING"):
+                parameters = self._quantize_serial_and_sharded(quantization_config)
+        self._assert_same_parameters(parameters)
+
+        # Explicitly passed ranges are never replaced.
+        tensors_range = compute_partial_tensors_range(quantization_config, self.dataset, batch_size=2)
+        with self.assertRaisesRegex(ValueError, "no precomputed range"):
+            self.quantizer.quantize(
+                quantization_config,
+                self.dataset,
+                os.path.join(self.tmpdir.name, "quantized"),
+                calibration_tensors_range=tensors_range,
+            )
+
+    @parameterized.expand(
+        [
+            ("percentile", vai_q_onnx.CalibrationMethod.Percentile),
+            ("minmse", vai_q_onnx.PowerOfTwoMethod.MinMSE),
+            ("entropy", vai_q_onnx.CalibrationMethod.Entropy),
+        ]
+    )
+    def test_unsupported_method_fallback(self, _, calibration_method):
+        quantization_config = AutoQuantizationConfig.cpu_cnn_config()
+        quantization_config.calibration_method = calibration_method
+        cache_dir = os.path.join(self.tmpdir.name, "cache")
+        save_dir = os.path.join(self.tmpdir.name, "quantized")
+
+        # The method is not supported by the cached calibration, vai_q_onnx calibrates the model.
+        with self.assertLogs("optimum.amd.ryzenai.quantization", level="WARNING"):
+            self.quantizer.quantize(
+                quantization_config, self.dataset, save_dir, batch_size=1, calibration_cache_dir=cache_dir
+            )
+        self.assertGreater(len(_get_qdq_parameters(os.path.join(save_dir, "model_quantized.onnx"))), 0)
+        self.assertFalse(os.path.exists(cache_dir))
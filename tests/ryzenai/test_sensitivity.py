@@ -0,0 +1,127 @@
+# Copyright 2024 The HuggingFace Team. All rights reserved.
+# Licensed under the MIT License.
+
+import os
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np
+import onnx
+import onnxruntime
+from datasets import Dataset
+from onnx import TensorProto, helper, numpy_helper
+
+from optimum.amd.ryzenai import AutoQuantizationConfig, RyzenAIOnnxQuantizer, RyzenAISensitivityReport
+from optimum.amd.ryzenai.sensitivity import (
+    RyzenAILayerSensitivity,
+    analyze_quantization_sensitivity,
+    get_qdq_activation_pairs,
+    quantize_mixed_precision,
+)
+from transformers import PretrainedConfig
+
+
+def _make_two_conv_model(model_path):
+    conv1 = numpy_helper.from_array(np.random.randn(8, 3, 3, 3).astype(np.float32), name="conv1.weight")
+    # A wide weight range makes the second convolution the most sensitive to quantization.
+    weight = np.random.randn(4, 8, 3, 3).astype(np.float32)
+    weight[0, 0, 0, 0] = 100.0
+    conv2 = numpy_helper.from_array(weight, name="conv2.weight")
+    graph = helper.make_graph(
+        [
+            helper.make_node("Conv", ["pixel_values", "conv1.weight"], ["conv1"], name="Conv_1", pads=[1, 1, 1, 1]),
+            helper.make_node("Relu", ["conv1"], ["relu1"], name="Relu_1"),
+            helper.make_node("Conv", ["relu1", "conv2.weight"], ["conv2"], name="Conv_2", pads=[1, 1, 1, 1]),
+            helper.make_node("GlobalAveragePool", ["conv2"], ["logits"], name="GlobalAveragePool_1"),
+        ],
+        "two_conv",
+        inputs=[helper.make_tensor_value_info("pixel_values", TensorProto.FLOAT, ["batch_size", 3, 8, 8])],
+        outputs=[helper.make_tensor_value_info("logits", TensorProto.FLOAT, ["batch_size", 4, 1, 1])],
+        initializer=[conv1, conv2],
+    )
+    onnx.save(helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)], ir_version=8), model_path)
+
+
+class RyzenAISensitivityTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.float_model_path = os.path.join(self.tmpdir.name, "model.onnx")
+        _make_two_conv_model(self.float_model_path)
+
+        self.dataset = Dataset.from_dict({"pixel_values": np.random.randn(6, 3, 8, 8).astype(np.float32)})
+        self.quantizer = RyzenAIOnnxQuantizer(Path(self.float_model_path), config=PretrainedConfig())
+        self.quantization_config = AutoQuantizationConfig.cpu_cnn_config()
+        self.tensors_range = self.quantizer.compute_calibration_tensors_range(self.quantization_config, self.dataset)
+
+        quantized_dir = self.quantizer.quantize(
+            self.quantization_config,
+            self.dataset,
+            os.path.join(self.tmpdir.name, "quantized"),
+            calibration_tensors_range=self.tensors_range,
+        )
+        self.quantized_model_path = os.path.join(quantized_dir, "model_quantized.onnx")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _run(self, model_path):
+        session = onnxruntime.InferenceSession(model_path, providers=["CPUExecutionProvider"])
+        return session.run(None, {"pixel_values": np.asarray(self.dataset["pixel_values"], dtype=np.float32)})[0]
+
+    def test_analyze(self):
+        pairs = get_qdq_activation_pairs(onnx.load(self.quantized_model_path))
+        self.assertIn("pixel_values", pairs)
+
+        report = analyze_quantization_sensitivity(
+            self.float_model_path, self.quantized_model_path, self.dataset, batch_size=4
+        )
+        self.assertIsInstance(report, RyzenAISensitivityReport)
+        self.assertEqual(report.num_samples, 6)
+        self.assertEqual(report.layers[0].node_names, ["Conv_2"])
+        degradations = [layer.degradation_db for layer in report.layers]
+        self.assertEqual(degradations, sorted(degradations, reverse=True))
+
+        # Capturing the activations in several passes gives the same results.
+        chunked = analyze_quantization_sensitivity(
+            self.float_model_path, self.quantized_model_path, self.dataset, batch_size=4, num_tensors_per_run=1
+        )
+        self.assertEqual(
+            [(layer.tensor_name, round(layer.sqnr_db, 6)) for layer in chunked.layers],
+            [(layer.tensor_name, round(layer.sqnr_db, 6)) for layer in report.layers],
+        )
+
+        report.save(os.path.join(self.tmpdir.name, "sensitivity.json"))
+        self.assertIn("Conv", report.summary())
+
+    def test_degradation_float_inputs(self):
+        def layer(sqnr_db, input_sqnr_db):
+            return RyzenAILayerSensitivity("tensor", ["node"], ["Conv"], sqnr_db=sqnr_db, input_sqnr_db=input_sqnr_db)
+
+        # Layers without quantized inputs are not ranked before the layers adding a larger error.
+        self.assertEqual(layer(30.0, float("inf")).degradation_db, -30.0)
+        self.assertGreater(layer(25.0, 40.0).degradation_db, layer(30.0, float("inf")).degradation_db)
+        self.assertEqual(layer(float("inf"), float("inf")).degradation_db, 0.0)
+        self.assertEqual(layer(float("inf"), 40.0).degradation_db, 0.0)
+
+    def test_quantize_mixed_precision(self):
+        report = analyze_quantization_sensitivity(self.float_model_path, self.quantized_model_path, self.dataset)
+        mixed_dir = quantize_mixed_precision(
+            self.quantizer,
+            self.quantization_config,
+            report,
+            os.path.join(self.tmpdir.name, "mixed"),
+            top_k=1,
+            calibration_tensors_range=self.tensors_range,
+        )
+        mixed_model_path = os.path.join(mixed_dir, "model_mixed_precision.onnx")
+
+        # The weights of the excluded convolution are not quantized anymore.
+        mixed_model = onnx.load(mixed_model_path)
+        conv2 = next(node for node in mixed_model.graph.node if node.name == "Conv_2")
+        self.assertEqual(conv2.input[1], "conv2.weight")
+
+        reference = self._run(self.float_model_path)
+        quantized_error = np.abs(self._run(self.quantized_model_path) - reference).mean()
+        mixed_error = np.abs(self._run(mixed_model_path) - reference).mean()
+        self.assertLess(mixed_error, quantized_error)
@@ -0,0 +1,116 @@
+# Copyright 2024 The HuggingFace Team. All rights reserved.
+# Licensed under the MIT License.
+
+import os
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np
+from datasets import Dataset
+from onnxruntime.quantization import CalibrationMethod
+from testing_utils import make_conv_model
+
+from optimum.amd.ryzenai import AutoQuantizationConfig, RyzenAIOnnxQuantizer, RyzenAISweepReport, RyzenAISweepResult
+from optimum.amd.ryzenai.sweep import compute_proxy_metrics, quantization_config_grid
+from transformers import PretrainedConfig
+
+
+class RyzenAISweepReportTest(unittest.TestCase):
+    def test_compute_proxy_metrics(self):
+        reference = [[np.random.randn(4, 10).astype(np.float32)] for _ in range(2)]
+
+        cosine_similarity, sqnr_db = compute_proxy_metrics(reference, reference)
+        self.assertAlmostEqual(cosine_similarity, 1.0)
+        self.assertEqual(sqnr_db, float("inf"))
+
+        noisy = [[batch[0] + 0.1 * np.std(batch[0])] for batch in reference]
+        cosine_similarity, sqnr_db = compute_proxy_metrics(reference, noisy)
+        self.assertLess(cosine_similarity, 1.0)
+        signal = sum(float(np.sum(batch[0].astype(np.float64) ** 2)) for batch in reference)
+        noise = sum(float(np.sum((0.1 * np.std(batch[0])) ** 2) * batch[0].size) for batch in reference)
+        self.assertAlmostEqual(sqnr_db, 10 * np.log10(signal / noise), places=3)
+
+    def test_pareto_front(self):
+        config = AutoQuantizationConfig.cpu_cnn_config()
+        report = RyzenAISweepReport(
+            results=[
+                RyzenAISweepResult("slow_accurate", config, cosine_similarity=0.999, latency_ms=3.0),
+                RyzenAISweepResult("fast", config, cosine_similarity=0.99, latency_ms=1.0),
+                RyzenAISweepResult("dominated", config, cosine_similarity=0.98, latency_ms=2.0),
+                RyzenAISweepResult("pruned", config, cosine_similarity=0.5, pruned=True),
+            ]
+        )
+
+        self.assertEqual([result.name for result in report.pareto_front()], ["fast", "slow_accurate"])
+        self.assertIn("pruned", report.summary())
+
+    def test_config_grid(self):
+        grid = quantization_config_grid(
+            AutoQuantizationConfig.cpu_cnn_config(),
+            calibration_method=[CalibrationMethod.MinMax, CalibrationMethod.Percentile],
+            activations_symmetric=[False, True],
+        )
+
+        self.assertEqual(len(grid), 4)
+        config = grid["calibration_method=Percentile,activations_symmetric=True"]
+        self.assertEqual(config.calibration_method, CalibrationMethod.Percentile)
+        self.assertTrue(config.activations_symmetric)
+
+
+class RyzenAIQuantizationSweepTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        model_path = os.path.join(self.tmpdir.name, "model.onnx")
+        make_conv_model(model_path)
+
+        self.quantizer = RyzenAIOnnxQuantizer(Path(model_path), config=PretrainedConfig())
+        self.calibration_dataset = Dataset.from_dict({"pixel_values": np.random.randn(8, 3, 8, 8).astype(np.float32)})
+        self.evaluation_dataset = Dataset.from_dict({"pixel_values": np.random.randn(6, 3, 8, 8).astype(np.float32)})
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_sweep(self):
+        configs = quantization_config_grid(
+            AutoQuantizationConfig.cpu_cnn_config(),
+            calibration_method=[CalibrationMethod.MinMax, CalibrationMethod.Percentile],
+            activations_symmetric=[False, True],
+        )
+        save_dir = os.path.join(self.tmpdir.name, "sweep")
+
+        report = self.quantizer.sweep(
+            configs, self.calibration_dataset, self.evaluation_dataset, save_dir, batch_size=2, num_workers=2
+        )
+
+        self.assertEqual([result.name for result in report.results], list(configs))
+        for result in report.results:
+            self.assertIsNone(result.error)
+            self.assertFalse(result.pruned)
+            self.assertEqual(result.num_evaluated_batches, 3)
+            self.assertGreater(result.cosine_similarity, 0.9)
+            self.assertGreater(result.latency_ms, 0)
+            self.assertTrue(os.path.isfile(result.model_path))
+
+        self.assertGreater(len(report.pareto_front()), 0)
+        self.assertTrue(os.path.isfile(os.path.join(save_dir, "sweep_report.json")))
+
+        # The calibration statistics are cached, and every configuration is pruned after the first batch.
+        report = self.quantizer.sweep(
+            configs, self.calibration_dataset, self.evaluation_dataset, save_dir, batch_size=2, min_sqnr_db=1000
+        )
+        self.assertTrue(all(result.pruned and result.num_evaluated_batches == 1 for result in report.results))
+        self.assertTrue(all(result.latency_ms is None for result in report.results))
+        self.assertEqual(report.pareto_front(), [])
+
+    def test_sweep_calibration_error(self):
+        configs = quantization_config_grid(
+            AutoQuantizationConfig.cpu_cnn_config(), calibration_method=[CalibrationMethod.MinMax]
+        )
+        calibration_dataset = Dataset.from_dict({"pixel_values": np.random.randn(8, 3, 4, 4).astype(np.float32)})
+
+        # Calibration errors are raised instead of being reported as a failed configuration.
+        with self.assertRaises(Exception):
+            self.quantizer.sweep(
+                configs, calibration_dataset, self.evaluation_dataset, os.path.join(self.tmpdir.name, "sweep")
+            )
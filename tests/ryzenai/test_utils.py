@@ -0,0 +1,227 @@
+# Copyright 2024 The HuggingFace Team. All rights reserved.
+# Licensed under the MIT License.
+
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+import onnx
+from onnx import TensorProto, helper, numpy_helper
+from testing_utils import make_matmul_model
+
+from optimum.amd.ryzenai.modeling import (
+    RyzenAIModel,
+    RyzenAIModelForImageClassification,
+    RyzenAIShapeBucketedModel,
+    _get_numpy_dtype,
+)
+from optimum.amd.ryzenai.utils import get_onnx_graph_io
+from transformers import PretrainedConfig
+
+
+class OnnxGraphIOTest(unittest.TestCase):
+    def test_graph_io(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            model_path = os.path.join(tmpdir, "model.onnx")
+            onnx.save(make_matmul_model(), model_path)
+
+            graph_io = get_onnx_graph_io(model_path)
+            self.assertEqual([inp.name for inp in graph_io.inputs], ["pixel_values"])
+            self.assertEqual([out.name for out in graph_io.outputs], ["logits"])
+            self.assertEqual(graph_io.inputs[0].type.tensor_type.shape.dim[0].dim_param, "batch_size")
+
+    def test_graph_io_external_data(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            model_path = os.path.join(tmpdir, "model.onnx")
+            onnx.save(
+                make_matmul_model(),
+                model_path,
+                save_as_external_data=True,
+                location="model.onnx_data",
+                size_threshold=0,
+            )
+            # The external data is never read.
+            os.remove(os.path.join(tmpdir, "model.onnx_data"))
+
+            graph_io = get_onnx_graph_io(model_path)
+            self.assertEqual([inp.name for inp in graph_io.inputs], ["pixel_values"])
+
+    def test_graph_io_cache_invalidation(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            model_path = os.path.join(tmpdir, "model.onnx")
+            onnx.save(make_matmul_model(hidden_dim=16), model_path)
+            graph_io = get_onnx_graph_io(model_path)
+            self.assertIs(graph_io, get_onnx_graph_io(model_path))
+
+            onnx.save(make_matmul_model(hidden_dim=32), model_path)
+            stat = os.stat(model_path)
+            os.utime(model_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+            graph_io = get_onnx_graph_io(model_path)
+            self.assertEqual(graph_io.inputs[0].type.tensor_type.shape.dim[1].dim_value, 32)
+
+    def test_check_uses_static_shape(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            model_path = os.path.join(tmpdir, "model.onnx")
+            onnx.save(make_matmul_model(), model_path)
+            self.assertFalse(RyzenAIModel._check_uses_static_shape(model_path))
+
+            onnx.save(make_matmul_model(dynamic_hidden_dim=True), model_path)
+            stat = os.stat(model_path)
+            os.utime(model_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+            self.assertTrue(RyzenAIModel._check_uses_static_shape(model_path))
+
+            onnx.save(make_matmul_model(dynamic_output_dim=True), model_path)
+            os.utime(model_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 2_000_000_000))
+            self.assertTrue(RyzenAIModel._check_uses_static_shape(model_path))
+
+
+class RyzenAIShapeBucketedModelTest(unittest.TestCase):
+    def test_bucket_routing_and_padding(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            model_path = os.path.join(tmpdir, "model.onnx")
+            model = make_matmul_model(dynamic_hidden_dim=False)
+            onnx.save(model, model_path)
+            weight = numpy_helper.to_array(model.graph.initializer[0])
+
+            bucketed = RyzenAIShapeBucketedModel(
+                model_path, buckets=[(4, 16), (1, 16)], provider="CPUExecutionProvider", max_sessions=1
+            )
+            self.assertEqual(bucketed.select_bucket({"pixel_values": (3, 16)}), {"pixel_values": (4, 16)})
+            self.assertEqual(bucketed.select_bucket({"pixel_values": (1, 16)}), {"pixel_values": (1, 16)})
+            with self.assertRaises(ValueError):
+                bucketed.select_bucket({"pixel_values": (5, 16)})
+
+            inputs = np.random.rand(3, 16).astype(np.float32)
+            logits = bucketed(pixel_values=inputs)["logits"]
+            self.assertEqual(logits.shape, (3, 8))
+            self.assertTrue(np.allclose(logits, inputs @ weight, atol=1e-5))
+
+            static_model_path = bucketed.get_static_model_path({"pixel_values": (4, 16)})
+            static_inputs = get_onnx_graph_io(static_model_path).inputs
+            self.assertFalse(RyzenAIModel._check_uses_static_shape(static_model_path))
+            self.assertEqual(static_inputs[0].type.tensor_type.shape.dim[0].dim_value, 4)
+
+            # The least recently used session is released, and the static model is reused rather than rebuilt.
+            mtime = os.stat(static_model_path).st_mtime_ns
+            bucketed(pixel_values=inputs[:1])
+            self.assertEqual(len(bucketed._sessions), 1)
+            bucketed(pixel_values=inputs)
+            self.assertEqual(os.stat(static_model_path).st_mtime_ns, mtime)
+            self.assertEqual(len([f for f in os.listdir(tmpdir) if f.startswith("model_static_")]), 2)
+
+    def test_crop_padded_axes(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            model_path = os.path.join(tmpdir, "model.onnx")
+            shape = ["batch_size", "sequence_length", 4]
+            graph = helper.make_graph(
+                [helper.make_node("Relu", ["input_ids"], ["hidden_states"])],
+                "relu",
+                inputs=[helper.make_tensor_value_info("input_ids", TensorProto.FLOAT, shape)],
+                outputs=[helper.make_tensor_value_info("hidden_states", TensorProto.FLOAT, shape)],
+            )
+            onnx.save(helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)], ir_version=8), model_path)
+
+            bucketed = RyzenAIShapeBucketedModel(model_path, buckets=[(2, 8, 4)], provider="CPUExecutionProvider")
+            inputs = np.random.randn(1, 5, 4).astype(np.float32)
+            hidden_states = bucketed(input_ids=inputs)["hidden_states"]
+            self.assertEqual(hidden_states.shape, (1, 5, 4))
+            self.assertTrue(np.array_equal(hidden_states, np.maximum(inputs, 0)))
+
+    def test_external_data(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            model_path = os.path.join(tmpdir, "model.onnx")
+            model = make_matmul_model(hidden_dim=64)
+            weight = numpy_helper.to_array(model.graph.initializer[0])
+            onnx.save(model, model_path, save_as_external_data=True, location="model.onnx_data", size_threshold=0)
+
+            bucketed = RyzenAIShapeBucketedModel(model_path, buckets=[(4, 64)], provider="CPUExecutionProvider")
+            inputs = np.random.rand(3, 64).astype(np.float32)
+            self.assertTrue(np.allclose(bucketed(pixel_values=inputs)["logits"], inputs @ weight, atol=1e-5))
+
+            # The static model keeps its tensors in an external data file.
+            static_model_path = bucketed.get_static_model_path({"pixel_values": (4, 64)})
+            static_model = onnx.load(str(static_model_path), load_external_data=False)
+            self.assertEqual(static_model.graph.initializer[0].data_location, TensorProto.EXTERNAL)
+            self.assertTrue(os.path.exists(f"{static_model_path}_data"))
+
+            # The bucket hash changes with the external data of the model.
+            model.graph.initializer[0].CopyFrom(numpy_helper.from_array(weight + 1, name="weight"))
+            os.remove(os.path.join(tmpdir, "model.onnx_data"))
+            onnx.save(model, model_path, save_as_external_data=True, location="model.onnx_data", size_threshold=0)
+            updated = RyzenAIShapeBucketedModel(model_path, buckets=[(4, 64)], provider="CPUExecutionProvider")
+            self.assertNotEqual(updated.get_static_model_path({"pixel_values": (4, 64)}), static_model_path)
+
+
+class RyzenAIModelBatchingTest(unittest.TestCase):
+    def test_static_batch_splitting(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            model_path = os.path.join(tmpdir, "model.onnx")
+            model = make_matmul_model(batch_dim=2)
+            onnx.save(model, model_path)
+            weight = numpy_helper.to_array(model.graph.initializer[0])
+
+            session = RyzenAIModel.load_model(model_path, provider="CPUExecutionProvider")
+            ryzen_model = RyzenAIModelForImageClassification(session, config=PretrainedConfig())
+            self.assertEqual(ryzen_model.static_batch_size, 2)
+
+            # The batch is split in two full batches, and a padded one whose padding is cropped from the outputs.
+            inputs = np.random.rand(5, 16).astype(np.float32)
+            logits = ryzen_model(inputs).logits
+            self.assertEqual(logits.shape, (5, 8))
+            self.assertTrue(np.allclose(logits, inputs @ weight, atol=1e-5))
+            self.assertEqual(ryzen_model(inputs[:2]).logits.shape, (2, 8))
+
+            larger_model = ryzen_model.with_batch_size(4)
+            self.assertIsInstance(larger_model, RyzenAIModelForImageClassification)
+            self.assertEqual(larger_model.static_batch_size, 4)
+            self.assertEqual(larger_model.model_path.name, "model_batch_4.onnx")
+            self.assertTrue(np.allclose(larger_model(inputs).logits, logits, atol=1e-5))
+
+    def test_reshape_batch_size_external_data(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            model_path = os.path.join(tmpdir, "model.onnx")
+            model = make_matmul_model(batch_dim=2, hidden_dim=64)
+            weight = numpy_helper.to_array(model.graph.initializer[0])
+            onnx.save(model, model_path, save_as_external_data=True, location="model.onnx_data", size_threshold=0)
+
+            load = onnx.load
+
+            def load_graph(*args, **kwargs):
+                # The external data is copied, never loaded in memory.
+                self.assertFalse(kwargs.get("load_external_data", True))
+                return load(*args, **kwargs)
+
+            with patch("onnx.load", load_graph):
+                static_model_path = RyzenAIModel.reshape_batch_size(model_path, 4)
+            static_model = onnx.load(str(static_model_path), load_external_data=False)
+            self.assertEqual(static_model.graph.initializer[0].data_location, TensorProto.EXTERNAL)
+            self.assertTrue(os.path.exists(os.path.join(tmpdir, "model_batch_4.onnx_data")))
+
+            session = RyzenAIModel.load_model(static_model_path, provider="CPUExecutionProvider")
+            inputs = np.random.rand(4, 64).astype(np.float32)
+            self.assertTrue(np.allclose(session.run(None, {"pixel_values": inputs})[0], inputs @ weight, atol=1e-5))
+
+    def test_reshape_batch_size_initializer_inputs(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            model_path = os.path.join(tmpdir, "model.onnx")
+            model = make_matmul_model(batch_dim=2)
+            # The initializers may also be listed as graph inputs, as required below IR version 4.
+            model.graph.input.append(helper.make_tensor_value_info("weight", TensorProto.FLOAT, [16, 8]))
+            onnx.save(model, model_path)
+
+            static_model_path = RyzenAIModel.reshape_batch_size(model_path, 4)
+            static_inputs = get_onnx_graph_io(static_model_path).inputs
+            self.assertEqual([inp.type.tensor_type.shape.dim[0].dim_value for inp in static_inputs], [4, 16])
+
+            session = RyzenAIModel.load_model(static_model_path, provider="CPUExecutionProvider")
+            self.assertEqual(
+                session.run(None, {"pixel_values": np.random.rand(4, 16).astype(np.float32)})[0].shape, (4, 8)
+            )
+
+    def test_unknown_output_type(self):
+        self.assertEqual(_get_numpy_dtype("tensor(float)"), np.float32)
+        with self.assertRaises(ValueError):
+            _get_numpy_dtype("tensor(bfloat16)")
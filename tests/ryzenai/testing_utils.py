@@ -1,9 +1,13 @@
 # Copyright 2023 The HuggingFace Team. All rights reserved.
 # Licensed under the MIT License.
 
-import json
 import os
 
+import numpy as np
+import onnx
+from onnx import TensorProto, helper, numpy_helper
+
+from optimum.amd.ryzenai.operators import RyzenAIOperatorsReport, load_operators_baseline
 from transformers import set_seed
 
 
@@ -16,12 +20,56 @@ DEFAULT_VAIP_CONFIG = ".\\tests\\ryzenai\\vaip_config.json"
 
 
 def parse_json(json_path):
-    with open(json_path, "r") as json_file:
-        data = json.load(json_file)
-        result = {"all": 0, "dpu": 0, "cpu": 0}
-        for entry in data["deviceStat"]:
-            result[entry["name"].lower()] = entry["nodeNum"]
-        return result
+    return RyzenAIOperatorsReport.from_ep_report(json_path).num_nodes
+
+
+def make_conv_model(model_path):
+    weight = numpy_helper.from_array(np.random.randn(4, 3, 3, 3).astype(np.float32), name="weight")
+    graph = helper.make_graph(
+        [
+            helper.make_node("Conv", ["pixel_values", "weight"], ["conv"], pads=[1, 1, 1, 1]),
+            helper.make_node("Relu", ["conv"], ["relu"]),
+            helper.make_node("GlobalAveragePool", ["relu"], ["logits"]),
+        ],
+        "conv",
+        inputs=[helper.make_tensor_value_info("pixel_values", TensorProto.FLOAT, ["batch_size", 3, 8, 8])],
+        outputs=[helper.make_tensor_value_info("logits", TensorProto.FLOAT, ["batch_size", 4, 1, 1])],
+        initializer=[weight],
+    )
+    onnx.save(helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)], ir_version=8), model_path)
+
+
+def make_classification_model(model_path, height=8, width=8, num_labels=10):
+    weight = numpy_helper.from_array(np.random.rand(3, num_labels).astype(np.float32), name="weight")
+    graph = helper.make_graph(
+        [
+            helper.make_node("GlobalAveragePool", ["pixel_values"], ["pooled"]),
+            helper.make_node("Flatten", ["pooled"], ["flat"]),
+            helper.make_node("MatMul", ["flat", "weight"], ["logits"]),
+        ],
+        "classifier",
+        inputs=[helper.make_tensor_value_info("pixel_values", TensorProto.FLOAT, ["batch_size", 3, height, width])],
+        outputs=[helper.make_tensor_value_info("logits", TensorProto.FLOAT, ["batch_size", num_labels])],
+        initializer=[weight],
+    )
+    onnx.save(helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)], ir_version=8), model_path)
+
+
+def make_matmul_model(batch_dim="batch_size", hidden_dim=16, dynamic_hidden_dim=False, dynamic_output_dim=False):
+    weight = numpy_helper.from_array(np.random.rand(hidden_dim, 8).astype(np.float32), name="weight")
+    input_shape = [batch_dim, "hidden_size" if dynamic_hidden_dim else hidden_dim]
+    graph = helper.make_graph(
+        [helper.make_node("MatMul", ["pixel_values", "weight"], ["logits"])],
+        "matmul",
+        inputs=[helper.make_tensor_value_info("pixel_values", TensorProto.FLOAT, input_shape)],
+        outputs=[
+            helper.make_tensor_value_info(
+                "logits", TensorProto.FLOAT, [batch_dim, "num_labels" if dynamic_output_dim else 8]
+            )
+        ],
+        initializer=[weight],
+    )
+    return helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)], ir_version=8)
 
 
 class RyzenAITestCaseMixin:
@@ -92,9 +140,7 @@ class RyzenAITestCaseMixin:
         return result
 
     def get_baseline_ops(self, key):
-        with open(BASELINE_JSON, "r") as json_file:
-            data = json.load(json_file)
-            return data[key]
+        return load_operators_baseline(BASELINE_JSON)[key].num_nodes
 
 
 RYZEN_PREQUANTIZED_MODEL_IMAGE_CLASSIFICATION = [
@@ -0,0 +1,135 @@
+# Copyright 2024 The HuggingFace Team. All rights reserved.
+# Licensed under the MIT License.
+
+import argparse
+import math
+import time
+from itertools import combinations
+
+import numpy as np
+
+from optimum.amd.topology_utils import find_max_bandwidth_cluster, partition_bandwidth_clusters
+
+
+def make_hierarchical_bandwidth_matrix(num_devices, seed=0, noise=0.05):
+    """
+    A synthetic node where devices are paired on a package (dual-die, as MI250), packages are grouped by four with
+    Infinity Fabric links, and groups communicate through PCIe.
+    """
+    rng = np.random.default_rng(seed)
+    devices = np.arange(num_devices)
+    same_package = devices[:, None] // 2 == devices[None, :] // 2
+    same_group = devices[:, None] // 8 == devices[None, :] // 8
+
+    bandwidths = np.where(same_package, 200.0, np.where(same_group, 100.0, 50.0))
+    bandwidths = bandwidths * (1 + noise * rng.standard_normal((num_devices, num_devices)))
+    bandwidths = (bandwidths + bandwidths.T) / 2
+
+    # Shuffle the device indices so that the structure is not aligned with the enumeration order.
+    permutation = rng.permutation(num_devices)
+    bandwidths = bandwidths[np.ix_(permutation, permutation)]
+    np.fill_diagonal(bandwidths, np.inf)
+    return bandwidths.tolist()
+
+
+def make_random_bandwidth_matrix(num_devices, seed=0):
+    rng = np.random.default_rng(seed)
+    bandwidths = rng.uniform(25, 200, (num_devices, num_devices))
+    bandwidths = (bandwidths + bandwidths.T) / 2
+    np.fill_diagonal(bandwidths, np.inf)
+    return bandwidths.tolist()
+
+
+def enumerate_max_bandwidth_cluster(bandwidth_matrix, cluster_num_devices):
+    """
+    The reference exhaustive search over all the combinations of devices.
+    """
+    bandwidths = np.array(bandwidth_matrix)
+    np.fill_diagonal(bandwidths, 0)
+    best_cluster, best_total = None, -1
+    for cluster in combinations(range(len(bandwidths)), cluster_num_devices):
+        total = bandwidths[np.ix_(cluster, cluster)].sum()
+        if total > best_total:
+            best_cluster, best_total = list(cluster), total
+
+    return best_cluster, best_total
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the selection of high-bandwidth device clusters.")
+    parser.add_argument("--num-devices", type=int, nargs="+", default=[8, 16, 32, 64], help="Node sizes.")
+    parser.add_argument("--cluster-sizes", type=int, nargs="+", default=[2, 4, 8], help="Cluster sizes.")
+    parser.add_argument("--kind", choices=["hierarchical", "random"], default="hierarchical", help="Synthetic node.")
+    parser.add_argument("--seeds", type=int, default=3, help="Number of synthetic matrices per node size.")
+    parser.add_argument(
+        "--max-combinations", type=int, default=200_000, help="Largest search space of the exhaustive reference."
+    )
+    parser.add_argument("--max-exact-devices", type=int, default=32, help="Largest node size of the exact search.")
+    args = parser.parse_args()
+
+    make_matrix = make_hierarchical_bandwidth_matrix if args.kind == "hierarchical" else make_random_bandwidth_matrix
+
+    header = (
+        f"{'devices':>7} {'cluster':>7} {'enumerate (s)':>13} {'exact (s)':>10} {'greedy (s)':>10} {'greedy/best':>11}"
+    )
+    print(header)
+    print("-" * len(header))
+    for num_devices in args.num_devices:
+        for cluster_num_devices in args.cluster_sizes:
+            if cluster_num_devices > num_devices:
+                continue
+
+            timings = {"enumerate": [], "exact": [], "greedy": []}
+            ratios = []
+            for seed in range(args.seeds):
+                bandwidth_matrix = make_matrix(num_devices, seed=seed)
+
+                best_total = None
+                if math.comb(num_devices, cluster_num_devices) <= args.max_combinations:
+                    (_, best_total), duration = timed(
+                        enumerate_max_bandwidth_cluster, bandwidth_matrix, cluster_num_devices
+                    )
+                    timings["enumerate"].append(duration)
+                if num_devices <= args.max_exact_devices:
+                    (_, exact_total), duration = timed(
+                        find_max_bandwidth_cluster, bandwidth_matrix, cluster_num_devices, method="exact"
+                    )
+                    timings["exact"].append(duration)
+                    best_total = exact_total
+                (_, greedy_total), duration = timed(
+                    find_max_bandwidth_cluster, bandwidth_matrix, cluster_num_devices, method="greedy"
+                )
+                timings["greedy"].append(duration)
+                if best_total is not None:
+                    ratios.append(greedy_total / best_total)
+
+            columns = [f"{np.mean(timings[name]):.4f}" if timings[name] else "-" for name in timings]
+            ratio = f"{min(ratios):.4f}" if ratios else "-"
+            print(
+                f"{num_devices:>7} {cluster_num_devices:>7} {columns[0]:>13} {columns[1]:>10} {columns[2]:>10} "
+                f"{ratio:>11}"
+            )
+
+    print()
+    print(f"{'devices':>7} {'jobs':>12} {'partition (s)':>13} {'min avg bandwidth':>17}")
+    for num_devices in args.num_devices:
+        for cluster_num_devices in args.cluster_sizes:
+            if cluster_num_devices > num_devices:
+                continue
+            cluster_sizes = [cluster_num_devices] * (num_devices // cluster_num_devices)
+            bandwidth_matrix = np.array(make_matrix(num_devices))
+            clusters, duration = timed(partition_bandwidth_clusters, bandwidth_matrix.tolist(), cluster_sizes)
+            np.fill_diagonal(bandwidth_matrix, np.nan)
+            min_avg = min(np.nanmean(bandwidth_matrix[np.ix_(cluster, cluster)]) for cluster in clusters)
+            jobs = f"{len(cluster_sizes)}x{cluster_num_devices}"
+            print(f"{num_devices:>7} {jobs:>12} {duration:>13.4f} {min_avg:>17.1f}")
+
+
+if __name__ == "__main__":
+    main()
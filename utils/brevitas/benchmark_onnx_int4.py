@@ -0,0 +1,113 @@
+# Copyright 2024 The HuggingFace Team. All rights reserved.
+# Licensed under the MIT License.
+
+import argparse
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import onnxruntime
+import torch
+from brevitas.export.onnx.standard.qcdq.manager import StdQCDQONNXManager
+from brevitas_examples.llm.llm_quant.export import brevitas_proxy_export_mode
+
+from optimum.amd.brevitas import BrevitasQuantizationConfig, BrevitasQuantizer, pack_onnx_int4_weights
+from optimum.exporters.onnx import onnx_export_from_model
+
+
+def get_directory_size_mb(directory):
+    return sum(path.stat().st_size for path in Path(directory).iterdir() if path.is_file()) / 2**20
+
+
+def get_load_time(onnx_path, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        session = onnxruntime.InferenceSession(str(onnx_path), providers=["CPUExecutionProvider"])
+    return (time.perf_counter() - start) / iterations, session
+
+
+def get_latency(session, inputs, iterations):
+    session.run(None, inputs)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        logits = session.run(["logits"], inputs)[0]
+    return (time.perf_counter() - start) / iterations, logits
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the ONNX export of Brevitas models with packed 4-bit weights against the QCDQ export."
+    )
+    parser.add_argument("--model", type=str, default="facebook/opt-125m", help="Model to quantize.")
+    parser.add_argument(
+        "--weights-quant-granularity",
+        choices=["per_tensor", "per_channel", "per_group"],
+        default="per_group",
+        help="Granularity of the quantization of the weights.",
+    )
+    parser.add_argument("--weights-group-size", type=int, default=128, help="Group size of per-group quantization.")
+    parser.add_argument(
+        "--export-weight-q-node",
+        action="store_true",
+        help="Export the QCDQ weights as float initializers followed by QuantizeLinear, rather than as int8.",
+    )
+    parser.add_argument("--seqlens", type=int, nargs="+", default=[1, 128], help="Sequence lengths of the inputs.")
+    parser.add_argument("--iterations", type=int, default=10, help="Number of timed loads and inferences.")
+    args = parser.parse_args()
+
+    qconfig = BrevitasQuantizationConfig(
+        weights_bitwidth=4,
+        weights_quant_granularity=args.weights_quant_granularity,
+        weights_group_size=args.weights_group_size if args.weights_quant_granularity == "per_group" else None,
+        weights_only=True,
+        activations_equalization=None,
+    )
+    quantizer = BrevitasQuantizer.from_pretrained(args.model, device_map="cpu")
+    model = quantizer.quantize(qconfig).eval()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        qcdq_dir = Path(tmpdir) / "qcdq"
+        packed_dir = Path(tmpdir) / "int4"
+
+        export_manager = StdQCDQONNXManager
+        export_manager.change_weight_export(export_weight_q_node=args.export_weight_q_node)
+        with torch.no_grad(), brevitas_proxy_export_mode(model, export_manager=export_manager):
+            onnx_export_from_model(model, qcdq_dir, task="text-generation", do_validation=False, no_post_process=True)
+
+        shutil.copytree(qcdq_dir, packed_dir)
+        start = time.perf_counter()
+        num_packed = pack_onnx_int4_weights(packed_dir / "model.onnx")
+        packing_time = time.perf_counter() - start
+        print(f"Packed {num_packed} weights in {packing_time:.1f} s")
+
+        results = {}
+        for name, directory in [("qcdq", qcdq_dir), ("int4", packed_dir)]:
+            load_time, session = get_load_time(directory / "model.onnx", args.iterations)
+            latencies = {}
+            for seqlen in args.seqlens:
+                inputs = {
+                    "input_ids": np.random.default_rng(0).integers(0, quantizer.config.vocab_size, (1, seqlen)),
+                    "attention_mask": np.ones((1, seqlen), dtype=np.int64),
+                }
+                inputs = {input.name: inputs[input.name] for input in session.get_inputs() if input.name in inputs}
+                latencies[seqlen] = get_latency(session, inputs, args.iterations)
+            results[name] = (get_directory_size_mb(directory), load_time, latencies)
+
+    (qcdq_size, qcdq_load_time, qcdq_latencies), (int4_size, int4_load_time, int4_latencies) = results.values()
+    print(f"File size: QCDQ {qcdq_size:.1f} MiB, int4 {int4_size:.1f} MiB ({qcdq_size / int4_size:.2f}x smaller)")
+    print(f"Load time: QCDQ {qcdq_load_time * 1e3:.1f} ms, int4 {int4_load_time * 1e3:.1f} ms")
+    print(f"{'seqlen':>7} {'QCDQ (ms)':>10} {'int4 (ms)':>10} {'speedup':>8} {'max logits diff':>16}")
+    for seqlen in args.seqlens:
+        qcdq_latency, qcdq_logits = qcdq_latencies[seqlen]
+        int4_latency, int4_logits = int4_latencies[seqlen]
+        max_diff = np.abs(qcdq_logits - int4_logits).max()
+        print(
+            f"{seqlen:>7} {qcdq_latency * 1e3:>10.2f} {int4_latency * 1e3:>10.2f} "
+            f"{qcdq_latency / int4_latency:>8.2f} {max_diff:>16.4f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
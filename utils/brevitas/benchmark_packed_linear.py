@@ -0,0 +1,82 @@
+# Copyright 2024 The HuggingFace Team. All rights reserved.
+# Licensed under the MIT License.
+
+import argparse
+import time
+
+import torch
+
+from optimum.amd.brevitas import BrevitasQuantizationConfig, BrevitasQuantizer, pack_quantized_linears
+
+
+def get_model_size_mb(model):
+    tensors = {tensor.data_ptr(): tensor for tensor in list(model.parameters()) + list(model.buffers())}
+    return sum(tensor.numel() * tensor.element_size() for tensor in tensors.values()) / 2**20
+
+
+@torch.no_grad()
+def get_latency(model, input_ids, iterations):
+    model(input_ids=input_ids)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        logits = model(input_ids=input_ids)["logits"]
+    return (time.perf_counter() - start) / iterations, logits
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the packed integer linear layers against the fake-quantized layers of Brevitas on CPU."
+    )
+    parser.add_argument("--model", type=str, default="facebook/opt-125m", help="Model to quantize.")
+    parser.add_argument("--weights-bitwidth", type=int, default=4, help="Bit width of the weights.")
+    parser.add_argument(
+        "--weights-quant-granularity",
+        choices=["per_tensor", "per_channel", "per_group"],
+        default="per_group",
+        help="Granularity of the quantization of the weights.",
+    )
+    parser.add_argument("--weights-group-size", type=int, default=128, help="Group size of per-group quantization.")
+    parser.add_argument(
+        "--compute-dtype",
+        choices=["float32", "bfloat16"],
+        default="bfloat16",
+        help="Dtype of the matrix multiplications of the packed layers, `bfloat16` enables the int4 and int8 kernels.",
+    )
+    parser.add_argument("--seqlens", type=int, nargs="+", default=[1, 128], help="Sequence lengths of the inputs.")
+    parser.add_argument("--iterations", type=int, default=10, help="Number of timed forward passes.")
+    args = parser.parse_args()
+
+    qconfig = BrevitasQuantizationConfig(
+        weights_bitwidth=args.weights_bitwidth,
+        weights_quant_granularity=args.weights_quant_granularity,
+        weights_group_size=args.weights_group_size if args.weights_quant_granularity == "per_group" else None,
+        weights_only=True,
+        activations_equalization=None,
+    )
+    quantizer = BrevitasQuantizer.from_pretrained(args.model, device_map="cpu")
+    model = quantizer.quantize(qconfig).eval()
+
+    inputs = {seqlen: torch.randint(0, quantizer.config.vocab_size, (1, seqlen)) for seqlen in args.seqlens}
+    fake_quant_size = get_model_size_mb(model)
+    fake_quant_results = {
+        seqlen: get_latency(model, input_ids, args.iterations) for seqlen, input_ids in inputs.items()
+    }
+
+    model = pack_quantized_linears(model, compute_dtype=getattr(torch, args.compute_dtype))
+    packed_size = get_model_size_mb(model)
+    packed_results = {seqlen: get_latency(model, input_ids, args.iterations) for seqlen, input_ids in inputs.items()}
+
+    print(f"Model size: fake-quantized {fake_quant_size:.1f} MiB, packed {packed_size:.1f} MiB")
+    print(f"{'seqlen':>7} {'fake-quant (ms)':>16} {'packed (ms)':>12} {'speedup':>8} {'max logits diff':>16}")
+    for seqlen in args.seqlens:
+        fake_quant_latency, fake_quant_logits = fake_quant_results[seqlen]
+        packed_latency, packed_logits = packed_results[seqlen]
+        max_diff = (fake_quant_logits - packed_logits).abs().max().item()
+        print(
+            f"{seqlen:>7} {fake_quant_latency * 1e3:>16.2f} {packed_latency * 1e3:>12.2f} "
+            f"{fake_quant_latency / packed_latency:>8.2f} {max_diff:>16.4f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+# Copyright 2024 The HuggingFace Team. All rights reserved.
+# Licensed under the MIT License.
+
+import argparse
+import json
+import math
+import time
+
+import numpy as np
+
+from optimum.amd.ryzenai import RyzenAIDetectionPostprocessor
+from optimum.amd.ryzenai.processing import YOLO_DEFAULT_ANCHORS
+
+
+def sigmoid(x):
+    return 1 / (1 + math.exp(-x))
+
+
+def iou(box1, box2):
+    width = max(0.0, min(box1[2], box2[2]) - max(box1[0], box2[0]))
+    height = max(0.0, min(box1[3], box2[3]) - max(box1[1], box2[1]))
+    intersection = width * height
+    union = (box1[2] - box1[0]) * (box1[3] - box1[1]) + (box2[2] - box2[0]) * (box2[3] - box2[1]) - intersection
+    return intersection / union if union > 0 else 0.0
+
+
+def reference_yolov5(outputs, input_size, num_classes, score_threshold, iou_threshold, max_detections):
+    """
+    Per-box Python decoding and NMS, as commonly found in YOLOv5 inference scripts.
+    """
+    num_outputs = 5 + num_classes
+    outputs = sorted(outputs, key=lambda output: -output.shape[2] * output.shape[3])
+
+    candidates = []
+    for output, anchors in zip(outputs, YOLO_DEFAULT_ANCHORS):
+        _, _, height, width = output.shape
+        stride = input_size[0] / height
+        for anchor_index, (anchor_width, anchor_height) in enumerate(anchors):
+            for y in range(height):
+                for x in range(width):
+                    cell = [
+                        sigmoid(v)
+                        for v in output[0, anchor_index * num_outputs : (anchor_index + 1) * num_outputs, y, x]
+                    ]
+                    scores = [score * cell[4] for score in cell[5:]]
+                    label = max(range(num_classes), key=lambda i: scores[i])
+                    if scores[label] < score_threshold:
+                        continue
+                    center_x = (cell[0] * 2 - 0.5 + x) * stride
+                    center_y = (cell[1] * 2 - 0.5 + y) * stride
+                    box_width = (cell[2] * 2) ** 2 * anchor_width
+                    box_height = (cell[3] * 2) ** 2 * anchor_height
+                    box = [
+                        min(max(center_x - box_width / 2, 0), input_size[1]),
+                        min(max(center_y - box_height / 2, 0), input_size[0]),
+                        min(max(center_x + box_width / 2, 0), input_size[1]),
+                        min(max(center_y + box_height / 2, 0), input_size[0]),
+                    ]
+                    candidates.append((scores[label], label, box))
+
+    candidates.sort(key=lambda candidate: -candidate[0])
+    detections = []
+    for score, label, box in candidates:
+        if all(label != kept[1] or iou(box, kept[2]) <= iou_threshold for kept in detections):
+            detections.append((score, label, box))
+        if len(detections) == max_detections:
+            break
+    return detections
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the vectorized detection postprocessing against a per-box Python reference."
+    )
+    parser.add_argument("--input-size", type=int, default=640, help="Model input height and width.")
+    parser.add_argument("--num-classes", type=int, default=80, help="Number of classes.")
+    parser.add_argument("--score-threshold", type=float, default=0.25, help="Score threshold.")
+    parser.add_argument("--iou-threshold", type=float, default=0.45, help="NMS IoU threshold.")
+    parser.add_argument("--num-runs", type=int, default=10, help="Number of runs of the vectorized postprocessing.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the synthetic outputs.")
+    parser.add_argument("--output-json", type=str, default=None, help="Path to save the results as JSON.")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    input_size = (args.input_size, args.input_size)
+    outputs = [
+        rng.normal(
+            -2.0, 2.0, size=(1, 3 * (5 + args.num_classes), args.input_size // stride, args.input_size // stride)
+        ).astype(np.float32)
+        for stride in (8, 16, 32)
+    ]
+
+    postprocessor = RyzenAIDetectionPostprocessor(
+        "yolov5",
+        score_threshold=args.score_threshold,
+        iou_threshold=args.iou_threshold,
+        pre_nms_top_k=len(outputs[0].ravel()),
+        num_classes=args.num_classes,
+    )
+
+    start = time.perf_counter()
+    reference = reference_yolov5(
+        outputs, input_size, args.num_classes, args.score_threshold, args.iou_threshold, postprocessor.max_detections
+    )
+    reference_time = time.perf_counter() - start
+
+    postprocessor(outputs, input_size)
+    start = time.perf_counter()
+    for _ in range(args.num_runs):
+        detections = postprocessor(outputs, input_size)[0]
+    vectorized_time = (time.perf_counter() - start) / args.num_runs
+
+    matches = len(detections) == len(reference) and all(
+        label == detections.labels[i] and np.allclose(box, detections.boxes[i], atol=1e-3)
+        for i, (_, label, box) in enumerate(reference)
+    )
+
+    results = {
+        "num_detections": len(detections),
+        "matches_reference": bool(matches),
+        "reference_time_s": reference_time,
+        "vectorized_time_s": vectorized_time,
+        "speedup": reference_time / vectorized_time,
+    }
+    print(json.dumps(results, indent=2))
+
+    if args.output_json is not None:
+        with open(args.output_json, "w") as output_file:
+            json.dump(results, output_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
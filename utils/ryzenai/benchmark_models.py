@@ -0,0 +1,231 @@
+# Copyright 2024 The HuggingFace Team. All rights reserved.
+# Licensed under the MIT License.
+
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import onnx
+import onnxruntime as ort
+from onnx import TensorProto, helper, numpy_helper
+
+from optimum.amd.ryzenai import (
+    RyzenAIModelForCustomTasks,
+    RyzenAIModelForImageClassification,
+    RyzenAIModelForImageSegmentation,
+    RyzenAIModelForImageToImage,
+    RyzenAIModelForObjectDetection,
+)
+from optimum.amd.ryzenai.benchmark import RyzenAIBenchmarkReport, benchmark_model_path
+
+
+TASK_TO_MODEL_CLASS = {
+    "image-classification": RyzenAIModelForImageClassification,
+    "object-detection": RyzenAIModelForObjectDetection,
+    "image-segmentation": RyzenAIModelForImageSegmentation,
+    "image-to-image": RyzenAIModelForImageToImage,
+    "custom": RyzenAIModelForCustomTasks,
+}
+
+GRAPH_OPTIMIZATION_LEVELS = {
+    "disable": ort.GraphOptimizationLevel.ORT_DISABLE_ALL,
+    "basic": ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+    "extended": ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+    "all": ort.GraphOptimizationLevel.ORT_ENABLE_ALL,
+}
+
+
+def conv_block(nodes, initializers, rng, name, inputs, in_channels, out_channels, stride=1):
+    weight = numpy_helper.from_array(
+        (rng.standard_normal((out_channels, in_channels, 3, 3)) * 0.1).astype(np.float32), f"{name}.weight"
+    )
+    initializers.append(weight)
+    nodes.append(
+        helper.make_node(
+            "Conv", [inputs, weight.name], [f"{name}.conv"], name=name, pads=[1, 1, 1, 1], strides=[stride, stride]
+        )
+    )
+    nodes.append(helper.make_node("Relu", [f"{name}.conv"], [f"{name}.relu"], name=f"{name}_relu"))
+    return f"{name}.relu"
+
+
+def make_synthetic_model(task, image_size=224, width=32, seed=0):
+    """
+    A small convolutional stand-in of the prequantized models of a task, with a dynamic batch size.
+    """
+    rng = np.random.default_rng(seed)
+    nodes, initializers = [], []
+
+    features = "pixel_values"
+    channels = 3
+    feature_maps = []
+    for stage in range(4):
+        features = conv_block(nodes, initializers, rng, f"stage{stage}", features, channels, width * 2**stage, 2)
+        channels = width * 2**stage
+        feature_maps.append((features, channels, image_size // 2 ** (stage + 1)))
+
+    outputs = []
+    if task == "image-classification":
+        nodes.append(helper.make_node("GlobalAveragePool", [features], ["pooled"]))
+        nodes.append(helper.make_node("Flatten", ["pooled"], ["flat"]))
+        weight = numpy_helper.from_array(rng.standard_normal((channels, 1000)).astype(np.float32), "classifier")
+        initializers.append(weight)
+        nodes.append(helper.make_node("MatMul", ["flat", "classifier"], ["logits"]))
+        outputs.append(helper.make_tensor_value_info("logits", TensorProto.FLOAT, ["batch_size", 1000]))
+    elif task == "object-detection":
+        # One detection head per stride, as in YOLO models.
+        for idx, (feature, feature_channels, size) in enumerate(feature_maps[1:]):
+            head = f"head{idx}"
+            weight = numpy_helper.from_array(
+                rng.standard_normal((255, feature_channels, 1, 1)).astype(np.float32), f"{head}.weight"
+            )
+            initializers.append(weight)
+            nodes.append(helper.make_node("Conv", [feature, weight.name], [head]))
+            outputs.append(helper.make_tensor_value_info(head, TensorProto.FLOAT, ["batch_size", 255, size, size]))
+    else:
+        num_classes = 3 if task == "image-to-image" else 19
+        weight = numpy_helper.from_array(
+            rng.standard_normal((num_classes, channels, 1, 1)).astype(np.float32), "decoder.weight"
+        )
+        scales = numpy_helper.from_array(np.array([1, 1, 16, 16], dtype=np.float32), "decoder.scales")
+        initializers.extend([weight, scales])
+        nodes.append(helper.make_node("Conv", [features, weight.name], ["decoder"]))
+        nodes.append(helper.make_node("Resize", ["decoder", "", "decoder.scales"], ["output"], mode="linear"))
+        outputs.append(
+            helper.make_tensor_value_info(
+                "output", TensorProto.FLOAT, ["batch_size", num_classes, image_size, image_size]
+            )
+        )
+
+    graph = helper.make_graph(
+        nodes,
+        f"synthetic_{task}",
+        inputs=[
+            helper.make_tensor_value_info("pixel_values", TensorProto.FLOAT, ["batch_size", 3, image_size, image_size])
+        ],
+        outputs=outputs,
+        initializer=initializers,
+    )
+    return helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)], ir_version=8)
+
+
+def run_model_benchmark(model_path, task, model_name, args):
+    session_options = {
+        "graph_optimization_level": GRAPH_OPTIMIZATION_LEVELS[args.graph_optimization_level],
+        "execution_mode": ort.ExecutionMode.ORT_PARALLEL
+        if args.parallel_execution
+        else ort.ExecutionMode.ORT_SEQUENTIAL,
+    }
+    return benchmark_model_path(
+        model_path,
+        TASK_TO_MODEL_CLASS[task],
+        model_name=model_name,
+        batch_sizes=args.batch_sizes,
+        num_threads=args.num_threads,
+        num_runs=args.num_runs,
+        num_warmup_runs=args.num_warmup_runs,
+        session_options=session_options,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the latency, throughput, load time and memory of RyzenAIModel classes."
+    )
+    parser.add_argument(
+        "--model",
+        action="append",
+        default=[],
+        metavar="MODEL_ID:TASK",
+        help="A Hub model or local ONNX file to benchmark, with its task, e.g. amd/resnet50:image-classification.",
+    )
+    parser.add_argument(
+        "--synthetic",
+        nargs="*",
+        default=None,
+        choices=[task for task in TASK_TO_MODEL_CLASS if task != "custom"],
+        help="Tasks to benchmark synthetic stand-in models for. Defaults to all tasks when no --model is given.",
+    )
+    parser.add_argument("--image-size", type=int, default=224, help="Input size of the synthetic models.")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 4], help="Batch sizes.")
+    parser.add_argument(
+        "--num-threads", type=int, nargs="+", default=[0], help="Intra-op thread counts, 0 for the default."
+    )
+    parser.add_argument("--num-runs", type=int, default=100, help="Number of measured runs.")
+    parser.add_argument("--num-warmup-runs", type=int, default=10, help="Number of warmup runs.")
+    parser.add_argument(
+        "--graph-optimization-level",
+        choices=list(GRAPH_OPTIMIZATION_LEVELS),
+        default="all",
+        help="Graph optimizations.",
+    )
+    parser.add_argument("--parallel-execution", action="store_true", help="Use the parallel execution mode.")
+    parser.add_argument("--output-json", type=str, default=None, help="Path to save the results as JSON.")
+    parser.add_argument("--include-latencies", action="store_true", help="Save the latency of every run.")
+    parser.add_argument("--compare", metavar="BASELINE_JSON", help="Compare the results to a previous report.")
+    parser.add_argument("--metric", default="p50_ms", help="The metric compared by --compare.")
+    parser.add_argument(
+        "--tolerance", type=float, default=0.1, help="The relative degradation tolerated by --compare."
+    )
+    args = parser.parse_args()
+
+    synthetic_tasks = args.synthetic
+    if synthetic_tasks is None or (not synthetic_tasks and not args.model):
+        synthetic_tasks = [] if args.model else [task for task in TASK_TO_MODEL_CLASS if task != "custom"]
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        models = []
+        for task in synthetic_tasks:
+            model_path = os.path.join(tmpdir, f"synthetic_{task}.onnx")
+            onnx.save(make_synthetic_model(task, image_size=args.image_size), model_path)
+            models.append((model_path, task, f"synthetic/{task}"))
+
+        for model in args.model:
+            model_id, _, task = model.rpartition(":")
+            if task not in TASK_TO_MODEL_CLASS:
+                parser.error(f"Unknown task {task} for {model_id}, expected one of {list(TASK_TO_MODEL_CLASS)}.")
+            if os.path.isfile(model_id):
+                model_path = model_id
+            else:
+                import huggingface_hub
+
+                file_name = next(name for name in huggingface_hub.list_repo_files(model_id) if name.endswith(".onnx"))
+                model_path = huggingface_hub.hf_hub_download(model_id, file_name)
+            models.append((model_path, task, model_id))
+
+        # Each model runs in a fresh process, so that its peak memory does not include the previous models.
+        results = []
+        for model_path, task, model_name in models:
+            with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn")) as executor:
+                results.extend(executor.submit(run_model_benchmark, model_path, task, model_name, args).result())
+
+    report = RyzenAIBenchmarkReport(results)
+    print(report.summary())
+
+    if args.output_json is not None:
+        report.save(args.output_json, include_latencies=args.include_latencies)
+        print(f"Results saved to '{args.output_json}'.")
+
+    if args.compare is not None:
+        comparisons = report.compare(
+            RyzenAIBenchmarkReport.load_results(args.compare), metric=args.metric, tolerance=args.tolerance
+        )
+        regressions = [comparison for comparison in comparisons if comparison["regression"]]
+        for comparison in regressions:
+            print(
+                f"Regression: {comparison['model_name']} (batch {comparison['batch_size']}, "
+                f"{comparison['num_threads']} threads) {args.metric} {comparison['baseline']:.3f} -> "
+                f"{comparison['current']:.3f} ({comparison['change']:+.1%})"
+            )
+        if regressions:
+            return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,50 +4,62 @@
 import argparse
 import json
 import os
+import sys
 
-
-def parse_json(json_path):
-    with open(json_path, "r") as json_file:
-        data = json.load(json_file)
-        result = {"all": 0, "dpu": 0, "cpu": 0}
-        for entry in data["deviceStat"]:
-            result[entry["name"].lower()] = entry["nodeNum"]
-        return result
-
-
-def process_folder(input_folder):
-    result_dict = {}
-    for folder_name in os.listdir(input_folder):
-        folder_path = os.path.join(input_folder, folder_name)
-        if os.path.isdir(folder_path):
-            json_path = os.path.join(folder_path, "vitisai_ep_report.json")
-            if os.path.exists(json_path):
-                model_name = folder_name.lower()
-                result_dict[model_name] = parse_json(json_path)
-    return result_dict
+from optimum.amd.ryzenai.operators import (
+    collect_operators_reports,
+    diff_operators_baseline,
+    format_operators_diff,
+    load_operators_baseline,
+    op_type_placement_histogram,
+    save_operators_baseline,
+)
 
 
 def main():
-    parser = argparse.ArgumentParser(description="Process JSON files in folders.")
+    parser = argparse.ArgumentParser(description="Generate the operators baseline from a VitisAI EP cache folder.")
     parser.add_argument("input_folder", help="Path to the input folder")
-    parser.add_argument("output_json", help="Path to the output JSON file")
+    parser.add_argument("output_json", nargs="?", help="Path to the output JSON file")
+    parser.add_argument(
+        "--compare", metavar="BASELINE_JSON", help="Compare the reports to a baseline, and fail on DPU regressions"
+    )
+    parser.add_argument(
+        "--tolerance", type=float, default=0.0, help="The DPU coverage drop tolerated by --compare, e.g. 0.01 for 1%%"
+    )
+    parser.add_argument("--histogram-json", help="Path to save the per operator type placement histogram")
+    parser.add_argument("--num-workers", type=int, default=None, help="Number of threads reading the reports")
     args = parser.parse_args()
 
-    input_folder = args.input_folder
-    output_json = args.output_json
+    if not os.path.exists(args.input_folder):
+        print(f"Error: Input folder '{args.input_folder}' does not exist.")
+        return 1
+
+    if args.output_json is None and args.compare is None:
+        parser.error("Either output_json or --compare is required.")
+
+    reports = collect_operators_reports(args.input_folder, num_workers=args.num_workers)
+    print(f"Read {len(reports)} reports from '{args.input_folder}'.")
+
+    if args.output_json is not None:
+        save_operators_baseline(reports, args.output_json)
+        print(f"Processed successfully. Result saved to '{args.output_json}'.")
 
-    if not os.path.exists(input_folder):
-        print(f"Error: Input folder '{input_folder}' does not exist.")
-        return
+    if args.histogram_json is not None:
+        with open(args.histogram_json, "w") as histogram_file:
+            json.dump(op_type_placement_histogram(reports), histogram_file, indent=2)
+        print(f"Operator type placement histogram saved to '{args.histogram_json}'.")
 
-    result_dict = process_folder(input_folder)
-    sorted_result = dict(sorted(result_dict.items()))
+    if args.compare is not None:
+        diffs = diff_operators_baseline(load_operators_baseline(args.compare), reports)
+        print(format_operators_diff(diffs, tolerance=args.tolerance))
 
-    with open(output_json, "w") as output_file:
-        json.dump(sorted_result, output_file, indent=2)
+        regressions = [diff.model_name for diff in diffs if diff.is_regression(args.tolerance)]
+        if regressions:
+            print(f"DPU coverage regressed for {len(regressions)} model(s): {', '.join(regressions)}")
+            return 1
 
-    print(f"Processed successfully. Result saved to '{output_json}'.")
+    return 0
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())